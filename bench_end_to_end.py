@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+端到端吞吐量基准：用合成PDF驱动 src/main.py，连接本地模拟服务器，输出每分钟页数、页面耗时的p50/p95
+和main.py进程的峰值内存（RSS），不需要访问网络，可以在CI中发现性能退化
+
+模拟服务器按 --latency 分布生成每个请求的延迟，并按比例注入429/500、超时、格式错误和被截断的响应；
+延迟和故障由 --seed、请求内容和重试次数决定，与并发下请求到达的顺序无关。
+合成PDF的每页是一张JPEG扫描图，走扫描图直通路径；读取页数仍需要poppler的pdfinfo。
+模拟服务器和main.py各在一个子进程中运行，峰值内存只统计main.py
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+
+from PIL import Image, ImageDraw
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# main.py 每页完成时输出的耗时，format_time 只保留一位小数
+PAGE_DONE_PATTERN = re.compile(r"页面 (\d+) 处理完成，耗时: ([\d.]+)(秒|分钟|小时)")
+TIME_UNITS = {'秒': 1, '分钟': 60, '小时': 3600}
+
+# 各类故障的默认比例；无法解析的响应默认只重试一次（--malformed-retries），比例不宜过高，
+# 否则同一页连续两次无法解析时main.py会保存进度并退出
+DEFAULT_FAULT_RATES = {'429': 0.03, '500': 0.02, 'timeout': 0.01, 'malformed': 0.01, 'truncated': 0.01}
+
+
+def create_synthetic_pdf(pdf_path, pages, seed):
+    """生成每页为一张带文字行的JPEG扫描图的PDF（A4，150DPI）"""
+    rng = random.Random(seed)
+    images = []
+    for page_num in range(1, pages + 1):
+        image = Image.new('RGB', (1240, 1754), 'white')
+        draw = ImageDraw.Draw(image)
+        for row in range(rng.randint(20, 45)):
+            y = 150 + row * 34
+            draw.text((120, y), f"Page {page_num} line {row + 1} " + "lorem ipsum dolor sit amet " * 3,
+                      fill='black')
+        images.append(image)
+    images[0].save(pdf_path, save_all=True, append_images=images[1:], resolution=150, quality=85)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    """在子进程中启动模拟服务器，等待端口可以连接"""
+    port = free_port()
+    command = [sys.executable, os.path.join(PROJECT_DIR, 'mock_gemini_server.py'), '--port', str(port),
+               '--canned', '--quiet', '--latency', args.latency, '--hang-seconds', str(args.hang_seconds),
+               '--seed', str(args.seed)]
+    for fault in DEFAULT_FAULT_RATES:
+        command += [f'--{fault}-rate', str(getattr(args, f'{fault}_rate'))]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("模拟服务器启动失败")
+
+
+def run_main(pdf_path, output_path, base_url, args):
+    """
+    运行一次 main.py
+
+    Returns:
+        tuple: (退出码, 输出, 耗时秒数, 峰值RSS字节数)
+    """
+    command = [sys.executable, os.path.join(PROJECT_DIR, 'src', 'main.py'), '-i', pdf_path, '-o', output_path,
+               '--mode', args.mode, '--base-url', base_url, '--no-cache', '--concurrency', str(args.concurrency),
+               '--read-timeout', str(args.read_timeout), '--embedded-images'] + args.main_args
+    env = dict(os.environ, GEMINI_API_KEY='bench_key', PYTHONUNBUFFERED='1')
+    start_time = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+                               text=True, encoding='utf-8', errors='replace')
+    output = process.stdout.read()
+    # wait4 返回该子进程自己的资源用量，Linux上ru_maxrss的单位为KB
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.time() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return process.returncode, output, elapsed, peak_rss
+
+
+def percentile(values, p):
+    """最近秩法计算百分位数"""
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py端到端吞吐量基准（本地模拟服务器）',
+                                     epilog='"--" 之后的参数原样传给 main.py，例如: -- --stream --rpm 600')
+    parser.add_argument('--pages', type=int, default=60, help='合成PDF的页数 (默认: 60)')
+    parser.add_argument('--mode', choices=['simple', 'rich'], default='rich', help='处理模式 (默认: rich)')
+    parser.add_argument('--concurrency', type=int, default=8, help='main.py的 --concurrency (默认: 8)')
+    parser.add_argument('--latency', default='lognormal:0.8,0.5',
+                        help='模拟服务器的延迟分布 (默认: lognormal:0.8,0.5)')
+    for fault, rate in DEFAULT_FAULT_RATES.items():
+        parser.add_argument(f'--{fault}-rate', type=float, default=rate, help=f'{fault}故障的比例 (默认: {rate})')
+    parser.add_argument('--hang-seconds', type=float, default=10.0, help='超时故障保持连接的秒数 (默认: 10)')
+    parser.add_argument('--read-timeout', type=float, default=3.0, help='main.py的 --read-timeout (默认: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='合成PDF、延迟和故障的随机种子 (默认: 0)')
+    parser.add_argument('--json', metavar='FILE', help='把结果写入JSON文件')
+    parser.add_argument('--min-pages-per-minute', type=float, default=None, help='吞吐量低于该值时以退出码1结束')
+    parser.add_argument('--max-p95', type=float, default=None, help='页面耗时p95超过该秒数时以退出码1结束')
+    parser.add_argument('main_args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.main_args[:1] == ['--']:
+        args.main_args = args.main_args[1:]
+
+    if shutil.which('pdfinfo') is None:
+        print("✗ 未找到 pdfinfo，请安装 poppler-utils")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, 'synthetic.pdf')
+        create_synthetic_pdf(pdf_path, args.pages, args.seed)
+        process, base_url = start_server(args)
+        try:
+            code, output, elapsed, peak_rss = run_main(pdf_path, os.path.join(temp_dir, 'out.epub'), base_url, args)
+        finally:
+            process.kill()
+            process.wait()
+
+    latencies = [float(value) * TIME_UNITS[unit] for _, value, unit in PAGE_DONE_PATTERN.findall(output)]
+    if code != 0 or len(latencies) != args.pages:
+        print(output[-3000:])
+        print(f"✗ main.py 退出码 {code}，完成 {len(latencies)}/{args.pages} 页")
+        sys.exit(1)
+
+    result = {
+        'pages': args.pages,
+        'mode': args.mode,
+        'concurrency': args.concurrency,
+        'seconds': round(elapsed, 2),
+        'pages_per_minute': round(args.pages / elapsed * 60, 1),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+    }
+    print(f"{args.pages} 页，{args.mode} 模式，并发 {args.concurrency}，延迟 {args.latency}，种子 {args.seed}")
+    print(f"总耗时 {result['seconds']:.1f}s，{result['pages_per_minute']:.1f} 页/分钟")
+    print(f"页面耗时 p50 {result['p50']:.1f}s，p95 {result['p95']:.1f}s（main.py输出精确到0.1秒）")
+    print(f"main.py 峰值内存 {result['peak_rss_mb']:.1f}MB")
+    for line in output.splitlines():
+        if line.startswith(('重试统计', '限流统计', '请求耗时', 'token用量')):
+            print(line)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    failures = []
+    if args.min_pages_per_minute is not None and result['pages_per_minute'] < args.min_pages_per_minute:
+        failures.append(f"吞吐量 {result['pages_per_minute']} 页/分钟低于 {args.min_pages_per_minute}")
+    if args.max_p95 is not None and result['p95'] > args.max_p95:
+        failures.append(f"p95 {result['p95']}s 超过 {args.max_p95}s")
+    if failures:
+        print("✗ " + "；".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+图像上传体积基准：比较不同编码设置下的请求体积、编码耗时以及（可选）OCR延迟
+"""
+
+import os
+import sys
+import io
+import glob
+import time
+import base64
+import argparse
+import statistics
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image, ImageDraw
+
+from src.api.image_encoder import ImageEncoder
+from src.processors.pdf_processor import PageImage
+
+
+# 待比较的编码设置: (名称, ImageEncoder参数)
+SETTINGS = [
+    ('原图', dict(image_format='original')),
+    ('JPEG q80 长边2000', dict(image_format='jpeg', max_side=2000, quality=80)),
+    ('JPEG q60 长边1600', dict(image_format='jpeg', max_side=1600, quality=60)),
+    ('WebP q75 长边2000', dict(image_format='webp', max_side=2000, quality=75)),
+    ('PNG 8bit灰度 长边2000', dict(image_format='png', max_side=2000)),
+    ('PNG 4bit灰度 长边2000', dict(image_format='png', max_side=2000, png_bits=4)),
+]
+
+
+def synthetic_pages(count):
+    """生成模拟300dpi扫描页的PNG图像"""
+    pages = []
+    for page_num in range(1, count + 1):
+        image = Image.new('RGB', (2480, 3508), (248, 246, 240))
+        draw = ImageDraw.Draw(image)
+        draw.text((1100, 200), f"Chapter {page_num}", fill='black')
+        for line in range(70):
+            draw.text((200, 320 + line * 44), f"{line + 1:02d} " + "The quick brown fox jumps over the lazy dog. " * 3,
+                      fill='black')
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        pages.append(PageImage(page_num, buffer.getvalue(), 'image/png'))
+    return pages
+
+
+def load_pages(args):
+    """读取待测试的页面图像"""
+    if args.images:
+        paths = sorted(glob.glob(args.images))[:args.pages]
+        pages = []
+        for page_num, path in enumerate(paths, start=1):
+            with open(path, 'rb') as f:
+                pages.append(PageImage(page_num, f.read(), 'image/png'))
+        return pages
+    return synthetic_pages(args.pages)
+
+
+def run_setting(options, pages, gemini_client=None):
+    """使用一种编码设置处理全部页面，返回统计结果"""
+    encoder = ImageEncoder(**options)
+    payload_sizes = []
+    encode_times = []
+    ocr_times = []
+
+    # 基准输出只关心汇总数据
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        for page in pages:
+            start_time = time.time()
+            data, _ = encoder.encode(page)
+            encode_times.append(time.time() - start_time)
+            payload_sizes.append(len(base64.b64encode(data)))
+
+            if gemini_client:
+                gemini_client.image_encoder = encoder
+                start_time = time.time()
+                gemini_client.extract_text(page)
+                ocr_times.append(time.time() - start_time)
+    finally:
+        sys.stdout = stdout
+
+    return {
+        'payload_kb': statistics.mean(payload_sizes) / 1024,
+        'encode_ms': statistics.mean(encode_times) * 1000,
+        'ocr_s': statistics.mean(ocr_times) if ocr_times else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图像上传编码基准测试')
+    parser.add_argument('--images', help='页面图像的glob模式 (默认生成合成页面)')
+    parser.add_argument('--pages', type=int, default=5, help='测试页数 (默认: 5)')
+    parser.add_argument('--ocr', action='store_true', help='同时调用Gemini测量OCR延迟 (需要GEMINI_API_KEY)')
+    parser.add_argument('--model', choices=['flash', 'pro'], default='flash', help='OCR使用的模型')
+    parser.add_argument('--base-url', help='Gemini API的基础URL (可选)')
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    if not pages:
+        print("没有找到页面图像")
+        sys.exit(1)
+
+    gemini_client = None
+    if args.ocr:
+        from src.api.gemini_client import GeminiClient
+        gemini_client = GeminiClient(model_type=args.model, base_url=args.base_url)
+
+    print(f"测试 {len(pages)} 页\n")
+    header = f"{'设置':<22} {'请求图像(KB)':>12} {'编码(ms)':>10}"
+    if gemini_client:
+        header += f" {'OCR延迟(秒)':>12}"
+    print(header)
+
+    for name, options in SETTINGS:
+        result = run_setting(options, pages, gemini_client)
+        line = f"{name:<22} {result['payload_kb']:>12.1f} {result['encode_ms']:>10.1f}"
+        if result['ocr_s'] is not None:
+            line += f" {result['ocr_s']:>12.2f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
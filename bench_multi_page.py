@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+多页请求基准：在本地模拟服务器上比较每次请求识别1、2、4、8页时的吞吐量和token用量
+
+模拟服务器的响应时间 = 固定开销 + 每张图像的处理时间 + 输出token数 × 每个token的生成时间，
+并以一定概率在多页响应中遗漏页面，以体现逐页重新识别的额外开销
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.gemini_client import GeminiClient
+from src.api.retry_policy import RetryPolicy
+from src.api.rate_limiter import estimate_request_tokens
+from src.api.token_usage import MODEL_PRICES
+from src.processors.pdf_processor import PageImage
+from src.main import iter_page_results
+from mock_gemini_server import MockGeminiServer
+
+
+# 估算费用使用的单价（美元/百万token），为gemini-2.5-flash的公开价格
+INPUT_PRICE, OUTPUT_PRICE = MODEL_PRICES['gemini-2.5-flash']
+
+# 书页类型及其在书中的占比：(名称, 占比, 段落数范围, 每段字数范围)
+PAGE_MIX = [
+    ('正文页', 0.75, (3, 6), (120, 260)),
+    ('章节首页', 0.10, (1, 3), (60, 180)),
+    ('对话页', 0.10, (8, 14), (15, 60)),
+    ('尾页', 0.05, (1, 1), (20, 80)),
+]
+
+
+def make_book(page_count, seed):
+    """
+    生成按PAGE_MIX分布的书页及每页的识别结果
+
+    Returns:
+        tuple: (页面图像列表, 页码到内容块列表的映射)
+    """
+    rng = random.Random(seed)
+    pages, blocks = [], {}
+    for page_num in range(1, page_count + 1):
+        _, _, paragraphs, chars = rng.choices(PAGE_MIX, weights=[kind[1] for kind in PAGE_MIX])[0]
+        blocks[page_num] = [
+            {'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': '字' * rng.randint(*chars)}
+            for _ in range(rng.randint(*paragraphs))
+        ]
+        pages.append(PageImage(page_num, b'\x89PNG page %d' % page_num, 'image/png'))
+    return pages, blocks
+
+
+class SimulatedModel:
+    """根据请求中的图像生成响应，并统计服务器端看到的请求数和token数"""
+
+    def __init__(self, blocks, overhead, per_image, per_token, drop_rate, seed):
+        self.blocks = blocks
+        self.overhead = overhead
+        self.per_image = per_image
+        self.per_token = per_token
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def __call__(self, request):
+        parts = request['contents'][0]['parts']
+        page_nums = [int(base64.b64decode(part['inline_data']['data']).split()[-1])
+                     for part in parts if 'inline_data' in part]
+        if len(page_nums) > 1:
+            with self.lock:
+                kept = [(number, page_num) for number, page_num in enumerate(page_nums, 1)
+                        if self.rng.random() >= self.drop_rate]
+            text = json.dumps({"pages": [{"page": number, "is_toc": False, "blocks": self.blocks[page_num]}
+                                         for number, page_num in kept]}, ensure_ascii=False)
+        else:
+            text = json.dumps({"is_toc": False, "blocks": self.blocks[page_nums[0]]}, ensure_ascii=False)
+
+        output_tokens = len(text)
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += estimate_request_tokens(request)
+            self.output_tokens += output_tokens
+        time.sleep(self.overhead + self.per_image * len(page_nums) + self.per_token * output_tokens)
+        return text
+
+
+def run(pages, blocks, pages_per_request, args):
+    """用给定的每次请求页数识别全部页面，返回统计结果"""
+    model = SimulatedModel(blocks, args.overhead, args.per_image, args.per_token, args.drop_rate, args.seed)
+    server = MockGeminiServer(response_text=model).start()
+    try:
+        with patch.dict(os.environ, {'GEMINI_API_KEY': 'bench_key'}):
+            client = GeminiClient(base_url=server.base_url, pool_size=args.concurrency,
+                                  retry_policy=RetryPolicy(base_delay=0.01))
+
+        if pages_per_request > 1:
+            worker = lambda images, page_nums: client.extract_rich_structure_multi(images)
+        else:
+            worker = lambda image, page_num: client.extract_rich_structure_with_toc(image)
+
+        start_time = time.time()
+        results = {}
+        for page_num, _, future in iter_page_results(pages, 1, len(pages), worker, args.concurrency,
+                                                     pages_per_request):
+            (_, page_blocks), _ = future.result()
+            results[page_num] = page_blocks
+        elapsed = time.time() - start_time
+    finally:
+        server.stop()
+
+    assert results == blocks, "识别结果与预期不一致"
+    cost = (model.input_tokens * INPUT_PRICE + model.output_tokens * OUTPUT_PRICE) / 1_000_000
+    return {
+        'elapsed': elapsed,
+        'requests': model.requests,
+        'fallbacks': client.multi_page_fallbacks,
+        'input_tokens': model.input_tokens / len(pages),
+        'output_tokens': model.output_tokens / len(pages),
+        'cost': cost * 1000 / len(pages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多页请求的吞吐量和token用量基准')
+    parser.add_argument('--pages', type=int, default=48, help='书的页数 (默认: 48)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8], help='比较的每次请求页数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时进行的请求数 (默认: 4)')
+    parser.add_argument('--overhead', type=float, default=0.4, help='每次请求的固定开销秒数 (默认: 0.4)')
+    parser.add_argument('--per-image', type=float, default=0.05, help='每张图像的处理秒数 (默认: 0.05)')
+    parser.add_argument('--per-token', type=float, default=0.0002, help='每个输出token的生成秒数 (默认: 0.0002)')
+    parser.add_argument('--drop-rate', type=float, default=0.03, help='多页响应遗漏每一页的概率 (默认: 0.03)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args()
+
+    pages, blocks = make_book(args.pages, args.seed)
+    print(f"{args.pages} 页，并发 {args.concurrency}，每次请求固定开销 {args.overhead}s，"
+          f"多页响应遗漏率 {args.drop_rate:.0%}")
+    print(f"{'页/请求':>6} {'耗时':>8} {'页/秒':>7} {'请求数':>6} {'重新识别':>8} "
+          f"{'输入token/页':>12} {'输出token/页':>12} {'费用$/千页':>10}")
+    baseline = None
+    for size in args.sizes:
+        stats = run(pages, blocks, size, args)
+        baseline = baseline or stats
+        print(f"{size:>6} {stats['elapsed']:>7.2f}s {args.pages / stats['elapsed']:>7.1f} {stats['requests']:>6} "
+              f"{stats['fallbacks']:>8} {stats['input_tokens']:>12.0f} {stats['output_tokens']:>12.0f} "
+              f"{stats['cost']:>10.3f}")
+    print("\n每次请求的页数越多，提示词和固定开销分摊得越薄；但单个请求更慢，"
+          "页数接近并发数×每次请求页数时并行度下降，遗漏的页面还需要额外的单页请求。")
+
+
+if __name__ == '__main__':
+    main()
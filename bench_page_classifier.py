@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+本地页面分类基准：在带标注的合成页面集上统计各类别的精确率/召回率，
+以及跳过模型调用后节省的时间
+"""
+
+import os
+import sys
+import io
+import time
+import random
+import argparse
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+from src.processors.page_classifier import PageClassifier, PAGE_TYPES
+from src.processors.pdf_processor import PageImage
+
+
+PAGE_SIZE = (2480, 3508)
+WORDS = "the quick brown fox jumps over a lazy dog while seven wizards box and judge every quiet vexing".split()
+
+
+def new_page(rng):
+    """生成带有纸张底色的空白页"""
+    paper = rng.randint(225, 250)
+    image = Image.new('L', PAGE_SIZE, paper)
+    return image, ImageDraw.Draw(image)
+
+
+def add_scan_noise(image, draw, rng):
+    """添加扫描噪点和轻微模糊"""
+    for _ in range(rng.randint(0, 60)):
+        draw.point((rng.randrange(PAGE_SIZE[0]), rng.randrange(PAGE_SIZE[1])), fill=rng.randint(0, 120))
+    if rng.random() < 0.5:
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 1.0)))
+    return image
+
+
+def sentence(rng, width, font, draw):
+    """生成不超过指定宽度的一行文字"""
+    words = []
+    while True:
+        candidate = ' '.join(words + [rng.choice(WORDS)])
+        if draw.textlength(candidate, font=font) > width:
+            return ' '.join(words)
+        words = candidate.split(' ')
+
+
+def make_blank(rng):
+    image, draw = new_page(rng)
+    if rng.random() < 0.6:
+        font = ImageFont.load_default(size=36)
+        draw.text((PAGE_SIZE[0] // 2, PAGE_SIZE[1] - 100), str(rng.randint(1, 400)), fill=40, font=font)
+    return add_scan_noise(image, draw, rng)
+
+
+def make_text(rng):
+    image, draw = new_page(rng)
+    font_size = rng.randint(30, 44)
+    font = ImageFont.load_default(size=font_size)
+    left, right = rng.randint(220, 320), rng.randint(2160, 2260)
+    y = rng.randint(250, 400)
+    line_height = int(font_size * rng.uniform(1.4, 1.9))
+    if rng.random() < 0.4:
+        draw.text((900, y), "Chapter " + str(rng.randint(1, 30)), fill=0, font=ImageFont.load_default(size=64))
+        y += 200
+    while y < PAGE_SIZE[1] - 300:
+        # 段落最后一行较短
+        width = right - left if rng.random() > 0.15 else rng.randint(300, 1500)
+        draw.text((left, y), sentence(rng, width, font, draw), fill=rng.randint(0, 40), font=font)
+        y += line_height
+    return add_scan_noise(image, draw, rng)
+
+
+def make_toc(rng):
+    image, draw = new_page(rng)
+    font_size = rng.randint(32, 44)
+    font = ImageFont.load_default(size=font_size)
+    draw.text((1050, 250), rng.choice(["Contents", "Table of Contents"]), fill=0,
+              font=ImageFont.load_default(size=64))
+    left, right = rng.randint(250, 350), rng.randint(2100, 2250)
+    leaders = rng.random() < 0.6
+    page = rng.randint(1, 20)
+    y = 450
+    line_height = int(font_size * rng.uniform(1.8, 2.6))
+    while y < PAGE_SIZE[1] - 300:
+        indent = rng.choice([0, 0, 80, 160])
+        title = f"{rng.randint(1, 12)}.{rng.randint(1, 9)} " + sentence(rng, rng.randint(500, 1300), font, draw)
+        draw.text((left + indent, y), title, fill=0, font=font)
+        page += rng.randint(2, 25)
+        number_width = draw.textlength(str(page), font=font)
+        if leaders:
+            x = left + indent + draw.textlength(title, font=font) + 30
+            while x < right - number_width - 40:
+                draw.text((x, y), '.', fill=0, font=font)
+                x += 24
+        draw.text((right - number_width, y), str(page), fill=0, font=font)
+        y += line_height
+    return add_scan_noise(image, draw, rng)
+
+
+def make_picture(rng):
+    image, draw = new_page(rng)
+    width, height = rng.randint(1600, 2100), rng.randint(1800, 2900)
+    x, y = (PAGE_SIZE[0] - width) // 2, rng.randint(250, 450)
+    if rng.random() < 0.5:
+        photo = Image.effect_noise((width, height), rng.randint(40, 90)).filter(ImageFilter.GaussianBlur(3))
+    else:
+        photo = Image.linear_gradient('L').resize((width, height)).point(lambda v: 40 + v * 0.6)
+    image.paste(photo, (x, y))
+    if rng.random() < 0.5:
+        font = ImageFont.load_default(size=36)
+        draw.text((x, y + height + 60), "Figure " + sentence(rng, 900, font, draw), fill=0, font=font)
+    return add_scan_noise(image, draw, rng)
+
+
+GENERATORS = {
+    'blank': make_blank,
+    'text': make_text,
+    'toc': make_toc,
+    'picture': make_picture,
+}
+
+
+def build_fixtures(pages_per_type, seed):
+    """生成带标注的页面集"""
+    rng = random.Random(seed)
+    fixtures = []
+    page_num = 1
+    for label, generator in GENERATORS.items():
+        for _ in range(pages_per_type):
+            buffer = io.BytesIO()
+            generator(rng).save(buffer, format='PNG')
+            fixtures.append((label, PageImage(page_num, buffer.getvalue(), 'image/png')))
+            page_num += 1
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地页面分类基准测试')
+    parser.add_argument('--pages-per-type', type=int, default=10, help='每种页面类型的数量 (默认: 10)')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--call-seconds', type=float, default=8.0,
+                        help='一次模型调用的平均耗时（秒），用于估算节省的时间 (默认: 8)')
+    args = parser.parse_args()
+
+    print("生成测试页面...")
+    fixtures = build_fixtures(args.pages_per_type, args.seed)
+
+    classifier = PageClassifier()
+    results = []
+    start_time = time.time()
+    for label, page in fixtures:
+        results.append((label, classifier.classify(page, page.page_num)))
+    classify_seconds = time.time() - start_time
+
+    print(f"\n共 {len(fixtures)} 页，分类耗时 {classify_seconds:.2f} 秒 "
+          f"(平均 {classify_seconds / len(fixtures) * 1000:.0f} ms/页)\n")
+    print(f"{'类型':<10} {'预测数':>6} {'精确率':>8} {'召回率':>8}")
+    for page_type in GENERATORS:
+        predicted = sum(1 for _, result in results if result == page_type)
+        actual = sum(1 for label, _ in results if label == page_type)
+        correct = sum(1 for label, result in results if label == result == page_type)
+        precision = correct / predicted if predicted else 0
+        recall = correct / actual if actual else 0
+        print(f"{page_type:<10} {predicted:>6} {precision:>8.1%} {recall:>8.1%}")
+
+    uncertain = sum(1 for _, result in results if result == 'uncertain')
+    print(f"{'uncertain':<10} {uncertain:>6}")
+
+    # 空白页、目录页、纯图片页完全不调用模型；其余页面的目录检测合并在提取请求中，调用次数不变
+    skipped = sum(1 for _, result in results if result in ('blank', 'toc', 'picture'))
+    saved_seconds = skipped * args.call_seconds - classify_seconds
+    print(f"\n免去模型调用 {skipped} 次，按每次 {args.call_seconds:.1f} 秒估算节省 {saved_seconds:.0f} 秒 "
+          f"(已扣除本地分类耗时)")
+    misjudged = [(label, result) for label, result in results
+                 if result in PAGE_TYPES[:4] and result != label]
+    if misjudged:
+        print(f"误判 {len(misjudged)} 页: {misjudged}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+PDF页面渲染性能基准：比较不同pdftoppm并行进程数下的渲染速度（页/秒）
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image, ImageDraw
+
+from src.processors.pdf_processor import PDFProcessor
+
+
+def create_synthetic_pdf(pdf_path, pages):
+    """用Pillow生成一份每页包含多行文字的合成PDF"""
+    images = []
+    for page_num in range(1, pages + 1):
+        image = Image.new('L', (1240, 1754), 255)
+        draw = ImageDraw.Draw(image)
+        draw.text((100, 80), f"Chapter {page_num}", fill=0)
+        for line in range(60):
+            draw.text((100, 140 + line * 26), f"Line {line + 1} of page {page_num}: " + "lorem ipsum " * 8, fill=0)
+        images.append(image)
+    images[0].save(pdf_path, save_all=True, append_images=images[1:], resolution=150)
+
+
+def benchmark(pdf_path, dpi, worker_counts):
+    """依次使用不同进程数渲染同一份PDF并返回每组结果"""
+    processor = PDFProcessor()
+    results = []
+    for workers in worker_counts:
+        start_time = time.time()
+        images = processor.pdf_to_images(pdf_path, dpi=dpi, workers=workers)
+        elapsed = time.time() - start_time
+        results.append((workers, len(images), elapsed))
+        if images:
+            shutil.rmtree(os.path.dirname(images[0]), ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF渲染并行度基准测试')
+    parser.add_argument('--input', '-i', help='用于测试的PDF文件 (默认生成合成PDF)')
+    parser.add_argument('--pages', type=int, default=64, help='合成PDF的页数 (默认: 64)')
+    parser.add_argument('--dpi', type=int, default=300, help='渲染DPI (默认: 300)')
+    parser.add_argument('--workers', default=None,
+                        help='逗号分隔的进程数列表 (默认: 1,2,4,...,CPU核心数)')
+    args = parser.parse_args()
+
+    if shutil.which('pdftoppm') is None or shutil.which('pdfinfo') is None:
+        print("✗ 未找到 pdftoppm/pdfinfo，请安装 poppler-utils")
+        sys.exit(1)
+
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        cores = os.cpu_count() or 1
+        worker_counts = []
+        workers = 1
+        while workers < cores:
+            worker_counts.append(workers)
+            workers *= 2
+        worker_counts.append(cores)
+
+    temp_dir = None
+    pdf_path = args.input
+    if not pdf_path:
+        temp_dir = tempfile.mkdtemp()
+        pdf_path = os.path.join(temp_dir, 'synthetic.pdf')
+        print(f"生成 {args.pages} 页合成PDF...")
+        create_synthetic_pdf(pdf_path, args.pages)
+
+    try:
+        results = benchmark(pdf_path, args.dpi, worker_counts)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    baseline = results[0][1] / results[0][2] if results[0][2] > 0 else 0
+    print(f"\n{'进程数':>6} {'页数':>6} {'耗时(秒)':>10} {'页/秒':>8} {'加速比':>8}")
+    for workers, pages, elapsed in results:
+        rate = pages / elapsed if elapsed > 0 else 0
+        speedup = rate / baseline if baseline else 0
+        print(f"{workers:>6} {pages:>6} {elapsed:>10.2f} {rate:>8.2f} {speedup:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
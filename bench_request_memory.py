@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+请求体内存基准：高并发下用tracemalloc比较改动前的请求方式与预先序列化的请求体的内存峰值
+
+改动前每次尝试都重新编码图像、把base64解码为字符串，再由requests生成JSON文本并编码为字节；
+现在每页只生成一次请求体，base64字节直接拼接进请求体，重试时复用。
+模拟服务器在子进程中运行（超过 --max-in-flight 的请求返回429以产生重试），其内存不计入统计
+"""
+
+import io
+import os
+import sys
+import time
+import socket
+import argparse
+import tracemalloc
+import subprocess
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.gemini_client import GeminiClient
+from src.api.minigenai import build_payload, extract_response_text
+from src.api.retry_policy import RetryPolicy
+from src.processors.pdf_processor import PageImage
+
+
+class LegacyClient(GeminiClient):
+    """改动前的发送方式：每次尝试重新构造contents，由requests序列化JSON"""
+
+    def _send(self, prompt, image_path, generation_config, consume=None, prepared=None, model=None):
+        payload = build_payload(self.build_contents(prompt, image_path), generation_config)
+        url = f"{self.client.base_url}/v1beta/models/{self.model_name}:generateContent?key={self.client.api_key}"
+        resp = self.client.session.post(url, json=payload, timeout=self.client.timeout)
+        resp.raise_for_status()
+        return extract_response_text(resp.json())
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args):
+    """在子进程中启动模拟服务器，等待端口可以连接"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_gemini_server.py'),
+         '--port', str(port), '--delay', str(args.delay), '--max-in-flight', str(args.max_in_flight), '--quiet'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("模拟服务器启动失败")
+
+
+def run(client_class, pages, base_url, args):
+    """并发识别全部页面，返回 (内存峰值增量, 耗时, 重试次数)"""
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'bench_key'}):
+        client = client_class(base_url=base_url, pool_size=args.concurrency,
+                              retry_policy=RetryPolicy(base_delay=0.05, max_delay=0.5))
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start_time = time.time()
+    # 不输出每次重试的信息
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda page: client.extract_text(page, max_retries=50), pages))
+    elapsed = time.time() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert all(result == '模拟响应' for result in results)
+    return peak - baseline, elapsed, client.retry_policy.total_retries
+
+
+def main():
+    parser = argparse.ArgumentParser(description='请求体编码的内存峰值基准')
+    parser.add_argument('--pages', type=int, default=64, help='页数 (默认: 64)')
+    parser.add_argument('--image-size', type=float, default=2.0, help='每页图像大小MB (默认: 2)')
+    parser.add_argument('--concurrency', type=int, default=32, help='同时进行的请求数 (默认: 32)')
+    parser.add_argument('--max-in-flight', type=int, default=12,
+                        help='服务器同时处理的请求数，超出时返回429并重试 (默认: 12)')
+    parser.add_argument('--delay', type=float, default=0.3, help='服务器每个请求的处理秒数 (默认: 0.3)')
+    args = parser.parse_args()
+
+    size = int(args.image_size * 1024 * 1024)
+    # 随机数据无法压缩，与扫描页的PNG相近；编码器保持原始字节
+    pages = [PageImage(page_num, b'\x89PNG\r\n\x1a\n' + os.urandom(size), 'image/png')
+             for page_num in range(1, args.pages + 1)]
+
+    process, base_url = start_server(args)
+    try:
+        print(f"{args.pages} 页，每页 {args.image_size:.1f}MB，并发 {args.concurrency}，"
+              f"服务器同时处理 {args.max_in_flight} 个请求")
+        print(f"{'请求方式':<12} {'内存峰值':>10} {'每个并发页':>10} {'耗时':>8} {'重试':>6}")
+        for name, client_class in (('改动前', LegacyClient), ('预先序列化', GeminiClient)):
+            peak, elapsed, retries = run(client_class, pages, base_url, args)
+            print(f"{name:<12} {peak / 1024 / 1024:>8.1f}MB {peak / args.concurrency / size:>9.2f}x "
+                  f"{elapsed:>7.2f}s {retries:>6}")
+    finally:
+        process.kill()
+        process.wait()
+    print("\n每个并发页的内存以图像大小为单位：base64数据约为图像的1.33倍，请求体本身至少占这么多。")
+
+
+if __name__ == '__main__':
+    main()
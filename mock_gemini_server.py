@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""
+本地模拟Gemini API服务器：用于在不访问真实API的情况下测试连接复用、超时和延迟统计，
+也实现了Batch API的提交、查询和取消接口，上下文缓存（cachedContents）的创建、续期和删除接口，countTokens，
+以及按SSE分段返回的streamGenerateContent（可模拟生成中途停滞）。
+
+可以按分布生成每个请求的延迟，按比例注入429/500、超时、格式错误和被截断的响应，
+并根据提示词返回与富文本/纯文本模式格式一致的模拟识别结果。延迟和故障由随机种子、请求体和
+该请求体第几次出现决定，与请求到达的顺序无关，同样的参数总是得到同样的结果
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockAPIError(Exception):
+    """需要以错误状态码响应的请求"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.data = {"error": {"code": status, "message": message}}
+
+
+def text_tokens(text):
+    """粗略估算文本的token数：每个汉字一个token，其余字符每4个一个token"""
+    cjk = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(contents=None, system_instruction=None):
+    """粗略估算内容的token数：文本按 text_tokens 估算，每张图像1290个token"""
+    parts = [part for content in contents or [] for part in content.get('parts', [])]
+    parts += (system_instruction or {}).get('parts', [])
+    return sum(text_tokens(part['text']) if 'text' in part else 1290 for part in parts)
+
+
+# 可注入的故障类型
+FAULT_TYPES = ('429', '500', 'timeout', 'malformed', 'truncated')
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布
+
+    Args:
+        spec (str): "fixed:秒数"（或直接写秒数）、"uniform:最小,最大"、"lognormal:中位数,sigma"
+                    或 "tail:正常秒数,慢请求比例,慢请求秒数"
+
+    Returns:
+        callable: 接收random.Random、返回延迟秒数的函数
+    """
+    kind, _, params = spec.partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(value) for value in params.split(',')]
+    distributions = {
+        'fixed': (1, lambda rng, seconds: seconds),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+        'tail': (3, lambda rng, normal, ratio, slow: slow if rng.random() < ratio else normal),
+    }
+    if kind not in distributions or len(values) != distributions[kind][0]:
+        raise ValueError(f"无法解析的延迟分布: {spec}")
+    sample = distributions[kind][1]
+    return lambda rng: sample(rng, *values)
+
+
+def canned_response(request):
+    """
+    根据请求的提示词生成格式正确的模拟识别结果
+
+    支持合并目录检测的富文本/纯文本请求、多页请求、单独的目录检测、内容块数组和纯文本请求；
+    内容由页面图像决定，同一页总是得到同样的结果
+
+    Args:
+        request (dict): generateContent请求体
+
+    Returns:
+        str: 响应文本
+    """
+    parts = [part for content in request.get('contents', []) for part in content.get('parts', [])]
+    parts += (request.get('systemInstruction') or {}).get('parts', [])
+    prompt = '\n'.join(part['text'] for part in parts if 'text' in part)
+    images = [part['inline_data']['data'] for part in parts if 'inline_data' in part]
+
+    def page_rng(data):
+        return random.Random(hashlib.sha256(str(data).encode('utf-8')).digest())
+
+    def blocks(rng):
+        result = []
+        if rng.random() < 0.2:
+            result.append({'type': 'heading', 'level': 1, 'style': {'align': 'center'},
+                           'content': f"第{rng.randint(1, 30)}章"})
+        for _ in range(rng.randint(2, 5)):
+            result.append({'type': 'paragraph', 'level': 0, 'style': {'align': 'left'},
+                           'content': '模拟识别的正文内容。' * rng.randint(6, 20)})
+        return result
+
+    def text(rng):
+        # 纯文本模式的标题以"## "标记
+        return '\n\n'.join(('## ' if block['type'] == 'heading' else '') + block['content'] for block in blocks(rng))
+
+    if '"pages"' in prompt:
+        field, make = ('blocks', blocks) if '"blocks"' in prompt else ('text', text)
+        pages = [{'page': number, 'is_toc': False, field: make(page_rng(data))}
+                 for number, data in enumerate(images, 1)]
+        return json.dumps({'pages': pages}, ensure_ascii=False)
+    rng = page_rng(images[0] if images else prompt)
+    if '"is_toc"' in prompt:
+        field, make = ('blocks', blocks) if '"blocks"' in prompt else ('text', text)
+        return json.dumps({'is_toc': False, field: make(rng)}, ensure_ascii=False)
+    if '"true"或"false"' in prompt:
+        return 'false'
+    if '"type"' in prompt:
+        return json.dumps(blocks(rng), ensure_ascii=False)
+    return text(rng)
+
+
+def format_time(timestamp):
+    """RFC 3339格式的UTC时间"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 默认保持连接，客户端可以复用
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        path = self.path.split('?')[0]
+        if path.endswith(':batchGenerateContent'):
+            self.send_json(200, self.server.create_batch(path, json.loads(body)))
+            return
+        if path.startswith('/v1beta/batches/') and path.endswith(':cancel'):
+            job = self.server.cancel_batch(path[len('/v1beta/'):-len(':cancel')])
+            self.send_json(200 if job else 404, {} if job else self.not_found())
+            return
+        if path.endswith(':countTokens'):
+            request = json.loads(body)
+            with self.server.lock:
+                self.server.token_counts += 1
+            self.send_json(200, {"totalTokens": count_tokens(request.get('contents'),
+                                                             request.get('systemInstruction'))})
+            return
+        if path == '/v1beta/cachedContents':
+            try:
+                self.send_json(200, self.server.create_cached_content(json.loads(body)))
+            except MockAPIError as e:
+                self.send_json(e.status, e.data)
+            return
+
+        model = path.split('/models/')[-1].split(':')[0]
+        latency, fault = self.server.plan(body)
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.models[model] += 1
+            self.server.bytes_received += len(body)
+            throttled = self.server.max_in_flight is not None and self.server.in_flight >= self.server.max_in_flight
+            if throttled:
+                self.server.throttled += 1
+            else:
+                self.server.in_flight += 1
+                self.server.peak_in_flight = max(self.server.peak_in_flight, self.server.in_flight)
+
+        if throttled:
+            self.send_throttled()
+            return
+
+        # 模拟模型推理耗时
+        try:
+            if latency:
+                time.sleep(latency)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+        if fault == '429':
+            self.send_throttled()
+            return
+        if fault == '500':
+            self.send_json(500, {"error": {"code": 500, "status": "INTERNAL", "message": "Internal error"}})
+            return
+        if fault == 'timeout':
+            # 一直不响应，之后直接断开连接
+            time.sleep(self.server.hang_seconds)
+            self.close_connection = True
+            return
+
+        try:
+            data = self.server.generate(json.loads(body or b'{}'), model)
+        except MockAPIError as e:
+            self.send_json(e.status, e.data)
+            return
+        if fault:
+            data = self.server.corrupt(data, fault)
+        if path.endswith(':streamGenerateContent'):
+            self.send_stream(data)
+        else:
+            self.send_json(200, data)
+
+    def do_PATCH(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        cached = self.server.update_cached_content(self.path.split('?')[0][len('/v1beta/'):], body.get('ttl'))
+        self.send_json(200 if cached else 404, cached or self.not_found())
+
+    def do_DELETE(self):
+        deleted = self.server.delete_cached_content(self.path.split('?')[0][len('/v1beta/'):])
+        self.send_json(200 if deleted else 404, {} if deleted else self.not_found())
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        job = self.server.get_batch(path[len('/v1beta/'):]) if path.startswith('/v1beta/batches/') else None
+        self.send_json(200 if job else 404, job or self.not_found())
+
+    def send_json(self, status, data):
+        """发送JSON响应"""
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, data):
+        """把响应文本分成若干段，以SSE事件逐段发送，用量信息放在最后一段"""
+        text = data['candidates'][0]['content']['parts'][0]['text']
+        size = self.server.stream_chunk_size
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or ['']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for index, piece in enumerate(pieces):
+                if index == self.server.stall_after:
+                    # 模拟生成中途停滞
+                    time.sleep(self.server.stall_seconds)
+                elif index and self.server.stream_delay:
+                    time.sleep(self.server.stream_delay)
+                event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+                if index == len(pieces) - 1:
+                    event['candidates'][0]['finishReason'] = data['candidates'][0].get('finishReason')
+                    if 'usageMetadata' in data:
+                        event['usageMetadata'] = data['usageMetadata']
+                self.write_chunk(b'data: ' + json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\r\n\r\n')
+            self.write_chunk(b'')
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前中断了流
+            self.close_connection = True
+
+    def write_chunk(self, payload):
+        """按chunked编码写出一段数据，空数据表示结束"""
+        self.wfile.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b'\r\n')
+        self.wfile.flush()
+
+    def not_found(self):
+        return {"error": {"code": 404, "status": "NOT_FOUND", "message": f"{self.path.split('?')[0]} not found"}}
+
+    def send_throttled(self):
+        """模拟配额耗尽时的429响应"""
+        payload = json.dumps({
+            "error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Resource has been exhausted"}
+        }).encode('utf-8')
+        self.send_response(429)
+        if self.server.retry_after is not None:
+            self.send_header('Retry-After', str(self.server.retry_after))
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 允许大量客户端同时建立连接
+    request_queue_size = 256
+
+    def __init__(self, address=('127.0.0.1', 0), delay=0.0, response_text='模拟响应', verbose=False,
+                 max_in_flight=None, retry_after=None, batch_delay=0.0, min_cache_tokens=0,
+                 stream_chunk_size=64, stream_delay=0.0, stall_after=None, stall_seconds=0.0, model_responses=None,
+                 latency=None, fault_rates=None, hang_seconds=30.0, seed=0):
+        """
+        初始化模拟服务器
+
+        Args:
+            address (tuple): 监听地址，端口为0时自动分配
+            delay (float): 每个请求返回前等待的秒数
+            response_text: 返回的文本，或根据请求体生成文本的函数；
+                           也可以是 (文本, finishReason) 元组，finishReason默认为STOP
+            verbose (bool): 是否输出访问日志
+            max_in_flight (int): 同时处理的请求数上限，超出时返回429，None表示不限制
+            retry_after: 429响应中Retry-After头的值
+            batch_delay (float): 批处理任务从提交到完成的秒数，前一半时间为排队中
+            min_cache_tokens (int): 上下文缓存的最小token数，内容更少时创建请求返回400
+            stream_chunk_size (int): 流式响应每段的字符数
+            stream_delay (float): 流式响应相邻两段之间的秒数
+            stall_after (int): 流式响应发送该段之前停滞，None表示不停滞
+            stall_seconds (float): 停滞的秒数
+            model_responses (dict): 按模型名称指定的response_text，未列出的模型使用response_text
+            latency: 可选的延迟分布（parse_latency的返回值或其描述字符串），指定时代替delay
+            fault_rates (dict): 各类故障（FAULT_TYPES）的发生比例，如 {'429': 0.05, 'malformed': 0.01}
+            hang_seconds (float): 超时故障时保持连接不响应的秒数
+            seed (int): 决定延迟和故障的随机种子
+        """
+        super().__init__(address, MockGeminiHandler)
+        self.delay = delay
+        self.response_text = response_text
+        self.model_responses = model_responses or {}
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.fault_rates = fault_rates or {}
+        unknown = set(self.fault_rates) - set(FAULT_TYPES)
+        if unknown:
+            raise ValueError(f"未知的故障类型: {', '.join(sorted(unknown))}")
+        self.hang_seconds = hang_seconds
+        self.seed = seed
+        self.faults = Counter()
+        self._attempts = Counter()
+        self.models = Counter()
+        self.verbose = verbose
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+        self.batch_delay = batch_delay
+        self.batches = {}
+        self.batch_requests = 0
+        self._batch_ids = itertools.count(1)
+        self.min_cache_tokens = min_cache_tokens
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_delay = stream_delay
+        self.stall_after = stall_after
+        self.stall_seconds = stall_seconds
+        self.cached_contents = {}
+        self.cache_creations = 0
+        self.token_counts = 0
+        self._cache_ids = itertools.count(1)
+
+    @property
+    def base_url(self):
+        """供MiniGenAI/GeminiClient使用的base_url"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def plan(self, body):
+        """
+        决定一个请求的延迟和故障
+
+        同一个请求体第几次出现使用不同的随机序列，重试时不会总是遇到同样的故障
+
+        Args:
+            body (bytes): 请求体
+
+        Returns:
+            tuple: (延迟秒数, 故障类型或None)
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        with self.lock:
+            self._attempts[digest] += 1
+            rng = random.Random(f"{self.seed}:{digest}:{self._attempts[digest]}")
+        latency = self.latency(rng) if self.latency else self.delay
+        draw = rng.random()
+        for fault in FAULT_TYPES:
+            draw -= self.fault_rates.get(fault, 0)
+            if draw < 0:
+                with self.lock:
+                    self.faults[fault] += 1
+                return latency, fault
+        return latency, None
+
+    def corrupt(self, data, fault):
+        """
+        把正常响应改为格式错误（删除第一个引号）或被截断（只保留前一半并以MAX_TOKENS结束）的响应
+        """
+        candidate = data['candidates'][0]
+        text = candidate['content']['parts'][0]['text']
+        if fault == 'malformed':
+            text = text.replace('"', '', 1) if '"' in text else text + '}'
+        else:
+            text = text[:len(text) // 2]
+            candidate['finishReason'] = 'MAX_TOKENS'
+        candidate['content']['parts'][0]['text'] = text
+        return data
+
+    def generate(self, request, model=None):
+        """
+        生成一个generateContent响应
+
+        Args:
+            request (dict): 请求体
+            model (str): 请求路径中的模型名称
+
+        Returns:
+            dict: GenerateContentResponse
+        """
+        cached_tokens = 0
+        if request.get('cachedContent'):
+            # 引用上下文缓存时，把缓存的系统指令和内容合并到请求中
+            with self.lock:
+                cached = self.cached_contents.get(request['cachedContent'])
+                if cached is None or cached['expires'] <= time.time():
+                    raise MockAPIError(404, f"CachedContent not found: {request['cachedContent']}")
+            request = dict(request, contents=cached['contents'] + request['contents'])
+            if cached['systemInstruction']:
+                request['systemInstruction'] = cached['systemInstruction']
+            del request['cachedContent']
+            cached_tokens = cached['tokens']
+
+        text = self.model_responses.get(model, self.response_text)
+        if callable(text):
+            text = text(request)
+        text, finish_reason = text if isinstance(text, tuple) else (text, "STOP")
+        # 与 count_tokens 一样按 text_tokens 估算输出的token数
+        prompt_tokens = count_tokens(request.get('contents'), request.get('systemInstruction'))
+        candidates_tokens = text_tokens(text)
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": candidates_tokens,
+                 "totalTokenCount": prompt_tokens + candidates_tokens}
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                "finishReason": finish_reason}],
+                "usageMetadata": usage}
+
+    def create_cached_content(self, body):
+        """创建上下文缓存，内容少于min_cache_tokens时返回400"""
+        tokens = count_tokens(body.get('contents'), body.get('systemInstruction'))
+        if tokens < self.min_cache_tokens:
+            raise MockAPIError(400, f"Cached content is too small. total_token_count={tokens}, "
+                                    f"min_total_token_count={self.min_cache_tokens}")
+        with self.lock:
+            name = f"cachedContents/mock-{next(self._cache_ids)}"
+            self.cached_contents[name] = {
+                'model': body.get('model'),
+                'contents': body.get('contents') or [],
+                'systemInstruction': body.get('systemInstruction'),
+                'tokens': tokens,
+                'expires': time.time() + float(body.get('ttl', '3600s').rstrip('s')),
+            }
+            self.cache_creations += 1
+            return self._cached_content_info(name)
+
+    def update_cached_content(self, name, ttl):
+        """延长上下文缓存的有效期，已过期或不存在时返回None"""
+        with self.lock:
+            cached = self.cached_contents.get(name)
+            if cached is None or cached['expires'] <= time.time():
+                return None
+            cached['expires'] = time.time() + float((ttl or '3600s').rstrip('s'))
+            return self._cached_content_info(name)
+
+    def delete_cached_content(self, name):
+        """删除上下文缓存"""
+        with self.lock:
+            return self.cached_contents.pop(name, None) is not None
+
+    def _cached_content_info(self, name):
+        cached = self.cached_contents[name]
+        return {
+            "name": name,
+            "model": cached['model'],
+            "expireTime": format_time(cached['expires']),
+            "usageMetadata": {"totalTokenCount": cached['tokens']},
+        }
+
+    def create_batch(self, path, body):
+        """创建批处理任务，返回与batchGenerateContent相同格式的Operation"""
+        requests = body['batch']['input_config']['requests']['requests']
+        model = path.split('/models/')[-1].split(':')[0]
+        with self.lock:
+            name = f"batches/mock-{next(self._batch_ids)}"
+            self.batches[name] = {
+                'model': model,
+                'display_name': body['batch'].get('display_name', ''),
+                'requests': requests,
+                'created': time.time(),
+                'state': None,
+                'responses': None,
+            }
+        return self.get_batch(name)
+
+    def get_batch(self, name):
+        """
+        查询批处理任务，到达完成时间后依次生成每个请求的响应
+
+        Returns:
+            dict: 与batches.get相同格式的任务，任务不存在时返回None
+        """
+        with self.lock:
+            job = self.batches.get(name)
+            if job is None:
+                return None
+            elapsed = time.time() - job['created']
+            if job['state'] is None and elapsed >= self.batch_delay:
+                job['state'] = 'BATCH_STATE_SUCCEEDED'
+                job['responses'] = []
+                self.batch_requests += len(job['requests'])
+                for item in job['requests']:
+                    try:
+                        result = {"response": self.generate(item['request'])}
+                    except Exception as e:
+                        # 单个请求失败时任务仍然完成，该请求的结果为错误信息
+                        result = {"error": {"code": 500, "message": str(e)}}
+                    if 'metadata' in item:
+                        result['metadata'] = item['metadata']
+                    job['responses'].append(result)
+            state = job['state'] or ('BATCH_STATE_PENDING' if elapsed < self.batch_delay / 2 else 'BATCH_STATE_RUNNING')
+            data = {
+                "name": name,
+                "metadata": {
+                    "@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatch",
+                    "model": f"models/{job['model']}",
+                    "displayName": job['display_name'],
+                    "state": state,
+                    "batchStats": {"requestCount": str(len(job['requests']))},
+                },
+            }
+            if state in ('BATCH_STATE_SUCCEEDED', 'BATCH_STATE_CANCELLED'):
+                data["done"] = True
+            if job['responses'] is not None:
+                data["response"] = {
+                    "@type": "type.googleapis.com/google.ai.generativelanguage.v1main.GenerateContentBatchOutput",
+                    "inlinedResponses": {"inlinedResponses": job['responses']},
+                }
+            return data
+
+    def cancel_batch(self, name):
+        """取消尚未完成的批处理任务"""
+        with self.lock:
+            job = self.batches.get(name)
+            if job is not None and job['state'] is None:
+                job['state'] = 'BATCH_STATE_CANCELLED'
+            return job
+
+    def start(self):
+        """在后台线程中运行服务器"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # 客户端取消请求时连接被提前关闭，属于预期情况
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def stop(self):
+        """停止服务器"""
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟Gemini API服务器')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口 (默认: 8765)')
+    parser.add_argument('--delay', type=float, default=1.0, help='每个请求的模拟推理耗时（秒）')
+    parser.add_argument('--text', default='模拟响应', help='返回的文本')
+    parser.add_argument('--canned', action='store_true',
+                        help='根据提示词返回格式正确的模拟识别结果 (富文本/纯文本/多页/目录检测)，代替 --text')
+    parser.add_argument('--latency', default=None,
+                        help='延迟分布，代替 --delay: fixed:S、uniform:LO,HI、lognormal:MEDIAN,SIGMA 或 '
+                             'tail:NORMAL,RATIO,SLOW')
+    for fault, description in (('429', '返回429'), ('500', '返回500'), ('timeout', '不响应并断开连接'),
+                               ('malformed', '返回格式错误的JSON'), ('truncated', '返回被截断的响应')):
+        parser.add_argument(f'--{fault}-rate', type=float, default=0.0, help=f'{description}的请求比例 (默认: 0)')
+    parser.add_argument('--hang-seconds', type=float, default=30.0, help='超时故障保持连接的秒数 (默认: 30)')
+    parser.add_argument('--seed', type=int, default=0, help='决定延迟和故障的随机种子 (默认: 0)')
+    parser.add_argument('--batch-delay', type=float, default=10.0, help='批处理任务从提交到完成的秒数')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='同时处理的请求数上限，超出时返回429')
+    parser.add_argument('--quiet', action='store_true', help='不输出访问日志')
+    args = parser.parse_args()
+
+    fault_rates = {fault: getattr(args, f'{fault}_rate') for fault in FAULT_TYPES}
+    server = MockGeminiServer(('127.0.0.1', args.port), delay=args.delay,
+                              response_text=canned_response if args.canned else args.text,
+                              verbose=not args.quiet, max_in_flight=args.max_in_flight, batch_delay=args.batch_delay,
+                              latency=args.latency, fault_rates=fault_rates, hang_seconds=args.hang_seconds,
+                              seed=args.seed)
+    print(f"模拟服务器已启动: {server.base_url} (使用 --base-url {server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
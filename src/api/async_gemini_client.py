@@ -0,0 +1,184 @@
+import os
+import json
+import base64
+import asyncio
+from .async_minigenai import AsyncMiniGenAI, DEFAULT_MAX_CONCURRENCY
+from .http_session import DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .image_encoder import ImageEncoder
+from .retry_policy import RetryPolicy, RetryError
+from .gemini_client import (
+    GeminiClient, JSON_CONFIG, TEXT_PROMPT, TOC_PROMPT, RICH_STRUCTURE_PROMPT,
+    RICH_STRUCTURE_WITH_TOC_PROMPT, TEXT_WITH_TOC_PROMPT
+)
+
+
+class AsyncGeminiClient:
+    """
+    GeminiClient的asyncio版本：提示词、响应解析和重试策略与同步版本相同，
+    多个页面可以在同一个事件循环中并发识别
+    """
+
+    def __init__(self, model_type='flash', base_url=None, image_encoder=None, cache=None,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, rate_limiter=None, retry_policy=None):
+        """
+        初始化异步Gemini客户端
+
+        Args:
+            model_type (str): 使用的模型类型 ('flash' 或 'pro')
+            base_url (str): 可选的基础URL，用于指定代理服务器
+            image_encoder (ImageEncoder): 可选的图像编码器，用于在上传前缩放/重新编码页面图像
+            cache (ResponseCache): 可选的响应缓存
+            max_concurrency (int): 同时进行的请求数上限
+            connect_timeout (float): 建立连接的超时（秒）
+            read_timeout (float): 等待响应的超时（秒）
+            rate_limiter (RateLimiter): 可选的限流器，控制并发数和每分钟请求数/token数
+            retry_policy (RetryPolicy): 可选的重试策略，可以与同步客户端共用
+        """
+        api_key = os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("请设置GEMINI_API_KEY环境变量")
+
+        client_options = {
+            'cache': cache,
+            'max_concurrency': max_concurrency,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'rate_limiter': rate_limiter,
+        }
+        if base_url:
+            self.client = AsyncMiniGenAI(api_key, base_url, **client_options)
+        else:
+            self.client = AsyncMiniGenAI(api_key, **client_options)
+        self.cache = cache
+        self.model_name = 'gemini-2.5-pro' if model_type == 'pro' else 'gemini-2.5-flash'
+        self.image_encoder = image_encoder or ImageEncoder()
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """关闭连接池"""
+        await self.client.close()
+
+    async def build_image_part(self, image_path):
+        """
+        构造请求中的图像部分，缩放/重新编码在线程中进行，不阻塞事件循环
+
+        Args:
+            image_path: 图像文件路径，或带有data/mime_type属性的内存图像（PageImage）
+
+        Returns:
+            dict: inline_data 请求片段
+        """
+        image_data, mime_type = await asyncio.to_thread(self.image_encoder.encode, image_path)
+        return {
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": base64.b64encode(image_data).decode('utf-8')
+            }
+        }
+
+    async def extract_text(self, image_path, max_retries=3):
+        """
+        从图像中提取文本
+
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+
+        Returns:
+            str: 提取的文本内容
+        """
+        response = await self._generate_with_retries(TEXT_PROMPT, image_path, None, max_retries, "文本提取失败")
+        return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+    async def is_table_of_contents_page(self, image_path, max_retries=3):
+        """
+        检测图像是否为目录页面，检测失败时返回False
+
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+
+        Returns:
+            bool: True表示是目录页面，False表示不是
+        """
+        try:
+            return await self._generate_with_retries(TOC_PROMPT, image_path, None, max_retries, "目录页面检测失败",
+                                                     GeminiClient.parse_toc_response)
+        except RetryError as e:
+            print(f"目录页面检测失败，默认不跳过该页面: {e.last_exception}")
+            return False
+
+    async def extract_rich_structure(self, image_path, max_retries=3):
+        """
+        从图像中提取文本并识别丰富的文档结构
+
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+
+        Returns:
+            list: 包含结构化信息的字典列表
+        """
+        return await self._generate_with_retries(RICH_STRUCTURE_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                                 "结构化文本提取失败", GeminiClient.parse_json_response)
+
+    async def extract_rich_structure_with_toc(self, image_path, max_retries=3):
+        """
+        一次请求同时完成目录页面检测和富文本结构提取
+
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+
+        Returns:
+            tuple: (is_toc, blocks)，is_toc为True时blocks为空列表
+        """
+        return await self._generate_with_retries(RICH_STRUCTURE_WITH_TOC_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                                 "结构化文本提取失败", GeminiClient.parse_rich_with_toc_response)
+
+    async def extract_text_with_toc(self, image_path, max_retries=3):
+        """
+        一次请求同时完成目录页面检测和纯文本提取
+
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+
+        Returns:
+            tuple: (is_toc, text)，is_toc为True时text为空字符串
+        """
+        return await self._generate_with_retries(TEXT_WITH_TOC_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                                 "文本提取失败", GeminiClient.parse_text_with_toc_response)
+
+    async def _generate_with_retries(self, prompt, image_path, generation_config, max_retries, description,
+                                     parse=None):
+        """
+        发送一次页面识别请求并解析响应，失败时由重试策略决定是否重试
+
+        Args:
+            prompt (str): 提示词
+            image_path: 页面图像
+            generation_config (dict): 可选的生成配置
+            max_retries (int): 最多尝试的次数
+            description (str): 最终失败时的异常信息
+            parse: 可选的响应解析函数，解析失败按响应格式错误处理
+
+        Returns:
+            解析后的响应
+        """
+        # 图像只读取和编码一次，每次重试发送相同的请求内容
+        image_part = await self.build_image_part(image_path)
+        contents = [{"role": "user", "parts": [{"text": prompt}, image_part]}]
+
+        async def attempt():
+            response = await self.client.generate_content(self.model_name, contents, generation_config)
+            return parse(response) if parse else response
+
+        return await self.retry_policy.call_async(attempt, max_retries, description)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+from functools import partial
+
+import aiohttp
+
+from .response_cache import make_cache_key, is_cacheable_response
+from .rate_limiter import THROTTLE_STATUS_CODES, estimate_request_tokens, usage_token_count, parse_retry_after
+from .token_usage import GenerateResult, extract_usage
+from .minigenai import extract_response_text, extract_finish_reason
+from .http_session import RequestTimings, LatencyStats, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .errors import AsyncHTTPError
+
+
+# 默认同时进行的请求数上限
+DEFAULT_MAX_CONCURRENCY = 100
+
+# 记录时间点的aiohttp请求阶段
+TRACED_EVENTS = ('connection_create_start', 'connection_create_end', 'request_headers_sent',
+                 'request_chunk_sent', 'request_end')
+
+
+async def _mark(event, session, context, params):
+    """记录请求到达某个阶段的时间，保存在 trace_request_ctx 中"""
+    context.trace_request_ctx[event] = time.perf_counter()
+
+
+class AsyncMiniGenAI:
+    """
+    MiniGenAI的asyncio版本：基于aiohttp的keep-alive连接池，
+    一个事件循环即可同时进行数百个请求，无需为每个请求占用一个线程
+    """
+
+    def __init__(self, api_key: str, base_url: str = "https://generativelanguage.googleapis.com", cache=None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, rate_limiter=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max_concurrency
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.latency = LatencyStats()
+
+        # 同时进行的请求数上限；连接池大小与之相同，等待信号量的时间不计入请求耗时
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # aiohttp的会话需要在事件循环中创建，第一次请求时创建
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def generate_text(self, model: str, prompt: str, generation_config: dict = None):
+        """
+        调用文本生成接口
+        """
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return await self._generate(model, payload)
+
+    async def chat(self, model: str, history: list, generation_config: dict = None):
+        """
+        多轮对话
+        """
+        payload = {"contents": history}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return await self._generate(model, payload)
+
+    async def generate_content(self, model: str, contents: list, generation_config: dict = None):
+        """
+        生成内容，支持文本、图像以及 generation_config，返回值与 MiniGenAI.generate_content 相同
+        """
+        payload = {"contents": contents}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return await self._generate(model, payload)
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        """取得连接池所在的aiohttp会话，不存在时创建"""
+        if self._session is None:
+            trace_config = aiohttp.TraceConfig()
+            for event in TRACED_EVENTS:
+                getattr(trace_config, f"on_{event}").append(partial(_mark, event))
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout),
+                trace_configs=[trace_config],
+            )
+        return self._session
+
+    async def _generate(self, model: str, payload: dict):
+        """
+        发送 generateContent 请求，命中缓存时不访问网络
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = make_cache_key(model, payload)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return GenerateResult(cached, cached=True)
+
+        url = f"{self.base_url}/v1beta/models/{model}:generateContent?key={self.api_key}"
+        body = json.dumps(payload).encode("utf-8")
+        ticket = await self.rate_limiter.acquire_async(estimate_request_tokens(payload)) if self.rate_limiter else None
+        status = retry_after = tokens_used = None
+        try:
+            async with self._semaphore:
+                status, reason, headers, response_body, timings = await self._post(url, body)
+            self.latency.add(timings)
+            if status in THROTTLE_STATUS_CODES:
+                retry_after = parse_retry_after(headers, response_body)
+            if status >= 400:
+                raise AsyncHTTPError(status, reason, headers, response_body)
+            data = json.loads(response_body)
+            tokens_used = usage_token_count(data)
+        finally:
+            if ticket is not None:
+                self.rate_limiter.release(ticket, status, retry_after, tokens_used)
+
+        text = extract_response_text(data)
+        if text is None:
+            # 如果没有内容返回，或者结构不符合预期，以原始数据作为文本以供调试，仍然保留用量和finishReason
+            return GenerateResult(json.dumps(data, ensure_ascii=False), extract_usage(data), extract_finish_reason(data))
+
+        if cache_key is not None and is_cacheable_response(text, payload.get("generationConfig")):
+            self.cache.put(cache_key, text)
+        return GenerateResult(text, extract_usage(data), extract_finish_reason(data))
+
+    async def _post(self, url: str, body: bytes):
+        """
+        在池中的连接上发送POST请求
+
+        服务器可能已经关闭了空闲的keep-alive连接，这种情况下在收到任何响应之前连接就会断开，
+        此时换一个新连接重发一次。请求被取消或出错时aiohttp会关闭该连接，不会放回连接池。
+        """
+        while True:
+            timings = RequestTimings()
+            marks = {}
+            start = time.perf_counter()
+            try:
+                async with self._get_session().post(url, data=body, headers={"Content-Type": "application/json"},
+                                                    trace_request_ctx=marks) as response:
+                    response_body = await response.read()
+                return response.status, response.reason, response.headers, response_body, timings
+            except aiohttp.ServerDisconnectedError:
+                if "connection_create_start" in marks or "request_end" in marks:
+                    raise
+            finally:
+                self._record_timings(timings, marks, start)
+
+    @staticmethod
+    def _record_timings(timings, marks, start):
+        """根据各阶段的时间点计算耗时分解"""
+        timings.total = time.perf_counter() - start
+        sent = start
+        if "connection_create_start" in marks:
+            timings.reused = False
+            sent = marks.get("connection_create_end", sent)
+            timings.connect = sent - marks["connection_create_start"]
+        uploaded = marks.get("request_chunk_sent", marks.get("request_headers_sent"))
+        if uploaded is not None:
+            timings.upload = max(uploaded - sent, 0.0)
+            if "request_end" in marks:
+                timings.ttfb = marks["request_end"] - uploaded
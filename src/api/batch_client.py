@@ -0,0 +1,268 @@
+"""
+批处理API模块
+通过Gemini Batch API把整本书的页面请求作为一个异步任务提交：费用约为交互式调用的一半，
+也不受交互式请求的速率限制，代价是结果可能需要数小时（最长24小时）才返回
+"""
+
+import json
+import time
+import threading
+
+from .minigenai import extract_response_text
+from .response_cache import is_cacheable_response
+from .http_session import create_session, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .retry_policy import RetryPolicy
+
+
+# 内联提交的请求总大小上限为20MB，留出余量后超过该大小的书拆成多个任务
+BATCH_MAX_BYTES = 18 * 1024 * 1024
+
+# 查询任务状态的默认间隔（秒）
+DEFAULT_POLL_INTERVAL = 30
+
+# 任务状态
+BATCH_STATE_SUCCEEDED = 'BATCH_STATE_SUCCEEDED'
+BATCH_FINAL_STATES = (BATCH_STATE_SUCCEEDED, 'BATCH_STATE_FAILED', 'BATCH_STATE_CANCELLED', 'BATCH_STATE_EXPIRED')
+BATCH_STATE_NAMES = {
+    'BATCH_STATE_PENDING': '排队中',
+    'BATCH_STATE_RUNNING': '运行中',
+    BATCH_STATE_SUCCEEDED: '已完成',
+    'BATCH_STATE_FAILED': '失败',
+    'BATCH_STATE_CANCELLED': '已取消',
+    'BATCH_STATE_EXPIRED': '已过期',
+}
+
+
+class BatchJobError(Exception):
+    """批处理任务没有成功完成"""
+
+    def __init__(self, message: str, name: str, state: str):
+        super().__init__(message)
+        self.name = name
+        self.state = state
+
+
+def split_batches(requests: list, max_bytes: int = BATCH_MAX_BYTES) -> list:
+    """
+    按请求体大小把请求分成若干个任务
+
+    Args:
+        requests (list): [(key, payload), ...]
+        max_bytes (int): 每个任务的请求总大小上限
+
+    Returns:
+        list: 每个元素为一个任务的请求列表
+    """
+    batches, current, current_bytes = [], [], 0
+    for key, payload in requests:
+        size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        if current and current_bytes + size > max_bytes:
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append((key, payload))
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def job_state(job: dict) -> str:
+    """读取任务状态"""
+    return (job.get('metadata') or {}).get('state') or job.get('state') or 'BATCH_STATE_PENDING'
+
+
+def job_results(job: dict, keys: list = None):
+    """
+    读取已完成任务中每个请求的响应文本
+
+    Args:
+        job (dict): batches.get 返回的任务
+        keys (list): 提交时的请求键，响应中没有metadata时按顺序对应
+
+    Returns:
+        tuple: (results, errors)，results为请求键到响应文本的映射，errors为失败的请求数
+    """
+    output = (job.get('response') or {}).get('inlinedResponses') or {}
+    items = (output.get('inlinedResponses') or []) if isinstance(output, dict) else output
+    results, errors = {}, 0
+    for index, item in enumerate(items):
+        key = (item.get('metadata') or {}).get('key')
+        if key is None and keys and index < len(keys):
+            key = keys[index]
+        text = extract_response_text(item.get('response'))
+        if key is None or 'error' in item or text is None:
+            errors += 1
+            continue
+        results[key] = text
+    return results, errors
+
+
+class BatchClient:
+    def __init__(self, api_key: str, base_url: str = "https://generativelanguage.googleapis.com",
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, retry_policy=None, sleep=time.sleep):
+        """
+        初始化批处理客户端
+
+        Args:
+            api_key (str): API密钥
+            base_url (str): API的基础URL
+            poll_interval (float): 查询任务状态的间隔（秒）
+            connect_timeout (float): 建立连接的超时（秒）
+            read_timeout (float): 等待响应的超时（秒）
+            retry_policy (RetryPolicy): 提交和查询请求失败时使用的重试策略
+            sleep: 等待函数，测试时可替换
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.sleep = sleep
+        self.session = create_session(2)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.jobs_submitted = 0
+        self.requests_submitted = 0
+
+    def submit(self, model: str, requests: list, display_name: str = "pdf2epub") -> str:
+        """
+        提交一个内联请求的批处理任务
+
+        Args:
+            model (str): 模型名称
+            requests (list): [(key, payload), ...]，key会作为metadata随响应返回
+            display_name (str): 任务名称
+
+        Returns:
+            str: 任务名（如 "batches/123"），用于查询状态
+        """
+        body = {
+            "batch": {
+                "display_name": display_name,
+                "input_config": {
+                    "requests": {
+                        "requests": [{"request": payload, "metadata": {"key": key}} for key, payload in requests]
+                    }
+                }
+            }
+        }
+        url = f"{self.base_url}/v1beta/models/{model}:batchGenerateContent"
+        job = self.retry_policy.call(lambda: self._request('post', url, json=body), 5, "提交批处理任务失败")
+        with self._lock:
+            self.jobs_submitted += 1
+            self.requests_submitted += len(requests)
+        print(f"已提交批处理任务 {job['name']}，共 {len(requests)} 个请求")
+        return job['name']
+
+    def get(self, name: str) -> dict:
+        """
+        查询任务
+
+        Args:
+            name (str): 任务名
+
+        Returns:
+            dict: 任务信息，完成后包含每个请求的响应
+        """
+        url = f"{self.base_url}/v1beta/{name}"
+        return self.retry_policy.call(lambda: self._request('get', url), 5, "查询批处理任务失败")
+
+    def cancel(self, name: str):
+        """取消任务"""
+        url = f"{self.base_url}/v1beta/{name}:cancel"
+        self.retry_policy.call(lambda: self._request('post', url), 5, "取消批处理任务失败")
+
+    def wait(self, name: str, timeout: float = None) -> dict:
+        """
+        定期查询直到任务结束
+
+        Args:
+            name (str): 任务名
+            timeout (float): 最长等待秒数，None表示一直等待
+
+        Returns:
+            dict: 成功完成的任务；任务失败、取消或过期时抛出BatchJobError
+        """
+        start = time.time()
+        last_state = None
+        while True:
+            job = self.get(name)
+            state = job_state(job)
+            if state != last_state:
+                print(f"批处理任务 {name}: {BATCH_STATE_NAMES.get(state, state)}")
+                last_state = state
+            if state in BATCH_FINAL_STATES:
+                break
+            if timeout is not None and time.time() - start >= timeout:
+                raise BatchJobError(f"等待批处理任务 {name} 超时", name, state)
+            self.sleep(self.poll_interval)
+
+        if state != BATCH_STATE_SUCCEEDED:
+            raise BatchJobError(f"批处理任务 {name} {BATCH_STATE_NAMES.get(state, state)}", name, state)
+        return job
+
+    def print_summary(self):
+        """输出提交的任务数和请求数"""
+        if self.jobs_submitted:
+            print(f"批处理: 提交 {self.jobs_submitted} 个任务，共 {self.requests_submitted} 个请求")
+
+    def _request(self, method: str, url: str, **kwargs) -> dict:
+        resp = self.session.request(method, url, params={"key": self.api_key}, timeout=self.timeout, **kwargs)
+        resp.raise_for_status()
+        return resp.json()
+
+
+class PrefetchedResponses:
+    """
+    批处理取回的响应，接口与ResponseCache相同
+
+    MiniGenAI按缓存键先在这里查找，按正常流程组装章节时命中的页面不再发送交互式请求；
+    没有取回的页面仍按原来的方式请求
+    """
+
+    def __init__(self, cache=None):
+        """
+        Args:
+            cache (ResponseCache): 可选的持久响应缓存，批处理结果同时写入其中
+        """
+        self.cache = cache
+        self.responses = {}
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, text, generation_config=None) -> bool:
+        """
+        加入一个批处理响应，要求JSON却无法解析的响应不加入，之后改为交互式请求
+
+        Returns:
+            bool: 是否加入
+        """
+        if not is_cacheable_response(text, generation_config):
+            return False
+        with self._lock:
+            self.responses[key] = text
+        if self.cache is not None:
+            self.cache.put(key, text)
+        return True
+
+    def get(self, key):
+        with self._lock:
+            text = self.responses.get(key)
+            if text is not None:
+                self.used += 1
+                return text
+        return self.cache.get(key) if self.cache is not None else None
+
+    def put(self, key, value):
+        if self.cache is not None:
+            self.cache.put(key, value)
+
+    def contains(self, key):
+        return key in self.responses or (self.cache is not None and self.cache.contains(key))
+
+    def print_summary(self):
+        """输出使用批处理结果的请求数"""
+        if self.responses:
+            print(f"批处理结果: 取回 {len(self.responses)} 个响应，使用 {self.used} 次")
@@ -0,0 +1,234 @@
+"""
+上下文缓存模块
+把每页请求都相同的长提示词作为系统指令上传为Gemini上下文缓存，每页请求只引用缓存名称。
+缓存中的token按缓存价格计费，提示词也不再随每个请求上传；缓存在有效期结束前自动续期
+"""
+
+import time
+import threading
+
+import requests
+
+from .minigenai import DEFAULT_CACHE_TTL
+
+
+# 距离过期不足该秒数时续期，避免请求发出时缓存刚好过期
+REFRESH_MARGIN = 120
+
+# 引用的缓存已被删除或过期时，generateContent返回的状态码
+MISSING_CACHE_STATUS_CODES = (403, 404)
+
+# 各模型上下文缓存的最小token数（Gemini文档）；未列出的模型由服务器判断
+MIN_CACHE_TOKENS = {
+    'gemini-2.5-flash': 1024,
+    'gemini-2.5-pro': 2048,
+}
+
+
+class CachedPrompt:
+    """一个已上传的提示词"""
+
+    def __init__(self, name: str, expires: float, tokens: int):
+        self.name = name
+        self.expires = expires
+        self.tokens = tokens
+        self.uses = 0
+
+
+class ContextCache:
+    """
+    管理一个任务中各个提示词的上下文缓存，线程安全
+
+    提示词的token数（countTokens）达不到模型的最小缓存大小时不创建缓存，直接随请求发送；
+    服务器仍返回400时同样处理。创建和续期请求不持有锁，进行期间其他线程不必等待
+    """
+
+    def __init__(self, client, model: str, ttl: float = DEFAULT_CACHE_TTL, refresh_margin: float = REFRESH_MARGIN,
+                 clock=time.time, min_tokens: dict = None):
+        """
+        初始化上下文缓存
+
+        Args:
+            client (MiniGenAI): 用于创建、续期和删除缓存的客户端
+            model (str): 默认的模型名称，缓存只能被同一模型使用
+            ttl (float): 每次创建或续期的有效期（秒）
+            refresh_margin (float): 距离过期不足该秒数时续期
+            clock: 返回当前时间的函数，测试时可替换
+            min_tokens (dict): 模型名称到最小缓存token数的映射，默认使用 MIN_CACHE_TOKENS
+        """
+        self.client = client
+        self.model = model
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.clock = clock
+        self.min_tokens = MIN_CACHE_TOKENS if min_tokens is None else min_tokens
+        self._prompts = {}
+        # 缓存名称到CachedPrompt，请求成功后按名称统计
+        self._by_name = {}
+        self._uncacheable = set()
+        # 各提示词的token数，每个提示词只计算一次
+        self._token_counts = {}
+        # 正在创建或续期缓存的提示词
+        self._pending = set()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.created = 0
+        self.refreshed = 0
+        self.uses = 0
+        self.saved_tokens = 0
+
+    def handle(self, prompt: str, model: str = None):
+        """
+        取得提示词的缓存名称，需要时创建或续期
+
+        Args:
+            prompt (str): 提示词
+            model (str): 使用缓存的模型，默认为初始化时的模型
+
+        Returns:
+            str或None: 缓存名称；该提示词无法缓存时返回None，调用方应直接发送提示词
+        """
+        key = (model or self.model, prompt)
+        with self._lock:
+            if key in self._uncacheable:
+                return None
+            cached = self._prompts.get(key)
+            now = self.clock()
+            if key in self._pending or (cached is not None and now < cached.expires - self.refresh_margin):
+                # 其他线程正在创建时本次随请求发送提示词；正在续期时旧缓存在refresh_margin内仍然有效
+                return cached.name if cached is not None else None
+            self._pending.add(key)
+        try:
+            if cached is not None:
+                cached = self._refresh(key, cached, now)
+            if cached is None:
+                cached = self._create(key, now)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        return cached.name if cached is not None else None
+
+    def check(self, prompts, model: str = None):
+        """
+        预先检查提示词能否缓存，达不到最小缓存大小的提示词之后直接随请求发送
+
+        Args:
+            prompts (list): 任务中使用的提示词
+            model (str): 使用缓存的模型，默认为初始化时的模型
+
+        Returns:
+            list: 可以缓存（或无法得知token数、由服务器判断）的提示词
+        """
+        return [prompt for prompt in prompts if not self._too_small((model or self.model, prompt))]
+
+    def record_use(self, name: str):
+        """
+        引用缓存的请求成功后记录一次使用和少上传的token数
+
+        Args:
+            name (str): handle() 返回的缓存名称
+        """
+        with self._lock:
+            cached = self._by_name.get(name)
+            if cached is None:
+                return
+            cached.uses += 1
+            self.uses += 1
+            self.saved_tokens += cached.tokens
+
+    def invalidate(self, prompt: str, model: str = None):
+        """服务器上的缓存已不存在（如被删除），下次调用handle()时重新创建"""
+        with self._lock:
+            self._prompts.pop((model or self.model, prompt), None)
+
+    def close(self):
+        """删除本任务创建的缓存"""
+        with self._lock:
+            prompts, self._prompts = self._prompts, {}
+            self._by_name = {}
+        for cached in prompts.values():
+            try:
+                self.client.delete_cached_content(cached.name)
+            except requests.RequestException as e:
+                print(f"删除上下文缓存 {cached.name} 失败（到期后自动删除）: {e}")
+
+    def print_summary(self):
+        """输出缓存的创建、续期次数和节省的输入token数"""
+        if not self.created:
+            return
+        print(f"上下文缓存: 创建 {self.created} 次，续期 {self.refreshed} 次，{self.uses} 次请求引用缓存的提示词，"
+              f"少上传约 {self.saved_tokens} 个输入token（按缓存价格计费）")
+
+    def _too_small(self, key):
+        """
+        提示词的token数是否达不到模型的最小缓存大小，达不到时记为无法缓存
+
+        Returns:
+            bool: 达不到时为True；模型没有最小缓存大小或无法计算token数时为False，由服务器判断
+        """
+        model, prompt = key
+        minimum = self.min_tokens.get(model, 0)
+        if not minimum:
+            return False
+        with self._lock:
+            tokens = self._token_counts.get(key)
+        if tokens is None:
+            try:
+                tokens = self.client.count_tokens(model, [{"parts": [{"text": prompt}]}])
+            except requests.RequestException as e:
+                print(f"计算提示词的token数失败，由服务器判断能否缓存: {e}")
+                return False
+            with self._lock:
+                self._token_counts[key] = tokens
+        if tokens >= minimum:
+            return False
+        with self._lock:
+            if key not in self._uncacheable:
+                self._uncacheable.add(key)
+                print(f"提示词只有 {tokens} 个token，少于 {model} 上下文缓存的最小大小 {minimum}，改为随请求发送")
+        return True
+
+    def _create(self, key, now):
+        model, prompt = key
+        if self._too_small(key):
+            return None
+        try:
+            result = self.client.create_cached_content(model, system_instruction=prompt, ttl=self.ttl,
+                                                       display_name="pdf2epub prompt")
+        except requests.HTTPError as e:
+            # 400通常表示内容少于模型的最小缓存token数，之后不再尝试
+            if e.response is not None and e.response.status_code == 400:
+                print(f"提示词无法使用上下文缓存，改为随请求发送: {e}")
+                with self._lock:
+                    self._uncacheable.add(key)
+            else:
+                print(f"创建上下文缓存失败，本次随请求发送提示词: {e}")
+            return None
+        except requests.RequestException as e:
+            print(f"创建上下文缓存失败，本次随请求发送提示词: {e}")
+            return None
+
+        tokens = (result.get("usageMetadata") or {}).get("totalTokenCount") or self._token_counts.get(key, 0)
+        cached = CachedPrompt(result["name"], now + self.ttl, tokens)
+        with self._lock:
+            self._prompts[key] = cached
+            self._by_name[cached.name] = cached
+            self.created += 1
+        print(f"已创建上下文缓存 {cached.name}（{tokens} 个token，有效期 {int(self.ttl)} 秒）")
+        return cached
+
+    def _refresh(self, key, cached, now):
+        try:
+            self.client.update_cached_content(cached.name, self.ttl)
+        except requests.RequestException as e:
+            # 缓存已经过期或被删除，重新创建
+            print(f"上下文缓存 {cached.name} 续期失败，重新创建: {e}")
+            with self._lock:
+                if self._prompts.get(key) is cached:
+                    del self._prompts[key]
+            return None
+        with self._lock:
+            cached.expires = now + self.ttl
+            self.refreshed += 1
+        return cached
@@ -0,0 +1,232 @@
+"""
+端点池模块
+一次转换可以同时使用多个 (API密钥, 基础URL) 端点，按加权轮询或最少未完成请求分配页面请求：
+吞吐量不再受单个密钥的配额和单个代理的处理能力限制。连续返回5xx/429或连接失败的端点暂停一段时间，
+到期后先试一个请求，成功才恢复正常分配
+"""
+
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+from .rate_limiter import THROTTLE_STATUS_CODES
+
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# 分配策略
+STRATEGIES = ('least-outstanding', 'round-robin')
+
+# 连续失败达到该次数时暂停端点
+DEFAULT_EJECT_AFTER = 3
+
+# 暂停的秒数
+DEFAULT_EJECT_SECONDS = 30.0
+
+
+def is_endpoint_failure(status):
+    """
+    判断一次请求的结果是否说明端点不健康
+
+    Args:
+        status (int): HTTP状态码，连接失败、超时等没有收到响应时为None
+
+    Returns:
+        bool: 限流、5xx或没有收到响应时返回True；其他4xx是请求本身的问题，不计入
+    """
+    if status is None or status in THROTTLE_STATUS_CODES:
+        return True
+    return isinstance(status, int) and status >= 500
+
+
+class Endpoint:
+    """一个 (API密钥, 基础URL) 端点及其健康状态和统计信息"""
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL, weight: float = 1.0):
+        """
+        初始化端点
+
+        Args:
+            api_key (str): API密钥
+            base_url (str): API的基础URL
+            weight (float): 权重，权重越大分到的请求越多
+        """
+        if weight <= 0:
+            raise ValueError(f"端点权重必须大于0: {weight}")
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.weight = weight
+
+        # 调度状态
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.current_weight = 0.0
+
+        # 统计信息
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.latency = 0.0
+
+    @property
+    def label(self):
+        """用于输出的名称：主机名和密钥的最后4位"""
+        return f"{urlsplit(self.base_url).netloc or self.base_url}(…{self.api_key[-4:]})"
+
+    def __repr__(self):
+        return f"Endpoint({self.label}, weight={self.weight})"
+
+
+class EndpointPool:
+    """
+    在多个端点之间分配请求，线程安全
+
+    只有一个端点时行为与直接使用该端点相同（暂停期间仍然使用它）
+    """
+
+    def __init__(self, endpoints, strategy: str = 'least-outstanding', eject_after: int = DEFAULT_EJECT_AFTER,
+                 eject_seconds: float = DEFAULT_EJECT_SECONDS, clock=time.monotonic):
+        """
+        初始化端点池
+
+        Args:
+            endpoints (list): Endpoint列表
+            strategy (str): 'least-outstanding'（未完成请求数/权重最小的端点）或 'round-robin'（平滑加权轮询）
+            eject_after (int): 连续失败多少次后暂停端点
+            eject_seconds (float): 暂停的秒数
+            clock: 返回当前时间的函数，测试时可替换
+        """
+        if not endpoints:
+            raise ValueError("端点池至少需要一个端点")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的分配策略: {strategy}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+
+    @property
+    def primary(self):
+        """第一个端点，用于上下文缓存、批处理等不分配的请求"""
+        return self.endpoints[0]
+
+    def acquire(self, endpoint: Endpoint = None, avoid: Endpoint = None) -> Endpoint:
+        """
+        选择处理下一个请求的端点，请求完成后必须调用 release()
+
+        Args:
+            endpoint (Endpoint): 指定端点时直接使用（如上下文缓存只能在创建它的端点上引用）
+            avoid (Endpoint): 有其他可用端点时不选择该端点（如对冲请求避开原请求所在的端点）
+
+        Returns:
+            Endpoint: 选中的端点
+        """
+        with self._lock:
+            if endpoint is None:
+                endpoint = self._select(self.clock(), avoid)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, status=None, elapsed: float = None, cancelled: bool = False):
+        """
+        记录请求结果，连续失败达到 eject_after 次时暂停端点
+
+        Args:
+            endpoint (Endpoint): acquire() 返回的端点
+            status (int): HTTP状态码，没有收到响应时为None
+            elapsed (float): 请求耗时（秒），请求成功时记入端点的延迟统计
+            cancelled (bool): 请求被主动中断（如对冲请求中落后的一个），不说明端点不健康
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+            if cancelled:
+                return
+            if not is_endpoint_failure(status):
+                endpoint.consecutive_failures = 0
+                if elapsed is not None:
+                    endpoint.latency += elapsed
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            # 暂停到期后的第一个请求仍然失败时立即再次暂停
+            if endpoint.consecutive_failures >= self.eject_after and len(self.endpoints) > 1:
+                now = self.clock()
+                if endpoint.ejected_until <= now:
+                    endpoint.ejections += 1
+                    print(f"端点 {endpoint.label} 连续失败 {endpoint.consecutive_failures} 次，"
+                          f"暂停 {self.eject_seconds:.0f} 秒")
+                endpoint.ejected_until = now + self.eject_seconds
+
+    def print_summary(self):
+        """输出各端点的请求数、失败次数、暂停次数和平均耗时"""
+        if len(self.endpoints) < 2:
+            return
+        print("端点统计:")
+        for endpoint in self.endpoints:
+            succeeded = endpoint.requests - endpoint.failures
+            average = f"{endpoint.latency / succeeded:.2f}s" if succeeded else "-"
+            print(f"  {endpoint.label}: {endpoint.requests} 次请求，失败 {endpoint.failures} 次，"
+                  f"暂停 {endpoint.ejections} 次，平均耗时 {average}")
+
+    def _select(self, now, avoid=None):
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+        if avoid is not None and len(healthy) > 1:
+            healthy = [endpoint for endpoint in healthy if endpoint is not avoid] or healthy
+        if not healthy:
+            # 全部暂停时使用最早恢复的端点，不让请求停下来
+            return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+
+        if self.strategy == 'round-robin':
+            # 平滑加权轮询：每轮按权重增加，选中后减去总权重，权重大的端点分到的请求均匀分散
+            total = sum(endpoint.weight for endpoint in healthy)
+            for endpoint in healthy:
+                endpoint.current_weight += endpoint.weight
+            chosen = max(healthy, key=lambda endpoint: endpoint.current_weight)
+            chosen.current_weight -= total
+            return chosen
+
+        # 最少未完成请求：负载相同时轮流选择，避免总是落在第一个端点
+        self._next += 1
+        count = len(healthy)
+        return min((healthy[(self._next + offset) % count] for offset in range(count)),
+                   key=lambda endpoint: endpoint.in_flight / endpoint.weight)
+
+
+def load_endpoints(path: str, default_api_key: str = None):
+    """
+    从JSON文件读取端点列表
+
+    文件内容为数组，每项可包含 base_url、api_key 或 api_key_env（从该环境变量读取密钥）以及 weight；
+    没有指定密钥时使用 default_api_key，没有指定基础URL时使用官方地址
+
+    Args:
+        path (str): JSON文件路径
+        default_api_key (str): 默认的API密钥
+
+    Returns:
+        list: Endpoint列表
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"端点文件应为非空数组: {path}")
+
+    endpoints = []
+    for index, item in enumerate(items, 1):
+        api_key = item.get('api_key')
+        if not api_key and item.get('api_key_env'):
+            api_key = os.environ.get(item['api_key_env'])
+            if not api_key:
+                raise ValueError(f"第 {index} 个端点的环境变量 {item['api_key_env']} 没有设置")
+        api_key = api_key or default_api_key
+        if not api_key:
+            raise ValueError(f"第 {index} 个端点没有API密钥")
+        endpoints.append(Endpoint(api_key, item.get('base_url') or DEFAULT_BASE_URL, float(item.get('weight', 1))))
+    return endpoints
@@ -0,0 +1,15 @@
+"""
+错误类型模块
+模型调用各层共用的异常，传输实现和重试策略都从这里导入，互不依赖
+"""
+
+
+class AsyncHTTPError(Exception):
+    """服务器返回4xx/5xx状态码"""
+
+    def __init__(self, status: int, reason: str, headers: dict, body: bytes):
+        super().__init__(f"{status} {reason}: {body[:200].decode('utf-8', 'replace')}")
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
@@ -9,43 +9,384 @@ import base64
 import json
 import time
 import sys
-from .minigenai import MiniGenAI
+import threading
+from functools import partial
+import requests
+from .minigenai import MiniGenAI, build_payload, DEFAULT_STALL_TIMEOUT
+from .json_stream import JsonArrayStream
+from .context_cache import ContextCache, MISSING_CACHE_STATUS_CODES
+from .model_cascade import ModelCascade, ESCALATION_REASONS
+from .token_usage import page_number
+from .response_cache import make_cache_key
+from .request_body import PreparedContents
+from .http_session import DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from .image_encoder import ImageEncoder
+from .retry_policy import RetryPolicy, RetryError
+
+
+# 目录页面的判断特征
+TOC_CRITERIA = """
+目录页面的特征包括：
+1. 标题包含"目录"、"Contents"、"Table of Contents"等字样
+2. 页面包含多个条目，每个条目后面有页码
+3. 有明显的层级结构（章节编号、缩进等）
+4. 页面主要由标题和页码组成，而非完整的段落文本
+""".strip()
+
+# 富文本模式内容块的JSON格式说明
+RICH_BLOCK_FORMAT = """
+每个对象应包含以下字段：
+- "type": 元素类型，可选值为 "heading" (标题) 或 "paragraph" (段落)。
+- "level": 如果类型是 "heading"，此字段表示标题级别（例如：1, 2, 3）。
+- "style": 一个包含样式信息的对象，目前只需支持 "align" 字段，可选值为 "center", "left", "right"。
+- "content": 元素的纯文本内容。请将段落内视觉上的换行合并。
+
+例如，一个居中的大标题和随后的段落应转换为：
+[
+    {
+        "type": "heading",
+        "level": 1,
+        "style": { "align": "center" },
+        "content": "译者序"
+    },
+    {
+        "type": "paragraph",
+        "level": 0,
+        "style": { "align": "left" },
+        "content": "本书系美国研究中国问题专家兼著名记者弗克斯·巴特菲尔德关于中国当代社会生活的专著，重点放在饱经10年浩劫的70年代末和80年代初。"
+    }
+]
+""".strip()
+
+# 纯文本模式的文本整理规则
+TEXT_RULES = """
+1. 将同一个段落内因排版而断开的行合并成一个连续的段落。不要保留图片中句子中间的视觉换行。
+2. 段落与段落之间用一个双换行符（一个空行）分隔。
+3. 如果有明显的章节或分节标题，请在标题前使用'## '（井号后有一个空格）进行标记。
+""".strip()
+
+TEXT_PROMPT = f"""
+请准确提取这张图片中的所有文本内容，并将其整理成流畅的文本。
+请遵循以下规则：
+{TEXT_RULES}
+4. 只返回提取和整理后的文本内容，不要添加任何额外的注释或说明。
+""".strip()
+
+TEXT_WITH_STRUCTURE_PROMPT = """
+请准确提取这张图片中的所有文本内容，并识别文档结构。
+返回JSON格式的结果，包含以下字段：
+- text: 完整的文本内容
+- titles: 标题列表（如果有）
+- paragraphs: 段落数量
+
+保持原有的排版格式，段落之间用双换行符分隔，段落内保持原有的单行换行。
+""".strip()
+
+TOC_PROMPT = f"""
+请分析这张图片，判断它是否为目录页面（Table of Contents）。
+{TOC_CRITERIA}
+
+请只返回"true"或"false"：
+- 如果是目录页面，返回"true"
+- 如果不是目录页面，返回"false"
+""".strip()
+
+RICH_STRUCTURE_PROMPT = f"""
+请详细分析这张图片的版面布局和文本内容。
+将所有识别到的内容转换成一个JSON数组，每个JSON对象代表一个内容块（如标题或段落）。
+{RICH_BLOCK_FORMAT}
+请严格按照此JSON格式返回结果，不要添加任何其他说明文字。
+""".strip()
+
+# 合并目录检测与内容提取的提示词，一次请求同时返回目录判断和识别结果
+RICH_STRUCTURE_WITH_TOC_PROMPT = f"""
+请先判断这张图片是否为目录页面（Table of Contents），再详细分析它的版面布局和文本内容。
+{TOC_CRITERIA}
+
+返回一个JSON对象，包含以下字段：
+- "is_toc": 布尔值，是目录页面时为 true，否则为 false。
+- "blocks": 内容块数组。如果是目录页面，返回空数组；否则将所有识别到的内容转换成内容块，每个内容块代表一个标题或段落。
+
+{RICH_BLOCK_FORMAT}
+请严格按照 {{"is_toc": ..., "blocks": [...]}} 的JSON格式返回结果，不要添加任何其他说明文字。
+""".strip()
+
+TEXT_WITH_TOC_PROMPT = f"""
+请先判断这张图片是否为目录页面（Table of Contents），再准确提取其中的所有文本内容。
+{TOC_CRITERIA}
+
+返回一个JSON对象，包含以下字段：
+- "is_toc": 布尔值，是目录页面时为 true，否则为 false。
+- "text": 如果是目录页面，返回空字符串；否则为提取并整理后的文本。
+
+整理文本时请遵循以下规则：
+{TEXT_RULES}
+请严格按照 {{"is_toc": ..., "text": "..."}} 的JSON格式返回结果，不要添加任何其他说明文字。
+""".strip()
+
+# 一次请求识别多张连续页面时的提示词，每张图像前会附上编号
+MULTI_PAGE_RICH_PROMPT = f"""
+下面依次给出若干张连续的书页图像，每张图像前标注了它的编号（从1开始）。
+请逐张判断是否为目录页面（Table of Contents），并分别分析每张图像的版面布局和文本内容。各页单独识别，不要把一页的内容合并到另一页。
+{TOC_CRITERIA}
+
+返回一个JSON对象，其中 "pages" 数组为每张图像包含一个对象，字段如下：
+- "page": 图像编号（整数，从1开始）。
+- "is_toc": 布尔值，是目录页面时为 true，否则为 false。
+- "blocks": 该页的内容块数组。如果是目录页面，返回空数组。
+
+{RICH_BLOCK_FORMAT}
+请严格按照 {{"pages": [{{"page": 1, "is_toc": ..., "blocks": [...]}}, ...]}} 的JSON格式返回结果，不要添加任何其他说明文字。
+""".strip()
+
+MULTI_PAGE_TEXT_PROMPT = f"""
+下面依次给出若干张连续的书页图像，每张图像前标注了它的编号（从1开始）。
+请逐张判断是否为目录页面（Table of Contents），并分别准确提取每张图像中的所有文本内容。各页单独提取，不要把一页的内容合并到另一页。
+{TOC_CRITERIA}
+
+返回一个JSON对象，其中 "pages" 数组为每张图像包含一个对象，字段如下：
+- "page": 图像编号（整数，从1开始）。
+- "is_toc": 布尔值，是目录页面时为 true，否则为 false。
+- "text": 如果是目录页面，返回空字符串；否则为该页提取并整理后的文本。
+
+整理文本时请遵循以下规则：
+{TEXT_RULES}
+请严格按照 {{"pages": [{{"page": 1, "is_toc": ..., "text": "..."}}, ...]}} 的JSON格式返回结果，不要添加任何其他说明文字。
+""".strip()
+
+# 要求模型直接返回JSON的生成配置
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+# 富文本内容块的响应schema
+BLOCK_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING", "enum": ["heading", "paragraph"]},
+        "level": {"type": "INTEGER"},
+        "style": {"type": "OBJECT", "properties": {"align": {"type": "STRING", "enum": ["center", "left", "right"]}}},
+        "content": {"type": "STRING"},
+    },
+    "required": ["type", "content"],
+}
+
+
+def multi_page_config(content_field, content_schema):
+    """
+    多页请求的生成配置：响应按图像编号给出每页的结果
+
+    Args:
+        content_field (str): 每页识别结果的字段名
+        content_schema (dict): 该字段的schema
+
+    Returns:
+        dict: generation_config
+    """
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": {
+            "type": "OBJECT",
+            "properties": {
+                "pages": {
+                    "type": "ARRAY",
+                    "items": {
+                        "type": "OBJECT",
+                        "properties": {
+                            "page": {"type": "INTEGER"},
+                            "is_toc": {"type": "BOOLEAN"},
+                            content_field: content_schema,
+                        },
+                        "required": ["page", "is_toc", content_field],
+                    },
+                },
+            },
+            "required": ["pages"],
+        },
+    }
+
+
+MULTI_PAGE_RICH_CONFIG = multi_page_config("blocks", {"type": "ARRAY", "items": BLOCK_SCHEMA})
+MULTI_PAGE_TEXT_CONFIG = multi_page_config("text", {"type": "STRING"})
+
+# 单页请求使用的提示词和生成配置：(处理模式, 是否同时检测目录页面) -> (prompt, generation_config)
+PAGE_REQUESTS = {
+    ('rich', True): (RICH_STRUCTURE_WITH_TOC_PROMPT, JSON_CONFIG),
+    ('rich', False): (RICH_STRUCTURE_PROMPT, JSON_CONFIG),
+    ('simple', True): (TEXT_WITH_TOC_PROMPT, JSON_CONFIG),
+    ('simple', False): (TEXT_PROMPT, None),
+}
+
+
+def request_prompts(mode, separate_toc_check=False, pages_per_request=1):
+    """
+    一个任务的页面请求使用的提示词
+
+    Args:
+        mode (str): 处理模式 ('rich' 或 'simple')
+        separate_toc_check (bool): 目录页面检测是否单独发送请求
+        pages_per_request (int): 每次请求识别的页数
+
+    Returns:
+        list: 提示词
+    """
+    if pages_per_request > 1:
+        return [MULTI_PAGE_RICH_PROMPT if mode == 'rich' else MULTI_PAGE_TEXT_PROMPT]
+    prompts = [PAGE_REQUESTS[(mode, not separate_toc_check)][0]]
+    if separate_toc_check:
+        prompts.append(TOC_PROMPT)
+    return prompts
 
 
 class GeminiClient:
-    def __init__(self, model_type='flash', base_url=None):
+    def __init__(self, model_type='flash', base_url=None, image_encoder=None, cache=None,
+                 pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, rate_limiter=None, retry_policy=None, context_cache_ttl=None,
+                 stream=False, stall_timeout=DEFAULT_STALL_TIMEOUT, line_counter=None, endpoints=None, hedge=None,
+                 usage=None):
         """
         初始化Gemini客户端
         
         Args:
-            model_type (str): 使用的模型类型 ('flash' 或 'pro')
+            model_type (str): 使用的模型类型 ('flash'、'pro' 或 'cascade'，cascade先用flash，结果没有通过检查的页面改用pro)
             base_url (str): 可选的基础URL，用于指定代理服务器
+            image_encoder (ImageEncoder): 可选的图像编码器，用于在上传前缩放/重新编码页面图像
+            cache (ResponseCache): 可选的响应缓存，相同图像和提示词的请求直接使用缓存结果
+            pool_size (int): HTTP连接池大小
+            connect_timeout (float): 建立连接的超时（秒）
+            read_timeout (float): 等待响应的超时（秒）
+            rate_limiter (RateLimiter): 可选的限流器，控制并发数和每分钟请求数/token数
+            retry_policy (RetryPolicy): 可选的重试策略，默认使用指数退避
+            context_cache_ttl (float): 设置时把提示词上传为上下文缓存，每页请求只引用缓存，值为缓存的有效期（秒）
+            stream (bool): 是否使用流式接口，边生成边解析，停滞的响应提前中断
+            stall_timeout (float): 流式响应超过该秒数没有新数据时中断并按超时重试
+            line_counter: 可选，根据页面图像返回文字行数的函数，cascade模式下用来发现识别结果过短的页面
+            endpoints (EndpointPool): 可选的端点池，页面请求分配到多个 (API密钥, 基础URL) 端点，
+                                      指定时忽略base_url和GEMINI_API_KEY
+            hedge (HedgePolicy): 可选的对冲策略，请求超过最近延迟的百分位数仍未返回时再发送一个相同的请求
+            usage (TokenUsage): 可选的token用量统计，每次请求（包括重试）的用量按调用类型和模型累计
         """
-        api_key = os.environ.get('GEMINI_API_KEY')
+        api_key = endpoints.primary.api_key if endpoints else os.environ.get('GEMINI_API_KEY')
         if not api_key:
             raise ValueError("请设置GEMINI_API_KEY环境变量")
         
         # 初始化MiniGenAI客户端
-        self.client = MiniGenAI(api_key, base_url) if base_url else MiniGenAI(api_key)
+        client_options = {
+            'cache': cache,
+            'pool_size': pool_size,
+            'connect_timeout': connect_timeout,
+            'read_timeout': read_timeout,
+            'rate_limiter': rate_limiter,
+            'endpoints': endpoints,
+            'hedge': hedge,
+            'usage': usage,
+        }
+        if base_url:
+            self.client = MiniGenAI(api_key, base_url, **client_options)
+        else:
+            self.client = MiniGenAI(api_key, **client_options)
+        self.cache = cache
         
         # 选择模型
         if model_type == 'pro':
             self.model_name = 'gemini-2.5-pro'
         else:
             self.model_name = 'gemini-2.5-flash'
+        # 级联模式：每页先用flash，结果没有通过检查时改用pro
+        self.cascade = None
+        if model_type == 'cascade':
+            self.cascade = ModelCascade(self.model_name, 'gemini-2.5-pro', line_counter=line_counter)
+        
+        # 默认保持原始图像字节，只根据数据判断MIME类型
+        self.image_encoder = image_encoder or ImageEncoder()
+        # 所有请求共用的重试策略，统计整个任务的重试次数
+        self.retry_policy = retry_policy or RetryPolicy()
+        
+        # 可选的上下文缓存：固定的长提示词只上传一次
+        self.context_cache = None
+        if context_cache_ttl:
+            self.context_cache = ContextCache(self.client, self.model_name, ttl=context_cache_ttl)
+        
+        # 流式请求：富文本内容块边生成边解析
+        self.stream = stream
+        self.stall_timeout = stall_timeout
+        
+        # 可选的token用量统计
+        self.usage = usage
+        
+        # 多页请求的统计信息
+        self.multi_page_requests = 0
+        self.multi_page_pages = 0
+        self.multi_page_fallbacks = 0
+        self._lock = threading.Lock()
     
     def encode_image(self, image_path):
         """
         将图像编码为base64
         
         Args:
-            image_path (str): 图像文件路径
+            image_path: 图像文件路径，或带有data/mime_type属性的内存图像（PageImage）
             
         Returns:
             str: base64编码的图像数据
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return self.build_image_part(image_path)["inline_data"]["data"]
+    
+    def build_image_part(self, image_path, raw=False):
+        """
+        构造请求中的图像部分，图像先经过编码器缩放/重新编码
+        
+        Args:
+            image_path: 图像文件路径，或带有data/mime_type属性的内存图像（PageImage）
+            raw (bool): 为True时data为base64字节，由MiniGenAI直接拼接进请求体，不再解码为字符串
+            
+        Returns:
+            dict: inline_data 请求片段，mime_type 与实际图像数据一致
+        """
+        image_data, mime_type = self.image_encoder.encode(image_path)
+        data = base64.b64encode(image_data)
+        return {
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": data if raw else data.decode('utf-8')
+            }
+        }
+    
+    def build_contents(self, prompt, image_path, raw=False):
+        """
+        构造页面识别请求的contents
+        
+        Args:
+            prompt (str): 提示词，None表示提示词已在上下文缓存中
+            image_path: 页面图像；为列表时按顺序附上编号后放入同一个请求
+            raw (bool): 为True时返回PreparedContents，请求体只序列化一次，重试时复用
+            
+        Returns:
+            list: generateContent 请求的contents
+        """
+        parts = [{"text": prompt}] if prompt is not None else []
+        if isinstance(image_path, list):
+            for number, image in enumerate(image_path, 1):
+                parts.append({"text": f"图像 {number}:"})
+                parts.append(self.build_image_part(image, raw))
+        else:
+            parts.append(self.build_image_part(image_path, raw))
+        contents = [{"role": "user", "parts": parts}]
+        return PreparedContents(contents) if raw else contents
+    
+    def build_page_request(self, image_path, mode, check_toc=True):
+        """
+        构造与单页提取方法完全相同的请求体，用于批处理提交
+        
+        Args:
+            image_path: 页面图像
+            mode (str): 处理模式 ('rich' 或 'simple')
+            check_toc (bool): 是否同时检测目录页面（对应 *_with_toc 方法）
+            
+        Returns:
+            tuple: (缓存键, 请求体, generation_config)，缓存键与交互式请求的缓存键相同
+        """
+        prompt, generation_config = PAGE_REQUESTS[(mode, check_toc)]
+        payload = build_payload(self.build_contents(prompt, image_path), generation_config)
+        return make_cache_key(self.model_name, payload), payload, generation_config
     
     def extract_text(self, image_path, max_retries=3):
         """
@@ -53,60 +394,13 @@ class GeminiClient:
         
         Args:
             image_path (str): 图像文件路径
-            max_retries (int): 最大重试次数
+            max_retries (int): 最多尝试的次数
             
         Returns:
             str: 提取的文本内容
         """
-        last_exception = None
-        
-        for attempt in range(max_retries):
-            try:
-                # 构造提示词
-                prompt = """
-                请准确提取这张图片中的所有文本内容，并将其整理成流畅的文本。
-                请遵循以下规则：
-                1. 将同一个段落内因排版而断开的行合并成一个连续的段落。不要保留图片中句子中间的视觉换行。
-                2. 段落与段落之间用一个双换行符（一个空行）分隔。
-                3. 如果有明显的章节或分节标题，请在标题前使用'## '（井号后有一个空格）进行标记。
-                4. 只返回提取和整理后的文本内容，不要添加任何额外的注释或说明。
-                """.strip()
-                
-                # 将图像转换为base64
-                image_base64 = self.encode_image(image_path)
-                
-                # 构造包含图像的内容
-                contents = [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt},
-                            {
-                                "inline_data": {
-                                    "mime_type": "image/png",
-                                    "data": image_base64
-                                }
-                            }
-                        ]
-                    }
-                ]
-                
-                # 调用模型
-                response = self.client.generate_content(self.model_name, contents)
-                
-                return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
-                
-            except Exception as e:
-                last_exception = e
-                if attempt < max_retries - 1:  # 不是最后一次尝试
-                    wait_time = 5 + attempt * 5  # 5秒, 10秒, 15秒
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-                    print(f"等待 {wait_time} 秒后进行第 {attempt + 2} 次尝试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-        
-        raise Exception(f"文本提取失败，已重试 {max_retries} 次: {last_exception}")
+        response = self._generate_with_retries(TEXT_PROMPT, image_path, None, max_retries, "文本提取失败")
+        return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
     
     def extract_text_with_structure(self, image_path, max_retries=3):
         """
@@ -114,72 +408,18 @@ class GeminiClient:
         
         Args:
             image_path (str): 图像文件路径
-            max_retries (int): 最大重试次数
+            max_retries (int): 最多尝试的次数
             
         Returns:
             dict: 包含文本和结构信息的字典
         """
-        last_exception = None
-        
-        for attempt in range(max_retries):
-            try:
-                # 构造提示词
-                prompt = """
-                请准确提取这张图片中的所有文本内容，并识别文档结构。
-                返回JSON格式的结果，包含以下字段：
-                - text: 完整的文本内容
-                - titles: 标题列表（如果有）
-                - paragraphs: 段落数量
-                
-                保持原有的排版格式，段落之间用双换行符分隔，段落内保持原有的单行换行。
-                """.strip()
-                
-                # 将图像转换为base64
-                image_base64 = self.encode_image(image_path)
-                
-                # 构造包含图像的内容
-                contents = [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt},
-                            {
-                                "inline_data": {
-                                    "mime_type": "image/png",
-                                    "data": image_base64
-                                }
-                            }
-                        ]
-                    }
-                ]
-                
-                # 调用模型
-                response = self.client.generate_content(self.model_name, contents)
-                
-                if isinstance(response, str):
-                    return {
-                        'text': response,
-                        'titles': [],
-                        'paragraphs': 0
-                    }
-                else:
-                    return {
-                        'text': json.dumps(response, ensure_ascii=False),
-                        'titles': [],
-                        'paragraphs': 0
-                    }
-                    
-            except Exception as e:
-                last_exception = e
-                if attempt < max_retries - 1:  # 不是最后一次尝试
-                    wait_time = 5 + attempt * 5  # 5秒, 10秒, 15秒
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-                    print(f"等待 {wait_time} 秒后进行第 {attempt + 2} 次尝试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-        
-        raise Exception(f"结构化文本提取失败，已重试 {max_retries} 次: {last_exception}")
+        response = self._generate_with_retries(TEXT_WITH_STRUCTURE_PROMPT, image_path, None, max_retries,
+                                               "结构化文本提取失败")
+        return {
+            'text': response if isinstance(response, str) else json.dumps(response, ensure_ascii=False),
+            'titles': [],
+            'paragraphs': 0
+        }
     
     def is_table_of_contents_page(self, image_path, max_retries=3):
         """
@@ -187,68 +427,18 @@ class GeminiClient:
         
         Args:
             image_path (str): 图像文件路径
-            max_retries (int): 最大重试次数
+            max_retries (int): 最多尝试的次数
             
         Returns:
             bool: True表示是目录页面，False表示不是
         """
-        last_exception = None
-        
-        for attempt in range(max_retries):
-            try:
-                prompt = """
-                请分析这张图片，判断它是否为目录页面（Table of Contents）。
-                目录页面的特征包括：
-                1. 标题包含"目录"、"Contents"、"Table of Contents"等字样
-                2. 页面包含多个条目，每个条目后面有页码
-                3. 有明显的层级结构（章节编号、缩进等）
-                4. 页面主要由标题和页码组成，而非完整的段落文本
-                
-                请只返回"true"或"false"：
-                - 如果是目录页面，返回"true"
-                - 如果不是目录页面，返回"false"
-                """.strip()
-                
-                image_base64 = self.encode_image(image_path)
-                
-                contents = [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt},
-                            {
-                                "inline_data": {
-                                    "mime_type": "image/png",
-                                    "data": image_base64
-                                }
-                            }
-                        ]
-                    }
-                ]
-                
-                response = self.client.generate_content(self.model_name, contents)
-                
-                # 解析响应
-                if isinstance(response, str):
-                    response_text = response.strip().lower()
-                    return response_text == "true"
-                else:
-                    response_text = str(response).strip().lower()
-                    return "true" in response_text
-                    
-            except Exception as e:
-                last_exception = e
-                if attempt < max_retries - 1:
-                    wait_time = 5 + attempt * 5
-                    print(f"目录页面检测第 {attempt + 1} 次尝试失败: {str(e)}")
-                    print(f"等待 {wait_time} 秒后进行第 {attempt + 2} 次尝试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"目录页面检测第 {attempt + 1} 次尝试失败: {str(e)}")
-        
-        # 如果检测失败，默认返回False，继续处理页面
-        print(f"目录页面检测失败，默认不跳过该页面: {last_exception}")
-        return False
+        try:
+            return self._generate_with_retries(TOC_PROMPT, image_path, None, max_retries, "目录页面检测失败",
+                                               self.parse_toc_response)
+        except RetryError as e:
+            # 如果检测失败，默认返回False，继续处理页面
+            print(f"目录页面检测失败，默认不跳过该页面: {e.last_exception}")
+            return False
     
     def extract_rich_structure(self, image_path, max_retries=3):
         """
@@ -256,141 +446,394 @@ class GeminiClient:
         
         Args:
             image_path (str): 图像文件路径
-            max_retries (int): 最大重试次数
+            max_retries (int): 最多尝试的次数
             
         Returns:
             list: 包含结构化信息的字典列表
         """
-        last_exception = None
+        return self._generate_with_retries(RICH_STRUCTURE_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                           "结构化文本提取失败", self.parse_json_response)
+    
+    def extract_rich_structure_with_toc(self, image_path, max_retries=3, on_block=None):
+        """
+        一次请求同时完成目录页面检测和富文本结构提取
         
-        for attempt in range(max_retries):
-            try:
-                # 构造新的、要求返回JSON的提示词
-                prompt = """
-                请详细分析这张图片的版面布局和文本内容。
-                将所有识别到的内容转换成一个JSON数组，每个JSON对象代表一个内容块（如标题或段落）。
-                每个对象应包含以下字段：
-                - "type": 元素类型，可选值为 "heading" (标题) 或 "paragraph" (段落)。
-                - "level": 如果类型是 "heading"，此字段表示标题级别（例如：1, 2, 3）。
-                - "style": 一个包含样式信息的对象，目前只需支持 "align" 字段，可选值为 "center", "left", "right"。
-                - "content": 元素的纯文本内容。请将段落内视觉上的换行合并。
-
-                例如，一个居中的大标题和随后的段落应转换为：
-                [
-                    {
-                        "type": "heading",
-                        "level": 1,
-                        "style": { "align": "center" },
-                        "content": "译者序"
-                    },
-                    {
-                        "type": "paragraph",
-                        "level": 0,
-                        "style": { "align": "left" },
-                        "content": "本书系美国研究中国问题专家兼著名记者弗克斯·巴特菲尔德关于中国当代社会生活的专著，重点放在饱经10年浩劫的70年代末和80年代初。"
-                    }
-                ]
-                请严格按照此JSON格式返回结果，不要添加任何其他说明文字。
-                """.strip()
-                
-                image_base64 = self.encode_image(image_path)
-                
-                contents = [
-                    {"role": "user", "parts": [{"text": prompt}, {"inline_data": {"mime_type": "image/jpeg", "data": image_base64}}]}
-                ]
-                
-                # 请求模型返回JSON
-                response = self.client.generate_content(
-                    self.model_name, 
-                    contents,
-                    generation_config={"response_mime_type": "application/json"}
-                )
-                
-                # MiniGenAI可能直接返回解析好的dict/list，如果不是则需要手动解析
-                if isinstance(response, str):
-                    # 清理可能的Markdown代码块标记
-                    response_text = response.strip().replace('```json', '').replace('```', '').strip()
-                    return json.loads(response_text)
-                return response # 假设已经是一个list或dict
-                
-            except Exception as e:
-                last_exception = e
-                # (重试逻辑保持不变)
-                if attempt < max_retries - 1:
-                    wait_time = 5 + attempt * 5
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-                    print(f"等待 {wait_time} 秒后进行第 {attempt + 2} 次尝试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-        
-        raise Exception(f"结构化文本提取失败，已重试 {max_retries} 次: {last_exception}")
+        流式模式下内容块边生成边解析，格式错误的内容块会立即中断响应
+        
+        Args:
+            image_path (str): 图像文件路径
+            max_retries (int): 最多尝试的次数
+            on_block: 可选的回调 on_block(index, block)，流式模式下每个内容块完成时调用；
+                      重试时从index 0重新开始，调用方应按index覆盖之前收到的内容块
+            
+        Returns:
+            tuple: (is_toc, blocks)，is_toc为True时blocks为空列表
+        """
+        stream_blocks = None
+        if self.stream or on_block is not None:
+            stream_blocks = partial(self._stream_blocks, on_block=on_block)
+        return self._generate_with_retries(RICH_STRUCTURE_WITH_TOC_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                           "结构化文本提取失败", self.parse_rich_with_toc_response, stream_blocks)
     
-    def is_table_of_contents_page(self, image_path, max_retries=3):
+    def extract_text_with_toc(self, image_path, max_retries=3):
         """
-        检测图像是否为目录页面
+        一次请求同时完成目录页面检测和纯文本提取
         
         Args:
             image_path (str): 图像文件路径
-            max_retries (int): 最大重试次数
+            max_retries (int): 最多尝试的次数
             
         Returns:
-            bool: True表示是目录页面，False表示不是
+            tuple: (is_toc, text)，is_toc为True时text为空字符串
         """
-        last_exception = None
+        return self._generate_with_retries(TEXT_WITH_TOC_PROMPT, image_path, JSON_CONFIG, max_retries,
+                                           "文本提取失败", self.parse_text_with_toc_response)
+    
+    def extract_rich_structure_multi(self, images, max_retries=3):
+        """
+        一次请求识别多张连续页面的目录判断和富文本结构
+        
+        响应中缺少或无法解析的页面，以及整个多页请求失败时，改为逐页重新识别
         
-        for attempt in range(max_retries):
+        Args:
+            images (list): 页面图像列表
+            max_retries (int): 最多尝试的次数
+            
+        Returns:
+            list: 与images一一对应的 (is_toc, blocks)
+        """
+        return self._extract_multi(images, MULTI_PAGE_RICH_PROMPT, MULTI_PAGE_RICH_CONFIG, 'blocks',
+                                   self.parse_rich_with_toc_response, self.extract_rich_structure_with_toc,
+                                   max_retries, "结构化文本提取失败")
+    
+    def extract_text_multi(self, images, max_retries=3):
+        """
+        一次请求识别多张连续页面的目录判断和纯文本
+        
+        Args:
+            images (list): 页面图像列表
+            max_retries (int): 最多尝试的次数
+            
+        Returns:
+            list: 与images一一对应的 (is_toc, text)
+        """
+        return self._extract_multi(images, MULTI_PAGE_TEXT_PROMPT, MULTI_PAGE_TEXT_CONFIG, 'text',
+                                   self.parse_text_with_toc_response, self.extract_text_with_toc,
+                                   max_retries, "文本提取失败")
+    
+    def print_multi_page_summary(self):
+        """输出多页请求的数量和逐页重新识别的页数"""
+        if not self.multi_page_requests:
+            return
+        print(f"多页请求: {self.multi_page_requests} 次请求共识别 {self.multi_page_pages} 页，"
+              f"逐页重新识别 {self.multi_page_fallbacks} 页")
+    
+    def _extract_multi(self, images, prompt, generation_config, content_field, parse_page, extract_single,
+                       max_retries, description):
+        """
+        发送多页请求，并对缺少或无法解析的页面逐页重新识别
+        
+        Args:
+            images (list): 页面图像列表
+            prompt (str): 多页提示词
+            generation_config (dict): 带有按页编号的响应schema的生成配置
+            content_field (str): 每页识别结果的字段名
+            parse_page: 解析单页结果的函数
+            extract_single: 逐页识别的方法
+            max_retries (int): 最多尝试的次数
+            description (str): 最终失败时的异常信息
+            
+        Returns:
+            list: 与images一一对应的单页结果
+        """
+        images = list(images)
+        if len(images) == 1:
+            return [extract_single(images[0], max_retries)]
+        
+        parse = partial(self.parse_multi_page_response, count=len(images), parse_page=parse_page,
+                        content_field=content_field)
+        try:
+            # 多页响应无法解析时逐页重新识别，不必先重试整个多页请求
+            pages, finish_reason = self._call_model(self.model_name, prompt, images, generation_config, max_retries,
+                                                    description, parse, malformed_retries=0)
+        except RetryError as e:
+            print(f"多页请求失败，{len(images)} 页改为逐页识别: {e}")
+            pages, finish_reason = {}, None
+        if self.cascade:
+            # 没有通过检查的页面逐页识别，必要时改用pro
+            pages = {index: result for index, result in pages.items()
+                     if self.cascade.check(result, finish_reason, images[index]) is None}
+        
+        missing = [index for index in range(len(images)) if index not in pages]
+        if pages and missing:
+            print(f"多页响应中缺少或无法解析第 {'、'.join(str(index + 1) for index in missing)} 张图像，逐页重新识别")
+        with self._lock:
+            self.multi_page_requests += 1
+            self.multi_page_pages += len(images)
+            self.multi_page_fallbacks += len(missing)
+        return [pages[index] if index in pages else extract_single(image, max_retries)
+                for index, image in enumerate(images)]
+    
+    def _generate_with_retries(self, prompt, image_path, generation_config, max_retries, description, parse=None,
+                               consume=None):
+        """
+        发送一次页面识别请求并解析响应，失败时由重试策略决定是否重试
+        
+        Args:
+            prompt (str): 提示词
+            image_path: 页面图像；为列表时按顺序附上编号后放入同一个请求
+            generation_config (dict): 可选的生成配置
+            max_retries (int): 最多尝试的次数
+            description (str): 最终失败时的异常信息
+            parse: 可选的响应解析函数，解析失败按响应格式错误处理
+            consume: 可选的流式处理函数，接收文本片段的迭代器，返回拼接后的完整文本；
+                     未指定时流式模式下直接拼接
+            
+        Returns:
+            解析后的响应
+        """
+        # 图像只编码一次，请求体在各次重试和级联的两个模型之间复用
+        prepared = {}
+        if self.cascade is None or isinstance(image_path, list):
+            result, _ = self._call_model(self.model_name, prompt, image_path, generation_config, max_retries,
+                                         description, parse, consume, prepared)
+            return result
+        
+        cascade = self.cascade
+        # 单独的目录检测不是该页的识别结果，只计入请求数和耗时，不计入页数
+        counts_page = prompt != TOC_PROMPT
+        start = time.time()
+        try:
+            # flash的响应无法解析时直接改用pro，不再重试flash
+            result, finish_reason = self._call_model(cascade.primary, prompt, image_path, generation_config,
+                                                     max_retries, description, parse, consume, prepared,
+                                                     malformed_retries=0)
+            reason = cascade.check(result, finish_reason, image_path)
+        except RetryError as e:
+            if e.reason != 'malformed':
+                raise
+            reason = 'malformed'
+        cascade.record(cascade.primary, time.time() - start, final=counts_page and reason is None, reason=reason)
+        if reason is None:
+            return result
+        
+        print(f"{cascade.primary} {ESCALATION_REASONS[reason]}，改用 {cascade.fallback} 重新识别")
+        start = time.time()
+        result, _ = self._call_model(cascade.fallback, prompt, image_path, generation_config, max_retries,
+                                     description, parse, consume, prepared)
+        cascade.record(cascade.fallback, time.time() - start, final=counts_page)
+        return result
+    
+    def _call_model(self, model, prompt, image_path, generation_config, max_retries, description, parse=None,
+                    consume=None, prepared=None, malformed_retries=None):
+        """
+        使用指定模型发送请求并解析响应，失败时由重试策略决定是否重试
+        
+        Args:
+            malformed_retries (int): 响应无法解析时最多重试的次数，默认使用重试策略的设置
+        
+        Returns:
+            tuple: (解析后的响应, 最后一次请求的finishReason)
+        """
+        if consume is None and self.stream:
+            consume = ''.join
+        prepared = {} if prepared is None else prepared
+        finish_reason = None
+        call_type = 'toc_check' if prompt == TOC_PROMPT else 'extraction'
+        pages = [page_number(image) for image in (image_path if isinstance(image_path, list) else [image_path])]
+        
+        def attempt():
+            nonlocal finish_reason
+            response = self._send(prompt, image_path, generation_config, consume, prepared, model)
+            finish_reason = self.client.last_finish_reason
+            # 无法解析而重试的响应同样计费，解析之前记录用量
+            if self.usage is not None:
+                self.usage.record(self.client.last_usage, model, call_type, pages)
+            return parse(response) if parse else response
+        
+        return self.retry_policy.call(attempt, max_retries, description, malformed_retries), finish_reason
+    
+    def _send(self, prompt, image_path, generation_config, consume=None, prepared=None, model=None):
+        """
+        发送一次请求；启用上下文缓存时提示词通过缓存名称引用
+        
+        Args:
+            consume: 指定时使用流式接口，由该函数读取文本片段并返回完整文本
+            prepared (dict): 已经构造的contents（按提示词区分），重试时复用
+            model (str): 使用的模型，默认为 self.model_name
+        
+        Returns:
+            MiniGenAI返回的响应
+        """
+        model = model or self.model_name
+        prepared = {} if prepared is None else prepared
+        
+        def contents(text):
+            if text not in prepared:
+                prepared[text] = self.build_contents(text, image_path, raw=True)
+            return prepared[text]
+        
+        if consume is None:
+            generate = self.client.generate_content
+        else:
+            def generate(model, contents, generation_config, **kwargs):
+                return consume(self.client.stream_generate_content(model, contents, generation_config,
+                                                                   stall_timeout=self.stall_timeout, **kwargs))
+        
+        handle = self.context_cache.handle(prompt, model) if self.context_cache else None
+        if handle is not None:
+            try:
+                response = generate(model, contents(None), generation_config, cached_content=handle)
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in MISSING_CACHE_STATUS_CODES:
+                    raise
+                # 缓存已被删除或过期：本次直接发送提示词，下次请求时重新创建缓存
+                print(f"上下文缓存 {handle} 不可用，本次随请求发送提示词: {e}")
+                self.context_cache.invalidate(prompt, model)
+            else:
+                # 只统计成功的请求，失败重试的请求没有少上传提示词
+                self.context_cache.record_use(handle)
+                return response
+        return generate(model, contents(prompt), generation_config)
+    
+    @staticmethod
+    def _stream_blocks(chunks, on_block=None):
+        """
+        边接收边解析内容块，内容块不是JSON对象时立即中断响应，不必等模型生成完整页
+        
+        Args:
+            chunks: 文本片段的迭代器
+            on_block: 可选的回调 on_block(index, block)
+            
+        Returns:
+            str: 完整的响应文本
+        """
+        parser = JsonArrayStream('blocks')
+        index = 0
+        try:
+            for chunk in chunks:
+                for block in parser.feed(chunk):
+                    if not isinstance(block, dict):
+                        raise ValueError(f"内容块格式错误: {type(block).__name__}")
+                    if on_block is not None:
+                        on_block(index, block)
+                    index += 1
+        finally:
+            # 提前中断时关闭生成器，释放连接和限流配额
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+        return parser.text
+    
+    @staticmethod
+    def parse_toc_response(response):
+        """
+        解析目录页面检测的响应
+        
+        Args:
+            response: MiniGenAI返回的文本，或已经解析好的数据
+            
+        Returns:
+            bool: True表示是目录页面
+        """
+        if isinstance(response, str):
+            return response.strip().lower() == "true"
+        return "true" in str(response).strip().lower()
+    
+    @staticmethod
+    def parse_rich_with_toc_response(response):
+        """
+        解析合并目录检测的富文本结构响应
+        
+        Args:
+            response: MiniGenAI返回的文本，或已经解析好的dict/list
+            
+        Returns:
+            tuple: (is_toc, blocks)，is_toc为True时blocks为空列表
+        """
+        result = GeminiClient.parse_json_response(response)
+        # 模型偶尔会省略外层对象，直接返回内容块数组
+        if isinstance(result, list):
+            return False, result
+        if not isinstance(result, dict):
+            raise ValueError(f"响应格式错误: {type(result).__name__}")
+        
+        is_toc = bool(result.get('is_toc', False))
+        blocks = result.get('blocks') or []
+        if not isinstance(blocks, list):
+            raise ValueError(f"blocks字段格式错误: {type(blocks).__name__}")
+        return is_toc, ([] if is_toc else blocks)
+    
+    @staticmethod
+    def parse_text_with_toc_response(response):
+        """
+        解析合并目录检测的纯文本响应
+        
+        Args:
+            response: MiniGenAI返回的文本，或已经解析好的dict
+            
+        Returns:
+            tuple: (is_toc, text)，is_toc为True时text为空字符串
+        """
+        result = GeminiClient.parse_json_response(response)
+        if not isinstance(result, dict):
+            raise ValueError(f"响应格式错误: {type(result).__name__}")
+        
+        is_toc = bool(result.get('is_toc', False))
+        text = result.get('text') or ''
+        return is_toc, ('' if is_toc else str(text))
+    
+    @staticmethod
+    def parse_multi_page_response(response, count, parse_page, content_field):
+        """
+        解析多页请求的响应，跳过缺少识别结果或格式错误的页面
+        
+        Args:
+            response: MiniGenAI返回的文本，或已经解析好的dict/list
+            count (int): 请求中的图像数
+            parse_page: 解析单页结果的函数，格式错误时抛出ValueError
+            content_field (str): 每页识别结果的字段名，非目录页面缺少该字段时视为格式错误
+            
+        Returns:
+            dict: 图像下标（从0开始）到单页结果的映射
+        """
+        result = GeminiClient.parse_json_response(response)
+        if isinstance(result, dict):
+            result = result.get('pages')
+        if not isinstance(result, list):
+            raise ValueError(f"pages字段格式错误: {type(result).__name__}")
+        
+        pages = {}
+        for entry in result:
+            if not isinstance(entry, dict):
+                continue
             try:
-                prompt = """
-                请分析这张图片，判断它是否为目录页面（Table of Contents）。
-                目录页面的特征包括：
-                1. 标题包含"目录"、"Contents"、"Table of Contents"等字样
-                2. 页面包含多个条目，每个条目后面有页码
-                3. 有明显的层级结构（章节编号、缩进等）
-                4. 页面主要由标题和页码组成，而非完整的段落文本
-                
-                请只返回"true"或"false"：
-                - 如果是目录页面，返回"true"
-                - 如果不是目录页面，返回"false"
-                """.strip()
-                
-                image_base64 = self.encode_image(image_path)
-                
-                contents = [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt},
-                            {
-                                "inline_data": {
-                                    "mime_type": "image/png",
-                                    "data": image_base64
-                                }
-                            }
-                        ]
-                    }
-                ]
-                
-                response = self.client.generate_content(self.model_name, contents)
-                
-                # 解析响应
-                if isinstance(response, str):
-                    response_text = response.strip().lower()
-                    return response_text == "true"
-                else:
-                    response_text = str(response).strip().lower()
-                    return "true" in response_text
-                    
-            except Exception as e:
-                last_exception = e
-                if attempt < max_retries - 1:
-                    wait_time = 5 + attempt * 5
-                    print(f"目录页面检测第 {attempt + 1} 次尝试失败: {str(e)}")
-                    print(f"等待 {wait_time} 秒后进行第 {attempt + 2} 次尝试...")
-                    time.sleep(wait_time)
-                else:
-                    print(f"目录页面检测第 {attempt + 1} 次尝试失败: {str(e)}")
-        
-        # 如果检测失败，默认返回False，继续处理页面
-        print(f"目录页面检测失败，默认不跳过该页面: {last_exception}")
-        return False
\ No newline at end of file
+                index = int(entry.get('page')) - 1
+            except (TypeError, ValueError):
+                continue
+            if not 0 <= index < count or index in pages:
+                continue
+            if content_field not in entry and not entry.get('is_toc'):
+                continue
+            try:
+                pages[index] = parse_page(entry)
+            except ValueError:
+                continue
+        return pages
+    
+    @staticmethod
+    def parse_json_response(response):
+        """
+        解析模型返回的JSON内容
+        
+        Args:
+            response: MiniGenAI返回的文本，或已经解析好的dict/list
+            
+        Returns:
+            dict或list: 解析后的JSON数据
+        """
+        if isinstance(response, str):
+            # 清理可能的Markdown代码块标记
+            response_text = response.strip().replace('```json', '').replace('```', '').strip()
+            return json.loads(response_text)
+        return response
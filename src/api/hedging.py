@@ -0,0 +1,98 @@
+"""
+对冲请求模块
+请求在最近请求延迟的某个百分位数内还没有返回时，再发送一个相同的请求，采用先返回的结果：
+少数在代理中排队很久的页面不再拖慢整本书。额外发送的请求数受预算限制
+"""
+
+import threading
+from collections import deque
+
+
+# 默认在最近延迟的第95百分位数时发送对冲请求
+DEFAULT_HEDGE_PERCENTILE = 95
+
+# 额外请求数最多占全部请求的比例
+DEFAULT_HEDGE_BUDGET = 0.05
+
+# 至少有这么多个延迟样本后才开始对冲
+MIN_SAMPLES = 20
+
+# 计算百分位数时使用的最近延迟样本数
+WINDOW_SIZE = 200
+
+
+class HedgePolicy:
+    """
+    根据最近的请求延迟决定何时发送对冲请求，并统计对冲的次数和效果，线程安全
+    """
+
+    def __init__(self, percentile: float = DEFAULT_HEDGE_PERCENTILE, budget: float = DEFAULT_HEDGE_BUDGET,
+                 min_samples: int = MIN_SAMPLES, window: int = WINDOW_SIZE):
+        """
+        初始化对冲策略
+
+        Args:
+            percentile (float): 请求超过最近延迟的该百分位数（0-100）仍未返回时发送对冲请求
+            budget (float): 对冲请求数最多占全部请求的比例
+            min_samples (int): 延迟样本少于该数时不对冲
+            window (int): 保留的最近延迟样本数
+        """
+        if not 0 < percentile < 100:
+            raise ValueError(f"百分位数应在0到100之间: {percentile}")
+        if budget < 0:
+            raise ValueError(f"对冲预算不能为负数: {budget}")
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float):
+        """记录一个成功请求的耗时（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def delay(self):
+        """
+        计算发送对冲请求前等待的秒数，同时把本次请求计入预算的分母
+
+        Returns:
+            float或None: 等待秒数；样本不足时返回None，不对冲
+        """
+        with self._lock:
+            self.requests += 1
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        index = min(int(len(samples) * self.percentile / 100), len(samples) - 1)
+        return samples[index]
+
+    def try_hedge(self) -> bool:
+        """
+        预算允许时占用一次对冲名额
+
+        Returns:
+            bool: 是否可以发送对冲请求
+        """
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        """记录一次对冲请求先于原请求返回"""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def print_summary(self):
+        """输出对冲请求的次数和先返回的次数"""
+        if not self.hedges:
+            return
+        print(f"对冲请求: {self.requests} 次请求中发送 {self.hedges} 次对冲请求"
+              f"（{self.hedges / self.requests:.1%}），其中 {self.hedge_wins} 次先于原请求返回")
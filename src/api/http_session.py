@@ -0,0 +1,229 @@
+"""
+HTTP连接池模块
+提供带keep-alive连接池的requests会话，并记录每个请求的连接、上传和首字节等待耗时
+"""
+
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# 默认连接池大小（每个主机保持的连接数）
+DEFAULT_POOL_SIZE = 10
+
+# 默认超时（秒）：建立连接的超时，以及等待响应数据的超时
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 300
+
+# 当前线程正在进行的请求的耗时记录，由连接对象写入
+_current = threading.local()
+
+
+class RequestTimings:
+    """单个请求的耗时分解（秒）"""
+
+    def __init__(self):
+        self.connect = 0.0
+        self.upload = 0.0
+        self.ttfb = 0.0
+        self.total = 0.0
+        self.reused = True
+
+    @property
+    def download(self):
+        """读取响应体的耗时"""
+        return max(self.total - self.connect - self.upload - self.ttfb, 0.0)
+
+    def __repr__(self):
+        return (f"RequestTimings(connect={self.connect:.3f}, upload={self.upload:.3f}, "
+                f"ttfb={self.ttfb:.3f}, download={self.download:.3f}, total={self.total:.3f})")
+
+
+class _TimedConnectionMixin:
+    """在urllib3连接的各个阶段记录耗时"""
+
+    def connect(self):
+        timings = getattr(_current, 'timings', None)
+        start = time.perf_counter()
+        super().connect()
+        if timings is not None:
+            timings.connect += time.perf_counter() - start
+            timings.reused = False
+
+    def request(self, *args, **kwargs):
+        timings = getattr(_current, 'timings', None)
+        connect_before = timings.connect if timings is not None else 0.0
+        start = time.perf_counter()
+        result = super().request(*args, **kwargs)
+        if timings is not None:
+            # 未建立连接时http.client会在发送时自动连接，这部分计入连接耗时
+            timings.upload += time.perf_counter() - start - (timings.connect - connect_before)
+        return result
+
+    def getresponse(self, *args, **kwargs):
+        inflight = getattr(_current, 'inflight', None)
+        if inflight is not None:
+            # 等待响应期间可以从其他线程中断
+            inflight.attach(self)
+        timings = getattr(_current, 'timings', None)
+        start = time.perf_counter()
+        response = super().getresponse(*args, **kwargs)
+        if timings is not None:
+            timings.ttfb += time.perf_counter() - start
+        return response
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOL_CLASSES = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """使用可记录耗时的连接类的HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+        return manager
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    创建带连接池的会话，同一主机的连接在请求之间保持并复用
+
+    Args:
+        pool_size (int): 每个主机最多保持的连接数，应不小于并发请求数
+
+    Returns:
+        requests.Session: 可在多个线程间共享的会话
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class InflightRequest:
+    """
+    一个可以从其他线程中断的请求
+
+    requests无法取消正在等待响应的调用；cancel() 关闭该请求所用连接的套接字，
+    等待中的线程随即收到连接错误，连接也不会再放回连接池
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        """记录请求所用的连接；已经取消时立即关闭"""
+        with self._lock:
+            self._connection = connection
+            if self.cancelled:
+                self._shutdown(connection)
+
+    def detach(self):
+        """请求结束，连接可能已放回连接池供其他请求使用，之后不能再关闭它"""
+        with self._lock:
+            self._connection = None
+
+    def cancel(self):
+        """中断请求"""
+        with self._lock:
+            self.cancelled = True
+            if self._connection is not None:
+                self._shutdown(self._connection)
+
+    @staticmethod
+    def _shutdown(connection):
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def timed_post(session, url, inflight=None, **kwargs):
+    """
+    发送POST请求并记录耗时分解
+
+    Args:
+        session (requests.Session): 会话
+        url (str): 请求地址
+        inflight (InflightRequest): 指定时可以通过它从其他线程中断请求
+        **kwargs: 传给 session.post 的其他参数
+
+    Returns:
+        tuple: (requests.Response, RequestTimings)
+    """
+    timings = RequestTimings()
+    _current.timings = timings
+    _current.inflight = inflight
+    start = time.perf_counter()
+    try:
+        response = session.post(url, **kwargs)
+    finally:
+        timings.total = time.perf_counter() - start
+        _current.timings = None
+        _current.inflight = None
+        if inflight is not None:
+            inflight.detach()
+    return response, timings
+
+
+class LatencyStats:
+    """累计多个请求的耗时分解，线程安全"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.connect = 0.0
+        self.upload = 0.0
+        self.ttfb = 0.0
+        self.download = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, timings):
+        """记录一个请求的耗时"""
+        with self._lock:
+            self.requests += 1
+            if not timings.reused:
+                self.new_connections += 1
+            self.connect += timings.connect
+            self.upload += timings.upload
+            self.ttfb += timings.ttfb
+            self.download += timings.download
+
+    def print_summary(self):
+        """输出平均耗时分解"""
+        if not self.requests:
+            return
+        count = self.requests
+        print(f"请求耗时: {count} 次请求，新建连接 {self.new_connections} 次，平均 连接 {self.connect / count:.2f}s / "
+              f"上传 {self.upload / count:.2f}s / 首字节 {self.ttfb / count:.2f}s / 下载 {self.download / count:.2f}s")
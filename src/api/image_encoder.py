@@ -0,0 +1,168 @@
+"""
+图像编码模块
+负责在发送请求前缩放、重新编码页面图像以减小上传体积
+"""
+
+import io
+import threading
+
+from PIL import Image
+
+
+# 可选的输出格式，original 表示保持原始字节不变
+IMAGE_FORMATS = ('original', 'jpeg', 'webp', 'png')
+
+# PNG可选的位深度
+PNG_BIT_DEPTHS = (1, 2, 4, 8)
+
+# Gemini API接受的图像类型，其他格式（BMP、TIFF、GIF）上传前转换为PNG
+SUPPORTED_MIME_TYPES = ('image/png', 'image/jpeg', 'image/webp')
+
+# 常见图像格式的文件头
+_MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+)
+
+
+def detect_mime_type(data):
+    """
+    根据图像数据的文件头判断MIME类型
+
+    Args:
+        data (bytes): 图像数据
+
+    Returns:
+        str: MIME类型，无法识别时返回None
+    """
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    for magic, mime_type in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime_type
+    return None
+
+
+def read_image_bytes(image):
+    """
+    读取图像数据
+
+    Args:
+        image: 图像文件路径，或带有data属性的内存图像（PageImage）
+
+    Returns:
+        bytes: 图像数据
+    """
+    image_data = getattr(image, 'data', None)
+    if image_data is not None:
+        return image_data
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+
+class ImageEncoder:
+    def __init__(self, image_format='original', max_side=None, quality=80, grayscale=True, png_bits=8):
+        """
+        初始化图像编码器
+
+        Args:
+            image_format (str): 输出格式 ('original'、'jpeg'、'webp' 或 'png')
+            max_side (int): 图像长边的最大像素数，超过时等比缩小，None表示不缩放
+            quality (int): JPEG/WebP的压缩质量 (1-100)
+            grayscale (bool): 重新编码时是否转换为灰度图
+            png_bits (int): PNG的位深度 (1、2、4 或 8)，小于8时量化为对应数量的灰阶
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图像格式: {image_format}")
+        if png_bits not in PNG_BIT_DEPTHS:
+            raise ValueError(f"不支持的PNG位深度: {png_bits}")
+
+        self.image_format = image_format
+        self.max_side = max_side
+        self.quality = quality
+        self.grayscale = grayscale
+        self.png_bits = png_bits
+
+        self.pages = 0
+        self.original_bytes = 0
+        self.encoded_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_passthrough(self):
+        """是否保持原始图像字节不变"""
+        return self.image_format == 'original' and not self.max_side
+
+    def encode(self, image):
+        """
+        编码页面图像
+
+        Args:
+            image: 图像文件路径，或带有data属性的内存图像（PageImage）
+
+        Returns:
+            tuple: (图像数据, MIME类型)，MIME类型始终与数据实际格式一致，且为API接受的类型
+        """
+        original = read_image_bytes(image)
+        original_type = detect_mime_type(original)
+        supported = original_type is None or original_type in SUPPORTED_MIME_TYPES
+        if self.is_passthrough and supported:
+            return original, original_type or 'image/png'
+
+        with Image.open(io.BytesIO(original)) as source:
+            source_format = (source.format or 'PNG').lower()
+            target_format = source_format if self.image_format == 'original' else self.image_format
+            if target_format not in ('jpeg', 'webp', 'png'):
+                target_format = 'png'
+
+            # 直通模式下只为转换格式而重新编码，保留原来的颜色
+            picture = source.convert('L') if self.grayscale and not self.is_passthrough else source.convert('RGB')
+            resized = bool(self.max_side and max(picture.size) > self.max_side)
+            if resized:
+                picture.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+
+            encoded = self._save(picture, target_format)
+
+        # 未缩放且重新编码反而更大时（如源图已经是高压缩JPEG）保留原图，API不接受的格式除外
+        if not resized and supported and len(encoded) >= len(original):
+            encoded = original
+        mime_type = detect_mime_type(encoded) or 'image/png'
+
+        self._record(len(original), len(encoded))
+        return encoded, mime_type
+
+    def print_summary(self):
+        """输出整个任务的图像上传体积统计"""
+        if self.is_passthrough or not self.pages:
+            return
+        saved = self.original_bytes - self.encoded_bytes
+        ratio = saved / self.original_bytes * 100 if self.original_bytes else 0
+        print(f"图像编码统计: {self.pages} 页，原始 {self.original_bytes / 1024 / 1024:.1f}MB，"
+              f"上传 {self.encoded_bytes / 1024 / 1024:.1f}MB，节省 {ratio:.1f}%")
+
+    def _save(self, picture, target_format):
+        """按目标格式保存图像"""
+        buffer = io.BytesIO()
+        if target_format == 'png':
+            if self.png_bits < 8:
+                picture = picture.convert('L').quantize(colors=2 ** self.png_bits)
+                picture.save(buffer, format='PNG', optimize=True, bits=self.png_bits)
+            else:
+                picture.save(buffer, format='PNG', optimize=True)
+        elif target_format == 'webp':
+            picture.save(buffer, format='WEBP', quality=self.quality, method=4)
+        else:
+            picture.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+        return buffer.getvalue()
+
+    def _record(self, original_size, encoded_size):
+        """记录单页编码前后的字节数，任务结束时由 print_summary 汇总输出"""
+        with self._lock:
+            self.pages += 1
+            self.original_bytes += original_size
+            self.encoded_bytes += encoded_size
@@ -0,0 +1,99 @@
+"""
+增量JSON解析模块
+流式响应到达时逐段扫描，产出指定数组中已经完整的元素，不必等整个JSON结束
+"""
+
+import json
+
+
+class JsonArrayStream:
+    """
+    增量解析 {"key": [元素, ...], ...} 或 [元素, ...] 形式的JSON，逐个产出数组元素
+
+    只跟踪括号层级和字符串状态，每个元素完整后单独用json.loads解析；
+    整个响应的结构仍由调用方在结束后解析和校验
+    """
+
+    def __init__(self, key: str = None):
+        """
+        Args:
+            key (str): 根对象中目标数组的字段名；None表示根本身就是数组。
+                       根为数组时无论key为何值都直接解析根数组（模型偶尔省略外层对象）
+        """
+        self.key = key
+        self.text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._current_key = None
+        self._array_depth = None
+        self._item_start = None
+        self._done = False
+
+    def feed(self, chunk: str) -> list:
+        """
+        加入一段文本
+
+        Args:
+            chunk (str): 新到达的文本
+
+        Returns:
+            list: 这段文本中完成的数组元素（已解析），元素不是合法JSON时抛出ValueError
+        """
+        self.text += chunk
+        items = []
+        text = self.text
+        for index in range(self._pos, len(text)):
+            if self._done:
+                break
+            char = text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start:index + 1]
+                continue
+
+            in_array = self._array_depth is not None and self._depth == self._array_depth
+            if in_array and self._item_start is None and char not in ' \t\r\n,]':
+                self._item_start = index
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index
+            elif char == ':' and self._depth == 1:
+                self._current_key = json.loads(self._last_string) if self._last_string else None
+            elif char in '{[':
+                if self._depth == 0 and char == '{' and self.key is None:
+                    raise ValueError("响应的根不是数组")
+                if self._array_depth is None and (
+                        (self._depth == 0 and char == '[') or
+                        (self._depth == 1 and char == '[' and self._current_key == self.key)):
+                    self._array_depth = self._depth + 1
+                self._depth += 1
+            elif char in '}]':
+                if in_array:
+                    # 数组中的字符串、数字等标量在逗号或右括号处结束
+                    self._finish_item(text, index, items)
+                if self._depth == self._array_depth and char == ']':
+                    self._done = True
+                self._depth -= 1
+                if self._array_depth is not None and self._depth == self._array_depth:
+                    self._finish_item(text, index + 1, items)
+            elif char == ',' and in_array:
+                self._finish_item(text, index, items)
+        self._pos = len(text)
+        return items
+
+    def _finish_item(self, text, end, items):
+        if self._item_start is None:
+            return
+        items.append(json.loads(text[self._item_start:end]))
+        self._item_start = None
@@ -1,75 +1,513 @@
-import requests
+import time
+import threading
+import hashlib
 import json
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+from .response_cache import make_cache_key, make_body_cache_key, is_cacheable_response
+from .request_body import encode_payload, PreparedContents
+from .rate_limiter import THROTTLE_STATUS_CODES, estimate_request_tokens, usage_token_count, parse_retry_after
+from .endpoint_pool import Endpoint, EndpointPool
+from .token_usage import GenerateResult, extract_usage
+from .http_session import (
+    create_session, timed_post, LatencyStats, InflightRequest,
+    DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+)
+
+
+# 上下文缓存的默认有效期（秒）
+DEFAULT_CACHE_TTL = 3600
+
+# 流式响应超过该秒数没有收到新数据时视为停滞（秒）
+DEFAULT_STALL_TIMEOUT = 60
+
+
+class StreamStalledError(requests.Timeout):
+    """流式响应在stall_timeout秒内没有收到新数据，按超时处理"""
+
+
+def build_payload(contents: list, generation_config: dict = None, system_instruction: str = None,
+                  cached_content: str = None) -> dict:
+    """
+    构造 generateContent 请求体；批处理请求使用相同的请求体，缓存键因此与交互式请求一致
+
+    Args:
+        contents (list): 对话内容
+        generation_config (dict): 可选的生成配置
+        system_instruction (str): 可选的系统指令
+        cached_content (str): 可选的上下文缓存名称（如 "cachedContents/abc"），其中的内容不再随请求发送
+    """
+    payload = {"contents": contents}
+    if system_instruction:
+        payload["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+    if cached_content:
+        payload["cachedContent"] = cached_content
+    if generation_config:
+        # 注意：Google API 的 JSON key 是 camelCase 风格的 "generationConfig"
+        payload["generationConfig"] = generation_config
+    return payload
+
+
+def extract_response_text(data):
+    """
+    取出 generateContent 响应中的文本
+
+    Returns:
+        str或None: 第一个候选的第一段文本，响应结构不符合预期时返回None
+    """
+    # 提取内容时，如果返回的是JSON，它会被包含在"text"字段中
+    # 上层 gemini_client 会处理JSON字符串的解析
+    try:
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def iter_sse_events(lines):
+    """
+    解析Server-Sent Events，逐个产出data字段中的JSON
+
+    Args:
+        lines: 响应的各行（bytes），事件之间以空行分隔
+
+    Yields:
+        dict: 每个事件的数据
+    """
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield json.loads(b"\n".join(data))
+                data = []
+        elif line.startswith(b"data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield json.loads(b"\n".join(data))
+
+
+def extract_finish_reason(data):
+    """
+    取出响应中第一个候选的finishReason
+
+    Returns:
+        str或None: 如 "STOP"、"MAX_TOKENS"、"SAFETY"，响应中没有时返回None
+    """
+    try:
+        return data["candidates"][0].get("finishReason")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return None
 
 
 class MiniGenAI:
-    def __init__(self, api_key: str, base_url: str = "https://generativelanguage.googleapis.com"):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip("/")
+    def __init__(self, api_key: str, base_url: str = "https://generativelanguage.googleapis.com", cache=None,
+                 pool_size: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, rate_limiter=None, endpoints=None, hedge=None,
+                 usage=None):
+        # 页面请求在端点池的各个端点之间分配；没有指定端点池时只使用 (api_key, base_url) 一个端点
+        self.endpoints = endpoints or EndpointPool([Endpoint(api_key, base_url)])
+        # 上下文缓存、批处理等管理请求使用第一个端点
+        self.api_key = self.endpoints.primary.api_key
+        self.base_url = self.endpoints.primary.base_url
+        # 可选的响应缓存（ResponseCache），相同请求直接返回缓存的结果
+        self.cache = cache
+        # 可选的限流器（RateLimiter），多个线程共用，控制并发数和每分钟配额
+        self.rate_limiter = rate_limiter
+
+        # 所有请求共用一个带keep-alive连接池的会话，避免每次请求（包括重试）都重新握手
+        self.session = create_session(pool_size)
+        self.timeout = (connect_timeout, read_timeout)
+        self.latency = LatencyStats()
+        self._local = threading.local()
+        # 上下文缓存名称到其内容摘要的映射，计算响应缓存键时代替每次任务都不同的名称
+        self._cached_content_digests = {}
+        # 可选的对冲策略（HedgePolicy）：请求迟迟不返回时再发送一个相同的请求
+        self.hedge = hedge
+        # 可选的token用量统计（TokenUsage）：被放弃的对冲请求已经完成时同样计费，由这里记录
+        self.usage = usage
+
+    @property
+    def last_timings(self):
+        """
+        当前线程最近一次网络请求的耗时分解（RequestTimings），命中缓存的请求不会更新
+        """
+        return getattr(self._local, 'timings', None)
+
+    @property
+    def last_finish_reason(self):
+        """
+        当前线程最近一次请求的finishReason，命中缓存时为None
+        """
+        return getattr(self._local, 'finish_reason', None)
+
+    @property
+    def last_usage(self):
+        """
+        当前线程最近一次请求的token用量（extract_usage 的结果），命中缓存或响应中没有用量信息时为None；
+        流式请求的结果只有文本，用量从这里读取
+        """
+        return getattr(self._local, 'usage', None)
 
     def generate_text(self, model: str, prompt: str, generation_config: dict = None):
         """
         调用文本生成接口
         """
-        url = f"{self.base_url}/v1beta/models/{model}:generateContent?key={self.api_key}"
-        headers = {"Content-Type": "application/json"}
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        
+
         # 修改: 添加 generation_config 支持
         if generation_config:
             payload["generationConfig"] = generation_config
 
-        resp = requests.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        try:
-            return data["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception:
-            return data
+        return self._generate(model, payload)
 
     def chat(self, model: str, history: list, generation_config: dict = None):
         """
         多轮对话
         """
-        url = f"{self.base_url}/v1beta/models/{model}:generateContent?key={self.api_key}"
-        headers = {"Content-Type": "application/json"}
         payload = {"contents": history}
 
         # 修改: 添加 generation_config 支持
         if generation_config:
             payload["generationConfig"] = generation_config
-            
-        resp = requests.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-        try:
-            return data["candidates"][0]["content"]["parts"][0]["text"]
-        except Exception:
-            return data
 
-    def generate_content(self, model: str, contents: list, generation_config: dict = None):
+        return self._generate(model, payload)
+
+    def generate_content(self, model: str, contents: list, generation_config: dict = None,
+                         system_instruction: str = None, cached_content: str = None):
+        """
+        生成内容，支持文本、图像、generation_config、系统指令以及引用上下文缓存
+
+        Returns:
+            GenerateResult: 响应文本，同时带有token用量和finishReason；响应中没有文本时文本为原始JSON
         """
-        生成内容，支持文本、图像以及 generation_config
+        return self._generate(model, build_payload(contents, generation_config, system_instruction, cached_content))
+
+    def stream_generate_content(self, model: str, contents: list, generation_config: dict = None,
+                                system_instruction: str = None, cached_content: str = None,
+                                stall_timeout: float = DEFAULT_STALL_TIMEOUT):
+        """
+        通过 streamGenerateContent 流式生成内容，边生成边产出文本片段
+
+        响应缓存的缓存键与 generate_content 相同，命中缓存时一次产出完整文本。
+        超过stall_timeout秒没有收到新数据时抛出StreamStalledError，不必等到读取超时
+
+        Args:
+            model (str): 模型名称
+            contents (list): 对话内容
+            generation_config (dict): 可选的生成配置
+            system_instruction (str): 可选的系统指令
+            cached_content (str): 可选的上下文缓存名称
+            stall_timeout (float): 两段数据之间允许的最长间隔（秒）
+
+        Yields:
+            str: 依次生成的文本片段
         """
-        url = f"{self.base_url}/v1beta/models/{model}:generateContent?key={self.api_key}"
+        payload = build_payload(contents, generation_config, system_instruction, cached_content)
+        body = self._encode(payload)
+        self._local.finish_reason = None
+        self._local.usage = None
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(model, payload, body)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
         headers = {"Content-Type": "application/json"}
-        payload = {"contents": contents}
+        ticket = self.rate_limiter.acquire(estimate_request_tokens(payload)) if self.rate_limiter else None
+        endpoint = self.endpoints.acquire(self._pinned_endpoint(payload))
+        url = f"{endpoint.base_url}/v1beta/models/{model}:streamGenerateContent?alt=sse&key={endpoint.api_key}"
+        status = retry_after = tokens_used = elapsed = None
+        chunks = []
+        try:
+            # 流式读取时读取超时作用于每次socket读取，正好用来发现停滞的流
+            resp, timings = timed_post(self.session, url, headers=headers, data=body,
+                                       timeout=(self.timeout[0], min(stall_timeout, self.timeout[1])), stream=True)
+            self._local.timings = timings
+            try:
+                status = resp.status_code
+                if status in THROTTLE_STATUS_CODES:
+                    retry_after = parse_retry_after(resp.headers, resp.content)
+                resp.raise_for_status()
 
-        # --- 主要修改点 ---
-        # 如果提供了 generation_config，则将其添加到请求体中
-        if generation_config:
-            # 注意：Google API 的 JSON key 是 camelCase 风格的 "generationConfig"
-            payload["generationConfig"] = generation_config
-        # --- 修改结束 ---
+                start = time.perf_counter()
+                last_data = start
+                for event in iter_sse_events(self._iter_lines(resp, stall_timeout)):
+                    tokens_used = usage_token_count(event) or tokens_used
+                    self._local.finish_reason = extract_finish_reason(event) or self._local.finish_reason
+                    self._local.usage = extract_usage(event) or self._local.usage
+                    text = extract_response_text(event)
+                    now = time.perf_counter()
+                    if not text:
+                        # 只有空白或用量信息的事件不算作进展
+                        if now - last_data > stall_timeout:
+                            raise StreamStalledError(f"流式响应超过 {stall_timeout} 秒没有新内容")
+                        continue
+                    last_data = now
+                    chunks.append(text)
+                    yield text
+                timings.total += time.perf_counter() - start
+                self.latency.add(timings)
+                elapsed = timings.total
+            finally:
+                resp.close()
+        except StreamStalledError:
+            # 停滞的流说明端点不健康
+            status = None
+            raise
+        finally:
+            self.endpoints.release(endpoint, status, elapsed)
+            if ticket is not None:
+                self.rate_limiter.release(ticket, status, retry_after, tokens_used)
 
-        resp = requests.post(url, headers=headers, json=payload)
+        text = "".join(chunks)
+        if cache_key is not None and self._cacheable(text, payload):
+            self.cache.put(cache_key, text)
+
+    @staticmethod
+    def _iter_lines(resp, stall_timeout):
+        """逐行读取流式响应，读取超时转换为StreamStalledError"""
+        try:
+            yield from resp.iter_lines()
+        except requests.ConnectionError as e:
+            # requests把读取响应体时的超时包装为ConnectionError
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                raise StreamStalledError(f"流式响应超过 {stall_timeout} 秒没有收到数据") from e
+            raise
+
+    def create_cached_content(self, model: str, system_instruction: str = None, contents: list = None,
+                              ttl: float = DEFAULT_CACHE_TTL, display_name: str = None) -> dict:
+        """
+        上传上下文缓存，之后的请求通过名称引用，不再重复发送其中的内容
+
+        Args:
+            model (str): 模型名称，缓存只能被同一模型使用
+            system_instruction (str): 缓存的系统指令
+            contents (list): 缓存的对话内容
+            ttl (float): 有效期（秒）
+            display_name (str): 可选的显示名称
+
+        Returns:
+            dict: CachedContent，包含name、expireTime和usageMetadata
+        """
+        body = {"model": f"models/{model}", "ttl": f"{int(ttl)}s"}
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        if contents:
+            body["contents"] = contents
+        if display_name:
+            body["displayName"] = display_name
+        cached = self._request("post", "cachedContents", json=body)
+
+        digest = hashlib.sha256(json.dumps(
+            [model, body.get("systemInstruction"), body.get("contents")], sort_keys=True, ensure_ascii=False
+        ).encode('utf-8')).hexdigest()
+        self._cached_content_digests[cached["name"]] = digest
+        return cached
+
+    def update_cached_content(self, name: str, ttl: float = DEFAULT_CACHE_TTL) -> dict:
+        """
+        延长上下文缓存的有效期
+
+        Returns:
+            dict: 更新后的CachedContent
+        """
+        return self._request("patch", name, json={"ttl": f"{int(ttl)}s"}, params={"updateMask": "ttl"})
+
+    def delete_cached_content(self, name: str):
+        """删除上下文缓存，停止计算存储费用"""
+        self._request("delete", name)
+        self._cached_content_digests.pop(name, None)
+
+    def count_tokens(self, model: str, contents: list) -> int:
+        """
+        按模型的分词器计算内容的token数（countTokens，不计费）
+
+        Args:
+            model (str): 模型名称
+            contents (list): 对话内容
+
+        Returns:
+            int: token数
+        """
+        return self._request("post", f"models/{model}:countTokens", json={"contents": contents})["totalTokens"]
+
+    def _request(self, method: str, path: str, params: dict = None, **kwargs):
+        """发送上下文缓存管理请求"""
+        url = f"{self.base_url}/v1beta/{path}"
+        resp = self.session.request(method, url, params={"key": self.api_key, **(params or {})},
+                                    timeout=self.timeout, **kwargs)
         resp.raise_for_status()
-        data = resp.json()
-        
-        # 提取内容时，如果返回的是JSON，它会被包含在"text"字段中
-        # 这个逻辑保持不变，因为上层 gemini_client 会处理JSON字符串的解析
+        return resp.json() if resp.content else {}
+
+    @staticmethod
+    def _encode(payload: dict) -> bytes:
+        """序列化请求体；contents为PreparedContents时复用已经生成的请求体"""
+        contents = payload.get("contents")
+        if isinstance(contents, PreparedContents):
+            return contents.encode(payload)
+        return encode_payload(payload)
+
+    def _pinned_endpoint(self, payload: dict):
+        """上下文缓存属于创建它的密钥，引用缓存的请求固定发往第一个端点"""
+        return self.endpoints.primary if payload.get("cachedContent") else None
+
+    def _cache_key(self, model: str, payload: dict, body: bytes) -> str:
+        """
+        计算响应缓存键；引用上下文缓存时按缓存内容而不是名称计算，重新运行任务时仍能命中
+        """
+        name = payload.get("cachedContent")
+        if name in self._cached_content_digests:
+            return make_cache_key(model, dict(payload, cachedContent=self._cached_content_digests[name]))
+        return make_body_cache_key(model, body)
+
+    def _generate(self, model: str, payload: dict):
+        """
+        发送 generateContent 请求，命中缓存时不访问网络
+        """
+        body = self._encode(payload)
+        self._local.finish_reason = None
+        self._local.usage = None
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(model, payload, body)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return GenerateResult(cached, cached=True)
+
+        if self.hedge is not None:
+            data, timings = self._post_hedged(model, payload, body)
+        else:
+            data, timings = self._post(model, payload, body)
+        self._local.timings = timings
+        self._local.finish_reason = extract_finish_reason(data)
+        self._local.usage = extract_usage(data)
+
+        text = extract_response_text(data)
+        if text is None:
+            # 如果没有内容返回（如因安全原因被拦截），或者结构不符合预期，以原始数据作为文本以供调试，
+            # 仍然保留用量和finishReason；这样的结果不缓存
+            return GenerateResult(json.dumps(data, ensure_ascii=False), self._local.usage, self._local.finish_reason)
+
+        if cache_key is not None and self._cacheable(text, payload):
+            self.cache.put(cache_key, text)
+        return GenerateResult(text, self._local.usage, self._local.finish_reason)
+
+    def _post(self, model: str, payload: dict, body: bytes, avoid=None, chosen=None, inflight=None, hedge=False):
+        """
+        发送一次 generateContent 请求
+
+        Args:
+            avoid (Endpoint): 尽量不使用的端点（对冲请求避开原请求所在的端点）
+            chosen (list): 指定时把选中的端点追加到其中
+            inflight (InflightRequest): 指定时可以通过它从其他线程中断请求
+            hedge (bool): 是否为对冲请求，对冲请求不等待限流器的并发名额
+
+        Returns:
+            tuple: (响应JSON, RequestTimings)
+        """
+        headers = {"Content-Type": "application/json"}
+        ticket = self.rate_limiter.acquire(estimate_request_tokens(payload), hedge) if self.rate_limiter else None
+        endpoint = self.endpoints.acquire(self._pinned_endpoint(payload), avoid=avoid)
+        if chosen is not None:
+            chosen.append(endpoint)
+        url = f"{endpoint.base_url}/v1beta/models/{model}:generateContent?key={endpoint.api_key}"
+        status = retry_after = tokens_used = elapsed = None
         try:
-            return data["candidates"][0]["content"]["parts"][0]["text"]
-        except (KeyError, IndexError):
-            # 如果没有内容返回，或者结构不符合预期，返回原始数据以供调试
-            return data
\ No newline at end of file
+            # 请求体已经序列化，不再由requests重新生成JSON文本
+            resp, timings = timed_post(self.session, url, inflight=inflight, headers=headers, data=body,
+                                       timeout=self.timeout)
+            self._local.timings = timings
+            self.latency.add(timings)
+            status = resp.status_code
+            if status in THROTTLE_STATUS_CODES:
+                retry_after = parse_retry_after(resp.headers, resp.content)
+            resp.raise_for_status()
+            data = resp.json()
+            tokens_used = usage_token_count(data)
+            elapsed = timings.total
+        finally:
+            cancelled = status is None and inflight is not None and inflight.cancelled
+            self.endpoints.release(endpoint, status, elapsed, cancelled)
+            if ticket is not None:
+                self.rate_limiter.release(ticket, status, retry_after, tokens_used)
+        if self.hedge is not None:
+            self.hedge.record(elapsed)
+        return data, timings
+
+    def _post_hedged(self, model: str, payload: dict, body: bytes):
+        """
+        发送请求，超过对冲延迟仍未返回且预算允许时，向另一个端点发送相同的请求，采用先成功返回的结果
+
+        落后的请求立即中断，释放它占用的连接、限流名额和端点；它在中断前已经完成时记录其token用量
+
+        Returns:
+            tuple: (响应JSON, RequestTimings)
+        """
+        delay = self.hedge.delay()
+        if delay is None:
+            return self._post(model, payload, body)
+
+        chosen = []
+        primary_request = InflightRequest()
+        primary = self._submit(self._post, model, payload, body, chosen=chosen, inflight=primary_request)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.hedge.try_hedge():
+            return primary.result()
+
+        print(f"请求超过 {delay:.1f} 秒没有返回，发送对冲请求")
+        hedge_request = InflightRequest()
+        hedge = self._submit(self._post, model, payload, body, avoid=chosen[0] if chosen else None,
+                             inflight=hedge_request, hedge=True)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # 同时返回时优先采用原请求
+            for future in sorted(done, key=lambda future: future is not primary):
+                if future.exception() is not None:
+                    continue
+                if future is hedge:
+                    self.hedge.record_win()
+                    loser, loser_request = primary, primary_request
+                else:
+                    loser, loser_request = hedge, hedge_request
+                loser_request.cancel()
+                loser.add_done_callback(lambda late: self._record_discarded(model, late))
+                return future.result()
+        # 两个请求都失败时按原请求的错误处理
+        return primary.result()
+
+    def _record_discarded(self, model: str, future: Future):
+        """被放弃的请求在中断前已经完成时，服务器同样计费，记录其token用量"""
+        if self.usage is None or future.exception() is not None:
+            return
+        data, _ = future.result()
+        self.usage.record(extract_usage(data), model, 'discarded')
+
+    @staticmethod
+    def _submit(fn, *args, **kwargs):
+        """
+        在后台守护线程中调用函数；被放弃的请求可能还要等到读取超时，守护线程不会阻止程序退出
+
+        Returns:
+            Future: 调用结果
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _cacheable(self, text, payload):
+        """生成没有正常结束（如达到输出上限被截断）的响应不缓存"""
+        if self._local.finish_reason not in (None, "STOP"):
+            return False
+        return is_cacheable_response(text, payload.get("generationConfig"))
@@ -0,0 +1,146 @@
+"""
+模型级联模块
+每页先用flash识别，结果没有通过检查时再用pro重新识别：大多数页面只付flash的费用和延迟，
+密集表格、质量差的照片、竖排文字等flash处理不好的页面仍能得到pro的结果
+"""
+
+import threading
+from collections import Counter
+
+
+PRIMARY_MODEL = 'gemini-2.5-flash'
+FALLBACK_MODEL = 'gemini-2.5-pro'
+
+# 正常结束的finishReason；缓存命中等无法得知时为None，视为正常
+NORMAL_FINISH_REASONS = (None, 'STOP')
+
+# 页面检测到的文字行数不少于该值时才检查识别结果是否过短
+MIN_CHECKED_LINES = 8
+
+# 平均每行识别出的字符数低于该值时认为识别结果不完整
+MIN_CHARS_PER_LINE = 4
+
+# 改用pro的原因及其说明
+ESCALATION_REASONS = {
+    'malformed': '响应无法解析',
+    'empty': '没有识别出内容',
+    'finish_reason': '生成没有正常结束',
+    'sparse': '识别出的文字远少于页面上的文字行',
+}
+
+
+def result_text_length(result):
+    """
+    计算识别结果中的字符数
+
+    Args:
+        result: (is_toc, blocks)、(is_toc, text)、内容块列表或文本
+
+    Returns:
+        int或None: 字符数；目录页面或其他类型的结果返回None，不做检查
+    """
+    if isinstance(result, tuple) and len(result) == 2:
+        is_toc, content = result
+        if is_toc:
+            return None
+        result = content
+    if isinstance(result, str):
+        return len(result.strip())
+    if isinstance(result, list):
+        return sum(len(str(block.get('content', '')).strip()) for block in result if isinstance(block, dict))
+    return None
+
+
+class ModelCascade:
+    """
+    判断flash的结果是否需要交给pro重新识别，并按模型统计页数和耗时，线程安全
+    """
+
+    def __init__(self, primary: str = PRIMARY_MODEL, fallback: str = FALLBACK_MODEL, line_counter=None,
+                 min_chars_per_line: float = MIN_CHARS_PER_LINE):
+        """
+        初始化模型级联
+
+        Args:
+            primary (str): 先使用的模型
+            fallback (str): 结果没有通过检查时使用的模型
+            line_counter: 可选，根据页面图像返回文字行数的函数，用于判断识别结果是否过短
+            min_chars_per_line (float): 平均每行至少应识别出的字符数
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.line_counter = line_counter
+        self.min_chars_per_line = min_chars_per_line
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.pages = Counter()
+        self.requests = Counter()
+        self.latency = Counter()
+        self.escalations = Counter()
+
+    def check(self, result, finish_reason=None, image=None):
+        """
+        检查flash的识别结果
+
+        Args:
+            result: 解析后的识别结果
+            finish_reason (str): 响应的finishReason
+            image: 页面图像，用于统计文字行数
+
+        Returns:
+            str或None: 需要改用pro的原因（ESCALATION_REASONS中的键），通过检查时返回None
+        """
+        if finish_reason not in NORMAL_FINISH_REASONS:
+            return 'finish_reason'
+        length = result_text_length(result)
+        if length is None:
+            return None
+
+        lines = self._count_lines(image)
+        if length == 0:
+            # 页面上确实没有文字行时，空结果是正确的
+            return 'empty' if lines is None or lines > 0 else None
+        if lines is not None and lines >= MIN_CHECKED_LINES and length < lines * self.min_chars_per_line:
+            return 'sparse'
+        return None
+
+    def record(self, model: str, elapsed: float, final: bool = True, reason: str = None):
+        """
+        记录一次识别
+
+        Args:
+            model (str): 使用的模型
+            elapsed (float): 耗时（秒），包括重试
+            final (bool): 是否为该页最终采用的结果
+            reason (str): 改用pro的原因
+        """
+        with self._lock:
+            self.requests[model] += 1
+            self.latency[model] += elapsed
+            if final:
+                self.pages[model] += 1
+            if reason:
+                self.escalations[reason] += 1
+
+    def print_summary(self):
+        """输出各模型识别的页数、平均耗时和改用pro的原因"""
+        if not self.requests:
+            return
+        details = '，'.join(f"{model} {self.pages[model]} 页（{self.requests[model]} 次识别，"
+                           f"平均 {self.latency[model] / self.requests[model]:.2f}s）"
+                           for model in (self.primary, self.fallback) if self.requests[model])
+        print(f"模型级联: {details}")
+        if self.escalations:
+            reasons = '，'.join(f"{ESCALATION_REASONS[reason]} {count}"
+                               for reason, count in self.escalations.most_common())
+            print(f"改用 {self.fallback} 的原因: {reasons}")
+
+    def _count_lines(self, image):
+        if self.line_counter is None or image is None:
+            return None
+        try:
+            return self.line_counter(image)
+        except Exception as e:
+            print(f"统计页面文字行数失败，跳过识别结果长度检查: {e}")
+            return None
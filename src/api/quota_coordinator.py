@@ -0,0 +1,312 @@
+"""
+跨进程配额协调模块
+同一台机器上使用同一个API密钥的多个转换进程通过一个共享的SQLite文件协调：
+全局的每分钟请求数令牌桶、全局并发上限和按先来先服务排队的等待队列，
+使所有进程加起来不超过配额，并且每个进程都能公平地分到请求名额。
+全局上限保存在协调文件中，以文件中的值为准，不会因为各进程的参数不同而各自按不同的上限计算
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .rate_limiter import THROTTLE_STATUS_CODES, BURST_SECONDS
+
+
+# 默认的协调文件位置
+DEFAULT_QUOTA_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'pdf2epub', 'quota.sqlite3')
+
+# 排队时检查一次的间隔（秒）
+POLL_INTERVAL = 0.02
+
+# 清理已退出进程遗留的名额和排队记录的最小间隔（秒）
+CLEANUP_INTERVAL = 1.0
+
+
+def process_alive(pid: int) -> bool:
+    """判断本机上的进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def format_limit(value) -> str:
+    """格式化全局上限，None表示不限制"""
+    return '不限制' if value is None else f"{value:g}"
+
+
+class QuotaCoordinator:
+    """
+    多个进程共用的配额协调器，接口与 RateLimiter 的 acquire/release 相同
+
+    每个请求先进入全局队列，排到队首且全局并发数和令牌桶都允许时才获得名额；
+    进程异常退出后，它持有的名额会在其他进程排队时被回收
+
+    全局上限在第一个进程启动时写入协调文件；仍有其他进程在使用该文件时，
+    以不同的上限启动会报错，所有进程都退出后才能更改上限
+    """
+
+    def __init__(self, path: str = DEFAULT_QUOTA_PATH, requests_per_minute: float = None,
+                 max_concurrency: int = None, burst_seconds: float = BURST_SECONDS):
+        """
+        初始化配额协调器
+
+        Args:
+            path (str): 共享的SQLite文件路径，所有进程需要使用同一个文件
+            requests_per_minute (float): 所有进程合计的每分钟请求数上限，None表示不限制
+            max_concurrency (int): 所有进程合计的并发请求数上限，None表示不限制
+            burst_seconds (float): 令牌桶容量对应的秒数
+
+        Raises:
+            ValueError: 其他仍在运行的进程使用的全局上限与本进程不同
+        """
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.burst_seconds = burst_seconds
+        self.pid = os.getpid()
+
+        self.requests = 0
+        self.wait_seconds = 0.0
+        self.reclaimed = 0
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 手动管理事务：每次检查都在 BEGIN IMMEDIATE 中进行，同一时刻只有一个进程能修改状态
+        self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'id INTEGER PRIMARY KEY CHECK (id = 1), level REAL, updated REAL NOT NULL, paused_until REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, '
+                'acquired REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS waiters (id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, '
+                'enqueued REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS limits ('
+                'id INTEGER PRIMARY KEY CHECK (id = 1), requests_per_minute REAL, max_concurrency INTEGER)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS processes (pid INTEGER PRIMARY KEY, started REAL NOT NULL)'
+            )
+            connection.execute('INSERT OR IGNORE INTO bucket (id, level, updated, paused_until) VALUES (1, NULL, ?, 0)',
+                               (time.time(),))
+        try:
+            with self._transaction() as connection:
+                self._register(connection)
+        except ValueError:
+            self.close()
+            raise
+
+    def acquire(self, tokens: int = 0) -> int:
+        """
+        排队等待一个全局请求名额
+
+        Args:
+            tokens (int): 请求的估算token数（目前只用于与RateLimiter保持相同接口）
+
+        Returns:
+            int: 名额编号，需要传给 release()
+        """
+        start = time.time()
+        waiter = self._enqueue()
+        try:
+            while True:
+                lease, wait = self._try_acquire(waiter)
+                if lease is not None:
+                    self._record(start)
+                    return lease
+                time.sleep(min(max(wait, POLL_INTERVAL), 1.0))
+        except BaseException:
+            self._dequeue(waiter)
+            raise
+
+    async def acquire_async(self, tokens: int = 0) -> int:
+        """acquire() 的协程版本"""
+        # SQLite操作可能等待其他进程的写锁，放在线程中进行，不阻塞事件循环
+        start = time.time()
+        waiter = await asyncio.to_thread(self._enqueue)
+        try:
+            while True:
+                lease, wait = await asyncio.to_thread(self._try_acquire, waiter)
+                if lease is not None:
+                    self._record(start)
+                    return lease
+                await asyncio.sleep(min(max(wait, POLL_INTERVAL), 1.0))
+        except BaseException:
+            await asyncio.to_thread(self._dequeue, waiter)
+            raise
+
+    def release(self, lease: int, status: int = None, retry_after: float = None, tokens_used: int = None):
+        """
+        归还名额；收到限流响应时让所有进程一起暂停
+
+        Args:
+            lease (int): acquire() 的返回值
+            status (int): HTTP状态码，网络错误时为None
+            retry_after (float): 服务器要求的等待秒数
+            tokens_used (int): 实际token数（未使用）
+        """
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM leases WHERE id = ?', (lease,))
+            if status in THROTTLE_STATUS_CODES and retry_after:
+                connection.execute('UPDATE bucket SET paused_until = MAX(paused_until, ?) WHERE id = 1',
+                                   (time.time() + retry_after,))
+
+    def snapshot(self) -> dict:
+        """
+        当前的全局状态
+
+        Returns:
+            dict: 进行中的请求数、排队数、参与的进程数和剩余暂停时间
+        """
+        with self._lock:
+            connection = self._connection
+            in_flight = connection.execute('SELECT COUNT(*) FROM leases').fetchone()[0]
+            waiting = connection.execute('SELECT COUNT(*) FROM waiters').fetchone()[0]
+            processes = connection.execute(
+                'SELECT COUNT(*) FROM (SELECT pid FROM leases UNION SELECT pid FROM waiters)').fetchone()[0]
+            paused_until = connection.execute('SELECT paused_until FROM bucket WHERE id = 1').fetchone()[0]
+        return {
+            'in_flight': in_flight,
+            'waiting': waiting,
+            'processes': processes,
+            'paused_for': max(paused_until - time.time(), 0.0),
+        }
+
+    def print_summary(self):
+        """输出本进程通过协调器发出的请求和排队时间"""
+        if not self.requests:
+            return
+        reclaimed = f"，回收已退出进程的名额 {self.reclaimed} 个" if self.reclaimed else ""
+        print(f"全局配额: 本进程 {self.requests} 次请求，累计排队 {self.wait_seconds:.1f} 秒{reclaimed}")
+
+    def close(self):
+        """注销本进程并关闭数据库连接"""
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.execute('DELETE FROM processes WHERE pid = ?', (self.pid,))
+                finally:
+                    self._connection.close()
+                    self._connection = None
+
+    @contextmanager
+    def _transaction(self):
+        """持有进程内的锁并在 BEGIN IMMEDIATE 事务中执行，正常结束时提交，出错时回滚"""
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+
+    def _register(self, connection):
+        """
+        登记本进程，检查全局上限与仍在使用协调文件的其他进程是否一致
+
+        没有其他进程时，以本进程的参数更新文件中保存的上限
+        """
+        for (pid,) in connection.execute('SELECT pid FROM processes').fetchall():
+            if pid != self.pid and not process_alive(pid):
+                connection.execute('DELETE FROM processes WHERE pid = ?', (pid,))
+        others = connection.execute('SELECT COUNT(*) FROM processes WHERE pid != ?', (self.pid,)).fetchone()[0]
+        stored = connection.execute('SELECT requests_per_minute, max_concurrency FROM limits WHERE id = 1').fetchone()
+        limits = (self.requests_per_minute, self.max_concurrency)
+        if others and stored is not None and tuple(stored) != limits:
+            raise ValueError(
+                f"配额文件 {self.path} 正在被 {others} 个其他进程使用，全局上限为 每分钟请求数 {format_limit(stored[0])}、"
+                f"并发数 {format_limit(stored[1])}，与本进程的 {format_limit(limits[0])}、{format_limit(limits[1])} 不一致"
+            )
+        connection.execute('INSERT OR REPLACE INTO limits (id, requests_per_minute, max_concurrency) VALUES (1, ?, ?)',
+                           limits)
+        connection.execute('INSERT OR REPLACE INTO processes (pid, started) VALUES (?, ?)', (self.pid, time.time()))
+
+    def _enqueue(self) -> int:
+        with self._transaction() as connection:
+            return connection.execute('INSERT INTO waiters (pid, enqueued) VALUES (?, ?)',
+                                      (self.pid, time.time())).lastrowid
+
+    def _dequeue(self, waiter: int):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM waiters WHERE id = ?', (waiter,))
+
+    def _record(self, start: float):
+        with self._lock:
+            self.requests += 1
+            self.wait_seconds += time.time() - start
+
+    def _try_acquire(self, waiter: int):
+        """
+        在一个事务中检查队首、暂停、并发数和令牌桶
+
+        Returns:
+            tuple: (lease, wait)，获得名额时lease为名额编号，否则为None，wait为建议等待的秒数
+        """
+        with self._transaction() as connection:
+            now = time.time()
+            if now - self._last_cleanup >= CLEANUP_INTERVAL:
+                self._last_cleanup = now
+                self._cleanup(connection)
+
+            head = connection.execute('SELECT MIN(id) FROM waiters').fetchone()[0]
+            if head != waiter:
+                return None, POLL_INTERVAL
+
+            level, updated, paused_until = connection.execute(
+                'SELECT level, updated, paused_until FROM bucket WHERE id = 1').fetchone()
+            if now < paused_until:
+                return None, paused_until - now
+
+            # 以协调文件中保存的全局上限为准
+            requests_per_minute, max_concurrency = connection.execute(
+                'SELECT requests_per_minute, max_concurrency FROM limits WHERE id = 1').fetchone()
+            if max_concurrency is not None:
+                in_flight = connection.execute('SELECT COUNT(*) FROM leases').fetchone()[0]
+                if in_flight >= max_concurrency:
+                    return None, POLL_INTERVAL
+
+            if requests_per_minute:
+                rate = requests_per_minute / 60.0
+                capacity = max(rate * self.burst_seconds, 1.0)
+                level = capacity if level is None else min(capacity, level + (now - updated) * rate)
+                if level < 1:
+                    connection.execute('UPDATE bucket SET level = ?, updated = ? WHERE id = 1', (level, now))
+                    return None, (1 - level) / rate
+                connection.execute('UPDATE bucket SET level = ?, updated = ? WHERE id = 1', (level - 1, now))
+
+            connection.execute('DELETE FROM waiters WHERE id = ?', (waiter,))
+            lease = connection.execute('INSERT INTO leases (pid, acquired) VALUES (?, ?)',
+                                       (self.pid, now)).lastrowid
+            return lease, 0.0
+
+    def _cleanup(self, connection):
+        """删除已退出进程遗留的名额和排队记录"""
+        pids = [row[0] for row in connection.execute('SELECT pid FROM leases UNION SELECT pid FROM waiters')]
+        for pid in pids:
+            if pid == self.pid or process_alive(pid):
+                continue
+            deleted = connection.execute('DELETE FROM leases WHERE pid = ?', (pid,)).rowcount
+            connection.execute('DELETE FROM waiters WHERE pid = ?', (pid,))
+            connection.execute('DELETE FROM processes WHERE pid = ?', (pid,))
+            self.reclaimed += deleted
+
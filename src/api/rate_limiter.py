@@ -0,0 +1,327 @@
+"""
+客户端限流模块
+用令牌桶控制每分钟请求数和token数，并按AIMD（加性增、乘性减）自动调整并发上限：
+收到429/503时并发上限减半，之后每成功一轮请求加1，使长时间任务贴近配额运行而不触发限流
+"""
+
+import re
+import json
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+
+# 表示配额耗尽或服务过载的状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+# 令牌桶容量对应的秒数：允许短时间内突发这么多秒的配额
+BURST_SECONDS = 10
+
+# 每张图像的估算token数：Gemini按768x768分块计费，每块258个token，常见书页约5块
+IMAGE_TOKENS = 1290
+
+# 异步等待并发名额时的轮询间隔（秒）
+POLL_INTERVAL = 0.05
+
+
+def estimate_request_tokens(payload: dict) -> int:
+    """
+    估算请求消耗的token数，实际用量在收到响应后根据usageMetadata校正
+
+    Args:
+        payload (dict): generateContent请求体
+
+    Returns:
+        int: 估算的token数
+    """
+    tokens = 0
+    for content in payload.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                # 中文大约每个字一个token，按字符数估算偏保守
+                tokens += len(part["text"])
+            elif "inline_data" in part:
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+def usage_token_count(data):
+    """
+    读取响应中的实际token用量
+
+    Args:
+        data: generateContent响应的JSON数据
+
+    Returns:
+        int或None: totalTokenCount，响应中没有用量信息时返回None
+    """
+    if not isinstance(data, dict):
+        return None
+    count = (data.get("usageMetadata") or {}).get("totalTokenCount")
+    return count if isinstance(count, int) else None
+
+
+def parse_retry_after(headers, body=None):
+    """
+    解析服务器要求的等待时间
+
+    优先使用Retry-After响应头（秒数或HTTP日期），其次使用Gemini错误详情中的retryDelay（如"37s"）
+
+    Args:
+        headers: 响应头（键不区分大小写的映射或小写键的dict）
+        body (bytes): 响应体
+
+    Returns:
+        float或None: 需要等待的秒数，无法确定时返回None
+    """
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        value = value.strip()
+        if re.fullmatch(r"\d+(\.\d+)?", value):
+            return float(value)
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    if body:
+        try:
+            details = json.loads(body).get("error", {}).get("details", [])
+        except (ValueError, AttributeError):
+            return None
+        for detail in details if isinstance(details, list) else []:
+            match = re.fullmatch(r"(\d+(?:\.\d+)?)s", str(detail.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """按每分钟速率补充的令牌桶，余额可以为负（实际用量超过估算时先透支）"""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        返回还需等待多少秒才有足够的令牌，超过容量的请求只需等到桶满
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+    def consume(self, amount: float):
+        """扣除令牌，amount为负时退还"""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateTicket:
+    """一次已获准的请求"""
+
+    def __init__(self, tokens: int, started: float):
+        self.tokens = tokens
+        self.started = started
+        # 跨进程配额协调器分配的名额编号
+        self.lease = None
+
+
+class RateLimiter:
+    """
+    多个线程（或协程）共用的客户端限流器
+
+    acquire() 在并发名额、请求数配额和token配额都满足时返回，请求结束后必须调用 release()
+    """
+
+    def __init__(self, max_concurrency: int = 1, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 min_concurrency: int = 1, decrease_factor: float = 0.5, coordinator=None):
+        """
+        初始化限流器
+
+        Args:
+            max_concurrency (int): 并发上限的最大值，也是初始值
+            requests_per_minute (float): 每分钟请求数上限，None表示不限制
+            tokens_per_minute (float): 每分钟token数上限，None表示不限制
+            min_concurrency (int): 并发上限的最小值
+            decrease_factor (float): 收到限流响应时并发上限的缩小比例
+            coordinator (QuotaCoordinator): 可选的跨进程配额协调器，本进程获得名额后还需在全局队列中排队
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = max(min(min_concurrency, self.max_concurrency), 1)
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.coordinator = coordinator
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+        # 统计信息
+        self.requests = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.lowest_limit = self.max_concurrency
+        self.wait_seconds = 0.0
+        self.tokens_used = 0
+
+    @property
+    def concurrency(self) -> int:
+        """当前生效的并发上限"""
+        return max(int(self.limit), self.min_concurrency)
+
+    def acquire(self, tokens: int = 0, hedge: bool = False) -> RateTicket:
+        """
+        等待直到允许发送请求
+
+        Args:
+            tokens (int): 请求的估算token数
+            hedge (bool): 是否为对冲请求。对冲请求不等待本进程的并发名额（仍计入进行中的请求数，
+                          并遵守暂停和每分钟配额），否则原请求占着唯一的名额时对冲请求只能等它结束
+
+        Returns:
+            RateTicket: 需要传给 release()
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                ticket, wait = self._try_acquire(tokens, start, hedge)
+                if ticket is not None:
+                    break
+                # wait为None表示在等待并发名额，由release()唤醒
+                self._condition.wait(wait)
+        if self.coordinator is not None:
+            try:
+                ticket.lease = self.coordinator.acquire(tokens)
+            except BaseException:
+                self._release_slot(ticket)
+                raise
+        return ticket
+
+    async def acquire_async(self, tokens: int = 0) -> RateTicket:
+        """acquire() 的协程版本，等待期间不阻塞事件循环"""
+        start = time.monotonic()
+        while True:
+            with self._condition:
+                ticket, wait = self._try_acquire(tokens, start)
+            if ticket is not None:
+                break
+            await asyncio.sleep(POLL_INTERVAL if wait is None else wait)
+        if self.coordinator is not None:
+            try:
+                ticket.lease = await self.coordinator.acquire_async(tokens)
+            except BaseException:
+                self._release_slot(ticket)
+                raise
+        return ticket
+
+    def release(self, ticket: RateTicket, status: int = None, retry_after: float = None, tokens_used: int = None):
+        """
+        请求结束，根据结果调整并发上限
+
+        Args:
+            ticket (RateTicket): acquire() 的返回值
+            status (int): HTTP状态码，网络错误时为None
+            retry_after (float): 服务器要求的等待秒数
+            tokens_used (int): 响应中报告的实际token数
+        """
+        if ticket.lease is not None:
+            self.coordinator.release(ticket.lease, status, retry_after, tokens_used)
+        now = time.monotonic()
+        with self._condition:
+            self.in_flight -= 1
+            if tokens_used is not None:
+                self.tokens_used += tokens_used
+                if self.token_bucket is not None:
+                    self.token_bucket.consume(tokens_used - ticket.tokens)
+
+            if status in THROTTLE_STATUS_CODES:
+                self._on_throttled(ticket, status, retry_after, now)
+            elif isinstance(status, int) and status < 400:
+                # 加性增：大约每完成一轮（当前并发数个）成功请求，并发上限加1
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def _release_slot(self, ticket: RateTicket):
+        """在全局队列中排队失败（如被取消）时归还本进程的名额，不影响并发上限"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_throttled(self, ticket, status, retry_after, now):
+        self.throttled += 1
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        # 同一轮拥塞中已发出的请求会接连收到429，只按第一个缩小一次
+        if ticket.started < self._last_decrease or self.limit <= self.min_concurrency:
+            return
+        self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+        self.lowest_limit = min(self.lowest_limit, self.concurrency)
+        self.decreases += 1
+        self._last_decrease = now
+        pause = f"，暂停 {retry_after:.1f} 秒" if retry_after else ""
+        print(f"收到限流响应 ({status})，并发上限降至 {self.concurrency}{pause}")
+
+    def _try_acquire(self, tokens, start, hedge=False):
+        """
+        尝试获取请求名额，对冲请求不检查并发上限
+
+        Returns:
+            tuple: (ticket, wait)，获取成功时wait为0；失败时ticket为None，wait为建议等待的秒数，
+                   None表示需要等待其他请求结束
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return None, self.paused_until - now
+        if self.in_flight >= self.concurrency and not hedge:
+            return None, None
+
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.wait_time(tokens, now))
+        if wait > 0:
+            return None, wait
+
+        if self.request_bucket is not None:
+            self.request_bucket.consume(1)
+        if self.token_bucket is not None:
+            self.token_bucket.consume(tokens)
+        self.in_flight += 1
+        self.requests += 1
+        self.wait_seconds += now - start
+        return RateTicket(tokens, now), 0.0
+
+    def snapshot(self) -> dict:
+        """
+        当前限流状态，便于在长时间任务中观察
+
+        Returns:
+            dict: 当前并发上限、进行中的请求数、剩余暂停时间和累计统计
+        """
+        with self._condition:
+            return {
+                'concurrency': self.concurrency,
+                'in_flight': self.in_flight,
+                'paused_for': max(self.paused_until - time.monotonic(), 0.0),
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'decreases': self.decreases,
+                'wait_seconds': self.wait_seconds,
+                'tokens_used': self.tokens_used,
+            }
+
+    def print_summary(self):
+        """输出限流统计"""
+        if not self.requests:
+            return
+        print(f"限流统计: {self.requests} 次请求，收到限流响应 {self.throttled} 次，并发上限调整 {self.decreases} 次"
+              f"（最低 {self.lowest_limit}，当前 {self.concurrency}），累计排队 {self.wait_seconds:.1f} 秒")
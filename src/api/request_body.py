@@ -0,0 +1,97 @@
+"""
+请求体编码模块
+页面图像以base64字节直接拼接进序列化好的请求体，不经过中间的字符串和JSON文本；
+同一页的请求体只生成一次，重试时直接复用
+"""
+
+import re
+import json
+
+
+# 序列化时代替图像数据的占位符，NUL字符在JSON中转义为\u0000，不会与普通文本混淆
+_PLACEHOLDER = re.compile(rb'"\\u0000(\d+)\\u0000"')
+
+
+def encode_payload(payload: dict) -> bytes:
+    """
+    把请求体序列化为UTF-8 JSON
+
+    输出与 json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':')) 完全相同，
+    因此可以直接用来计算缓存键。值为bytes或memoryview的字段（base64编码的图像数据）原样拼接，
+    整个请求体只复制一次
+
+    Args:
+        payload (dict): generateContent请求体
+
+    Returns:
+        bytes: 请求体
+    """
+    blobs = []
+
+    def placeholder(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blobs.append(value)
+            return f"\0{len(blobs) - 1}\0"
+        raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+    skeleton = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'),
+                          default=placeholder).encode('utf-8')
+    if not blobs:
+        return skeleton
+
+    pieces = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(skeleton):
+        pieces.append(skeleton[position:match.start() + 1])
+        pieces.append(blobs[int(match.group(1))])
+        pieces.append(b'"')
+        position = match.end()
+    pieces.append(skeleton[position:])
+    return b''.join(pieces)
+
+
+class PreparedContents(list):
+    """
+    一页请求的contents，图像数据为base64字节
+
+    第一次序列化后请求体被缓存，图像数据改为指向请求体内部的memoryview，
+    此后请求体是base64数据唯一的一份副本；重试时直接复用同一个请求体
+    """
+
+    def __init__(self, contents):
+        super().__init__(contents)
+        self._bodies = {}
+
+    def encode(self, payload: dict) -> bytes:
+        """
+        序列化以本对象为contents的请求体，相同的其他字段只序列化一次
+
+        Args:
+            payload (dict): 请求体，payload["contents"] 为本对象
+
+        Returns:
+            bytes: 请求体
+        """
+        options = json.dumps({key: value for key, value in payload.items() if key != "contents"}, sort_keys=True)
+        body = self._bodies.get(options)
+        if body is None:
+            body = encode_payload(payload)
+            self._bodies[options] = body
+            self._share_image_data(body)
+        return body
+
+    def _share_image_data(self, body):
+        """把各个图像部分的数据换成请求体中对应位置的只读视图，释放原来的base64字节"""
+        view = memoryview(body)
+        position = 0
+        for content in self:
+            for part in content.get("parts", []):
+                inline_data = part.get("inline_data")
+                if not inline_data or not isinstance(inline_data.get("data"), bytes):
+                    continue
+                data = inline_data["data"]
+                start = body.find(b'"data":"' + data[:64], position) + len(b'"data":"')
+                if start < len(b'"data":"') or view[start:start + len(data)] != data:
+                    continue
+                inline_data["data"] = view[start:start + len(data)]
+                position = start + len(data)
@@ -0,0 +1,219 @@
+"""
+响应缓存模块
+按请求内容（图像数据、提示词、模型名、generation_config）的哈希在本地SQLite中缓存模型响应，
+重新转换同一本书时无需再次调用API
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .request_body import encode_payload
+
+
+# 默认缓存位置
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'pdf2epub', 'responses.sqlite3')
+
+# 默认缓存容量上限（字节）
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+
+# 缓存模式：use 读写缓存，refresh 忽略已有缓存但写入新响应，off 完全不使用缓存
+CACHE_MODES = ('use', 'refresh', 'off')
+
+
+def make_cache_key(model, payload):
+    """
+    计算请求的缓存键
+
+    Args:
+        model (str): 模型名称
+        payload (dict): 请求体，包含contents（图像数据与提示词）和generationConfig
+
+    Returns:
+        str: SHA-256十六进制摘要
+    """
+    return make_body_cache_key(model, encode_payload(payload))
+
+
+def make_body_cache_key(model, body):
+    """
+    根据已经序列化的请求体计算缓存键，结果与 make_cache_key 相同
+
+    Args:
+        model (str): 模型名称
+        body (bytes): encode_payload 生成的请求体
+
+    Returns:
+        str: SHA-256十六进制摘要
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def is_cacheable_response(text, generation_config=None):
+    """
+    判断响应是否可以缓存：要求JSON输出时，只缓存能够解析的响应，避免重试时反复命中错误结果
+
+    Args:
+        text (str): 响应文本
+        generation_config (dict): 请求的generation_config
+
+    Returns:
+        bool: 可以缓存时返回True
+    """
+    if not generation_config or generation_config.get("response_mime_type") != "application/json":
+        return True
+    try:
+        json.loads(text.strip().replace('```json', '').replace('```', '').strip())
+        return True
+    except ValueError:
+        return False
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_SIZE, mode='use'):
+        """
+        初始化响应缓存
+
+        Args:
+            path (str): SQLite数据库文件路径
+            max_bytes (int): 缓存容量上限，超过时按最近最少使用淘汰
+            mode (str): 缓存模式 ('use'、'refresh' 或 'off')
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"不支持的缓存模式: {mode}")
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._total_bytes = 0
+
+        if mode != 'off':
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # 多个工作线程共用同一个连接，由锁保证串行访问
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            # WAL模式下每次提交无需等待完整的磁盘同步，命中缓存时更新访问时间的开销很小
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+            self._connection.commit()
+            self._total_bytes = self._connection.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, key):
+        """
+        读取缓存的响应
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            str: 缓存的响应文本，未命中时返回None
+        """
+        if self.mode == 'off':
+            return None
+        if self.mode == 'refresh':
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def contains(self, key):
+        """
+        判断缓存中是否有该请求的响应，不更新命中统计和访问时间
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            bool: 按当前缓存模式get()会命中时返回True
+        """
+        if self.mode != 'use':
+            return False
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM responses WHERE key = ?', (key,)).fetchone() is not None
+
+    def put(self, key, value):
+        """
+        写入响应，超出容量上限时淘汰最久未使用的条目
+
+        Args:
+            key (str): 缓存键
+            value (str): 响应文本
+        """
+        if self.mode == 'off':
+            return
+
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            row = self._connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._total_bytes -= row[0]
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, value, size, time.time())
+            )
+            self._total_bytes += size
+            self._evict()
+            self._connection.commit()
+
+    def print_summary(self):
+        """输出缓存命中统计"""
+        if self.mode == 'off':
+            return
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        print(f"响应缓存: 命中 {self.hits} 次，未命中 {self.misses} 次 (命中率 {hit_rate:.1f}%)，"
+              f"淘汰 {self.evictions} 条，占用 {self._total_bytes / 1024 / 1024:.1f}MB")
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
+                self._connection = None
+
+    def _evict(self):
+        """按最近访问时间淘汰条目，直到总大小不超过上限（调用方需持有锁）"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._connection.execute(
+                'SELECT key, size FROM responses ORDER BY last_access LIMIT 64').fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    return
@@ -0,0 +1,268 @@
+"""
+重试策略模块
+所有模型调用共用的重试引擎：按错误类型判断是否值得重试，使用带上限的指数退避和完全随机抖动，
+遵守服务器的Retry-After，并限制整个任务的重试总次数
+"""
+
+import time
+import random
+import asyncio
+import threading
+from collections import Counter
+
+import aiohttp
+import requests
+
+from .errors import AsyncHTTPError
+from .rate_limiter import parse_retry_after
+
+
+# 退避基数和上限（秒）：第n次重试前等待 [0, min(上限, 基数 * 2^n)] 内的随机时间
+DEFAULT_BASE_DELAY = 2.0
+DEFAULT_MAX_DELAY = 60.0
+
+# 无法解析的响应在一次调用中最多重试的次数：模型的输出是采样得到的，重新生成通常就能解析，
+# 但反复出错的页面不值得按 max_attempts 一直重试
+DEFAULT_MALFORMED_RETRIES = 1
+
+# 错误类型及其说明
+ERROR_REASONS = {
+    'throttled': '限流',
+    'server_error': '服务器错误',
+    'timeout': '超时',
+    'connection': '连接错误',
+    'malformed': '响应格式错误',
+    'client_error': '请求错误',
+    'other': '其他错误',
+}
+
+
+class RetryError(Exception):
+    """重试后仍然失败，或遇到不可重试的错误"""
+
+    def __init__(self, message: str, reason: str, attempts: int, last_exception: Exception):
+        super().__init__(message)
+        self.reason = reason
+        self.attempts = attempts
+        self.last_exception = last_exception
+
+
+def error_status(exception):
+    """
+    取出异常对应的HTTP状态码和响应信息
+
+    Returns:
+        tuple: (status, headers, body)，不是HTTP错误时status为None
+    """
+    if isinstance(exception, AsyncHTTPError):
+        return exception.status, exception.headers, exception.body
+    if isinstance(exception, requests.HTTPError) and exception.response is not None:
+        response = exception.response
+        return response.status_code, response.headers, response.content
+    return None, {}, None
+
+
+def classify_error(exception) -> str:
+    """
+    判断异常的类型
+
+    Args:
+        exception (Exception): 一次尝试抛出的异常
+
+    Returns:
+        str: ERROR_REASONS中的一个键
+    """
+    status, _, _ = error_status(exception)
+    if status is not None:
+        if status == 429:
+            return 'throttled'
+        if status == 408:
+            return 'timeout'
+        if status >= 500:
+            return 'server_error'
+        return 'client_error'
+    if isinstance(exception, (requests.Timeout, asyncio.TimeoutError, TimeoutError)):
+        return 'timeout'
+    if isinstance(exception, (requests.ConnectionError, aiohttp.ClientConnectionError, ConnectionError)):
+        return 'connection'
+    # 要求JSON的响应无法解析，或者字段格式不对（json.JSONDecodeError也是ValueError）
+    if isinstance(exception, ValueError):
+        return 'malformed'
+    return 'other'
+
+
+class RetryPolicy:
+    """
+    一个任务中所有请求共用的重试策略，线程安全
+
+    call() / call_async() 执行一次操作，失败时按策略等待后重试，并按原因统计重试次数
+    """
+
+    def __init__(self, base_delay: float = DEFAULT_BASE_DELAY, max_delay: float = DEFAULT_MAX_DELAY,
+                 retry_budget: int = None, malformed_retries: int = DEFAULT_MALFORMED_RETRIES, sleep=time.sleep,
+                 async_sleep=asyncio.sleep, rng=None):
+        """
+        初始化重试策略
+
+        Args:
+            base_delay (float): 指数退避的基数（秒）
+            max_delay (float): 单次等待的上限（秒）
+            retry_budget (int): 整个任务最多重试的次数，用完后失败的请求不再重试，None表示不限制
+            malformed_retries (int): 无法解析的响应在一次调用中最多重试的次数，0表示不重试
+            sleep: 同步等待函数，测试时可替换
+            async_sleep: 异步等待函数，测试时可替换
+            rng (random.Random): 随机数生成器，测试时可固定种子
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.malformed_retries = malformed_retries
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.calls = 0
+        self.retries = Counter()
+        self.failures = Counter()
+        self.budget_exhausted = 0
+
+    @property
+    def total_retries(self) -> int:
+        """已经进行的重试总次数"""
+        return sum(self.retries.values())
+
+    def is_retryable(self, reason: str, retried: int = 0, malformed_retries: int = None) -> bool:
+        """
+        该类型的错误是否值得重试
+
+        Args:
+            reason (str): ERROR_REASONS中的一个键
+            retried (int): 本次调用中该类型的错误已经重试的次数
+            malformed_retries (int): 覆盖 self.malformed_retries
+        """
+        if reason == 'client_error':
+            return False
+        if reason == 'malformed':
+            return retried < (self.malformed_retries if malformed_retries is None else malformed_retries)
+        return True
+
+    def backoff(self, attempt: int) -> float:
+        """
+        第attempt次重试（从0开始）前的等待时间：完全随机抖动的指数退避
+
+        Args:
+            attempt (int): 已失败的次数减1
+
+        Returns:
+            float: 等待秒数
+        """
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, operation, max_attempts: int = 3, description: str = "请求失败", malformed_retries: int = None):
+        """
+        执行操作，失败时按策略重试
+
+        Args:
+            operation: 无参数的函数，每次尝试调用一次
+            max_attempts (int): 最多尝试的次数
+            description (str): 最终失败时异常信息的前缀
+            malformed_retries (int): 本次调用中无法解析的响应最多重试的次数，默认为 self.malformed_retries
+
+        Returns:
+            operation的返回值
+        """
+        with self._lock:
+            self.calls += 1
+        attempt = 0
+        retried = Counter()
+        while True:
+            try:
+                return operation()
+            except Exception as e:
+                delay = self._on_failure(e, attempt, max_attempts, description, retried, malformed_retries)
+            self.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, operation, max_attempts: int = 3, description: str = "请求失败",
+                         malformed_retries: int = None):
+        """
+        call() 的协程版本
+
+        Args:
+            operation: 无参数、返回协程的函数
+            max_attempts (int): 最多尝试的次数
+            description (str): 最终失败时异常信息的前缀
+            malformed_retries (int): 本次调用中无法解析的响应最多重试的次数，默认为 self.malformed_retries
+
+        Returns:
+            协程的返回值
+        """
+        with self._lock:
+            self.calls += 1
+        attempt = 0
+        retried = Counter()
+        while True:
+            try:
+                return await operation()
+            except Exception as e:
+                delay = self._on_failure(e, attempt, max_attempts, description, retried, malformed_retries)
+            await self.async_sleep(delay)
+            attempt += 1
+
+    def _on_failure(self, exception, attempt, max_attempts, description, retried, malformed_retries=None):
+        """
+        记录一次失败并决定是否重试
+
+        Args:
+            retried (Counter): 本次调用中各类型的错误已经重试的次数，决定重试时更新
+
+        Returns:
+            float: 重试前需要等待的秒数；不再重试时抛出RetryError
+        """
+        reason = classify_error(exception)
+        attempts = attempt + 1
+        print(f"第 {attempts} 次尝试失败（{ERROR_REASONS[reason]}）: {str(exception)}")
+
+        with self._lock:
+            if not self.is_retryable(reason, retried[reason], malformed_retries):
+                self.failures[reason] += 1
+                if retried[reason]:
+                    message = f"{description}，{ERROR_REASONS[reason]}已重试 {retried[reason]} 次: {exception}"
+                else:
+                    message = f"{description}，{ERROR_REASONS[reason]}不可重试: {exception}"
+            elif attempts >= max_attempts:
+                self.failures[reason] += 1
+                message = f"{description}，已重试 {attempt} 次: {exception}"
+            elif self.retry_budget is not None and self.total_retries >= self.retry_budget:
+                self.failures[reason] += 1
+                self.budget_exhausted += 1
+                message = f"{description}，本任务的重试次数（{self.retry_budget}）已用完: {exception}"
+            else:
+                self.retries[reason] += 1
+                retried[reason] += 1
+                message = None
+        if message is not None:
+            raise RetryError(message, reason, attempts, exception) from exception
+
+        delay = self.backoff(attempt)
+        _, headers, body = error_status(exception)
+        retry_after = parse_retry_after(headers, body)
+        if retry_after is not None:
+            # 服务器明确要求的等待时间优先，但不超过退避上限太多
+            delay = max(delay, min(retry_after, self.max_delay * 2))
+        print(f"等待 {delay:.1f} 秒后进行第 {attempts + 1} 次尝试...")
+        return delay
+
+    def print_summary(self):
+        """输出按原因分类的重试统计"""
+        if not self.retries and not self.failures:
+            return
+        retries = '，'.join(f"{ERROR_REASONS[reason]} {count}" for reason, count in self.retries.most_common())
+        print(f"重试统计: {self.calls} 次调用，重试 {self.total_retries} 次" + (f"（{retries}）" if retries else ""))
+        if self.failures:
+            failures = '，'.join(f"{ERROR_REASONS[reason]} {count}" for reason, count in self.failures.most_common())
+            print(f"最终失败: {failures}")
+        if self.budget_exhausted:
+            print(f"重试次数用完后直接失败的请求: {self.budget_exhausted}")
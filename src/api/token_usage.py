@@ -0,0 +1,247 @@
+"""
+token用量模块
+generateContent 的结果保留响应中的token用量（usageMetadata）和finishReason；
+任务中每次请求的用量按页面、调用类型（目录检测/内容提取）、模型和整个任务累计，并按模型单价估算费用
+"""
+
+import os
+import re
+import threading
+
+
+# usageMetadata中的字段
+USAGE_FIELDS = {
+    'prompt': 'promptTokenCount',
+    'candidates': 'candidatesTokenCount',
+    'thoughts': 'thoughtsTokenCount',
+    'cached': 'cachedContentTokenCount',
+    'total': 'totalTokenCount',
+}
+
+# 各模型每百万token的标准价格（美元）：(输入, 输出)，输出包括思考token；不计上下文缓存的折扣
+MODEL_PRICES = {
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-pro': (1.25, 10.00),
+}
+
+# PDFProcessor 保存的页面图像文件名，如 page-001.png
+PAGE_FILE_PATTERN = re.compile(r'^page-(\d+)\.\w+$')
+
+# 调用类型及其说明
+CALL_TYPES = {
+    'toc_check': '目录检测',
+    'extraction': '内容提取',
+    'discarded': '被放弃的对冲请求',
+}
+
+
+def extract_usage(data):
+    """
+    取出响应中的token用量
+
+    Args:
+        data: generateContent响应（或流式响应的一个事件）的JSON数据
+
+    Returns:
+        dict或None: {'prompt', 'candidates', 'thoughts', 'cached', 'total'} 各项token数，
+                    响应中没有usageMetadata时返回None
+    """
+    metadata = data.get("usageMetadata") if isinstance(data, dict) else None
+    if not isinstance(metadata, dict):
+        return None
+    usage = {field: metadata.get(key) or 0 for field, key in USAGE_FIELDS.items()}
+    if not usage['total']:
+        usage['total'] = usage['prompt'] + usage['candidates'] + usage['thoughts']
+    return usage
+
+
+def page_number(image):
+    """
+    读取页面图像的页码
+
+    Args:
+        image: 图像文件路径或内存图像（PageImage）
+
+    Returns:
+        int或None: 页码，无法得知时返回None
+    """
+    page_num = getattr(image, 'page_num', None)
+    if page_num is not None:
+        return page_num
+    if isinstance(image, str):
+        match = PAGE_FILE_PATTERN.match(os.path.basename(image))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def estimate_cost(usage, model, prices=MODEL_PRICES):
+    """
+    按模型单价估算一次请求的费用
+
+    Args:
+        usage (dict): extract_usage 的结果
+        model (str): 模型名称
+        prices (dict): 模型名称到 (输入, 输出) 每百万token价格的映射
+
+    Returns:
+        float或None: 美元；没有该模型的价格时返回None
+    """
+    if model not in prices:
+        return None
+    input_price, output_price = prices[model]
+    return (usage['prompt'] * input_price + (usage['total'] - usage['prompt']) * output_price) / 1_000_000
+
+
+class GenerateResult(str):
+    """
+    generateContent 的结果：可以直接当作响应文本使用，同时保留token用量和finishReason
+
+    Attributes:
+        usage (dict): extract_usage 的结果，命中缓存或响应中没有用量信息时为None
+        finish_reason (str): 如 "STOP"、"MAX_TOKENS"，命中缓存时为None
+        cached (bool): 是否来自响应缓存
+    """
+
+    def __new__(cls, text, usage=None, finish_reason=None, cached=False):
+        result = super().__new__(cls, text)
+        result.usage = usage
+        result.finish_reason = finish_reason
+        result.cached = cached
+        return result
+
+    @property
+    def text(self):
+        """响应文本"""
+        return str(self)
+
+    @property
+    def prompt_tokens(self):
+        return (self.usage or {}).get('prompt', 0)
+
+    @property
+    def candidates_tokens(self):
+        return (self.usage or {}).get('candidates', 0)
+
+    @property
+    def total_tokens(self):
+        return (self.usage or {}).get('total', 0)
+
+
+def new_counts():
+    """一组累计值：请求数、各项token数和估算费用"""
+    return {'requests': 0, 'prompt': 0, 'candidates': 0, 'thoughts': 0, 'total': 0, 'cost': 0.0}
+
+
+def add_counts(counts, other, share=1.0):
+    """把other累加到counts中；token数和费用只累加其中share比例，请求数不分摊"""
+    for field in counts:
+        value = other.get(field, 0) * (1 if field == 'requests' else share)
+        counts[field] += value if field == 'cost' else round(value)
+
+
+class TokenUsage:
+    """
+    累计任务中各次请求的token用量和估算费用，线程安全
+
+    一次请求识别多页时，用量在这些页面之间平均分摊
+    """
+
+    def __init__(self, prices=None):
+        """
+        初始化用量统计
+
+        Args:
+            prices (dict): 模型名称到 (输入, 输出) 每百万token价格的映射，默认使用 MODEL_PRICES
+        """
+        self.prices = MODEL_PRICES if prices is None else prices
+        self.total = new_counts()
+        self.by_call_type = {}
+        self.by_model = {}
+        self.by_page = {}
+        # 没有价格、无法估算费用的模型
+        self.unpriced = set()
+        self._lock = threading.Lock()
+
+    def record(self, usage, model, call_type='extraction', pages=None):
+        """
+        记录一次请求的用量
+
+        Args:
+            usage (dict): extract_usage 的结果，为None（命中缓存或没有用量信息）时不记录
+            model (str): 模型名称
+            call_type (str): 'toc_check' 或 'extraction'
+            pages (list): 请求识别的页码，页码未知时为None
+        """
+        if not isinstance(usage, dict):
+            return
+        counts = dict(usage, requests=1, cost=estimate_cost(usage, model, self.prices) or 0.0)
+        pages = [page_num for page_num in pages or [] if page_num is not None]
+        with self._lock:
+            if model not in self.prices:
+                self.unpriced.add(model)
+            add_counts(self.total, counts)
+            add_counts(self.by_call_type.setdefault(call_type, new_counts()), counts)
+            add_counts(self.by_model.setdefault(model, new_counts()), counts)
+            for page_num in pages:
+                add_counts(self.by_page.setdefault(page_num, new_counts()), counts, 1 / len(pages))
+
+    def summary(self):
+        """
+        用量汇总，写入进度文件，--resume 时由 load() 读回
+
+        Returns:
+            dict: total、by_call_type、by_model和by_page（页码为字符串）各项累计值
+        """
+        with self._lock:
+            return {
+                'total': dict(self.total, cost=round(self.total['cost'], 6)),
+                'by_call_type': {name: dict(counts) for name, counts in self.by_call_type.items()},
+                'by_model': {name: dict(counts) for name, counts in self.by_model.items()},
+                'by_page': {str(page_num): dict(counts) for page_num, counts in sorted(self.by_page.items())},
+            }
+
+    def load(self, summary):
+        """
+        累加之前运行的用量汇总，恢复任务后整本书的用量仍然完整
+
+        Args:
+            summary (dict): summary() 的结果，为None时不做任何操作
+        """
+        if not summary:
+            return
+        with self._lock:
+            add_counts(self.total, summary.get('total', {}))
+            for name, counts in summary.get('by_call_type', {}).items():
+                add_counts(self.by_call_type.setdefault(name, new_counts()), counts)
+            for name, counts in summary.get('by_model', {}).items():
+                add_counts(self.by_model.setdefault(name, new_counts()), counts)
+            for page_num, counts in summary.get('by_page', {}).items():
+                add_counts(self.by_page.setdefault(int(page_num), new_counts()), counts)
+
+    def print_summary(self, top=5):
+        """
+        输出整个任务、各调用类型和各模型的用量与估算费用，以及用量最多的几页
+
+        Args:
+            top (int): 列出用量最多的页数
+        """
+        if not self.total['requests']:
+            return
+        print(f"token用量: {self._format(self.total)}")
+        for name, counts in self.by_call_type.items():
+            print(f"  {CALL_TYPES.get(name, name)}: {self._format(counts)}")
+        if len(self.by_model) > 1:
+            for name, counts in self.by_model.items():
+                print(f"  {name}: {self._format(counts)}")
+        if self.by_page:
+            pages = sorted(self.by_page.items(), key=lambda item: item[1]['total'], reverse=True)[:top]
+            print("  用量最多的页面: " + "，".join(f"第 {page_num} 页 {counts['total']:,}" for page_num, counts in pages))
+        if self.unpriced:
+            print(f"  没有 {'、'.join(sorted(self.unpriced))} 的价格，估算费用不包括这些模型")
+
+    @staticmethod
+    def _format(counts):
+        thoughts = f"（含思考 {counts['thoughts']:,}）" if counts['thoughts'] else ""
+        return (f"{counts['requests']} 次请求，输入 {counts['prompt']:,}，输出 {counts['total'] - counts['prompt']:,}"
+                f"{thoughts}，合计 {counts['total']:,} token，估算费用 ${counts['cost']:.4f}")
@@ -4,6 +4,7 @@ EPUB生成器模块
 """
 
 import os
+import mimetypes
 from ebooklib import epub
 from pathlib import Path
 
@@ -12,6 +13,30 @@ class EpubGenerator:
     def __init__(self):
         pass
     
+    def add_image(self, book, image_path):
+        """
+        将页面图像加入EPUB，同一图像只添加一次
+        
+        Args:
+            book (epub.EpubBook): EPUB书籍
+            image_path (str): 图像文件路径
+            
+        Returns:
+            str: 图像在EPUB中的路径，用于<img>的src属性
+        """
+        file_name = f'images/{os.path.basename(image_path)}'
+        if book.get_item_with_href(file_name) is None:
+            with open(image_path, 'rb') as f:
+                image_data = f.read()
+            media_type = mimetypes.guess_type(image_path)[0] or 'image/png'
+            book.add_item(epub.EpubImage(
+                uid=f'image_{os.path.splitext(os.path.basename(image_path))[0]}',
+                file_name=file_name,
+                media_type=media_type,
+                content=image_data
+            ))
+        return file_name
+    
     def create_epub(self, chapters, output_path, title="转换的电子书", author="未知作者"):
         """
         创建EPUB文件
@@ -118,6 +143,11 @@ class EpubGenerator:
             # 修复段落换行问题：正确处理段落和行内换行
             html_content = ['<h1>{}</h1>'.format(chapter['title'])]
             
+            # 纯图片页面直接嵌入页面图像
+            if chapter.get('image'):
+                html_content.append('<p class="image"><img src="{}" alt=""/></p>'.format(
+                    self.add_image(book, chapter['image'])))
+            
             # 按段落分割（双换行）
             paragraphs = chapter['content'].split('\n\n')
             for paragraph in paragraphs:
@@ -158,6 +188,8 @@ class EpubGenerator:
             h1 { text-align: center; }
             h2 { text-align: left; }
             p { text-indent: 2em; line-height: 1.5em; }
+            p.image { text-indent: 0; text-align: center; }
+            img { max-width: 100%; }
         '''
         nav_css = epub.EpubItem(
             uid="style_nav",
@@ -221,6 +253,8 @@ class EpubGenerator:
                 if block_type == 'heading':
                     level = block.get('level', 2)
                     html_parts.append(f'<h{level} {style_str}>{content}</h{level}>')
+                elif block_type == 'image':
+                    html_parts.append(f'<p class="image"><img src="{self.add_image(book, block["src"])}" alt=""/></p>')
                 else: # paragraph
                     # 段落默认左对齐，首行缩进由全局CSS控制
                     # 如果有特殊对齐要求，则应用
@@ -240,6 +274,8 @@ class EpubGenerator:
             h1 { text-align: center; }
             p { text-indent: 2em; line-height: 1.5em; text-align: justify; }
             h2, h3, h4 { text-align: left; }
+            p.image { text-indent: 0; text-align: center; }
+            img { max-width: 100%; }
         '''
         nav_css = epub.EpubItem(uid="style_nav", file_name="style/nav.css", media_type="text/css", content=style)
         book.add_item(nav_css)
@@ -308,6 +344,8 @@ class EpubGenerator:
                         if block_type == 'heading':
                             level = block.get('level', 2)
                             html_parts.append(f'<h{level} {style_str}>{content}</h{level}>')
+                        elif block_type == 'image':
+                            html_parts.append(f'<p class="image"><img src="{self.add_image(book, block["src"])}" alt=""/></p>')
                         else:
                             html_parts.append(f'<p {style_str}>{content}</p>')
                     
@@ -322,6 +360,8 @@ class EpubGenerator:
                     h1 { text-align: center; }
                     p { text-indent: 2em; line-height: 1.5em; text-align: justify; }
                     h2, h3, h4 { text-align: left; }
+                    p.image { text-indent: 0; text-align: center; }
+                    img { max-width: 100%; }
                 '''
                 nav_css = epub.EpubItem(
                     uid="style_nav", 
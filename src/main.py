@@ -7,7 +7,11 @@ import argparse
 import os
 import sys
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from types import GeneratorType
 
 # 添加src目录到Python路径
 # 假设您的目录结构是:
@@ -20,11 +24,29 @@ from pathlib import Path
 # sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
 from processors.pdf_processor import PDFProcessor
-from api.gemini_client import GeminiClient
+from processors.text_layer import TextLayerPage, TEXT_LAYER_MODES
+from processors.page_classifier import PageClassifier, PAGE_TYPE_NAMES
+from api.gemini_client import GeminiClient, request_prompts
+from api.minigenai import DEFAULT_CACHE_TTL, DEFAULT_STALL_TIMEOUT
+from api.image_encoder import ImageEncoder, IMAGE_FORMATS, PNG_BIT_DEPTHS, read_image_bytes, detect_mime_type
+from api.response_cache import ResponseCache, DEFAULT_CACHE_PATH, DEFAULT_CACHE_SIZE
+from api.http_session import DEFAULT_POOL_SIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+from api.rate_limiter import RateLimiter
+from api.endpoint_pool import EndpointPool, load_endpoints, STRATEGIES
+from api.hedging import HedgePolicy, DEFAULT_HEDGE_BUDGET
+from api.quota_coordinator import QuotaCoordinator
+from api.retry_policy import RetryPolicy, DEFAULT_MALFORMED_RETRIES
+from api.token_usage import TokenUsage
+from api.batch_client import (BatchClient, BatchJobError, PrefetchedResponses, split_batches, job_results,
+                              DEFAULT_POLL_INTERVAL)
 from generator.epub_generator import EpubGenerator
 from utils.progress_manager import ProgressManager
 
 
+# 内存模式未指定 --lookahead 时默认提前渲染的页数
+DEFAULT_IN_MEMORY_LOOKAHEAD = 4
+
+
 def format_time(seconds):
     """格式化时间显示"""
     if seconds < 60:
@@ -46,8 +68,8 @@ def main():
                        help='处理模式: simple (纯文本) 或 rich (保留版面结构，默认)')
     # --- 原有参数 ---
     parser.add_argument('--dpi', type=int, default=300, help='图像DPI (建议300以提高识别精度，默认: 300)')
-    parser.add_argument('--model', choices=['flash', 'pro'], default='flash', 
-                       help='使用的Gemini模型 (默认: flash)')
+    parser.add_argument('--model', choices=['flash', 'pro', 'cascade'], default='flash', 
+                       help='使用的Gemini模型，cascade先用flash，结果没有通过检查的页面改用pro (默认: flash)')
     parser.add_argument('--base-url', help='Gemini API的基础URL (可选，用于指定代理服务器)')
     parser.add_argument('--page-range', nargs=2, type=int, metavar=('START', 'END'),
                        help='处理的页码范围 (例如: --page-range 1 10 表示处理第1到10页)')
@@ -55,6 +77,88 @@ def main():
                        help='批处理大小，每处理多少页保存一次进度 (默认: 10)')
     parser.add_argument('--resume', action='store_true',
                        help='从上次中断的地方继续处理')
+    parser.add_argument('--render-workers', type=int, default=1,
+                       help='并行渲染PDF页面的pdftoppm进程数，0表示使用全部CPU核心 (默认: 1)')
+    parser.add_argument('--embedded-images', dest='extract_embedded', action='store_true',
+                       help='扫描图直通：只含单张JPEG扫描图的页面直接使用原图而不重新渲染 (默认: 全部重新渲染)')
+    parser.add_argument('--image-format', choices=IMAGE_FORMATS, default='original',
+                       help='上传前重新编码页面图像的格式 (默认: original 保持原图)')
+    parser.add_argument('--image-max-side', type=int, default=None,
+                       help='上传图像长边的最大像素数，超过时等比缩小 (例如: 2000)')
+    parser.add_argument('--image-quality', type=int, default=80,
+                       help='JPEG/WebP压缩质量 (默认: 80)')
+    parser.add_argument('--image-color', action='store_true',
+                       help='重新编码时保留彩色 (默认转换为灰度图)')
+    parser.add_argument('--png-bits', type=int, choices=PNG_BIT_DEPTHS, default=8,
+                       help='PNG格式的位深度，小于8时量化为对应数量的灰阶 (默认: 8)')
+    parser.add_argument('--text-layer', choices=TEXT_LAYER_MODES, default='off',
+                       help='PDF文本层直出: off (始终OCR，默认)、auto (文本层质量足够时跳过OCR)、'
+                            'force (只要有文本层就使用)')
+    parser.add_argument('--lookahead', type=int, default=0,
+                       help='流式渲染时最多提前渲染的页数，边渲染边识别 (建议4-8，默认: 0 表示先渲染全部页面)')
+    parser.add_argument('--in-memory', action='store_true',
+                       help='页面图像只保存在内存中，不写入临时文件 (自动启用流式渲染)')
+    parser.add_argument('--separate-toc-check', action='store_true',
+                       help='目录页面检测单独发送一次请求 (默认在提取请求中一并判断)')
+    parser.add_argument('--page-classifier', action='store_true',
+                       help='启用本地页面分类：本地判定的空白页、目录页直接跳过，纯图片页直接嵌入 '
+                            '(默认: 所有页面交由模型处理)')
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                       help=f'模型响应缓存文件路径 (默认: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // 1024 // 1024,
+                       help='响应缓存容量上限 (MB)，超出时淘汰最久未使用的条目 (默认: 512)')
+    parser.add_argument('--no-cache', dest='cache_mode', action='store_const', const='off', default='use',
+                       help='不读取也不写入响应缓存')
+    parser.add_argument('--refresh-cache', dest='cache_mode', action='store_const', const='refresh',
+                       help='忽略已有缓存，重新请求并更新缓存')
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                       help=f'与API服务器保持的keep-alive连接数 (默认: {DEFAULT_POOL_SIZE})')
+    parser.add_argument('--connect-timeout', type=float, default=DEFAULT_CONNECT_TIMEOUT,
+                       help=f'建立连接的超时秒数 (默认: {DEFAULT_CONNECT_TIMEOUT})')
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+                       help=f'等待模型响应的超时秒数，超时后按失败重试 (默认: {DEFAULT_READ_TIMEOUT})')
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='同时识别的页面数，结果仍按页码顺序组装 (默认: 1)')
+    parser.add_argument('--rpm', type=float, default=None,
+                       help='每分钟请求数上限，按API配额设置 (默认: 不限制)')
+    parser.add_argument('--tpm', type=float, default=None,
+                       help='每分钟token数上限，按API配额设置 (默认: 不限制)')
+    parser.add_argument('--quota-file', default=None,
+                       help='跨进程配额协调文件，同一台机器上使用同一文件的转换进程共享 --global-rpm/--global-concurrency (默认: 不启用)')
+    parser.add_argument('--global-rpm', type=float, default=None,
+                       help='所有进程合计的每分钟请求数上限，需要 --quota-file')
+    parser.add_argument('--global-concurrency', type=int, default=None,
+                       help='所有进程合计的并发请求数上限，需要 --quota-file')
+    parser.add_argument('--pages-per-request', type=int, default=1,
+                       help='每次请求识别的连续页面数，多页合并为一次请求以分摊提示词和请求开销 (默认: 1)')
+    parser.add_argument('--batch-api', action='store_true',
+                       help='通过Gemini Batch API异步提交所有页面请求 (费用约为交互式调用的一半，结果可能需要数小时)')
+    parser.add_argument('--batch-submit-only', action='store_true',
+                       help='只提交批处理任务并保存任务ID后退出，之后使用 --resume --batch-api 取回结果')
+    parser.add_argument('--batch-poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                       help=f'查询批处理任务状态的间隔秒数 (默认: {DEFAULT_POLL_INTERVAL})')
+    parser.add_argument('--context-cache', action='store_true',
+                       help='把固定的提示词上传为Gemini上下文缓存，每页请求只引用缓存 (缓存的输入token按缓存价格计费)')
+    parser.add_argument('--context-cache-ttl', type=int, default=DEFAULT_CACHE_TTL,
+                       help=f'上下文缓存的有效期秒数，到期前自动续期 (默认: {DEFAULT_CACHE_TTL})')
+    parser.add_argument('--stream', action='store_true',
+                       help='使用流式接口 (streamGenerateContent)，边生成边解析内容块，停滞的响应提前中断并重试')
+    parser.add_argument('--stall-timeout', type=float, default=DEFAULT_STALL_TIMEOUT,
+                       help=f'流式响应超过该秒数没有新数据时中断并重试 (默认: {DEFAULT_STALL_TIMEOUT})')
+    parser.add_argument('--malformed-retries', type=int, default=DEFAULT_MALFORMED_RETRIES,
+                       help=f'模型响应无法解析（JSON格式错误或被截断）时每页最多重试的次数 (默认: {DEFAULT_MALFORMED_RETRIES})')
+    parser.add_argument('--retry-budget', type=int, default=None,
+                       help='整个任务最多重试的次数，用完后失败的页面不再重试 (默认: 不限制)')
+    parser.add_argument('--endpoints', metavar='FILE',
+                       help='端点列表JSON文件，页面请求分配到其中的多个 (API密钥, 基础URL) 端点')
+    parser.add_argument('--endpoint-strategy', choices=STRATEGIES, default='least-outstanding',
+                       help='端点分配策略: least-outstanding (未完成请求最少) 或 round-robin (加权轮询) '
+                            '(默认: least-outstanding)')
+    parser.add_argument('--hedge-percentile', type=float, default=None,
+                       help='请求超过最近延迟的该百分位数 (如95) 仍未返回时，再发送一个相同的请求并采用先返回的结果 '
+                            '(默认: 不对冲)')
+    parser.add_argument('--hedge-budget', type=float, default=DEFAULT_HEDGE_BUDGET,
+                       help=f'对冲请求最多占全部请求的比例 (默认: {DEFAULT_HEDGE_BUDGET})')
     
     args = parser.parse_args()
     
@@ -62,19 +166,140 @@ def main():
         print(f"错误: 输入文件 {args.input} 不存在")
         sys.exit(1)
     
+    if (args.global_rpm or args.global_concurrency) and not args.quota_file:
+        print("错误: --global-rpm/--global-concurrency 需要同时指定 --quota-file")
+        sys.exit(1)
+    
+    if args.pages_per_request < 1:
+        print("错误: --pages-per-request 必须大于0")
+        sys.exit(1)
+    
+    if args.pages_per_request > 1 and args.separate_toc_check:
+        print("错误: --pages-per-request 不能与 --separate-toc-check 同时使用")
+        sys.exit(1)
+    
+    if args.batch_submit_only and not args.batch_api:
+        print("错误: --batch-submit-only 需要同时指定 --batch-api")
+        sys.exit(1)
+    
+    if args.batch_api and (args.separate_toc_check or args.pages_per_request > 1):
+        print("错误: --batch-api 不能与 --separate-toc-check 或 --pages-per-request 同时使用")
+        sys.exit(1)
+    
+    if args.context_cache and args.batch_api:
+        print("错误: --context-cache 不能与 --batch-api 同时使用")
+        sys.exit(1)
+    
+    if args.context_cache and args.endpoints:
+        print("错误: --context-cache 不能与 --endpoints 同时使用（上下文缓存只能由创建它的密钥引用）")
+        sys.exit(1)
+    
+    if args.hedge_percentile is not None and not 0 < args.hedge_percentile < 100:
+        print("错误: --hedge-percentile 必须在0到100之间")
+        sys.exit(1)
+    
+    if args.hedge_percentile is not None and args.stream:
+        print("错误: --hedge-percentile 不能与 --stream 同时使用（流式响应的停滞由 --stall-timeout 处理）")
+        sys.exit(1)
+    
+    if args.context_cache_ttl <= 0:
+        print("错误: --context-cache-ttl 必须大于0")
+        sys.exit(1)
+    
+    if args.malformed_retries < 0:
+        print("错误: --malformed-retries 不能小于0")
+        sys.exit(1)
+    
+    if args.stall_timeout <= 0:
+        print("错误: --stall-timeout 必须大于0")
+        sys.exit(1)
+    
     output_dir = os.path.dirname(args.output)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    gemini_client = None
+    quota_coordinator = None
     try:
         start_time = time.time()
         
-        # 创建进度管理器
+        # 创建进度管理器，token用量随进度一起保存
         progress_manager = ProgressManager(args.input, args.output)
+        token_usage = TokenUsage()
+        progress_manager.token_usage = token_usage
         
         pdf_processor = PDFProcessor()
-        gemini_client = GeminiClient(model_type=args.model, base_url=args.base_url)
+        image_encoder = ImageEncoder(
+            image_format=args.image_format,
+            max_side=args.image_max_side,
+            quality=args.image_quality,
+            grayscale=not args.image_color,
+            png_bits=args.png_bits
+        )
+        response_cache = ResponseCache(args.cache_path, max_bytes=args.cache_size * 1024 * 1024, mode=args.cache_mode)
+        # 多个进程共用一个配额时，每个请求还要在全局队列中排队
+        if args.quota_file:
+            quota_coordinator = QuotaCoordinator(
+                args.quota_file,
+                requests_per_minute=args.global_rpm,
+                max_concurrency=args.global_concurrency
+            )
+        # 收到429/503时自动降低并发，之后逐步恢复到 --concurrency
+        rate_limiter = RateLimiter(
+            max_concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            coordinator=quota_coordinator
+        )
+        # 批处理取回的响应放在响应缓存之前，按正常流程组装章节时直接使用
+        prefetched = PrefetchedResponses(response_cache) if args.batch_api else None
+        endpoint_pool = None
+        if args.endpoints:
+            endpoint_pool = EndpointPool(load_endpoints(args.endpoints, os.environ.get('GEMINI_API_KEY')),
+                                         strategy=args.endpoint_strategy)
+            print(f"使用 {len(endpoint_pool.endpoints)} 个端点，分配策略: {args.endpoint_strategy}")
+        line_classifier = PageClassifier()
+        gemini_client = GeminiClient(
+            model_type=args.model,
+            base_url=args.base_url,
+            image_encoder=image_encoder,
+            cache=prefetched or response_cache,
+            pool_size=max(args.pool_size, args.concurrency),
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            rate_limiter=rate_limiter,
+            retry_policy=RetryPolicy(retry_budget=args.retry_budget, malformed_retries=args.malformed_retries),
+            context_cache_ttl=args.context_cache_ttl if args.context_cache else None,
+            stream=args.stream,
+            stall_timeout=args.stall_timeout,
+            # 级联模式下用页面上的文字行数判断flash的识别结果是否过短
+            line_counter=(lambda image: line_classifier.measure(image)['lines']) if args.model == 'cascade' else None,
+            endpoints=endpoint_pool,
+            hedge=HedgePolicy(args.hedge_percentile, args.hedge_budget) if args.hedge_percentile is not None else None,
+            usage=token_usage
+        )
+        # 提示词都达不到最小缓存大小时上下文缓存不会节省任何token，不必继续
+        if gemini_client.context_cache and not gemini_client.context_cache.check(
+                request_prompts(args.mode, args.separate_toc_check, args.pages_per_request)):
+            print(f"错误: 本次任务使用的提示词都少于 {gemini_client.model_name} 上下文缓存的最小token数，"
+                  f"--context-cache 不会生效")
+            sys.exit(1)
+        batch_client = None
+        if args.batch_api:
+            batch_client = BatchClient(
+                gemini_client.client.api_key,
+                gemini_client.client.base_url,
+                poll_interval=args.batch_poll_interval,
+                connect_timeout=args.connect_timeout,
+                read_timeout=args.read_timeout,
+                retry_policy=gemini_client.retry_policy
+            )
         epub_generator = EpubGenerator()
+        page_classifier = None
+        if args.page_classifier:
+            page_classifier = PageClassifier(
+                text_provider=lambda page_num: pdf_processor.get_page_text(args.input, page_num)
+            )
         
         print(f"开始处理PDF文件: {args.input}")
         
@@ -87,6 +312,8 @@ def main():
             # 恢复之前的进度
             print(f"从第 {progress_data['processed_pages']} 页恢复处理...")
             processed_chapters = progress_data['processed_chapters']
+            progress_manager.batch_jobs = progress_data.get('batch_jobs', [])
+            token_usage.load(progress_data.get('token_usage'))
             start_page = progress_data['processed_pages'] + 1
             total_pages = progress_data['total_pages']
             
@@ -98,38 +325,49 @@ def main():
             
             if start_page <= total_pages:
                 print("正在提取剩余PDF页面...")
-                pdf_start_time = time.time()
-                images = pdf_processor.pdf_to_images(args.input, dpi=args.dpi, page_range=page_range)
-                pdf_end_time = time.time()
-                print(f"PDF页面提取完成，耗时: {format_time(pdf_end_time - pdf_start_time)}")
+                images, _ = extract_page_images(pdf_processor, args, page_range)
             else:
                 print("所有页面已处理完成，正在生成最终EPUB...")
                 images = []
         else:
             # 全新开始
             print("正在提取PDF页面...")
-            pdf_start_time = time.time()
-            images = pdf_processor.pdf_to_images(args.input, dpi=args.dpi, page_range=args.page_range)
-            pdf_end_time = time.time()
-            print(f"PDF页面提取完成，耗时: {format_time(pdf_end_time - pdf_start_time)}")
+            images, end_page = extract_page_images(pdf_processor, args, args.page_range)
             
             processed_chapters = []
             start_page = 1
             if args.page_range:
                 start_page = args.page_range[0]
-            total_pages = len(images) + start_page - 1
+            total_pages = end_page if end_page is not None else len(images) + start_page - 1
         
-        # 根据模式选择处理流程
-        if args.mode == 'rich':
-            processed_chapters = process_rich_mode_with_batching(
-                images, processed_chapters, gemini_client, epub_generator, 
-                progress_manager, args, start_page, total_pages
-            )
-        else:  # simple mode
-            processed_chapters = process_simple_mode_with_batching(
-                images, processed_chapters, gemini_client, epub_generator,
-                progress_manager, args, start_page, total_pages
+        page_types = None
+        if args.batch_api:
+            # 批处理需要一次提交所有页面，流式渲染的页面也全部渲染完
+            images = list(images)
+            page_types = prefetch_with_batch_api(
+                images, start_page, total_pages, processed_chapters, gemini_client, batch_client,
+                prefetched, args, page_classifier, progress_manager
             )
+            if page_types is None:
+                print("批处理任务已提交，完成后使用 --resume --batch-api 取回结果并生成EPUB")
+                return
+        
+        # 根据模式选择处理流程
+        try:
+            if args.mode == 'rich':
+                processed_chapters = process_rich_mode_with_batching(
+                    images, processed_chapters, gemini_client, epub_generator, 
+                    progress_manager, args, start_page, total_pages, page_classifier, page_types
+                )
+            else:  # simple mode
+                processed_chapters = process_simple_mode_with_batching(
+                    images, processed_chapters, gemini_client, epub_generator,
+                    progress_manager, args, start_page, total_pages, page_classifier, page_types
+                )
+        finally:
+            # 页面出错提前退出（包括sys.exit）时关闭流式渲染的生成器，删除其临时目录
+            if isinstance(images, GeneratorType):
+                images.close()
         
         # 生成最终EPUB文件
         if processed_chapters:
@@ -155,16 +393,482 @@ def main():
             total_end_time = time.time()
             print(f"\nEPUB文件已生成: {args.output}")
             print(f"总处理时间: {format_time(total_end_time - start_time)}")
+            image_encoder.print_summary()
+            response_cache.print_summary()
+            gemini_client.client.latency.print_summary()
+            gemini_client.client.endpoints.print_summary()
+            if gemini_client.client.hedge:
+                gemini_client.client.hedge.print_summary()
+            rate_limiter.print_summary()
+            if quota_coordinator:
+                quota_coordinator.print_summary()
+            gemini_client.retry_policy.print_summary()
+            gemini_client.print_multi_page_summary()
+            if batch_client:
+                batch_client.print_summary()
+                prefetched.print_summary()
+            if page_classifier:
+                page_classifier.print_summary()
+            if gemini_client.context_cache:
+                gemini_client.context_cache.print_summary()
+            if gemini_client.cascade:
+                gemini_client.cascade.print_summary()
+            token_usage.print_summary()
         else:
             print("没有内容可转换，请检查PDF文件")
         
     except Exception as e:
         print(f"\n处理过程中发生致命错误: {str(e)}")
         sys.exit(1)
+    finally:
+        # 任务结束或出错退出后都删除上下文缓存，不再计算存储费用
+        if gemini_client is not None and gemini_client.context_cache:
+            gemini_client.context_cache.close()
+        # 注销本进程，之后以不同的全局上限启动的进程不会被误判为冲突
+        if quota_coordinator is not None:
+            quota_coordinator.close()
+
+
+def extract_page_images(pdf_processor, args, page_range):
+    """
+    按命令行参数提取PDF页面图像
+    
+    Args:
+        pdf_processor (PDFProcessor): PDF处理器
+        args: 命令行参数
+        page_range (tuple): 页码范围 (start_page, end_page)，None表示全部页面
+        
+    Returns:
+        tuple: (images, end_page)。images中采用文本层的页面为TextLayerPage；
+               流式模式下images为按页产出图像路径（内存模式下为PageImage）的生成器，
+               end_page为校正后的结束页码；否则images为路径列表，end_page为None
+    """
+    if args.lookahead > 0 or args.in_memory:
+        # 内存模式只能配合流式渲染使用，否则整本书的图像都会驻留内存
+        lookahead = args.lookahead if args.lookahead > 0 else DEFAULT_IN_MEMORY_LOOKAHEAD
+        start_page, end_page, _ = pdf_processor.resolve_page_range(args.input, page_range)
+        print(f"启用流式渲染，最多提前渲染 {lookahead} 页" + ("，图像保存在内存中" if args.in_memory else ""))
+        images = pdf_processor.iter_page_images(
+            args.input, start_page, end_page, dpi=args.dpi,
+            lookahead=lookahead, workers=args.render_workers,
+            extract_embedded=args.extract_embedded, text_layer=args.text_layer,
+            in_memory=args.in_memory
+        )
+        return images, end_page
+    
+    pdf_start_time = time.time()
+    images = pdf_processor.pdf_to_images(
+        args.input, dpi=args.dpi, page_range=page_range, workers=args.render_workers,
+        extract_embedded=args.extract_embedded, text_layer=args.text_layer
+    )
+    pdf_end_time = time.time()
+    print(f"PDF页面提取完成，耗时: {format_time(pdf_end_time - pdf_start_time)}")
+    return images, None
+
+
+def release_page_image(image):
+    """处理完页面后删除临时图像文件，文本层页面和内存中的图像没有临时文件"""
+    if isinstance(image, str):
+        os.remove(image)
+
+
+def print_page_path_stats(page_path_counts):
+    """输出各页面的处理路径统计"""
+    print(f"页面处理路径: 文本层直出 {page_path_counts['text_layer']} 页，"
+          f"Gemini OCR {page_path_counts['ocr']} 页，"
+          f"图片嵌入 {page_path_counts['picture']} 页")
+
+
+def classify_page(image, page_classifier, page_num):
+    """
+    在调用Gemini之前本地判断页面类型
+
+    Args:
+        image: 页面图像路径、内存图像或TextLayerPage
+        page_classifier (PageClassifier): 页面分类器，None表示不进行本地分类
+        page_num (int): 页码
+
+    Returns:
+        str: 页面类型，文本层页面和未启用分类时返回'uncertain'
+    """
+    if page_classifier is None or isinstance(image, TextLayerPage):
+        return 'uncertain'
+    page_type = page_classifier.classify(image, page_num)
+    if page_type != 'uncertain':
+        print(f"页面 {page_num} 本地分类为{PAGE_TYPE_NAMES[page_type]}")
+    return page_type
+
+
+def save_picture_page(image, progress_manager, page_num):
+    """
+    保存纯图片页面的图像，用于嵌入EPUB
+
+    Returns:
+        str: 保存后的图像文件路径
+    """
+    image_data = read_image_bytes(image)
+    extension = {'image/jpeg': '.jpg', 'image/webp': '.webp', 'image/gif': '.gif'}.get(
+        detect_mime_type(image_data), '.png')
+    return progress_manager.save_page_image(page_num, image_data, extension)
+
+
+def extract_rich_page(image, gemini_client, args, page_type='uncertain'):
+    """
+    提取单页的富文本内容块
+
+    Args:
+        image: 页面图像路径、内存图像或TextLayerPage
+        gemini_client: Gemini客户端
+        args: 命令行参数
+        page_type (str): 本地分类结果，'text'表示已确定不是目录页面
+
+    Returns:
+        tuple: (是否为目录页面, 内容块列表, 处理路径 'text_layer' 或 'ocr')
+    """
+    # 有可用文本层的页面无需调用Gemini
+    if isinstance(image, TextLayerPage):
+        if image.looks_like_toc():
+            return True, [], 'text_layer'
+        return False, image.to_blocks(), 'text_layer'
+
+    if args.separate_toc_check or page_type == 'text':
+        if page_type != 'text' and gemini_client.is_table_of_contents_page(image):
+            return True, [], 'ocr'
+        return False, gemini_client.extract_rich_structure(image), 'ocr'
+
+    # 目录检测与结构提取合并为一次请求
+    is_toc, blocks = gemini_client.extract_rich_structure_with_toc(image)
+    return is_toc, blocks, 'ocr'
+
+
+def extract_simple_page(image, gemini_client, args, page_type='uncertain'):
+    """
+    提取单页的纯文本内容
+
+    Args:
+        image: 页面图像路径、内存图像或TextLayerPage
+        gemini_client: Gemini客户端
+        args: 命令行参数
+        page_type (str): 本地分类结果，'text'表示已确定不是目录页面
+
+    Returns:
+        tuple: (是否为目录页面, 文本, 处理路径 'text_layer' 或 'ocr')
+    """
+    if isinstance(image, TextLayerPage):
+        if image.looks_like_toc():
+            return True, '', 'text_layer'
+        return False, image.to_text(), 'text_layer'
+
+    if args.separate_toc_check or page_type == 'text':
+        if page_type != 'text' and gemini_client.is_table_of_contents_page(image):
+            return True, '', 'ocr'
+        return False, gemini_client.extract_text(image), 'ocr'
+
+    is_toc, text = gemini_client.extract_text_with_toc(image)
+    return is_toc, text, 'ocr'
+
+
+def process_rich_page(image, page_num, gemini_client, args, page_classifier, progress_manager,
+                      page_type=None, extracted=None):
+    """
+    识别单个页面的内容块，可以在工作线程中并发运行
+
+    Args:
+        page_type (str): 已经得到的本地分类结果，None表示在这里分类
+        extracted (tuple): 多页请求已经得到的 (是否为目录页面, 内容块列表, 处理路径)
+
+    Returns:
+        tuple: (内容块列表, 处理路径)，需要跳过的页面返回 (None, None)
+    """
+    # 空白页和目录页直接跳过，纯图片页嵌入原图，均无需调用Gemini
+    if page_type is None:
+        page_type = classify_page(image, page_classifier, page_num)
+    if page_type in ('blank', 'toc'):
+        print(f"跳过页面 {page_num}")
+        return None, None
+    
+    if page_type == 'picture':
+        blocks = [{
+            'type': 'image',
+            'level': 0,
+            'style': {'align': 'center'},
+            'content': '',
+            'src': save_picture_page(image, progress_manager, page_num)
+        }]
+        return blocks, 'picture'
+    
+    # 提取结构化数据，同时检测是否为目录页面
+    is_toc, blocks, page_path = extracted or extract_rich_page(image, gemini_client, args, page_type)
+    if is_toc:
+        print(f"检测到目录页面，跳过页面 {page_num}")
+        return None, None
+    return blocks, page_path
+
+
+def process_simple_page(image, page_num, gemini_client, args, page_classifier, progress_manager,
+                        page_type=None, extracted=None):
+    """
+    识别单个页面的文本并整理为章节，可以在工作线程中并发运行
+
+    Args:
+        page_type (str): 已经得到的本地分类结果，None表示在这里分类
+        extracted (tuple): 多页请求已经得到的 (是否为目录页面, 文本, 处理路径)
+
+    Returns:
+        tuple: (章节字典, 处理路径)，需要跳过的页面返回 (None, None)
+    """
+    # 空白页和目录页直接跳过，纯图片页嵌入原图，均无需调用Gemini
+    if page_type is None:
+        page_type = classify_page(image, page_classifier, page_num)
+    if page_type in ('blank', 'toc'):
+        print(f"跳过页面 {page_num}")
+        return None, None
+    
+    if page_type == 'picture':
+        chapter = {
+            'title': f"Page {page_num}",
+            'content': '',
+            'image': save_picture_page(image, progress_manager, page_num)
+        }
+        return chapter, 'picture'
+    
+    # 提取文本，同时检测是否为目录页面
+    is_toc, text, page_path = extracted or extract_simple_page(image, gemini_client, args, page_type)
+    if is_toc:
+        print(f"检测到目录页面，跳过页面 {page_num}")
+        return None, None
+    
+    # 智能提取标题
+    lines = text.split('\n')
+    chapter_title = f"Page {page_num}"  # 默认标题
+    content_lines = []
+    title_found = False
+    for line in lines:
+        if line.strip().startswith('##') and not title_found:
+            chapter_title = line.strip().lstrip('## ').strip()
+            title_found = True
+            continue
+        content_lines.append(line)
+    
+    content = '\n'.join(content_lines)
+    return {'title': chapter_title, 'content': content}, page_path
+
+
+def prefetch_with_batch_api(images, start_page, total_pages, processed_chapters, gemini_client, batch_client,
+                            prefetched, args, page_classifier, progress_manager):
+    """
+    通过Batch API提交需要OCR的页面，等待任务完成后把结果放入prefetched
+
+    之后按正常流程处理页面时，这些页面的请求直接使用批处理结果；没有取回结果的页面仍发送交互式请求。
+    任务ID随进度保存，中断后使用 --resume 继续等待已提交的任务而不是重新提交。
+
+    Args:
+        images (list): 页面图像列表
+        start_page (int): 第一个页面的页码
+        total_pages (int): 总页数
+        processed_chapters (list): 已处理的章节，随进度一起保存
+        gemini_client (GeminiClient): 用于构造与交互式请求相同的请求体
+        batch_client (BatchClient): 批处理客户端
+        prefetched (PrefetchedResponses): 存放批处理结果
+        args: 命令行参数
+        page_classifier (PageClassifier): 页面分类器，本地判定无需OCR的页面不提交
+        progress_manager (ProgressManager): 进度管理器
+
+    Returns:
+        dict: 页码到本地分类结果的映射，处理页面时直接复用；只提交不等待时返回None
+    """
+    page_types = {}
+    requests = {}
+    for i, image in enumerate(images):
+        page_num = start_page + i
+        if isinstance(image, TextLayerPage):
+            continue
+        page_type = classify_page(image, page_classifier, page_num)
+        page_types[page_num] = page_type
+        if page_type not in ('uncertain', 'text'):
+            continue
+        key, payload, generation_config = gemini_client.build_page_request(
+            image, args.mode, check_toc=page_type != 'text')
+        requests[key] = (payload, generation_config)
+    
+    submitted = {key for job in progress_manager.batch_jobs for key in job['keys']}
+    new_requests = [(key, payload) for key, (payload, _) in requests.items()
+                    if key not in submitted and not prefetched.contains(key)]
+    print(f"需要OCR的页面 {len(requests)} 页，其中 {len(new_requests)} 页需要提交批处理任务")
+    if new_requests:
+        for batch in split_batches(new_requests):
+            name = batch_client.submit(gemini_client.model_name, batch,
+                                       display_name=f"pdf2epub {Path(args.input).stem}")
+            progress_manager.batch_jobs.append({'name': name, 'keys': [key for key, _ in batch]})
+        progress_manager.save_progress(
+            processed_pages=start_page - 1,
+            total_pages=total_pages,
+            processed_chapters=processed_chapters,
+            mode=args.mode,
+            title=args.title
+        )
+    
+    if args.batch_submit_only:
+        return None
+    
+    for job in progress_manager.batch_jobs:
+        try:
+            result = batch_client.wait(job['name'])
+        except BatchJobError as e:
+            print(f"{e}，相关页面改为交互式请求")
+            continue
+        responses, _ = job_results(result, job['keys'])
+        added = sum(prefetched.add(key, text, requests[key][1] if key in requests else None)
+                    for key, text in responses.items())
+        if added < len(job['keys']):
+            print(f"批处理任务 {job['name']} 中 {len(job['keys']) - added} 个请求没有可用结果，相关页面改为交互式请求")
+    return page_types
+
+
+def process_page_group(images, page_nums, gemini_client, args, page_classifier, progress_manager,
+                       process_page, extract_multi):
+    """
+    处理一组连续页面：需要OCR的页面合并为一次多页请求，其余页面按单页流程处理
+
+    Args:
+        images (list): 页面图像列表
+        page_nums (list): 对应的页码
+        process_page (callable): process_rich_page 或 process_simple_page
+        extract_multi (callable): 多页识别方法，返回与输入一一对应的 (是否为目录页面, 内容)
+
+    Returns:
+        list: 与images一一对应的单页结果
+    """
+    page_types = [classify_page(image, page_classifier, page_num) for image, page_num in zip(images, page_nums)]
+    ocr_indexes = [i for i, image in enumerate(images)
+                   if not isinstance(image, TextLayerPage) and page_types[i] in ('uncertain', 'text')]
+    extracted = {}
+    if ocr_indexes:
+        results = extract_multi([images[i] for i in ocr_indexes])
+        for i, (is_toc, content) in zip(ocr_indexes, results):
+            extracted[i] = (is_toc, content, 'ocr')
+    return [process_page(image, page_num, gemini_client, args, page_classifier, progress_manager,
+                         page_type=page_types[i], extracted=extracted.get(i))
+            for i, (image, page_num) in enumerate(zip(images, page_nums))]
+
+
+def make_page_worker(process_page, extract_multi, gemini_client, args, page_classifier, progress_manager,
+                     page_types=None):
+    """
+    按 --pages-per-request 创建 iter_page_results 使用的工作函数
+
+    Args:
+        page_types (dict): 已经得到的页码到本地分类结果的映射，其中的页面不再重复分类
+
+    Returns:
+        callable: 单页时为 worker(image, page_num)，多页时为 worker(images, page_nums)
+    """
+    options = dict(gemini_client=gemini_client, args=args, page_classifier=page_classifier,
+                   progress_manager=progress_manager)
+    if args.pages_per_request > 1:
+        return partial(process_page_group, process_page=process_page, extract_multi=extract_multi, **options)
+    if page_types:
+        return lambda image, page_num: process_page(image, page_num, page_type=page_types.get(page_num), **options)
+    return partial(process_page, **options)
+
+
+def group_pages(images, start_page, group_size):
+    """
+    按顺序把页面分成每组group_size页
+
+    Yields:
+        list: [(页码, 页面图像), ...]
+    """
+    group = []
+    for i, image in enumerate(images):
+        group.append((start_page + i, image))
+        if len(group) >= group_size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+def iter_ordered(items, worker, concurrency=1):
+    """
+    在工作线程中处理各项并按提交顺序产出结果，同时处理的项数不超过concurrency
+
+    Yields:
+        tuple: (item, Future)，出错时Future的result()抛出异常
+    """
+    if concurrency <= 1:
+        for item in items:
+            future = Future()
+            try:
+                future.set_result(worker(item))
+            except Exception as e:
+                future.set_exception(e)
+            yield item, future
+        return
+    
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append((item, executor.submit(worker, item)))
+            # 队首完成前不再提交新的项，保证同时处理的项数不超过concurrency
+            if len(pending) >= concurrency:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        # 调用方提前退出（如遇到错误）时取消尚未开始的项
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_page_results(images, start_page, total_pages, page_worker, concurrency=1, pages_per_request=1):
+    """
+    处理页面并按页码顺序产出结果
+
+    concurrency大于1时，最多同时有concurrency个请求在工作线程中识别；无论完成顺序如何，
+    结果总是按页码顺序交给调用方，章节划分和进度保存因此与串行处理完全一致。
+    pages_per_request大于1时，每pages_per_request个连续页面交给工作函数一起处理。
+
+    Args:
+        images (iterable): 页面图像列表或生成器
+        start_page (int): 第一个页面的页码
+        total_pages (int): 总页数，仅用于输出进度
+        page_worker (callable): 单页时 page_worker(image, page_num) 返回单页结果；
+                                多页时 page_worker(images, page_nums) 返回各页结果的列表
+        concurrency (int): 同时处理的请求数
+        pages_per_request (int): 每组的页面数
+
+    Yields:
+        tuple: (页码, 页面图像, Future)，Future的结果为 (单页结果, 耗时秒数)，出错时result()抛出异常；
+               同一组的页面耗时相同
+    """
+    def run(group):
+        page_nums = [page_num for page_num, _ in group]
+        if len(page_nums) > 1:
+            print(f"处理页面 {page_nums[0]}-{page_nums[-1]}/{total_pages}...")
+        else:
+            print(f"处理页面 {page_nums[0]}/{total_pages}...")
+        page_start_time = time.time()
+        if pages_per_request > 1:
+            results = page_worker([image for _, image in group], page_nums)
+        else:
+            results = [page_worker(group[0][1], page_nums[0])]
+        elapsed = time.time() - page_start_time
+        return [(result, elapsed) for result in results]
+    
+    for group, group_future in iter_ordered(group_pages(images, start_page, pages_per_request), run, concurrency):
+        for index, (page_num, image) in enumerate(group):
+            future = Future()
+            try:
+                future.set_result(group_future.result()[index])
+            except Exception as e:
+                future.set_exception(e)
+            yield page_num, image, future
 
 
 def process_rich_mode_with_batching(images, processed_chapters, gemini_client, epub_generator, 
-                                  progress_manager, args, start_page, total_pages):
+                                  progress_manager, args, start_page, total_pages, page_classifier=None,
+                                  page_types=None):
     """富文本模式的分批处理"""
     print("正在使用Gemini提取版面结构 (富文本模式)...")
     text_start_time = time.time()
@@ -176,21 +880,19 @@ def process_rich_mode_with_batching(images, processed_chapters, gemini_client, e
     
     batch_count = 0
     pages_in_current_batch = 0
+    page_path_counts = {'text_layer': 0, 'ocr': 0, 'picture': 0}
     
-    for i, image_path in enumerate(images):
-        actual_page_num = start_page + i
-        page_start_time = time.time()
-        print(f"处理页面 {actual_page_num}/{total_pages}...")
-        
+    page_worker = make_page_worker(process_rich_page, gemini_client.extract_rich_structure_multi, gemini_client,
+                                   args, page_classifier, progress_manager, page_types)
+    
+    for actual_page_num, image_path, page_future in iter_page_results(
+            images, start_page, total_pages, page_worker, args.concurrency, args.pages_per_request):
         try:
-            # 检测是否为目录页面
-            if gemini_client.is_table_of_contents_page(image_path):
-                print(f"检测到目录页面，跳过页面 {actual_page_num}")
-                os.remove(image_path)
+            (blocks, page_path), page_elapsed = page_future.result()
+            if blocks is None:
+                release_page_image(image_path)
                 continue
-            
-            # 提取结构化数据
-            blocks = gemini_client.extract_rich_structure(image_path)
+            page_path_counts[page_path] += 1
             
             # 处理内容块，按章节组织
             for block in blocks:
@@ -216,11 +918,10 @@ def process_rich_mode_with_batching(images, processed_chapters, gemini_client, e
                     
                     current_chapter['blocks'].append(block)
             
-            os.remove(image_path)
+            release_page_image(image_path)
             pages_in_current_batch += 1
             
-            page_end_time = time.time()
-            print(f"页面 {actual_page_num} 处理完成，耗时: {format_time(page_end_time - page_start_time)}")
+            print(f"页面 {actual_page_num} 处理完成，耗时: {format_time(page_elapsed)}")
             
             # 检查是否达到批处理大小
             if pages_in_current_batch >= args.batch_size:
@@ -274,52 +975,38 @@ def process_rich_mode_with_batching(images, processed_chapters, gemini_client, e
     
     text_end_time = time.time()
     print(f"文本提取完成，耗时: {format_time(text_end_time - text_start_time)}")
+    print_page_path_stats(page_path_counts)
     
     return processed_chapters
 
 
 def process_simple_mode_with_batching(images, processed_chapters, gemini_client, epub_generator,
-                                    progress_manager, args, start_page, total_pages):
+                                    progress_manager, args, start_page, total_pages, page_classifier=None,
+                                    page_types=None):
     """纯文本模式的分批处理"""
     print("正在使用Gemini提取文本 (纯文本模式)...")
     text_start_time = time.time()
     
     batch_count = 0
     pages_in_current_batch = 0
+    page_path_counts = {'text_layer': 0, 'ocr': 0, 'picture': 0}
     
-    for i, image_path in enumerate(images):
-        actual_page_num = start_page + i
-        page_start_time = time.time()
-        print(f"处理页面 {actual_page_num}/{total_pages}...")
-        
+    page_worker = make_page_worker(process_simple_page, gemini_client.extract_text_multi, gemini_client,
+                                   args, page_classifier, progress_manager, page_types)
+    
+    for actual_page_num, image_path, page_future in iter_page_results(
+            images, start_page, total_pages, page_worker, args.concurrency, args.pages_per_request):
         try:
-            # 检测是否为目录页面
-            if gemini_client.is_table_of_contents_page(image_path):
-                print(f"检测到目录页面，跳过页面 {actual_page_num}")
-                os.remove(image_path)
+            (chapter, page_path), page_elapsed = page_future.result()
+            if chapter is None:
+                release_page_image(image_path)
                 continue
-            
-            text = gemini_client.extract_text(image_path)
-            
-            # 智能提取标题
-            lines = text.split('\n')
-            chapter_title = f"Page {actual_page_num}"  # 默认标题
-            content_lines = []
-            title_found = False
-            for line in lines:
-                if line.strip().startswith('##') and not title_found:
-                    chapter_title = line.strip().lstrip('## ').strip()
-                    title_found = True
-                    continue
-                content_lines.append(line)
-            
-            content = '\n'.join(content_lines)
-            processed_chapters.append({'title': chapter_title, 'content': content})
-            os.remove(image_path)
+            page_path_counts[page_path] += 1
+            processed_chapters.append(chapter)
+            release_page_image(image_path)
             pages_in_current_batch += 1
 
-            page_end_time = time.time()
-            print(f"页面 {actual_page_num} 处理完成，耗时: {format_time(page_end_time - page_start_time)}")
+            print(f"页面 {actual_page_num} 处理完成，耗时: {format_time(page_elapsed)}")
             
             # 检查是否达到批处理大小
             if pages_in_current_batch >= args.batch_size:
@@ -369,6 +1056,7 @@ def process_simple_mode_with_batching(images, processed_chapters, gemini_client,
     
     text_end_time = time.time()
     print(f"文本提取完成，耗时: {format_time(text_end_time - text_start_time)}")
+    print_page_path_stats(page_path_counts)
     
     return processed_chapters
 
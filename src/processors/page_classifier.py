@@ -0,0 +1,288 @@
+"""
+页面分类模块
+在调用Gemini之前，根据页面图像的统计信息（以及可用的文本层）在本地判断页面类型
+"""
+
+import io
+import threading
+from array import array
+
+from PIL import Image
+
+from .text_layer import TextLayerPage
+
+
+# 页面类型：空白页、纯图片页、目录页、正文页、无法确定
+PAGE_TYPES = ('blank', 'picture', 'toc', 'text', 'uncertain')
+
+PAGE_TYPE_NAMES = {
+    'blank': '空白页',
+    'picture': '纯图片页',
+    'toc': '目录页',
+    'text': '正文页',
+    'uncertain': '无法确定',
+}
+
+# 分析时将页面缩小到的长边像素数
+ANALYSIS_MAX_SIDE = 1000
+
+# 忽略的页边比例，避免扫描件边缘阴影和页码干扰
+MARGIN_RATIO = 0.05
+
+# 灰度低于该值的像素视为墨迹
+INK_THRESHOLD = 128
+
+# 灰度低于该值的像素视为非白色（用于判断图片区域的填充程度）
+NON_WHITE_THRESHOLD = 200
+
+# 墨迹像素比例低于该值的页面视为空白页
+BLANK_INK_RATIO = 0.0001
+
+# 墨迹比例高于该值的像素行视为有内容
+ROW_INK_RATIO = 0.002
+
+# 纯图片页：图片区域的最小高度比例、最小填充比例，以及图片区域占全部内容行的最小比例
+PICTURE_MIN_BAND_RATIO = 0.35
+PICTURE_MIN_FILL_RATIO = 0.3
+PICTURE_MIN_CONTENT_RATIO = 0.6
+
+# 正文页至少需要的文本行数
+MIN_TEXT_LINES = 8
+
+# 目录页：最少行数，以及判定为目录/无法确定的目录行比例
+MIN_TOC_LINES = 5
+TOC_LINE_RATIO = 0.6
+TOC_UNCERTAIN_RATIO = 0.3
+
+# 目录行：页码宽度上限、页码前空白（或点线引导符）的最小宽度、页码右对齐的容差，均为相对内容宽度的比例
+TOC_NUMBER_MAX_WIDTH = 0.1
+TOC_MIN_GAP = 0.05
+TOC_ALIGN_TOLERANCE = 0.03
+
+# 单列墨迹不超过该像素数时视为空白列（点线引导符的圆点也只有一两个像素）
+SPARSE_COLUMN_INK = 2
+
+
+def load_analysis_image(image):
+    """
+    读取页面图像并转换为用于分析的灰度小图（已去除页边）
+
+    Args:
+        image: 图像文件路径，或带有data属性的内存图像（PageImage）
+
+    Returns:
+        PIL.Image.Image: 灰度图像
+    """
+    data = getattr(image, 'data', None)
+    source = Image.open(io.BytesIO(data)) if data is not None else Image.open(image)
+    with source:
+        # JPEG可以在解码时直接缩小，大幅减少解码时间
+        source.draft('L', (ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE))
+        gray = source.convert('L')
+    gray.thumbnail((ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE))
+
+    width, height = gray.size
+    margin_x = int(width * MARGIN_RATIO)
+    margin_y = int(height * MARGIN_RATIO)
+    return gray.crop((margin_x, margin_y, width - margin_x, height - margin_y))
+
+
+def pixel_values(image):
+    """
+    读取 'F' 模式图像的像素值（代替新版Pillow中已弃用的 getdata）
+
+    Args:
+        image (PIL.Image.Image): 'F' 模式（32位浮点）图像
+
+    Returns:
+        array: 按行排列的像素值
+    """
+    return array('f', image.tobytes())
+
+
+def find_runs(values, threshold, max_gap=0):
+    """
+    查找连续超过阈值的区间
+
+    Args:
+        values (list): 数值序列
+        threshold (float): 阈值
+        max_gap (int): 区间内允许的最大空隙长度，更短的空隙会被合并
+
+    Returns:
+        list: (起始, 结束) 区间列表，结束位置不包含
+    """
+    runs = []
+    start = None
+    end = None
+    for index, value in enumerate(values):
+        if value > threshold:
+            if start is None:
+                start = index
+            elif index - end > max_gap:
+                runs.append((start, end))
+                start = index
+            end = index + 1
+    if start is not None:
+        runs.append((start, end))
+    return runs
+
+
+class PageClassifier:
+    def __init__(self, text_provider=None):
+        """
+        初始化页面分类器
+
+        Args:
+            text_provider (callable): 可选，根据页码返回页面文本层内容的函数，用于辅助识别目录页
+        """
+        self.text_provider = text_provider
+        self.counts = {page_type: 0 for page_type in PAGE_TYPES}
+        self._lock = threading.Lock()
+
+    def classify(self, image, page_num=None):
+        """
+        判断页面类型
+
+        Args:
+            image: 图像文件路径，或带有data属性的内存图像（PageImage）
+            page_num (int): 页码，从1开始计数，用于读取文本层
+
+        Returns:
+            str: 页面类型 ('blank'、'picture'、'toc'、'text' 或 'uncertain')
+        """
+        try:
+            page_type = self._classify(image, page_num)
+        except Exception as e:
+            print(f"第 {page_num} 页本地分类失败，交由模型判断: {e}")
+            page_type = 'uncertain'
+
+        with self._lock:
+            self.counts[page_type] += 1
+        return page_type
+
+    def print_summary(self):
+        """输出本地分类统计"""
+        total = sum(self.counts.values())
+        if not total:
+            return
+        details = '，'.join(f"{PAGE_TYPE_NAMES[page_type]} {self.counts[page_type]}"
+                           for page_type in PAGE_TYPES)
+        print(f"本地页面分类: 共 {total} 页，{details}")
+
+    def measure(self, image):
+        """
+        计算页面图像的统计信息
+
+        Args:
+            image: 图像文件路径，或带有data属性的内存图像（PageImage）
+
+        Returns:
+            dict: ink_ratio（墨迹比例）、picture_rows（图片区域行数）、content_rows（内容行数）、
+                  tall_bands（高度较大的区域数）、lines（文本行数）、toc_lines（目录行数）
+        """
+        gray = load_analysis_image(image)
+        width, height = gray.size
+        histogram = gray.histogram()
+        stats = {
+            'ink_ratio': sum(histogram[:INK_THRESHOLD]) / (width * height),
+            'picture_rows': 0,
+            'content_rows': 0,
+            'tall_bands': 0,
+            'lines': 0,
+            'toc_lines': 0,
+        }
+        if stats['ink_ratio'] < BLANK_INK_RATIO:
+            return stats
+
+        # 墨迹掩码（墨迹为1.0），按行求平均得到每行的墨迹比例
+        ink_mask = gray.point([255] * INK_THRESHOLD + [0] * (256 - INK_THRESHOLD)).convert('F')
+        row_profile = [value / 255 for value in pixel_values(ink_mask.resize((1, height), Image.BOX))]
+        bands = find_runs(row_profile, ROW_INK_RATIO)
+        stats['content_rows'] = sum(end - start for start, end in bands)
+
+        line_bands = []
+        for start, end in bands:
+            band_height = end - start
+            if band_height >= height * PICTURE_MIN_BAND_RATIO:
+                stats['tall_bands'] += 1
+                if self._band_fill_ratio(gray, ink_mask, start, end) >= PICTURE_MIN_FILL_RATIO:
+                    stats['picture_rows'] += band_height
+            else:
+                line_bands.append((start, end))
+
+        # 文本行：高度接近中位数的区域，排除插图、分隔线等
+        if line_bands:
+            heights = sorted(end - start for start, end in line_bands)
+            median_height = heights[len(heights) // 2]
+            line_bands = [(start, end) for start, end in line_bands
+                          if median_height * 0.4 <= end - start <= median_height * 2.5]
+        stats['lines'] = len(line_bands)
+
+        # 目录行：标题与页码之间有一大段空白或点线，页码较窄且各行右端对齐
+        number_edges = []
+        for start, end in line_bands:
+            right_edge = self._toc_number_edge(ink_mask, start, end)
+            if right_edge is not None:
+                number_edges.append(right_edge)
+        if number_edges:
+            rightmost = max(number_edges)
+            tolerance = width * TOC_ALIGN_TOLERANCE
+            stats['toc_lines'] = sum(1 for edge in number_edges if rightmost - edge <= tolerance)
+
+        return stats
+
+    def _classify(self, image, page_num):
+        """根据文本层和图像统计信息判断页面类型"""
+        text = ''
+        if self.text_provider and page_num is not None:
+            text = self.text_provider(page_num) or ''
+        if text.strip() and TextLayerPage(page_num, text).looks_like_toc():
+            return 'toc'
+
+        stats = self.measure(image)
+        if stats['ink_ratio'] < BLANK_INK_RATIO:
+            # 文本层有内容的页面可能只是颜色很浅，交由模型判断
+            return 'uncertain' if text.strip() else 'blank'
+
+        if stats['picture_rows'] and stats['picture_rows'] >= stats['content_rows'] * PICTURE_MIN_CONTENT_RATIO:
+            return 'picture'
+
+        lines = stats['lines']
+        toc_ratio = stats['toc_lines'] / lines if lines else 0
+        if lines >= MIN_TOC_LINES and toc_ratio >= TOC_LINE_RATIO:
+            return 'toc'
+        if toc_ratio >= TOC_UNCERTAIN_RATIO or stats['tall_bands']:
+            return 'uncertain'
+        if lines >= MIN_TEXT_LINES:
+            return 'text'
+        return 'uncertain'
+
+    def _band_fill_ratio(self, gray, ink_mask, start, end):
+        """计算区域内（按墨迹的水平范围）非白色像素的比例，照片和插图的填充比例远高于文字"""
+        width = gray.size[0]
+        column_profile = pixel_values(ink_mask.crop((0, start, width, end)).resize((width, 1), Image.BOX))
+        columns = find_runs(column_profile, 0)
+        if not columns:
+            return 0
+        left, right = columns[0][0], columns[-1][1]
+
+        histogram = gray.crop((left, start, right, end)).histogram()
+        return sum(histogram[:NON_WHITE_THRESHOLD]) / ((right - left) * (end - start))
+
+    def _toc_number_edge(self, ink_mask, start, end):
+        """判断文本行是否形如目录条目，是则返回页码的右边缘位置，否则返回None"""
+        width = ink_mask.size[0]
+        band_height = end - start
+        column_profile = pixel_values(ink_mask.crop((0, start, width, end)).resize((width, 1), Image.BOX))
+        ink_counts = [value / 255 * band_height for value in column_profile]
+
+        # 把间距小于最小空白宽度的墨迹列合并成段，目录条目应恰好分为标题和页码两段
+        segments = find_runs(ink_counts, SPARSE_COLUMN_INK, max_gap=int(width * TOC_MIN_GAP))
+        if len(segments) != 2:
+            return None
+
+        number_start, number_end = segments[1]
+        if number_end - number_start > width * TOC_NUMBER_MAX_WIDTH:
+            return None
+        return number_end
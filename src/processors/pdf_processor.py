@@ -4,14 +4,57 @@ PDF处理器模块
 """
 
 import os
+import shutil
 import subprocess
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ContentStream
+
+from .text_layer import TextLayerPage, is_text_layer_usable
+
+
+# 绘制路径/着色/内联图像的操作符，出现这些操作符说明页面含有矢量内容
+VECTOR_PAINT_OPERATORS = {
+    b'f', b'F', b'f*', b'S', b's', b'B', b'B*', b'b', b'b*', b'sh', b'INLINE IMAGE'
+}
+
+# 显示文本的操作符
+TEXT_SHOW_OPERATORS = {b'Tj', b'TJ', b"'", b'"'}
+
+# 嵌入图像需覆盖的最小页面比例
+MIN_EMBEDDED_IMAGE_COVERAGE = 0.9
+
+
+class PageImage:
+    """保存在内存中的页面图像，无需经过临时文件"""
+    
+    def __init__(self, page_num, data, mime_type):
+        """
+        初始化内存页面图像
+        
+        Args:
+            page_num (int): 页码，从1开始计数
+            data (bytes): 图像数据
+            mime_type (str): 图像的MIME类型
+        """
+        self.page_num = page_num
+        self.data = data
+        self.mime_type = mime_type
+    
+    def __repr__(self):
+        return f"PageImage(page_num={self.page_num}, mime_type={self.mime_type!r}, bytes={len(self.data)})"
+
 
 class PDFProcessor:
     def __init__(self):
-        pass
+        # PyPDF2的读取器不是线程安全的，并行渲染时共享同一个读取器需要加锁
+        self._readers = {}
+        self._reader_lock = threading.Lock()
     
     def get_pdf_info(self, pdf_path):
         """
@@ -38,23 +81,20 @@ class PDFProcessor:
         except subprocess.CalledProcessError as e:
             raise Exception(f"无法获取PDF信息: {e}")
     
-    def pdf_to_images(self, pdf_path, dpi=200, page_range=None):
+    def resolve_page_range(self, pdf_path, page_range=None):
         """
-        将PDF转换为PNG图像
+        解析并校正需要处理的页码范围
         
         Args:
             pdf_path (str): PDF文件路径
-            dpi (int): 图像DPI
             page_range (tuple): 页码范围 (start_page, end_page)，从1开始计数
             
         Returns:
-            list: 图像文件路径列表
+            tuple: (start_page, end_page, total_pages)
         """
-        # 获取PDF信息
         pdf_info = self.get_pdf_info(pdf_path)
         total_pages = int(pdf_info.get('Pages', 1))
         
-        # 处理页码范围
         if page_range:
             start_page, end_page = page_range
             # 确保页码在有效范围内
@@ -65,36 +105,574 @@ class PDFProcessor:
             start_page, end_page = 1, total_pages
             print(f"PDF信息: {total_pages} 页")
         
+        return start_page, end_page, total_pages
+    
+    def pdf_to_images(self, pdf_path, dpi=200, page_range=None, workers=1, extract_embedded=False,
+                      text_layer='off'):
+        """
+        将PDF转换为PNG图像
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            dpi (int): 图像DPI
+            page_range (tuple): 页码范围 (start_page, end_page)，从1开始计数
+            workers (int): 并行运行的pdftoppm进程数，None表示使用全部CPU核心
+            extract_embedded (bool): 对只包含单张JPEG扫描图的页面直接导出原图
+                                     (page-001.jpg)，其余页面仍然渲染
+            text_layer (str): 文本层模式 ('off'、'auto' 或 'force')，
+                              采用文本层的页面不渲染，以TextLayerPage代替图像路径
+            
+        Returns:
+            list: 按页码排序的图像文件路径（或TextLayerPage）列表
+        """
+        start_page, end_page, total_pages = self.resolve_page_range(pdf_path, page_range)
+        text_pages = self.classify_text_layer_pages(pdf_path, start_page, end_page, text_layer)
+        
         # 创建临时目录存储图像
         temp_dir = tempfile.mkdtemp()
         
-        # 使用pdftoppm转换PDF为图像
-        try:
-            # 构建命令参数
-            cmd = [
-                'pdftoppm',
-                '-png',
-                '-r', str(dpi),
-                '-progress'
-            ]
+        # 将页码范围切分为若干连续分片，每个分片由一个pdftoppm进程渲染
+        shards = self.split_page_range(start_page, end_page, self.resolve_workers(workers))
+        if len(shards) == 1:
+            extracted = self._render_shard(
+                pdf_path, dpi, start_page, end_page, temp_dir, extract_embedded,
+                skip_pages=text_pages, show_progress=True
+            )
+        else:
+            print(f"使用 {len(shards)} 个pdftoppm进程并行渲染")
+            with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+                futures = [
+                    executor.submit(
+                        self._render_shard, pdf_path, dpi, first, last, temp_dir, extract_embedded,
+                        skip_pages=text_pages
+                    )
+                    for first, last in shards
+                ]
+                extracted = sum(future.result() for future in futures)
+        
+        if extract_embedded:
+            rendered = end_page - start_page + 1 - extracted - len(text_pages)
+            print(f"直接导出嵌入图像 {extracted} 页，渲染 {rendered} 页")
+        
+        image_files = self._collect_page_files(temp_dir, start_page, end_page, total_pages, text_pages)
+        if not os.listdir(temp_dir):
+            os.rmdir(temp_dir)
+        return image_files
+    
+    def resolve_workers(self, workers):
+        """
+        解析渲染进程数
+        
+        Args:
+            workers (int): 期望的进程数，None或小于1表示使用全部CPU核心
             
-            # 如果指定了页码范围，添加范围参数
-            if page_range:
-                cmd.extend(['-f', str(start_page), '-l', str(end_page)])
+        Returns:
+            int: 实际使用的进程数
+        """
+        if workers is None or workers < 1:
+            return os.cpu_count() or 1
+        return workers
+    
+    def split_page_range(self, start_page, end_page, shard_count):
+        """
+        将页码范围切分为页数尽量均匀的连续分片
+        
+        Args:
+            start_page (int): 起始页码
+            end_page (int): 结束页码（包含）
+            shard_count (int): 分片数量
             
-            cmd.extend([pdf_path, os.path.join(temp_dir, 'page')])
+        Returns:
+            list: (first_page, last_page) 元组列表，按页码排序
+        """
+        page_count = end_page - start_page + 1
+        shard_count = max(1, min(shard_count, page_count))
+        base, extra = divmod(page_count, shard_count)
+        
+        shards = []
+        first = start_page
+        for i in range(shard_count):
+            size = base + (1 if i < extra else 0)
+            shards.append((first, first + size - 1))
+            first += size
+        return shards
+    
+    def _render_shard(self, pdf_path, dpi, first_page, last_page, output_dir, extract_embedded,
+                      skip_pages=(), show_progress=False):
+        """
+        处理一个分片：跳过skip_pages中的页面，尝试直接导出嵌入图像，
+        剩余页面按连续区间渲染
+        
+        Returns:
+            int: 直接导出嵌入图像的页数
+        """
+        if not extract_embedded and not skip_pages:
+            self._render_range(pdf_path, dpi, first_page, last_page, output_dir, show_progress)
+            return 0
+        
+        extracted = 0
+        run_start = None
+        for page_num in range(first_page, last_page + 2):
+            if page_num > last_page or page_num in skip_pages:
+                is_rendered = False
+            elif extract_embedded and self.save_embedded_image(pdf_path, page_num, output_dir):
+                extracted += 1
+                is_rendered = False
+            else:
+                is_rendered = True
             
+            if is_rendered and run_start is None:
+                run_start = page_num
+            elif not is_rendered and run_start is not None:
+                self._render_range(pdf_path, dpi, run_start, page_num - 1, output_dir, show_progress)
+                run_start = None
+        
+        return extracted
+    
+    def _render_range(self, pdf_path, dpi, first_page, last_page, output_dir, show_progress=False):
+        """使用一个pdftoppm进程渲染连续的页码范围"""
+        cmd = ['pdftoppm', '-png', '-r', str(dpi)]
+        if show_progress:
+            cmd.append('-progress')
+        cmd.extend(['-f', str(first_page), '-l', str(last_page)])
+        cmd.extend([pdf_path, os.path.join(output_dir, 'page')])
+        
+        try:
             subprocess.run(cmd, check=True)
         except subprocess.CalledProcessError as e:
             raise Exception(f"PDF转换失败: {e}")
+    
+    def _collect_page_files(self, output_dir, start_page, end_page, total_pages, text_pages=None):
+        """
+        收集pdftoppm生成的图像文件，并统一命名为 page-001.png 格式
         
-        # 获取生成的图像文件
+        pdftoppm会按PDF总页数的位数补零（如不足100页时为 page-01.png），
+        这里统一重命名为至少三位的页码，保证调用方看到的文件名一致。
+        采用文本层的页面按页码顺序插入对应的TextLayerPage。
+        """
+        digits = len(str(total_pages))
         image_files = []
         for i in range(start_page, end_page + 1):
-            # pdftoppm生成的文件名格式为 page-001.png, page-002.png, ...
-            filename = f"page-{i:03d}.png"
-            filepath = os.path.join(temp_dir, filename)
+            if text_pages and i in text_pages:
+                image_files.append(text_pages[i])
+                continue
+            
+            embedded = os.path.join(output_dir, f"page-{i:03d}.jpg")
+            if os.path.exists(embedded):
+                image_files.append(embedded)
+                continue
+            
+            filepath = os.path.join(output_dir, f"page-{i:03d}.png")
+            generated = os.path.join(output_dir, f"page-{i:0{digits}d}.png")
+            if not os.path.exists(filepath) and os.path.exists(generated):
+                os.rename(generated, filepath)
             if os.path.exists(filepath):
                 image_files.append(filepath)
         
-        return image_files
\ No newline at end of file
+        return image_files
+    
+    def render_page(self, pdf_path, page_num, dpi, output_dir, extract_embedded=False):
+        """
+        渲染单个PDF页面为PNG图像
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            dpi (int): 图像DPI
+            output_dir (str): 输出目录
+            extract_embedded (bool): 页面只包含单张JPEG扫描图时直接导出原图
+            
+        Returns:
+            str: 图像文件路径，文件名格式与pdf_to_images一致 (page-001.png 或 page-001.jpg)
+        """
+        if extract_embedded:
+            embedded_path = self.save_embedded_image(pdf_path, page_num, output_dir)
+            if embedded_path:
+                return embedded_path
+        
+        output_root = os.path.join(output_dir, f"page-{page_num:03d}")
+        cmd = [
+            'pdftoppm',
+            '-png',
+            '-r', str(dpi),
+            '-f', str(page_num),
+            '-l', str(page_num),
+            '-singlefile',
+            pdf_path,
+            output_root
+        ]
+        
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"第 {page_num} 页转换失败: {e}")
+        
+        return f"{output_root}.png"
+    
+    def render_page_to_memory(self, pdf_path, page_num, dpi, extract_embedded=False):
+        """
+        渲染单个PDF页面，图像直接从pdftoppm的标准输出读入内存
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            dpi (int): 图像DPI
+            extract_embedded (bool): 页面只包含单张JPEG扫描图时直接使用原图
+            
+        Returns:
+            PageImage: 内存中的页面图像
+        """
+        if extract_embedded:
+            image_data = self.extract_embedded_image(pdf_path, page_num)
+            if image_data is not None:
+                return PageImage(page_num, image_data, 'image/jpeg')
+        
+        # 不指定输出文件前缀时pdftoppm将图像写到标准输出
+        cmd = [
+            'pdftoppm',
+            '-png',
+            '-r', str(dpi),
+            '-f', str(page_num),
+            '-l', str(page_num),
+            '-singlefile',
+            pdf_path
+        ]
+        
+        try:
+            result = subprocess.run(cmd, check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"第 {page_num} 页转换失败: {e}")
+        
+        return PageImage(page_num, result.stdout, 'image/png')
+    
+    def iter_page_images(self, pdf_path, start_page, end_page, dpi=200, lookahead=4, workers=1,
+                         extract_embedded=False, text_layer='off', in_memory=False):
+        """
+        以流式方式逐页渲染PDF，边渲染边产出图像
+        
+        后台线程最多提前渲染 lookahead 页，调用方每取走一页才会继续渲染
+        后续页面，因此第一页渲染完成即可开始OCR，临时磁盘占用也只与
+        lookahead 成正比。页码范围应先通过 resolve_page_range 校正。
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            start_page (int): 起始页码，从1开始计数
+            end_page (int): 结束页码（包含）
+            dpi (int): 图像DPI
+            lookahead (int): 最多提前渲染的页数
+            workers (int): 并行渲染的pdftoppm进程数，None表示使用全部CPU核心，
+                           实际不会超过 lookahead
+            extract_embedded (bool): 页面只包含单张JPEG扫描图时直接导出原图
+            text_layer (str): 文本层模式 ('off'、'auto' 或 'force')
+            in_memory (bool): 页面图像保存在内存中（PageImage），不写临时文件
+            
+        Yields:
+            str: 按页码顺序产出的图像文件路径（内存模式下为PageImage），
+                 采用文本层的页面产出TextLayerPage
+        """
+        lookahead = max(1, lookahead)
+        workers = min(self.resolve_workers(workers), lookahead)
+        
+        temp_dir = None if in_memory else tempfile.mkdtemp()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = deque()
+        next_page = start_page
+        
+        try:
+            while True:
+                # 补足预渲染窗口，保证调用方处理当前页时后面还有 lookahead 页在渲染
+                while next_page <= end_page and len(pending) < lookahead:
+                    pending.append(executor.submit(
+                        self._produce_page, pdf_path, next_page, dpi, temp_dir, extract_embedded, text_layer
+                    ))
+                    next_page += 1
+                
+                if not pending:
+                    break
+                
+                image_path = pending.popleft().result()
+                if next_page <= end_page:
+                    pending.append(executor.submit(
+                        self._produce_page, pdf_path, next_page, dpi, temp_dir, extract_embedded, text_layer
+                    ))
+                    next_page += 1
+                
+                yield image_path
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def _produce_page(self, pdf_path, page_num, dpi, output_dir, extract_embedded, text_layer):
+        """
+        流式渲染中处理单页：优先采用文本层，其次导出嵌入图像，最后渲染；
+        output_dir为None时图像保存在内存中
+        """
+        text_page = self.classify_text_layer(pdf_path, page_num, text_layer)
+        if text_page is not None:
+            return text_page
+        if output_dir is None:
+            return self.render_page_to_memory(pdf_path, page_num, dpi, extract_embedded)
+        return self.render_page(pdf_path, page_num, dpi, output_dir, extract_embedded)
+    
+    def classify_text_layer_pages(self, pdf_path, start_page, end_page, mode):
+        """
+        批量判断页码范围内哪些页面可以直接使用文本层
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            start_page (int): 起始页码
+            end_page (int): 结束页码（包含）
+            mode (str): 文本层模式 ('off'、'auto' 或 'force')
+            
+        Returns:
+            dict: 页码 -> TextLayerPage
+        """
+        if mode == 'off':
+            return {}
+        
+        text_pages = {}
+        for page_num in range(start_page, end_page + 1):
+            text_page = self.classify_text_layer(pdf_path, page_num, mode)
+            if text_page is not None:
+                text_pages[page_num] = text_page
+        
+        print(f"文本层可用 {len(text_pages)} 页，需要OCR {end_page - start_page + 1 - len(text_pages)} 页")
+        return text_pages
+    
+    def classify_text_layer(self, pdf_path, page_num, mode):
+        """
+        判断单个页面是否可以直接使用PDF文本层代替OCR
+        
+        - off: 从不使用文本层
+        - auto: 页面有可见文本（不只是扫描件上不可见的OCR层）且文本质量足够时使用
+        - force: 只要页面能提取到文本就使用，没有文本的页面仍走OCR
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            mode (str): 文本层模式
+            
+        Returns:
+            TextLayerPage: 可以使用文本层时返回页面对象，否则返回None
+        """
+        if mode == 'off':
+            return None
+        
+        with self._reader_lock:
+            try:
+                reader = self._get_reader(pdf_path)
+                page = reader.pages[page_num - 1]
+                text = page.extract_text() or ''
+                if not text.strip():
+                    return None
+                
+                if mode == 'auto':
+                    if not is_text_layer_usable(text) or self._has_only_hidden_text(reader, page):
+                        return None
+            except Exception as e:
+                print(f"第 {page_num} 页文本层提取失败，改为OCR: {e}")
+                return None
+        
+        return TextLayerPage(page_num, text)
+    
+    def get_page_text(self, pdf_path, page_num):
+        """
+        读取页面文本层内容（包括扫描件上不可见的OCR层），不判断文本质量
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            
+        Returns:
+            str: 页面文本，没有文本层或读取失败时返回空字符串
+        """
+        with self._reader_lock:
+            try:
+                reader = self._get_reader(pdf_path)
+                return reader.pages[page_num - 1].extract_text() or ''
+            except Exception:
+                return ''
+    
+    def _has_only_hidden_text(self, reader, page):
+        """判断页面上的文本是否全部为不可见文本（扫描件附带的OCR层）"""
+        contents = page.get_contents()
+        if contents is None:
+            return False
+        if not isinstance(contents, ContentStream):
+            contents = ContentStream(contents, reader)
+        
+        text_render_mode = 0
+        state_stack = []
+        shown_text = False
+        for operands, operator in contents.operations:
+            if operator == b'q':
+                state_stack.append(text_render_mode)
+            elif operator == b'Q':
+                if state_stack:
+                    text_render_mode = state_stack.pop()
+            elif operator == b'Tr':
+                text_render_mode = int(operands[0])
+            elif operator in TEXT_SHOW_OPERATORS:
+                if text_render_mode != 3:
+                    return False
+                shown_text = True
+        
+        return shown_text
+    
+    def save_embedded_image(self, pdf_path, page_num, output_dir):
+        """
+        如果页面只包含一张铺满页面的JPEG扫描图，将原始JPEG字节写入输出目录
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            output_dir (str): 输出目录
+            
+        Returns:
+            str: 图像文件路径 (page-001.jpg)，页面不满足条件时返回None
+        """
+        image_data = self.extract_embedded_image(pdf_path, page_num)
+        if image_data is None:
+            return None
+        
+        filepath = os.path.join(output_dir, f"page-{page_num:03d}.jpg")
+        with open(filepath, 'wb') as f:
+            f.write(image_data)
+        return filepath
+    
+    def extract_embedded_image(self, pdf_path, page_num):
+        """
+        提取页面中唯一的JPEG扫描图的原始字节
+        
+        只有当页面内容仅为一次图像绘制（允许不可见的OCR文本层），图像不经
+        旋转/翻转地覆盖整个页面，且为可直接使用的RGB/灰度JPEG时才会提取；
+        含有可见文字、矢量图形、多张图像或其他编码的页面返回None，由调用方
+        回退到渲染。
+        
+        Args:
+            pdf_path (str): PDF文件路径
+            page_num (int): 页码，从1开始计数
+            
+        Returns:
+            bytes: JPEG图像数据，页面不满足条件时返回None
+        """
+        with self._reader_lock:
+            try:
+                reader = self._get_reader(pdf_path)
+                page = reader.pages[page_num - 1]
+                return self._extract_single_jpeg(reader, page)
+            except Exception as e:
+                print(f"第 {page_num} 页嵌入图像检测失败，改为渲染: {e}")
+                return None
+    
+    def _get_reader(self, pdf_path):
+        """获取（并缓存）PDF读取器"""
+        reader = self._readers.get(pdf_path)
+        if reader is None:
+            reader = PdfReader(pdf_path)
+            self._readers[pdf_path] = reader
+        return reader
+    
+    def _extract_single_jpeg(self, reader, page):
+        """检查页面结构，满足单图条件时返回JPEG字节"""
+        if int(page.get('/Rotate', 0) or 0) % 360 != 0:
+            return None
+        
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get('/XObject')
+        xobjects = xobjects.get_object() if xobjects is not None else {}
+        if len(xobjects) != 1:
+            return None
+        
+        name, xobject = next(iter(xobjects.items()))
+        image = xobject.get_object()
+        if image.get('/Subtype') != '/Image' or not self._is_plain_jpeg(image):
+            return None
+        
+        contents = page.get_contents()
+        if contents is None:
+            return None
+        if not isinstance(contents, ContentStream):
+            contents = ContentStream(contents, reader)
+        
+        placement = self._find_single_image_placement(contents.operations, name)
+        if placement is None:
+            return None
+        
+        # 图像需要不经旋转/翻转地覆盖几乎整个页面
+        a, b, c, d = placement
+        page_width = float(page.mediabox.width)
+        page_height = float(page.mediabox.height)
+        if abs(b) > 1e-6 or abs(c) > 1e-6 or a <= 0 or d <= 0:
+            return None
+        if a < page_width * MIN_EMBEDDED_IMAGE_COVERAGE or d < page_height * MIN_EMBEDDED_IMAGE_COVERAGE:
+            return None
+        
+        return image.get_data()
+    
+    def _is_plain_jpeg(self, image):
+        """判断图像XObject是否为可原样使用的RGB/灰度JPEG"""
+        filters = image.get('/Filter')
+        if isinstance(filters, list):
+            filters = filters[-1] if filters else None
+        if filters != '/DCTDecode':
+            return False
+        
+        # 带蒙版、解码数组的图像直接使用原图会与页面效果不一致
+        for key in ('/SMask', '/Mask', '/Decode', '/ImageMask'):
+            if key in image:
+                return False
+        
+        color_space = image.get('/ColorSpace')
+        color_space = color_space.get_object() if color_space is not None else None
+        if color_space in ('/DeviceRGB', '/DeviceGray'):
+            return True
+        if isinstance(color_space, list) and color_space and color_space[0] == '/ICCBased':
+            return int(color_space[1].get_object().get('/N', 0)) in (1, 3)
+        return False
+    
+    def _find_single_image_placement(self, operations, image_name):
+        """
+        分析内容流：只允许一次绘制指定图像，返回绘制时变换矩阵的 (a, b, c, d)
+        
+        可见文本、矢量绘制或多次绘制都会返回None。
+        """
+        ctm = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        text_render_mode = 0
+        state_stack = []
+        placement = None
+        
+        for operands, operator in operations:
+            if operator == b'q':
+                state_stack.append((list(ctm), text_render_mode))
+            elif operator == b'Q':
+                if state_stack:
+                    ctm, text_render_mode = state_stack.pop()
+            elif operator == b'cm':
+                a, b, c, d, e, f = (float(x) for x in operands)
+                ctm = [
+                    a * ctm[0] + b * ctm[2],
+                    a * ctm[1] + b * ctm[3],
+                    c * ctm[0] + d * ctm[2],
+                    c * ctm[1] + d * ctm[3],
+                    e * ctm[0] + f * ctm[2] + ctm[4],
+                    e * ctm[1] + f * ctm[3] + ctm[5],
+                ]
+            elif operator == b'Tr':
+                text_render_mode = int(operands[0])
+            elif operator in TEXT_SHOW_OPERATORS:
+                # 扫描件常带有不可见的OCR文本层 (Tr 3)，可见文本则说明页面不只是图像
+                if text_render_mode != 3:
+                    return None
+            elif operator in VECTOR_PAINT_OPERATORS:
+                return None
+            elif operator == b'Do':
+                if operands[0] != image_name or placement is not None:
+                    return None
+                placement = tuple(ctm[:4])
+        
+        return placement
@@ -0,0 +1,201 @@
+"""
+PDF文本层模块
+负责判断页面自带文本层的质量，并将其转换为与Gemini识别结果相同的结构
+"""
+
+import re
+import unicodedata
+
+
+# 文本层模式
+TEXT_LAYER_MODES = ('off', 'auto', 'force')
+
+# auto模式下采用文本层所需的最少有效字符数
+MIN_TEXT_LAYER_CHARS = 40
+
+# auto模式下有效字符（文字、数字、常见标点、空白）所占的最低比例
+MIN_VALID_CHAR_RATIO = 0.9
+
+# 章节标题识别：一级标题（章/篇/部/卷等）和二级标题（节）
+CHAPTER_HEADING_PATTERN = re.compile(
+    r'^(第[一二三四五六七八九十百千零〇两\d]+[章篇部卷回]|chapter\s+[\divxlc]+\b|part\s+[\divxlc]+\b|'
+    r'序言?$|前言$|后记$|译者序$|引言$|导言$|附录)',
+    re.IGNORECASE
+)
+SECTION_HEADING_PATTERN = re.compile(r'^(第[一二三四五六七八九十百零〇\d]+节|\d+(\.\d+)+\s)')
+
+# 目录条目：以页码结尾（可带点线引导符）
+TOC_ENTRY_PATTERN = re.compile(r'[\.·…\s]\s*\d{1,4}\s*$')
+TOC_TITLE_PATTERN = re.compile(r'^\s*(目\s*录|contents|table of contents)\s*$', re.IGNORECASE)
+
+# 句末标点，用于判断段落结束
+SENTENCE_END_CHARS = '。！？!?；;：:.”」』）)'
+
+
+def is_cjk(char):
+    """判断字符是否为中日韩文字"""
+    return '\u4e00' <= char <= '\u9fff' or '\u3400' <= char <= '\u4dbf' or '\u3040' <= char <= '\u30ff'
+
+
+def is_text_layer_usable(text):
+    """
+    判断文本层质量是否足以替代OCR
+
+    Args:
+        text (str): PyPDF2提取的页面文本
+
+    Returns:
+        bool: 文本足够长且没有明显乱码时返回True
+    """
+    if not text:
+        return False
+
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < MIN_TEXT_LAYER_CHARS:
+        return False
+
+    # 字体缺少ToUnicode映射时常见替换字符、私有区字符或 (cid:123) 形式的乱码
+    if '\ufffd' in text or '(cid:' in text:
+        return False
+
+    valid = 0
+    for c in chars:
+        category = unicodedata.category(c)
+        if category[0] in ('L', 'N', 'P') or c in '+-*/=<>%$&@#~^|`·—…':
+            if category != 'Co':
+                valid += 1
+    if valid / len(chars) < MIN_VALID_CHAR_RATIO:
+        return False
+
+    # 西文文本若大部分单词只有一个字母，通常是字符间距导致的逐字断开
+    words = re.findall(r'[A-Za-z]+', text)
+    if len(words) >= 20:
+        single_letters = sum(1 for w in words if len(w) == 1)
+        if single_letters / len(words) > 0.5:
+            return False
+
+    return True
+
+
+def join_lines(lines):
+    """将同一段落内因排版断开的行合并，中文直接连接，西文用空格连接并去除断词连字符"""
+    result = ''
+    for line in lines:
+        if not result:
+            result = line
+        elif result.endswith('-') and line[:1].islower():
+            result = result[:-1] + line
+        elif is_cjk(result[-1]) or is_cjk(line[0]):
+            result += line
+        else:
+            result += ' ' + line
+    return result
+
+
+class TextLayerPage:
+    """使用PDF文本层代替OCR的页面"""
+
+    def __init__(self, page_num, text):
+        """
+        初始化文本层页面
+
+        Args:
+            page_num (int): 页码，从1开始计数
+            text (str): 页面文本层内容
+        """
+        self.page_num = page_num
+        self.text = text
+
+    def __repr__(self):
+        return f"TextLayerPage(page_num={self.page_num}, chars={len(self.text)})"
+
+    def looks_like_toc(self):
+        """
+        根据文本判断是否为目录页面
+
+        Returns:
+            bool: 页面标题为"目录"/"Contents"，或大部分行以页码结尾时返回True
+        """
+        lines = [line.strip() for line in self.text.split('\n') if line.strip()]
+        if not lines:
+            return False
+
+        if any(TOC_TITLE_PATTERN.match(line) for line in lines[:3]):
+            return True
+
+        entries = sum(1 for line in lines if TOC_ENTRY_PATTERN.search(line))
+        return entries >= 5 and entries / len(lines) >= 0.6
+
+    def to_blocks(self):
+        """
+        转换为富文本模式的内容块列表，格式与 GeminiClient.extract_rich_structure 一致
+
+        Returns:
+            list: 内容块字典列表
+        """
+        lines = [line.strip() for line in self.text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+        line_lengths = [len(line) for line in lines if line]
+        full_line_length = max(line_lengths) if line_lengths else 0
+
+        blocks = []
+        paragraph = []
+
+        def flush_paragraph():
+            if paragraph:
+                blocks.append({
+                    'type': 'paragraph',
+                    'level': 0,
+                    'style': {'align': 'left'},
+                    'content': join_lines(paragraph)
+                })
+                paragraph.clear()
+
+        for line in lines:
+            if not line:
+                flush_paragraph()
+                continue
+
+            heading_level = self._heading_level(line)
+            if heading_level:
+                flush_paragraph()
+                blocks.append({
+                    'type': 'heading',
+                    'level': heading_level,
+                    'style': {'align': 'center' if heading_level == 1 else 'left'},
+                    'content': line
+                })
+                continue
+
+            paragraph.append(line)
+            # 以句末标点结束且明显短于整行的行视为段落结尾
+            if line[-1] in SENTENCE_END_CHARS and len(line) < full_line_length * 0.8:
+                flush_paragraph()
+
+        flush_paragraph()
+        return blocks
+
+    def to_text(self):
+        """
+        转换为纯文本模式的文本，格式与 GeminiClient.extract_text 一致：
+        段落之间以空行分隔，标题以'## '标记
+
+        Returns:
+            str: 整理后的文本
+        """
+        parts = []
+        for block in self.to_blocks():
+            if block['type'] == 'heading':
+                parts.append(f"## {block['content']}")
+            else:
+                parts.append(block['content'])
+        return '\n\n'.join(parts)
+
+    def _heading_level(self, line):
+        """识别章节标题，返回标题级别，不是标题时返回0"""
+        if len(line) > 30 or line[-1] in '。，,；;':
+            return 0
+        if CHAPTER_HEADING_PATTERN.match(line):
+            return 1
+        if SECTION_HEADING_PATTERN.match(line):
+            return 2
+        return 0
@@ -5,6 +5,7 @@
 
 import json
 import os
+import shutil
 from pathlib import Path
 
 
@@ -27,6 +28,15 @@ class ProgressManager:
         
         # 临时EPUB文件路径
         self.temp_epub_path = output_dir / f"{pdf_name}_temp.epub"
+        
+        # 嵌入EPUB的页面图像目录，断点续传时需要保留
+        self.images_dir = output_dir / f"{pdf_name}_images"
+        
+        # 已提交的批处理任务 [{'name': 任务名, 'keys': [请求键, ...]}, ...]，随进度一起保存
+        self.batch_jobs = []
+        
+        # 可选的token用量统计（TokenUsage），其汇总随进度一起保存，恢复任务时累加
+        self.token_usage = None
     
     def save_progress(self, processed_pages, total_pages, processed_chapters, mode, **kwargs):
         """
@@ -49,6 +59,10 @@ class ProgressManager:
             'temp_epub_path': str(self.temp_epub_path),
             **kwargs
         }
+        if self.batch_jobs:
+            progress_data['batch_jobs'] = self.batch_jobs
+        if self.token_usage is not None:
+            progress_data['token_usage'] = self.token_usage.summary()
         
         with open(self.progress_file, 'w', encoding='utf-8') as f:
             json.dump(progress_data, f, ensure_ascii=False, indent=2)
@@ -82,6 +96,24 @@ class ProgressManager:
             print(f"进度文件损坏，将重新开始: {e}")
             return None
     
+    def save_page_image(self, page_num, image_data, extension):
+        """
+        保存需要嵌入EPUB的页面图像
+        
+        Args:
+            page_num (int): 页码
+            image_data (bytes): 图像数据
+            extension (str): 文件扩展名，如 '.jpg'
+            
+        Returns:
+            str: 图像文件路径
+        """
+        self.images_dir.mkdir(parents=True, exist_ok=True)
+        image_path = self.images_dir / f"page-{page_num:03d}{extension}"
+        with open(image_path, 'wb') as f:
+            f.write(image_data)
+        return str(image_path)
+    
     def cleanup_temp_files(self):
         """
         清理临时文件
@@ -93,6 +125,10 @@ class ProgressManager:
         if self.temp_epub_path.exists():
             os.remove(self.temp_epub_path)
             print("已清理临时EPUB文件")
+        
+        if self.images_dir.exists():
+            shutil.rmtree(self.images_dir)
+            print("已清理页面图像目录")
     
     def get_temp_epub_path(self):
         """
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+测试asyncio版本的Gemini客户端
+"""
+
+import sys
+import os
+import time
+import json
+import asyncio
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.async_minigenai import AsyncMiniGenAI
+from src.api.errors import AsyncHTTPError
+from src.api.retry_policy import RetryPolicy
+from src.api.async_gemini_client import AsyncGeminiClient
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer
+
+
+CONTENTS = [{"role": "user", "parts": [{"text": "提取文本"}, {"inline_data": {"mime_type": "image/png", "data": "x" * 1000}}]}]
+
+
+async def start_raw_server(responses):
+    """启动按顺序返回原始HTTP响应的服务器，每个连接只处理一个请求"""
+    state = {'connections': 0}
+
+    async def handle(reader, writer):
+        state['connections'] += 1
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int([line.split(b":")[1] for line in head.split(b"\r\n") if line.lower().startswith(b"content-length")][0])
+        await reader.readexactly(length)
+        writer.write(responses.pop(0))
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    return server, f"http://{host}:{port}", state
+
+
+def test_many_concurrent_requests():
+    """测试数百个请求在一个事件循环中并发完成，连接数不超过并发上限"""
+    print("测试并发请求...")
+    server = MockGeminiServer(delay=0.2, response_text="页面文本").start()
+
+    async def run():
+        async with AsyncMiniGenAI('test_key', server.base_url, max_concurrency=100) as client:
+            start_time = time.time()
+            results = await asyncio.gather(*[client.generate_content('gemini-2.5-flash', CONTENTS) for _ in range(200)])
+            return results, time.time() - start_time, client.latency
+
+    try:
+        results, elapsed, latency = asyncio.run(run())
+        print(f"200个请求耗时 {elapsed:.2f} 秒，服务器接受连接 {server.connections} 次")
+        assert results == ["页面文本"] * 200
+        assert server.requests == 200
+        assert server.connections <= 100
+        assert latency.requests == 200 and latency.new_connections == server.connections
+        # 串行需要40秒，并发上限100时约两轮
+        assert elapsed < 5
+    finally:
+        server.stop()
+    print("并发请求测试通过")
+
+
+def test_connections_are_reused():
+    """测试连续请求复用同一个keep-alive连接"""
+    print("\n测试连接复用...")
+    server = MockGeminiServer(response_text="页面文本").start()
+
+    async def run():
+        async with AsyncMiniGenAI('test_key', server.base_url) as client:
+            for _ in range(5):
+                assert await client.generate_content('gemini-2.5-flash', CONTENTS) == "页面文本"
+
+    try:
+        asyncio.run(run())
+        assert server.requests == 5
+        assert server.connections == 1
+    finally:
+        server.stop()
+    print("连接复用测试通过")
+
+
+def test_chunked_response_and_http_error():
+    """测试分块编码的响应体和4xx/5xx状态码"""
+    print("\n测试分块响应与错误状态码...")
+    body = json.dumps({"candidates": [{"content": {"parts": [{"text": "分块文本"}]}}]}).encode('utf-8')
+    chunked = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+    for start in range(0, len(body), 16):
+        chunk = body[start:start + 16]
+        chunked += b"%x\r\n" % len(chunk) + chunk + b"\r\n"
+    chunked += b"0\r\n\r\n"
+    error = b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 7\r\nConnection: close\r\nContent-Length: 10\r\n\r\nrate limit"
+
+    async def run():
+        server, base_url, state = await start_raw_server([chunked, error])
+        async with server:
+            async with AsyncMiniGenAI('test_key', base_url) as client:
+                assert await client.generate_content('gemini-2.5-flash', CONTENTS) == "分块文本"
+                try:
+                    await client.generate_content('gemini-2.5-flash', CONTENTS)
+                    assert False, "应该抛出AsyncHTTPError"
+                except AsyncHTTPError as e:
+                    assert e.status == 429
+                    assert e.headers['retry-after'] == '7'
+                    assert e.body == b"rate limit"
+        return state['connections']
+
+    assert asyncio.run(run()) == 2
+    print("分块响应与错误状态码测试通过")
+
+
+def test_cancellation_closes_connection():
+    """测试取消进行中的请求时关闭连接，不影响后续请求"""
+    print("\n测试取消请求...")
+    server = MockGeminiServer(delay=0.5).start()
+
+    async def run():
+        async with AsyncMiniGenAI('test_key', server.base_url) as client:
+            task = asyncio.create_task(client.generate_content('gemini-2.5-flash', CONTENTS))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            try:
+                await task
+                assert False, "应该被取消"
+            except asyncio.CancelledError:
+                pass
+            # 被取消的连接上可能还有未读的响应，后续请求使用新连接
+            return await client.generate_content('gemini-2.5-flash', CONTENTS)
+
+    try:
+        assert asyncio.run(run()) == "模拟响应"
+        assert server.connections == 2
+    finally:
+        server.stop()
+    print("取消请求测试通过")
+
+
+def test_async_gemini_client_methods():
+    """测试AsyncGeminiClient的提取方法与同步版本解析结果一致"""
+    print("\n测试AsyncGeminiClient...")
+
+    def respond(payload):
+        prompt = payload['contents'][0]['parts'][0]['text']
+        if '"text": "..."' in prompt:
+            return json.dumps({"is_toc": False, "text": "## 标题\n\n正文"}, ensure_ascii=False)
+        if '"blocks"' in prompt:
+            return json.dumps({"is_toc": True, "blocks": [{"type": "paragraph"}]})
+        return "true"
+
+    server = MockGeminiServer(response_text=respond).start()
+    os.environ.setdefault('GEMINI_API_KEY', 'test_key')
+    image = PageImage(1, b'\x89PNG\r\n\x1a\n' + b'\x00' * 100, 'image/png')
+
+    async def run():
+        async with AsyncGeminiClient(base_url=server.base_url) as client:
+            return await asyncio.gather(
+                client.extract_text_with_toc(image),
+                client.extract_rich_structure_with_toc(image),
+                client.is_table_of_contents_page(image),
+            )
+
+    try:
+        text_result, rich_result, is_toc = asyncio.run(run())
+        assert text_result == (False, "## 标题\n\n正文")
+        assert rich_result == (True, [])
+        assert is_toc is True
+    finally:
+        server.stop()
+    print("AsyncGeminiClient测试通过")
+
+
+def test_image_encoded_once_across_retries():
+    """测试重试时不重新编码页面图像，每次发送相同的请求内容"""
+    print("\n测试重试时复用图像...")
+    os.environ.setdefault('GEMINI_API_KEY', 'test_key')
+    image = PageImage(1, b'\x89PNG\r\n\x1a\n' + b'\x00' * 100, 'image/png')
+    responses = [AsyncHTTPError(503, 'Service Unavailable', {}, b''), AsyncHTTPError(503, 'Service Unavailable', {}, b''),
+                 '{"is_toc": false, "text": "正文"}']
+
+    async def run():
+        async with AsyncGeminiClient(retry_policy=RetryPolicy(base_delay=0.001)) as client:
+            with patch.object(client.image_encoder, 'encode', wraps=client.image_encoder.encode) as encode, \
+                    patch.object(client.client, 'generate_content', side_effect=responses) as generate:
+                result = await client.extract_text_with_toc(image)
+            return result, encode.call_count, generate.call_args_list
+
+    result, encodes, calls = asyncio.run(run())
+    assert result == (False, "正文")
+    assert encodes == 1 and len(calls) == 3
+    assert calls[0].args[1] is calls[2].args[1]
+    print("重试时复用图像测试通过")
+
+
+if __name__ == '__main__':
+    test_many_concurrent_requests()
+    test_connections_are_reused()
+    test_chunked_response_and_http_error()
+    test_cancellation_closes_connection()
+    test_async_gemini_client_methods()
+    test_image_encoded_once_across_retries()
+    print("\n所有asyncio客户端测试通过！")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+测试Batch API模式：提交、查询任务，把结果交给正常的章节组装流程，以及断点续传时继续等待已提交的任务
+"""
+
+import sys
+import os
+import json
+import base64
+import argparse
+import tempfile
+from unittest.mock import MagicMock
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.batch_client import BatchClient, BatchJobError, PrefetchedResponses, split_batches, job_results
+from src.api.response_cache import ResponseCache
+from src.utils.progress_manager import ProgressManager
+from src.main import prefetch_with_batch_api, process_rich_mode_with_batching
+from mock_gemini_server import MockGeminiServer
+from testing_utils import make_pages, make_client
+
+
+def page_number(request):
+    """从请求中的图像数据取出页码"""
+    for part in request['contents'][0]['parts']:
+        if 'inline_data' in part:
+            return int(base64.b64decode(part['inline_data']['data']).split()[-1])
+
+
+def rich_response(request):
+    """模拟模型：每页一个章节标题和一个段落，第3页为目录页"""
+    page_num = page_number(request)
+    blocks = [{'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': f'第{page_num}章'},
+              {'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': f'第{page_num}页正文'}]
+    return json.dumps({'is_toc': page_num == 3, 'blocks': blocks}, ensure_ascii=False)
+
+
+def make_clients(server, cache=None):
+    prefetched = PrefetchedResponses(cache)
+    gemini_client = make_client(server, cache=prefetched)
+    batch_client = BatchClient('test_key', server.base_url, poll_interval=0.05)
+    return gemini_client, batch_client, prefetched
+
+
+def make_args(**kwargs):
+    options = dict(mode='rich', input='book.pdf', title='测试', concurrency=1, batch_size=100,
+                   separate_toc_check=False, pages_per_request=1, batch_submit_only=False)
+    options.update(kwargs)
+    return argparse.Namespace(**options)
+
+
+def test_batch_client_against_mock_server():
+    """测试提交、等待和按请求键读取结果，单个请求失败不影响其他请求"""
+    print("测试批处理客户端...")
+
+    def respond(request):
+        if request['contents'][0]['parts'][0]['text'] == '失败':
+            raise RuntimeError("模拟请求失败")
+        return request['contents'][0]['parts'][0]['text'] + '的响应'
+
+    server = MockGeminiServer(response_text=respond, batch_delay=0.2).start()
+    try:
+        client = BatchClient('test_key', server.base_url, poll_interval=0.05)
+        requests = [(f'key-{i}', {"contents": [{"parts": [{"text": text}]}]})
+                    for i, text in enumerate(['甲', '失败', '乙'])]
+        name = client.submit('gemini-2.5-flash', requests)
+        assert client.get(name)['metadata']['state'] == 'BATCH_STATE_PENDING'
+
+        job = client.wait(name)
+        results, errors = job_results(job)
+        assert results == {'key-0': '甲的响应', 'key-2': '乙的响应'}
+        assert errors == 1
+        # 批处理不占用交互式请求
+        assert server.requests == 0 and server.batch_requests == 3
+
+        # 已取消的任务抛出BatchJobError
+        name = client.submit('gemini-2.5-flash', requests)
+        client.cancel(name)
+        try:
+            client.wait(name)
+            assert False, "应该抛出BatchJobError"
+        except BatchJobError as e:
+            assert e.state == 'BATCH_STATE_CANCELLED'
+        client.print_summary()
+    finally:
+        server.stop()
+    print("批处理客户端测试通过")
+
+
+def test_split_batches():
+    """测试按请求体大小拆分任务"""
+    print("\n测试拆分批处理任务...")
+    requests = [(str(i), {"contents": [{"parts": [{"text": "字" * 100}]}]}) for i in range(10)]
+    size = len(json.dumps(requests[0][1], ensure_ascii=False).encode('utf-8'))
+    batches = split_batches(requests, max_bytes=size * 4)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert [key for batch in batches for key, _ in batch] == [str(i) for i in range(10)]
+    assert split_batches(requests) == [requests]
+    print("拆分批处理任务测试通过")
+
+
+def test_batch_results_feed_chapter_assembly():
+    """测试批处理结果直接用于章节组装，没有结果的页面改为交互式请求"""
+    print("\n测试批处理结果用于章节组装...")
+    server = MockGeminiServer(response_text=rich_response, batch_delay=0.1).start()
+    try:
+        gemini_client, batch_client, prefetched = make_clients(server)
+        pages = make_pages(5)
+        args = make_args()
+        progress_manager = MagicMock()
+        progress_manager.batch_jobs = []
+        page_types = prefetch_with_batch_api(pages, 1, 5, [], gemini_client, batch_client, prefetched,
+                                             args, None, progress_manager)
+        assert page_types == {page_num: 'uncertain' for page_num in range(1, 6)}
+        assert len(progress_manager.batch_jobs) == 1 and len(progress_manager.batch_jobs[0]['keys']) == 5
+
+        # 第5页的批处理结果丢失
+        del prefetched.responses[progress_manager.batch_jobs[0]['keys'][4]]
+        chapters = process_rich_mode_with_batching(pages, [], gemini_client, MagicMock(), progress_manager,
+                                                   args, 1, 5, None, page_types)
+    finally:
+        server.stop()
+
+    assert [chapter['title'] for chapter in chapters] == ['第1章', '第2章', '第4章', '第5章']
+    assert server.batch_requests == 5
+    assert server.requests == 1
+    assert prefetched.used == 4
+    print("批处理结果用于章节组装测试通过")
+
+
+def test_resume_waits_for_submitted_job():
+    """测试只提交后退出，--resume 时继续等待已保存的任务而不重新提交"""
+    print("\n测试断点续传批处理任务...")
+    server = MockGeminiServer(response_text=rich_response, batch_delay=0.3).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, 'book.epub')
+            cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+            pages = make_pages(4)
+
+            gemini_client, batch_client, prefetched = make_clients(server, cache)
+            progress_manager = ProgressManager('book.pdf', output)
+            assert prefetch_with_batch_api(pages, 1, 4, [], gemini_client, batch_client, prefetched,
+                                           make_args(batch_submit_only=True), None, progress_manager) is None
+
+            # 新进程：从进度文件恢复任务ID
+            gemini_client, batch_client, prefetched = make_clients(server, cache)
+            progress_manager = ProgressManager('book.pdf', output)
+            progress_data = progress_manager.load_progress()
+            assert progress_data['processed_pages'] == 0
+            progress_manager.batch_jobs = progress_data['batch_jobs']
+            page_types = prefetch_with_batch_api(pages, 1, 4, [], gemini_client, batch_client, prefetched,
+                                                 make_args(), None, progress_manager)
+            assert page_types is not None
+            assert batch_client.jobs_submitted == 0
+            assert len(server.batches) == 1 and len(prefetched.responses) == 4
+
+            # 结果同时写入持久缓存，之后不需要再提交
+            _, batch_client, prefetched = make_clients(server, cache)
+            progress_manager.batch_jobs = []
+            prefetch_with_batch_api(pages, 1, 4, [], gemini_client, batch_client, prefetched,
+                                    make_args(), None, progress_manager)
+            assert batch_client.jobs_submitted == 0
+            cache.close()
+    finally:
+        server.stop()
+    print("断点续传批处理任务测试通过")
+
+
+if __name__ == '__main__':
+    test_batch_client_against_mock_server()
+    test_split_batches()
+    test_batch_results_feed_chapter_assembly()
+    test_resume_waits_for_submitted_job()
+    print("\n所有Batch API测试通过！")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+测试模型级联：flash的结果没有通过检查时改用pro，图像只编码一次，网络或限流错误不改用pro
+"""
+
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.model_cascade import ModelCascade, PRIMARY_MODEL, FALLBACK_MODEL
+from src.api.response_cache import ResponseCache
+from src.api.retry_policy import RetryPolicy, RetryError
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer, canned_response
+import testing_utils
+
+
+BLOCKS = [{'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': '第一章'},
+          {'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': '正文' * 40}]
+RESPONSE = json.dumps({'is_toc': False, 'blocks': BLOCKS}, ensure_ascii=False)
+
+
+def make_client(server, cache=None, line_counter=None):
+    return testing_utils.make_client(server, model_type='cascade', cache=cache, line_counter=line_counter,
+                                     retry_policy=RetryPolicy(base_delay=0.001))
+
+
+def make_page(page_num=1):
+    return PageImage(page_num, b'\x89PNG\r\n\x1a\n' + os.urandom(100), 'image/png')
+
+
+def test_check():
+    """测试各种需要改用pro的情况"""
+    print("测试结果检查...")
+    cascade = ModelCascade(line_counter=lambda image: image)
+    assert cascade.check('完整的文本') is None
+    assert cascade.check('完整的文本', 'MAX_TOKENS') == 'finish_reason'
+    assert cascade.check('完整的文本', 'RECITATION') == 'finish_reason'
+    assert cascade.check((False, [])) == 'empty'
+    # 页面上没有文字行时空结果是正确的
+    assert cascade.check((False, []), image=0) is None
+    # 目录页面不检查长度
+    assert cascade.check((True, []), image=20) is None
+    # 20行文字只识别出10个字符
+    assert cascade.check((False, [{'content': '一二三四五六七八九十'}]), image=20) == 'sparse'
+    assert cascade.check((False, BLOCKS), image=20) is None
+    # 行数较少时不检查长度
+    assert cascade.check('短', image=3) is None
+
+    # 统计行数失败时跳过长度检查
+    def broken(image):
+        raise ValueError('无法解码')
+    assert ModelCascade(line_counter=broken).check('短', image=b'') is None
+    print("结果检查测试通过")
+
+
+def test_escalates_to_pro():
+    """测试flash生成被截断时改用pro，请求体在两个模型之间复用，未正常结束的响应不写入缓存"""
+    print("\n测试改用pro...")
+    server = MockGeminiServer(model_responses={PRIMARY_MODEL: ('被截断的', 'MAX_TOKENS'),
+                                               FALLBACK_MODEL: '完整的页面文本'}).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+            client = make_client(server, cache)
+            page = make_page()
+            with patch.object(client.image_encoder, 'encode', wraps=client.image_encoder.encode) as mock_encode:
+                assert client.extract_text(page) == '完整的页面文本'
+            assert mock_encode.call_count == 1
+            assert server.models == {PRIMARY_MODEL: 1, FALLBACK_MODEL: 1}
+            assert client.cascade.pages == {FALLBACK_MODEL: 1}
+            assert client.cascade.escalations == {'finish_reason': 1}
+
+            # 再次识别时pro的结果来自缓存
+            assert client.extract_text(page) == '完整的页面文本'
+            assert server.models == {PRIMARY_MODEL: 2, FALLBACK_MODEL: 1}
+            cache.close()
+    finally:
+        server.stop()
+    print("改用pro测试通过")
+
+
+def test_malformed_and_sparse_results():
+    """测试flash的响应无法解析或识别的文字过少时改用pro"""
+    print("\n测试格式错误和过短的结果...")
+    sparse = json.dumps({'is_toc': False, 'blocks': [{'type': 'paragraph', 'content': '只有一行'}]},
+                        ensure_ascii=False)
+    flash_responses = iter(['不是JSON', sparse])
+    server = MockGeminiServer(model_responses={PRIMARY_MODEL: lambda request: next(flash_responses),
+                                               FALLBACK_MODEL: RESPONSE}).start()
+    try:
+        client = make_client(server, line_counter=lambda image: 30)
+        assert client.extract_rich_structure_with_toc(make_page(1), max_retries=2) == (False, BLOCKS)
+        assert client.extract_rich_structure_with_toc(make_page(2), max_retries=2) == (False, BLOCKS)
+        assert server.models == {PRIMARY_MODEL: 2, FALLBACK_MODEL: 2}
+        assert client.cascade.escalations == {'malformed': 1, 'sparse': 1}
+        assert client.cascade.requests == {PRIMARY_MODEL: 2, FALLBACK_MODEL: 2}
+    finally:
+        server.stop()
+    print("格式错误和过短的结果测试通过")
+
+
+def test_good_and_throttled_pages_stay_on_flash():
+    """测试通过检查的页面只请求flash，限流导致的失败不改用pro"""
+    print("\n测试不需要改用pro的情况...")
+    server = MockGeminiServer(response_text=RESPONSE).start()
+    try:
+        client = make_client(server, line_counter=lambda image: 10)
+        assert client.extract_rich_structure_with_toc(make_page()) == (False, BLOCKS)
+        assert server.models == {PRIMARY_MODEL: 1}
+        assert client.cascade.pages == {PRIMARY_MODEL: 1}
+
+        server.max_in_flight = 0
+        try:
+            client.extract_text(make_page(2), max_retries=2)
+            assert False, "应该抛出RetryError"
+        except RetryError as e:
+            assert e.reason == 'throttled'
+        assert server.models == {PRIMARY_MODEL: 3}
+        assert not client.cascade.escalations
+    finally:
+        server.stop()
+    print("不需要改用pro的情况测试通过")
+
+
+def test_toc_check_not_counted_as_page():
+    """测试单独的目录检测只计入请求数，不计入识别的页数"""
+    print("\n测试目录检测不计入页数...")
+    server = MockGeminiServer(response_text=canned_response).start()
+    try:
+        client = make_client(server)
+        for page_num in (1, 2):
+            page = make_page(page_num)
+            assert client.is_table_of_contents_page(page) is False
+            assert client.extract_rich_structure(page)
+    finally:
+        server.stop()
+
+    assert server.models == {PRIMARY_MODEL: 4}
+    assert client.cascade.requests == {PRIMARY_MODEL: 4}
+    assert client.cascade.pages == {PRIMARY_MODEL: 2}
+    client.cascade.print_summary()
+    print("目录检测不计入页数测试通过")
+
+
+if __name__ == '__main__':
+    test_check()
+    test_escalates_to_pro()
+    test_malformed_and_sparse_results()
+    test_good_and_throttled_pages_stay_on_flash()
+    test_toc_check_not_counted_as_page()
+    print("\n所有模型级联测试通过！")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+测试目录检测与内容提取合并为一次请求
+"""
+
+import sys
+import os
+import json
+import argparse
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.processors.pdf_processor import PageImage
+from src.main import extract_rich_page, extract_simple_page
+from testing_utils import make_client
+
+
+def test_rich_structure_with_toc():
+    """测试富文本模式的合并请求"""
+    print("测试富文本合并请求...")
+    client = make_client()
+    page = PageImage(1, b'\x89PNG page', 'image/png')
+    blocks = [{'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': '第一章'}]
+
+    responses = [
+        '```json\n' + json.dumps({'is_toc': False, 'blocks': blocks}) + '\n```',
+        json.dumps({'is_toc': True, 'blocks': blocks}),
+        json.dumps(blocks),
+    ]
+    with patch.object(client.client, 'generate_content', side_effect=responses) as mock_generate:
+        assert client.extract_rich_structure_with_toc(page) == (False, blocks)
+        assert client.extract_rich_structure_with_toc(page) == (True, [])
+        # 模型直接返回内容块数组时视为非目录页面
+        assert client.extract_rich_structure_with_toc(page) == (False, blocks)
+
+    assert mock_generate.call_count == 3
+    print("富文本合并请求测试通过")
+
+
+def test_text_with_toc():
+    """测试纯文本模式的合并请求"""
+    print("\n测试纯文本合并请求...")
+    client = make_client()
+    page = PageImage(1, b'\x89PNG page', 'image/png')
+
+    responses = [
+        json.dumps({'is_toc': False, 'text': '## 第一章\n\n正文'}),
+        json.dumps({'is_toc': True, 'text': '目录 1'}),
+    ]
+    with patch.object(client.client, 'generate_content', side_effect=responses):
+        assert client.extract_text_with_toc(page) == (False, '## 第一章\n\n正文')
+        assert client.extract_text_with_toc(page) == (True, '')
+    print("纯文本合并请求测试通过")
+
+
+def test_single_request_per_page():
+    """测试默认每页只发送一次请求，--separate-toc-check 恢复两次请求"""
+    print("\n测试每页请求次数...")
+    client = make_client()
+    page = PageImage(1, b'\x89PNG page', 'image/png')
+    calls = []
+
+    def mock_generate_content(model, contents, generation_config=None):
+        calls.append(contents[0]['parts'][0]['text'])
+        prompt = contents[0]['parts'][0]['text']
+        if '"is_toc"' in prompt:
+            return json.dumps({'is_toc': False, 'text': '正文'})
+        if '目录页面' in prompt:
+            return 'NO'
+        return '正文'
+
+    with patch.object(client.client, 'generate_content', side_effect=mock_generate_content):
+        combined = extract_simple_page(page, client, argparse.Namespace(separate_toc_check=False))
+        assert combined == (False, '正文', 'ocr')
+        assert len(calls) == 1
+
+        calls.clear()
+        separate = extract_simple_page(page, client, argparse.Namespace(separate_toc_check=True))
+        assert separate == (False, '正文', 'ocr')
+        assert len(calls) == 2
+
+        calls.clear()
+        with patch.object(client, 'extract_rich_structure_with_toc', return_value=(True, [])):
+            assert extract_rich_page(page, client, argparse.Namespace(separate_toc_check=False)) == (True, [], 'ocr')
+        assert not calls
+    print("每页请求次数测试通过")
+
+
+if __name__ == '__main__':
+    test_rich_structure_with_toc()
+    test_text_with_toc()
+    test_single_request_per_page()
+    print("\n所有合并请求测试通过！")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试并发识别页面时按页码顺序组装结果
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+import threading
+from unittest.mock import MagicMock
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.main import iter_page_results, process_rich_mode_with_batching, process_simple_mode_with_batching
+from testing_utils import make_pages
+
+
+def make_args(concurrency, batch_size=4):
+    return argparse.Namespace(concurrency=concurrency, batch_size=batch_size, separate_toc_check=False,
+                              pages_per_request=1, title='测试')
+
+
+def page_blocks(page_num):
+    """每三页开始一个新章节"""
+    blocks = [{'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': f'第{page_num}页正文'}]
+    if page_num % 3 == 1:
+        blocks.insert(0, {'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': f'章节{page_num}'})
+    return blocks
+
+
+def make_gemini_client(seed):
+    """模拟Gemini客户端：页面完成顺序随机，第4页为目录页"""
+    rng = random.Random(seed)
+    delays = {page_num: rng.uniform(0.01, 0.08) for page_num in range(1, 100)}
+    client = MagicMock()
+
+    def extract_rich(image):
+        time.sleep(delays[image.page_num])
+        return image.page_num == 4, page_blocks(image.page_num)
+
+    def extract_text(image):
+        time.sleep(delays[image.page_num])
+        return image.page_num == 4, f"## 标题{image.page_num}\n\n第{image.page_num}页正文"
+
+    client.extract_rich_structure_with_toc.side_effect = extract_rich
+    client.extract_text_with_toc.side_effect = extract_text
+    return client
+
+
+def test_iter_page_results_keeps_order():
+    """测试结果按页码顺序产出，同时处理的页面数不超过并发数"""
+    print("测试按页码顺序产出结果...")
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0}
+
+    def worker(image, page_num):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+        # 越靠后的页面完成得越快
+        time.sleep(0.02 * (12 - page_num))
+        with lock:
+            state['running'] -= 1
+        return page_num * 10
+
+    start_time = time.time()
+    results = [(page_num, future.result()[0])
+               for page_num, _, future in iter_page_results(range(12), 1, 12, worker, concurrency=4)]
+    elapsed = time.time() - start_time
+
+    print(f"并发4处理12页耗时 {elapsed:.2f} 秒，最大同时处理 {state['max_running']} 页")
+    assert results == [(page_num, page_num * 10) for page_num in range(1, 13)]
+    assert state['max_running'] == 4
+    # 串行需要约1.3秒
+    assert elapsed < 1.0
+    print("按页码顺序产出结果测试通过")
+
+
+def test_rich_mode_same_result_as_serial():
+    """测试富文本模式并发处理得到的章节与串行处理完全一致"""
+    print("\n测试富文本模式并发处理...")
+    results = {}
+    for concurrency in (1, 4):
+        progress_manager = MagicMock()
+        chapters = process_rich_mode_with_batching(
+            make_pages(10), [], make_gemini_client(seed=concurrency), MagicMock(),
+            progress_manager, make_args(concurrency), 1, 10
+        )
+        saved_pages = [call.kwargs['processed_pages'] for call in progress_manager.save_progress.call_args_list]
+        results[concurrency] = (chapters, saved_pages)
+
+    chapters, saved_pages = results[4]
+    assert results[1] == results[4]
+    assert [chapter['title'] for chapter in chapters] == ['章节1', '章节7', '章节10']
+    # 第4页是目录页，第一章只包含第1-3页和第5-6页
+    assert len(chapters[0]['blocks']) == 5
+    # 每处理4页保存一次进度（目录页不计入），最后保存全部页数
+    assert saved_pages == [5, 9, 10]
+    print("富文本模式并发处理测试通过")
+
+
+def test_simple_mode_same_result_as_serial():
+    """测试纯文本模式并发处理得到的章节与串行处理完全一致"""
+    print("\n测试纯文本模式并发处理...")
+    results = []
+    for concurrency in (1, 3):
+        results.append(process_simple_mode_with_batching(
+            make_pages(8), [], make_gemini_client(seed=concurrency), MagicMock(),
+            MagicMock(), make_args(concurrency), 1, 8
+        ))
+
+    assert results[0] == results[1]
+    assert [chapter['title'] for chapter in results[1]] == ['标题1', '标题2', '标题3', '标题5', '标题6', '标题7', '标题8']
+    print("纯文本模式并发处理测试通过")
+
+
+def test_error_saves_contiguous_progress():
+    """测试某页失败时只保存该页之前连续完成的进度"""
+    print("\n测试出错时的进度保存...")
+    client = make_gemini_client(seed=0)
+    extract = client.extract_rich_structure_with_toc.side_effect
+
+    def failing_extract(image):
+        if image.page_num == 6:
+            raise Exception("模拟识别失败")
+        return extract(image)
+
+    client.extract_rich_structure_with_toc.side_effect = failing_extract
+    progress_manager = MagicMock()
+    try:
+        process_rich_mode_with_batching(make_pages(10), [], client, MagicMock(),
+                                        progress_manager, make_args(4, batch_size=100), 1, 10)
+        assert False, "应该退出"
+    except SystemExit as e:
+        assert e.code == 1
+
+    saved = progress_manager.save_progress.call_args.kwargs
+    assert saved['processed_pages'] == 5
+    # 第6页之后完成的页面不会进入已保存的章节
+    contents = [block['content'] for chapter in saved['processed_chapters'] for block in chapter['blocks']]
+    assert contents[-1] == '第5页正文'
+    print("出错时的进度保存测试通过")
+
+
+if __name__ == '__main__':
+    test_iter_page_results_keeps_order()
+    test_rich_mode_same_result_as_serial()
+    test_simple_mode_same_result_as_serial()
+    test_error_saves_contiguous_progress()
+    print("\n所有并发处理测试通过！")
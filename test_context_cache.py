@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+测试上下文缓存：提示词每个任务只上传一次，到期前续期，缓存丢失后重新创建，无法缓存时随请求发送
+"""
+
+import sys
+import os
+import json
+import base64
+import tempfile
+import threading
+import itertools
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.gemini_client import RICH_STRUCTURE_WITH_TOC_PROMPT, request_prompts
+from src.api.context_cache import ContextCache
+from src.api.response_cache import ResponseCache
+from mock_gemini_server import MockGeminiServer, text_tokens
+import testing_utils
+from testing_utils import make_pages
+
+
+PROMPT_TOKENS = text_tokens(RICH_STRUCTURE_WITH_TOC_PROMPT)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingModel:
+    """模拟模型：记录服务器合并缓存内容后看到的请求，每页返回一个段落"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        for part in request['contents'][0]['parts']:
+            if 'inline_data' in part:
+                page_num = int(base64.b64decode(part['inline_data']['data']).split()[-1])
+        blocks = [{'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': f'第{page_num}页正文'}]
+        return json.dumps({'is_toc': False, 'blocks': blocks}, ensure_ascii=False)
+
+    def prompt(self, index):
+        """第index个请求中提示词所在的位置：'system'、'inline' 或 None"""
+        request = self.requests[index]
+        system_instruction = request.get('systemInstruction', {'parts': [{}]})
+        if system_instruction['parts'][0].get('text') == RICH_STRUCTURE_WITH_TOC_PROMPT:
+            return 'system'
+        if request['contents'][0]['parts'][0].get('text') == RICH_STRUCTURE_WITH_TOC_PROMPT:
+            return 'inline'
+        return None
+
+
+def make_client(server, ttl=3600, cache=None, min_tokens=True):
+    client = testing_utils.make_client(server, cache=cache, context_cache_ttl=ttl)
+    if min_tokens:
+        # 模拟服务器默认没有最小缓存大小，测试中的提示词也不必达到真实模型的下限
+        client.context_cache.min_tokens = {}
+    return client
+
+
+def test_prompt_uploaded_once():
+    """测试多页请求共用一个缓存，页面请求不再携带提示词"""
+    print("测试提示词只上传一次...")
+    model = RecordingModel()
+    server = MockGeminiServer(response_text=model).start()
+    try:
+        client = make_client(server)
+        results = [client.extract_rich_structure_with_toc(page) for page in make_pages(3)]
+        inline_bytes = server.bytes_received
+        client.context_cache.close()
+        assert server.cached_contents == {}
+    finally:
+        server.stop()
+
+    assert [blocks[0]['content'] for _, blocks in results] == ['第1页正文', '第2页正文', '第3页正文']
+    assert server.cache_creations == 1
+    assert [model.prompt(i) for i in range(3)] == ['system'] * 3
+    # 每个页面请求只包含图像，不再上传提示词
+    assert inline_bytes < 3 * len(RICH_STRUCTURE_WITH_TOC_PROMPT.encode('utf-8'))
+    stats = client.context_cache
+    assert (stats.created, stats.uses, stats.saved_tokens) == (1, 3, 3 * PROMPT_TOKENS)
+    stats.print_summary()
+    print("提示词只上传一次测试通过")
+
+
+def test_refresh_before_expiry():
+    """测试接近过期时续期而不是重新创建"""
+    print("\n测试缓存续期...")
+    server = MockGeminiServer(response_text=RecordingModel()).start()
+    try:
+        client = make_client(server, ttl=600)
+        clock = client.context_cache.clock = FakeClock()
+        pages = make_pages(3)
+        client.extract_rich_structure_with_toc(pages[0])
+        clock.now += 300
+        client.extract_rich_structure_with_toc(pages[1])
+        assert client.context_cache.refreshed == 0
+        # 距离过期不足refresh_margin
+        clock.now += 250
+        client.extract_rich_structure_with_toc(pages[2])
+    finally:
+        server.stop()
+
+    assert (client.context_cache.created, client.context_cache.refreshed) == (1, 1)
+    assert server.cache_creations == 1
+    print("缓存续期测试通过")
+
+
+def test_recreate_after_cache_lost():
+    """测试服务器上的缓存被删除后本次随请求发送提示词，之后重新创建"""
+    print("\n测试缓存丢失后重新创建...")
+    model = RecordingModel()
+    server = MockGeminiServer(response_text=model).start()
+    try:
+        client = make_client(server)
+        pages = make_pages(3)
+        client.extract_rich_structure_with_toc(pages[0])
+        server.cached_contents.clear()
+        client.extract_rich_structure_with_toc(pages[1])
+        client.extract_rich_structure_with_toc(pages[2])
+    finally:
+        server.stop()
+
+    assert [model.prompt(i) for i in range(3)] == ['system', 'inline', 'system']
+    assert server.cache_creations == 2
+    # 缓存丢失不算作失败重试，引用丢失缓存的请求不计入节省的token
+    assert client.retry_policy.total_retries == 0
+    assert (client.context_cache.uses, client.context_cache.saved_tokens) == (2, 2 * PROMPT_TOKENS)
+    print("缓存丢失后重新创建测试通过")
+
+
+def test_small_prompt_sent_inline():
+    """测试提示词达不到最小缓存大小时改为随请求发送，之后不再尝试创建"""
+    print("\n测试无法缓存的提示词...")
+    model = RecordingModel()
+    server = MockGeminiServer(response_text=model, min_cache_tokens=100000).start()
+    try:
+        client = make_client(server)
+        for page in make_pages(2):
+            client.extract_rich_structure_with_toc(page)
+    finally:
+        server.stop()
+
+    assert [model.prompt(i) for i in range(2)] == ['inline', 'inline']
+    assert server.cache_creations == 0
+    assert client.context_cache.uses == 0
+
+    # countTokens得到的token数达不到模型文档中的最小缓存大小时，不向服务器发送创建请求
+    model = RecordingModel()
+    server = MockGeminiServer(response_text=model).start()
+    try:
+        client = make_client(server, min_tokens=False)
+        client.context_cache.min_tokens = {client.model_name: PROMPT_TOKENS + 1}
+        for page in make_pages(2):
+            client.extract_rich_structure_with_toc(page)
+    finally:
+        server.stop()
+
+    assert [model.prompt(i) for i in range(2)] == ['inline', 'inline']
+    assert server.cache_creations == 0 and server.requests == 2 and server.token_counts == 1
+    print("无法缓存的提示词测试通过")
+
+
+def test_shipped_prompts_below_minimum():
+    """测试随代码提供的提示词都达不到gemini-2.5-flash的最小缓存大小，check() 预先把它们排除"""
+    print("\n测试实际提示词的大小...")
+    prompts = {prompt for mode in ('rich', 'simple') for separate_toc_check in (False, True)
+               for pages_per_request in (1, 2) for prompt in request_prompts(mode, separate_toc_check, pages_per_request)}
+    server = MockGeminiServer(response_text=RecordingModel()).start()
+    try:
+        client = make_client(server, min_tokens=False)
+        assert client.context_cache.check(sorted(prompts)) == []
+        assert server.token_counts == len(prompts)
+        # 已经确定无法缓存的提示词不再计算token数，也不尝试创建缓存
+        client.extract_rich_structure_with_toc(make_pages(1)[0])
+    finally:
+        server.stop()
+
+    assert server.token_counts == len(prompts) and server.cache_creations == 0
+    # 没有最小缓存大小的模型不计算token数，由服务器判断
+    assert client.context_cache.check(sorted(prompts), model='custom-model') == sorted(prompts)
+    print("实际提示词的大小测试通过")
+
+
+def test_create_outside_lock():
+    """测试创建缓存的请求进行期间，其他线程不等待：同一提示词随请求发送，已缓存的提示词直接引用"""
+    print("\n测试创建缓存时不阻塞其他线程...")
+
+    class SlowClient:
+        def __init__(self):
+            self.started = threading.Event()
+            self.release = threading.Event()
+            self.ids = itertools.count(1)
+
+        def create_cached_content(self, model, system_instruction=None, **kwargs):
+            if system_instruction == 'slow':
+                self.started.set()
+                assert self.release.wait(5)
+            return {'name': f'cachedContents/{next(self.ids)}'}
+
+    client = SlowClient()
+    context_cache = ContextCache(client, 'custom-model')
+    assert context_cache.handle('fast') == 'cachedContents/1'
+    handles = []
+    thread = threading.Thread(target=lambda: handles.append(context_cache.handle('slow')))
+    thread.start()
+    try:
+        assert client.started.wait(5)
+        assert context_cache.handle('slow') is None
+        assert context_cache.handle('fast') == 'cachedContents/1'
+    finally:
+        client.release.set()
+        thread.join()
+
+    assert handles == ['cachedContents/2'] and context_cache.created == 2
+    assert context_cache.handle('slow') == 'cachedContents/2'
+    print("创建缓存时不阻塞其他线程测试通过")
+
+
+def test_failed_requests_not_counted():
+    """测试引用缓存的请求失败时不计入节省的token，重试成功后才计入"""
+    print("\n测试失败的请求不计入节省...")
+    server = MockGeminiServer(response_text=RecordingModel(), fault_rates={'500': 0.5}, seed=3).start()
+    try:
+        client = make_client(server)
+        client.retry_policy.base_delay = 0.001
+        for page in make_pages(4):
+            client.extract_rich_structure_with_toc(page, max_retries=10)
+    finally:
+        server.stop()
+
+    assert client.retry_policy.retries['server_error'] > 0
+    assert client.context_cache.uses == 4
+    assert client.context_cache.saved_tokens == 4 * PROMPT_TOKENS
+    print("失败的请求不计入节省测试通过")
+
+
+def test_response_cache_hits_across_jobs():
+    """测试每个任务的缓存名称不同，响应缓存仍然按提示词内容命中"""
+    print("\n测试跨任务命中响应缓存...")
+    server = MockGeminiServer(response_text=RecordingModel()).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+            pages = make_pages(2)
+            first = make_client(server, cache=cache)
+            results = [first.extract_rich_structure_with_toc(page) for page in pages]
+            first.context_cache.close()
+
+            second = make_client(server, cache=cache)
+            assert [second.extract_rich_structure_with_toc(page) for page in pages] == results
+            cache.close()
+    finally:
+        server.stop()
+
+    assert server.cache_creations == 2
+    assert server.requests == 2
+    print("跨任务命中响应缓存测试通过")
+
+
+if __name__ == '__main__':
+    test_prompt_uploaded_once()
+    test_refresh_before_expiry()
+    test_recreate_after_cache_lost()
+    test_small_prompt_sent_inline()
+    test_shipped_prompts_below_minimum()
+    test_create_outside_lock()
+    test_failed_requests_not_counted()
+    test_response_cache_hits_across_jobs()
+    print("\n所有上下文缓存测试通过！")
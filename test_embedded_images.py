@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+测试扫描图直通：单图页面直接导出原始JPEG，其余页面回退到渲染
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, NameObject
+
+from src.processors.pdf_processor import PDFProcessor
+
+
+def build_test_pdf(pdf_path):
+    """
+    生成测试PDF：
+    1. 单张RGB JPEG扫描图
+    2. 扫描图 + 可见文字（混合内容）
+    3. 扫描图 + 不可见OCR文本层
+    4. 扫描图 + 矢量线条
+    5. CMYK JPEG
+    6. 单张灰度JPEG扫描图
+    """
+    source_path = pdf_path + '.src.pdf'
+    pages = [
+        Image.new('RGB', (600, 800), (250, 240, 230)),
+        Image.new('RGB', (600, 800), 'white'),
+        Image.new('RGB', (600, 800), 'white'),
+        Image.new('RGB', (600, 800), 'white'),
+        Image.new('CMYK', (600, 800), (0, 0, 0, 10)),
+        Image.new('L', (600, 800), 200),
+    ]
+    pages[0].save(source_path, save_all=True, append_images=pages[1:], resolution=72)
+
+    reader = PdfReader(source_path)
+    writer = PdfWriter()
+    extra_ops = {
+        1: b" BT /F1 12 Tf 10 10 Td (Visible) Tj ET",
+        2: b" BT 3 Tr /F1 12 Tf 10 10 Td (Hidden OCR) Tj ET",
+        3: b" 0 0 m 600 800 l S",
+    }
+    for index, page in enumerate(reader.pages):
+        if index in extra_ops:
+            data = page.get_contents().get_data() + extra_ops[index]
+            stream = DecodedStreamObject()
+            stream.set_data(data)
+            page[NameObject('/Contents')] = writer._add_object(stream)
+        writer.add_page(page)
+
+    with open(pdf_path, 'wb') as f:
+        writer.write(f)
+    os.remove(source_path)
+
+
+def test_extract_embedded_image():
+    """测试单图页面识别"""
+    print("测试嵌入图像检测...")
+    temp_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(temp_dir, 'scan.pdf')
+    build_test_pdf(pdf_path)
+
+    try:
+        processor = PDFProcessor()
+        results = {page: processor.extract_embedded_image(pdf_path, page) for page in range(1, 7)}
+        for page, data in results.items():
+            print(f"第 {page} 页: {'直接导出' if data else '回退渲染'}")
+
+        assert results[1] is not None and results[1][:2] == b'\xff\xd8'
+        assert results[2] is None, "可见文字页面应回退渲染"
+        assert results[3] is not None, "不可见OCR文本层不影响直通"
+        assert results[4] is None, "矢量内容页面应回退渲染"
+        assert results[5] is None, "CMYK JPEG应回退渲染"
+        assert results[6] is not None
+
+        # 原始字节未经重新编码
+        reader = PdfReader(pdf_path)
+        image = next(iter(reader.pages[0]['/Resources']['/XObject'].values())).get_object()
+        assert results[1] == image.get_data()
+        print("嵌入图像检测测试通过")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def test_pdf_to_images_with_embedded():
+    """测试pdf_to_images混合直通与渲染"""
+    print("\n测试直通与渲染混合...")
+    temp_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(temp_dir, 'scan.pdf')
+    build_test_pdf(pdf_path)
+    rendered = []
+
+    def fake_run(cmd, **kwargs):
+        first = int(cmd[cmd.index('-f') + 1])
+        last = int(cmd[cmd.index('-l') + 1])
+        rendered.append((first, last))
+        for page in range(first, last + 1):
+            with open(f"{cmd[-1]}-{page}.png", 'wb') as f:
+                f.write(b'fake png')
+
+    try:
+        processor = PDFProcessor()
+        with patch.object(processor, 'get_pdf_info', return_value={'Pages': '6'}), \
+             patch('src.processors.pdf_processor.subprocess.run', side_effect=fake_run):
+            images = processor.pdf_to_images(pdf_path, dpi=300, extract_embedded=True)
+
+        names = [os.path.basename(path) for path in images]
+        print(f"输出文件: {names}")
+        print(f"pdftoppm调用: {rendered}")
+        assert names == ['page-001.jpg', 'page-002.png', 'page-003.jpg',
+                         'page-004.png', 'page-005.png', 'page-006.jpg']
+        assert rendered == [(2, 2), (4, 5)]
+        shutil.rmtree(os.path.dirname(images[0]))
+        print("直通与渲染混合测试通过")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    test_extract_embedded_image()
+    test_pdf_to_images_with_embedded()
+    print("\n所有扫描图直通测试通过！")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试端点池：加权轮询、最少未完成请求、连续失败的端点暂停后恢复，以及在多个模拟服务器之间分配页面请求
+"""
+
+import sys
+import os
+import json
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.endpoint_pool import Endpoint, EndpointPool, load_endpoints
+from src.api.gemini_client import GeminiClient
+from src.api.retry_policy import RetryPolicy
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_weighted_round_robin():
+    """测试加权轮询按权重分配，并且权重大的端点不会连续占满"""
+    print("测试加权轮询...")
+    a, b = Endpoint('key-a', 'http://a', weight=3), Endpoint('key-b', 'http://b')
+    pool = EndpointPool([a, b], strategy='round-robin')
+    order = []
+    for _ in range(8):
+        endpoint = pool.acquire()
+        pool.release(endpoint, 200, 0.1)
+        order.append(endpoint)
+    assert Counter(order) == {a: 6, b: 2}
+    assert order[:4] == [a, a, b, a]
+    print("加权轮询测试通过")
+
+
+def test_least_outstanding():
+    """测试新请求分配给未完成请求数（按权重折算）最少的端点"""
+    print("\n测试最少未完成请求...")
+    a, b = Endpoint('key-a', 'http://a', weight=2), Endpoint('key-b', 'http://b')
+    pool = EndpointPool([a, b])
+    held = [pool.acquire() for _ in range(6)]
+    assert (a.in_flight, b.in_flight) == (4, 2)
+
+    # b 上的请求完成后，下一个请求分给 b
+    for endpoint in held:
+        if endpoint is b:
+            pool.release(endpoint, 200, 0.1)
+    assert pool.acquire() is b
+    print("最少未完成请求测试通过")
+
+
+def test_ejection_and_recovery():
+    """测试连续失败的端点被暂停，到期后恢复；普通4xx错误不计入，只有一个端点时不暂停"""
+    print("\n测试端点暂停...")
+    clock = FakeClock()
+    a, b = Endpoint('key-a', 'http://a'), Endpoint('key-b', 'http://b')
+    pool = EndpointPool([a, b], strategy='round-robin', eject_after=3, eject_seconds=30, clock=clock)
+
+    for status in (500, 400, 429, None):
+        pool.release(pool.acquire(a), status)
+    assert a.consecutive_failures == 2
+    pool.release(pool.acquire(a), 503)
+    assert a.ejections == 1
+    assert all(pool.acquire() is b for _ in range(5))
+
+    # 暂停到期后再次分配；第一个请求仍失败时立即再次暂停
+    clock.now = 31
+    assert a in [pool.acquire() for _ in range(2)]
+    pool.release(a, 500)
+    assert a.ejections == 2 and a.ejected_until == 61
+    clock.now = 62
+    pool.release(pool.acquire(a), 200, 0.5)
+    assert a.consecutive_failures == 0 and a.latency == 0.5
+
+    single = Endpoint('key', 'http://only')
+    pool = EndpointPool([single], eject_after=1)
+    pool.release(pool.acquire(), 500)
+    assert single.ejections == 0 and pool.acquire() is single
+    print("端点暂停测试通过")
+
+
+def test_load_endpoints():
+    """测试从JSON文件读取端点，密钥可以来自环境变量或默认密钥"""
+    print("\n测试读取端点文件...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'endpoints.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump([{'base_url': 'https://proxy-a.example.com/', 'api_key_env': 'KEY_A', 'weight': 2},
+                       {'api_key': 'key-b'},
+                       {'base_url': 'https://proxy-c.example.com'}], f)
+        with patch.dict(os.environ, {'KEY_A': 'key-a'}):
+            endpoints = load_endpoints(path, default_api_key='default-key')
+        assert [(e.api_key, e.base_url, e.weight) for e in endpoints] == [
+            ('key-a', 'https://proxy-a.example.com', 2.0),
+            ('key-b', 'https://generativelanguage.googleapis.com', 1.0),
+            ('default-key', 'https://proxy-c.example.com', 1.0),
+        ]
+        try:
+            load_endpoints(path)
+            assert False, "应该抛出ValueError"
+        except ValueError:
+            pass
+    print("读取端点文件测试通过")
+
+
+def test_requests_spread_across_servers():
+    """测试页面请求分配到多个服务器，持续限流的服务器被暂停后其余请求都发往正常的服务器"""
+    print("\n测试多个服务器...")
+    healthy = [MockGeminiServer(delay=0.02).start() for _ in range(2)]
+    overloaded = MockGeminiServer(max_in_flight=0).start()
+    try:
+        pool = EndpointPool([Endpoint(f'key-{index}', server.base_url)
+                             for index, server in enumerate(healthy + [overloaded])], strategy='round-robin')
+        client = GeminiClient(endpoints=pool, retry_policy=RetryPolicy(base_delay=0.001))
+        for page_num in range(1, 13):
+            assert client.extract_text(PageImage(page_num, b'\x89PNG page %d' % page_num, 'image/png')) == '模拟响应'
+    finally:
+        for server in healthy + [overloaded]:
+            server.stop()
+
+    assert overloaded.requests == 3 and pool.endpoints[2].ejections == 1
+    assert healthy[0].requests == healthy[1].requests == 6
+    assert client.client.latency.requests == 15
+    print("多个服务器测试通过")
+
+
+if __name__ == '__main__':
+    test_weighted_round_robin()
+    test_least_outstanding()
+    test_ejection_and_recovery()
+    test_load_endpoints()
+    test_requests_spread_across_servers()
+    print("\n所有端点池测试通过！")
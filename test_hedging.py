@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+测试对冲请求：超过最近延迟的百分位数仍未返回的请求再发送一份，采用先返回的结果，额外请求数受预算限制
+"""
+
+import sys
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.hedging import HedgePolicy
+from src.api.endpoint_pool import Endpoint, EndpointPool
+from src.api.rate_limiter import RateLimiter
+from src.api.token_usage import TokenUsage
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer
+import testing_utils
+
+
+class StragglerResponder:
+    """标记为慢的服务器上，每页的第一个请求要等待很久，重复的请求正常返回"""
+
+    def __init__(self, stall_seconds=1.5):
+        self.stall_seconds = stall_seconds
+        self.slow = False
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        key = request['contents'][0]['parts'][-1]['inline_data']['data']
+        with self.lock:
+            first = key not in self.seen
+            self.seen.add(key)
+        if self.slow and first:
+            time.sleep(self.stall_seconds)
+        return '模拟响应'
+
+
+def make_client(hedge, base_url=None, endpoints=None, **kwargs):
+    return testing_utils.make_client(base_url=base_url, endpoints=endpoints, hedge=hedge, **kwargs)
+
+
+def warm_up(client, count):
+    """发送若干正常的请求，积累延迟样本"""
+    for page_num in range(1, count + 1):
+        assert client.extract_text(PageImage(page_num, b'\x89PNG warm %d' % page_num, 'image/png')) == '模拟响应'
+
+
+def test_policy():
+    """测试样本不足时不对冲，对冲延迟取最近延迟的百分位数，预算按请求数的比例计算"""
+    print("测试对冲策略...")
+    policy = HedgePolicy(percentile=90, budget=0.1, min_samples=5)
+    for latency in (1, 2, 3, 4):
+        policy.record(latency)
+    assert policy.delay() is None
+    for latency in range(5, 11):
+        policy.record(latency)
+    assert policy.delay() == 10
+    assert not policy.try_hedge()
+
+    for _ in range(8):
+        policy.delay()
+    assert policy.requests == 10
+    assert policy.try_hedge()
+    assert not policy.try_hedge()
+    print("对冲策略测试通过")
+
+
+def test_straggler_is_hedged():
+    """测试迟迟不返回的请求被对冲，结果来自对冲请求，落后的原请求立即中断"""
+    print("\n测试对冲慢请求...")
+    responder = StragglerResponder()
+    server = MockGeminiServer(delay=0.02, response_text=responder).start()
+    try:
+        hedge = HedgePolicy(percentile=90, budget=1.0, min_samples=5)
+        client = make_client(hedge, server.base_url)
+        warm_up(client, 5)
+
+        responder.slow = True
+        start = time.time()
+        assert client.extract_text(PageImage(6, b'\x89PNG straggler', 'image/png')) == '模拟响应'
+        assert time.time() - start < 1.0
+        assert (hedge.hedges, hedge.hedge_wins) == (1, 1)
+        assert client.client.last_timings is not None
+
+        # 被放弃的原请求不必等到服务器返回，中断后释放端点，也不算作端点失败
+        time.sleep(0.2)
+        assert server.requests == 7
+        endpoint = client.client.endpoints.primary
+        assert endpoint.in_flight == 0 and endpoint.failures == 0
+    finally:
+        server.stop()
+    print("对冲慢请求测试通过")
+
+
+def test_budget_limits_hedges():
+    """测试预算用完后不再对冲，慢请求照常等待"""
+    print("\n测试对冲预算...")
+    responder = StragglerResponder(stall_seconds=0.5)
+    server = MockGeminiServer(delay=0.02, response_text=responder).start()
+    try:
+        hedge = HedgePolicy(percentile=90, budget=0.0, min_samples=5)
+        client = make_client(hedge, server.base_url)
+        warm_up(client, 5)
+
+        responder.slow = True
+        start = time.time()
+        assert client.extract_text(PageImage(6, b'\x89PNG straggler', 'image/png')) == '模拟响应'
+        assert time.time() - start >= 0.5
+        assert hedge.hedges == 0 and server.requests == 6
+    finally:
+        server.stop()
+    print("对冲预算测试通过")
+
+
+def test_hedge_with_rate_limiter():
+    """测试与main.py一样使用并发上限为1的限流器时，对冲请求不等待原请求占用的名额"""
+    print("\n测试对冲请求与限流器...")
+    responder = StragglerResponder()
+    server = MockGeminiServer(delay=0.02, response_text=responder).start()
+    try:
+        hedge = HedgePolicy(percentile=90, budget=1.0, min_samples=5)
+        limiter = RateLimiter(max_concurrency=1)
+        usage = TokenUsage()
+        client = make_client(hedge, server.base_url, rate_limiter=limiter, usage=usage)
+        warm_up(client, 5)
+
+        responder.slow = True
+        start = time.time()
+        assert client.extract_text(PageImage(6, b'\x89PNG straggler', 'image/png')) == '模拟响应'
+        assert time.time() - start < 1.0
+        assert (hedge.hedges, hedge.hedge_wins) == (1, 1)
+
+        # 被中断的原请求归还限流名额，之后的请求不必等待
+        time.sleep(0.2)
+        assert limiter.in_flight == 0
+        responder.slow = False
+        start = time.time()
+        assert client.extract_text(PageImage(7, b'\x89PNG next', 'image/png')) == '模拟响应'
+        assert time.time() - start < 0.5
+        # 原请求在中断前没有返回，只记录实际返回的请求
+        assert usage.total['requests'] == 7 and 'discarded' not in usage.by_call_type
+    finally:
+        server.stop()
+
+    # 落后的请求在中断前已经完成时，同样计入用量
+    late = Future()
+    late.set_result(({'usageMetadata': {'promptTokenCount': 10, 'candidatesTokenCount': 5}}, None))
+    client.client._record_discarded('gemini-2.5-flash', late)
+    assert usage.by_call_type['discarded']['total'] == 15
+    print("对冲请求与限流器测试通过")
+
+
+def test_hedge_goes_to_another_endpoint():
+    """测试对冲请求发往原请求以外的端点"""
+    print("\n测试对冲到其他端点...")
+    responder = StragglerResponder()
+    slow = MockGeminiServer(delay=0.02, response_text=responder).start()
+    fast = MockGeminiServer(delay=0.02).start()
+    try:
+        pool = EndpointPool([Endpoint('key-a', slow.base_url), Endpoint('key-b', fast.base_url)],
+                            strategy='round-robin')
+        hedge = HedgePolicy(percentile=90, budget=1.0, min_samples=6)
+        client = make_client(hedge, endpoints=pool)
+        warm_up(client, 6)
+        assert (slow.requests, fast.requests) == (3, 3)
+
+        # 下一个请求轮到慢的端点，对冲请求避开它
+        responder.slow = True
+        start = time.time()
+        assert client.extract_text(PageImage(7, b'\x89PNG straggler', 'image/png')) == '模拟响应'
+        assert time.time() - start < 1.0
+        assert (slow.requests, fast.requests) == (4, 4)
+        assert hedge.hedge_wins == 1
+    finally:
+        slow.stop()
+        fast.stop()
+    print("对冲到其他端点测试通过")
+
+
+if __name__ == '__main__':
+    test_policy()
+    test_straggler_is_hedged()
+    test_budget_limits_hedges()
+    test_hedge_with_rate_limiter()
+    test_hedge_goes_to_another_endpoint()
+    print("\n所有对冲请求测试通过！")
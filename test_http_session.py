@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+测试MiniGenAI的连接池、超时和请求耗时分解
+"""
+
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.minigenai import MiniGenAI
+from mock_gemini_server import MockGeminiServer
+
+
+CONTENTS = [{"role": "user", "parts": [{"text": "提取文本"}, {"inline_data": {"mime_type": "image/png", "data": "x" * 50000}}]}]
+
+
+def test_connections_are_reused():
+    """测试连续请求复用同一个keep-alive连接"""
+    print("测试连接复用...")
+    server = MockGeminiServer(response_text="页面文本").start()
+    try:
+        client = MiniGenAI('test_key', server.base_url)
+        for _ in range(5):
+            assert client.generate_content('gemini-2.5-flash', CONTENTS) == "页面文本"
+
+        print(f"5次请求，服务器接受连接 {server.connections} 次")
+        assert server.requests == 5
+        assert server.connections == 1
+        assert client.latency.requests == 5 and client.latency.new_connections == 1
+    finally:
+        server.stop()
+    print("连接复用测试通过")
+
+
+def test_pool_shared_between_threads():
+    """测试多个线程共用连接池，连接数不超过并发数"""
+    print("\n测试多线程共用连接池...")
+    server = MockGeminiServer(delay=0.05).start()
+    try:
+        client = MiniGenAI('test_key', server.base_url, pool_size=4)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: client.generate_content('gemini-2.5-flash', CONTENTS), range(20)))
+
+        print(f"20次请求，服务器接受连接 {server.connections} 次")
+        assert results == ["模拟响应"] * 20
+        assert server.connections <= 4
+    finally:
+        server.stop()
+    print("多线程连接池测试通过")
+
+
+def test_latency_breakdown():
+    """测试耗时分解：模型推理时间计入首字节等待"""
+    print("\n测试耗时分解...")
+    server = MockGeminiServer(delay=0.3).start()
+    try:
+        client = MiniGenAI('test_key', server.base_url)
+        client.generate_content('gemini-2.5-flash', CONTENTS)
+        first = client.last_timings
+        client.generate_content('gemini-2.5-flash', CONTENTS)
+        second = client.last_timings
+
+        print(f"首次请求: {first}")
+        print(f"复用连接: {second}")
+        assert not first.reused and second.reused
+        assert first.connect > 0 and second.connect == 0
+        assert first.ttfb >= 0.3 and second.ttfb >= 0.3
+        assert first.upload < 0.3
+        assert abs(first.total - (first.connect + first.upload + first.ttfb + first.download)) < 1e-6
+    finally:
+        server.stop()
+    print("耗时分解测试通过")
+
+
+def test_read_timeout():
+    """测试服务器无响应时按读取超时失败，而不是一直挂起"""
+    print("\n测试读取超时...")
+    server = MockGeminiServer(delay=2).start()
+    try:
+        client = MiniGenAI('test_key', server.base_url, read_timeout=0.3)
+        try:
+            client.generate_content('gemini-2.5-flash', CONTENTS)
+            assert False, "应该抛出超时异常"
+        except requests.exceptions.ReadTimeout:
+            pass
+    finally:
+        server.stop()
+    print("读取超时测试通过")
+
+
+if __name__ == '__main__':
+    test_connections_are_reused()
+    test_pool_shared_between_threads()
+    test_latency_breakdown()
+    test_read_timeout()
+    print("\n所有连接池测试通过！")
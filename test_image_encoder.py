@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+测试上传前的图像缩放与重新编码
+"""
+
+import sys
+import os
+import io
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image, ImageDraw
+
+from src.api.image_encoder import ImageEncoder, detect_mime_type
+from src.processors.pdf_processor import PageImage
+
+
+def make_page_png(width=2480, height=3508):
+    """生成一张模拟300dpi扫描页的PNG"""
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for line in range(80):
+        draw.text((200, 200 + line * 40), "The quick brown fox jumps over the lazy dog " * 3, fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_detect_mime_type():
+    """测试根据文件头判断MIME类型"""
+    print("测试MIME类型识别...")
+    assert detect_mime_type(b'\x89PNG\r\n\x1a\n....') == 'image/png'
+    assert detect_mime_type(b'\xff\xd8\xff\xe0....') == 'image/jpeg'
+    assert detect_mime_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+    assert detect_mime_type(b'not an image') is None
+    print("MIME类型识别测试通过")
+
+
+def test_passthrough_uses_actual_type():
+    """测试默认直通模式下MIME类型取决于数据而非文件扩展名"""
+    print("\n测试直通模式...")
+    png = make_page_png(600, 800)
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+        f.write(png)
+        path = f.name
+    try:
+        data, mime_type = ImageEncoder().encode(path)
+        assert data == png
+        assert mime_type == 'image/png'
+    finally:
+        os.remove(path)
+    print("直通模式测试通过")
+
+
+def test_reencode_formats():
+    """测试各种格式的重新编码与缩放"""
+    print("\n测试重新编码...")
+    page = PageImage(7, make_page_png(), 'image/png')
+
+    settings = [
+        ('jpeg', dict(image_format='jpeg', max_side=2000, quality=70), 'image/jpeg'),
+        ('webp', dict(image_format='webp', max_side=2000, quality=70), 'image/webp'),
+        ('png 4bit', dict(image_format='png', max_side=2000, png_bits=4), 'image/png'),
+    ]
+    for name, options, expected_mime in settings:
+        encoder = ImageEncoder(**options)
+        data, mime_type = encoder.encode(page)
+        print(f"{name}: {len(page.data)} -> {len(data)} 字节, {mime_type}")
+        assert mime_type == expected_mime == detect_mime_type(data)
+        assert len(data) < len(page.data)
+
+        with Image.open(io.BytesIO(data)) as result:
+            assert max(result.size) == 2000
+            if name == 'png 4bit':
+                assert result.mode == 'P'
+            elif name == 'jpeg':
+                assert result.mode == 'L'
+
+        assert encoder.pages == 1 and encoder.encoded_bytes == len(data)
+    print("重新编码测试通过")
+
+
+def test_keep_original_when_larger():
+    """测试重新编码反而更大且无需缩放时保留原图"""
+    print("\n测试保留更小的原图...")
+    buffer = io.BytesIO()
+    Image.effect_noise((400, 400), 64).save(buffer, format='JPEG', quality=10)
+    original = buffer.getvalue()
+
+    data, mime_type = ImageEncoder(image_format='png').encode(PageImage(1, original, 'image/jpeg'))
+    assert data == original and mime_type == 'image/jpeg'
+    print("保留原图测试通过")
+
+
+def test_unsupported_formats_converted():
+    """测试API不接受的BMP、TIFF在直通模式下也转换为PNG"""
+    print("\n测试转换不支持的格式...")
+    picture = Image.new('RGB', (120, 80), (200, 30, 30))
+    for image_format, mime_type in (('BMP', 'image/bmp'), ('TIFF', 'image/tiff')):
+        buffer = io.BytesIO()
+        picture.save(buffer, format=image_format)
+        assert detect_mime_type(buffer.getvalue()) == mime_type
+
+        data, encoded_type = ImageEncoder().encode(PageImage(1, buffer.getvalue(), mime_type))
+        assert encoded_type == 'image/png' == detect_mime_type(data)
+        with Image.open(io.BytesIO(data)) as result:
+            assert result.size == (120, 80) and result.getpixel((0, 0)) == (200, 30, 30)
+    print("转换不支持的格式测试通过")
+
+
+if __name__ == '__main__':
+    test_detect_mime_type()
+    test_passthrough_uses_actual_type()
+    test_reencode_formats()
+    test_keep_original_when_larger()
+    test_unsupported_formats_converted()
+    print("\n所有图像编码测试通过！")
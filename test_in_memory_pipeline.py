@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试内存页面流水线：页面图像不经过临时文件直接送入请求编码
+"""
+
+import sys
+import os
+import base64
+import subprocess
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.processors.pdf_processor import PDFProcessor, PageImage
+from src.api.gemini_client import GeminiClient
+
+
+def fake_pdftoppm_stdout(cmd, **kwargs):
+    """模拟pdftoppm：未指定输出前缀时把PNG写到标准输出"""
+    assert cmd[-1].endswith('.pdf'), "内存模式不应指定输出文件前缀"
+    page_num = int(cmd[cmd.index('-f') + 1])
+    return subprocess.CompletedProcess(cmd, 0, stdout=b'\x89PNG page %d' % page_num, stderr=b'')
+
+
+def test_iter_page_images_in_memory():
+    """测试内存模式下不创建临时目录"""
+    print("测试内存模式流式渲染...")
+    processor = PDFProcessor()
+
+    with patch('src.processors.pdf_processor.subprocess.run', side_effect=fake_pdftoppm_stdout), \
+         patch('src.processors.pdf_processor.tempfile.mkdtemp') as mock_mkdtemp:
+        pages = list(processor.iter_page_images('/tmp/book.pdf', 3, 6, lookahead=2, in_memory=True))
+
+    mock_mkdtemp.assert_not_called()
+    print(f"产出页面: {pages}")
+    assert [page.page_num for page in pages] == [3, 4, 5, 6]
+    assert all(isinstance(page, PageImage) and page.mime_type == 'image/png' for page in pages)
+    assert pages[0].data == b'\x89PNG page 3'
+    print("内存模式流式渲染测试通过")
+
+
+def test_gemini_client_encodes_page_image():
+    """测试GeminiClient直接编码内存图像"""
+    print("\n测试内存图像编码...")
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        client = GeminiClient()
+
+    page = PageImage(1, b'\xff\xd8\xff jpeg bytes', 'image/jpeg')
+    assert client.encode_image(page) == base64.b64encode(page.data).decode('utf-8')
+    assert client.build_image_part(page)['inline_data']['mime_type'] == 'image/jpeg'
+
+    captured = {}
+
+    def mock_generate_content(model, contents, generation_config=None):
+        captured['inline_data'] = contents[0]['parts'][1]['inline_data']
+        return "识别的文本"
+
+    with patch.object(client.client, 'generate_content', side_effect=mock_generate_content):
+        assert client.extract_text(page) == "识别的文本"
+
+    assert captured['inline_data']['mime_type'] == 'image/jpeg'
+    assert base64.b64decode(captured['inline_data']['data']) == page.data
+    print("内存图像编码测试通过")
+
+
+if __name__ == '__main__':
+    test_iter_page_images_in_memory()
+    test_gemini_client_encodes_page_image()
+    print("\n所有内存流水线测试通过！")
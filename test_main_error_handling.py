@@ -12,6 +12,7 @@ from unittest.mock import patch, MagicMock
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.main import main
+from mock_gemini_server import MockGeminiServer
 
 
 def test_main_error_handling():
@@ -63,5 +64,78 @@ def test_main_error_handling():
             os.remove(test_pdf_path)
 
 
+
+def test_streaming_renderer_closed_on_error():
+    """测试页面出错退出时关闭流式渲染的生成器（临时目录得以删除），删除上下文缓存并注销配额协调"""
+    print("\n测试出错时关闭流式渲染...")
+    
+    state = {'rendered': 0, 'closed': False}
+    
+    def iter_page_images(*args, **kwargs):
+        try:
+            for page_num in range(1, 4):
+                state['rendered'] += 1
+                yield f"/tmp/page-{page_num:03d}.png"
+        finally:
+            state['closed'] = True
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        test_pdf_path = os.path.join(temp_dir, 'test.pdf')
+        with open(test_pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4 fake PDF content")
+        test_args = ['main.py', '--input', test_pdf_path, '--output', os.path.join(temp_dir, 'test.epub'),
+                     '--lookahead', '2', '--no-cache', '--quota-file', os.path.join(temp_dir, 'quota.sqlite3')]
+        
+        with patch.object(sys, 'argv', test_args), \
+             patch('src.main.PDFProcessor') as mock_pdf_processor, \
+             patch('src.main.GeminiClient') as mock_gemini_client, \
+             patch('src.main.QuotaCoordinator') as mock_quota_coordinator:
+            mock_pdf_processor.return_value.resolve_page_range.return_value = (1, 3, 3)
+            mock_pdf_processor.return_value.iter_page_images.side_effect = iter_page_images
+            mock_gemini_client.return_value.extract_rich_structure_with_toc.side_effect = Exception("模拟Gemini调用失败")
+            
+            try:
+                main()
+                assert False, "页面出错时应该退出"
+            except SystemExit as e:
+                assert e.code == 1
+            # 出错退出时同样删除上下文缓存
+            mock_gemini_client.return_value.context_cache.close.assert_called_once()
+            mock_quota_coordinator.return_value.close.assert_called_once()
+    
+    assert state['rendered'] == 1 and state['closed']
+    print("出错时关闭流式渲染测试通过")
+
+
+def test_context_cache_fails_fast():
+    """测试提示词都达不到最小缓存大小时 --context-cache 在处理页面之前报错退出"""
+    print("\n测试上下文缓存无法生效时立即退出...")
+    server = MockGeminiServer().start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            test_pdf_path = os.path.join(temp_dir, 'test.pdf')
+            with open(test_pdf_path, "wb") as f:
+                f.write(b"%PDF-1.4 fake PDF content")
+            test_args = ['main.py', '--input', test_pdf_path, '--output', os.path.join(temp_dir, 'test.epub'),
+                         '--no-cache', '--context-cache', '--base-url', server.base_url]
+            
+            with patch.object(sys, 'argv', test_args), \
+                 patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}), \
+                 patch('src.main.PDFProcessor') as mock_pdf_processor:
+                try:
+                    main()
+                    assert False, "上下文缓存无法生效时应该退出"
+                except SystemExit as e:
+                    assert e.code == 1
+    finally:
+        server.stop()
+    
+    assert mock_pdf_processor.return_value.method_calls == []
+    assert server.token_counts == 1 and server.cache_creations == 0 and server.requests == 0
+    print("上下文缓存无法生效时立即退出测试通过")
+
+
 if __name__ == '__main__':
-    test_main_error_handling()
\ No newline at end of file
+    test_main_error_handling()
+    test_streaming_renderer_closed_on_error()
+    test_context_cache_fails_fast()
\ No newline at end of file
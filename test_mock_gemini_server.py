@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+测试模拟服务器：模拟识别结果与各模式的解析格式一致，延迟和故障可复现，客户端能够从注入的故障中恢复
+"""
+
+import sys
+import os
+import random
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.minigenai import MiniGenAI
+from src.api.gemini_client import TEXT_PROMPT, TOC_PROMPT
+from src.api.retry_policy import RetryPolicy
+from mock_gemini_server import MockGeminiServer, canned_response, parse_latency
+import testing_utils
+from testing_utils import make_pages
+
+
+def make_client(server, **kwargs):
+    return testing_utils.make_client(server, retry_policy=RetryPolicy(base_delay=0.001, malformed_retries=10), **kwargs)
+
+
+def test_latency_distributions():
+    """测试延迟分布的解析"""
+    print("测试延迟分布...")
+    rng = random.Random(1)
+    assert parse_latency('0.5')(rng) == 0.5
+    assert parse_latency('fixed:2')(rng) == 2
+    assert all(1 <= parse_latency('uniform:1,3')(rng) <= 3 for _ in range(100))
+    samples = sorted(parse_latency('lognormal:8,0.5')(rng) for _ in range(1001))
+    assert 7 < samples[500] < 9
+    assert sum(parse_latency('tail:8,0.1,90')(rng) == 90 for _ in range(1000)) in range(70, 130)
+    for spec in ('normal:1,2', 'uniform:1', 'fixed:a'):
+        try:
+            parse_latency(spec)
+            assert False, f"应该拒绝 {spec}"
+        except ValueError:
+            pass
+    print("延迟分布测试通过")
+
+
+def test_canned_responses_parse():
+    """测试模拟识别结果可以被各模式的解析函数正确解析，同一页总是得到同样的结果"""
+    print("\n测试模拟识别结果...")
+    server = MockGeminiServer(response_text=canned_response).start()
+    try:
+        client = make_client(server)
+        page, other = make_pages(2)
+        is_toc, blocks = client.extract_rich_structure_with_toc(page)
+        assert not is_toc and blocks and all(block['content'] for block in blocks)
+        assert client.extract_rich_structure_with_toc(page) == (is_toc, blocks)
+        assert client.extract_rich_structure_with_toc(other) != (is_toc, blocks)
+
+        is_toc, text = client.extract_text_with_toc(page)
+        assert not is_toc and '\n\n' in text
+        assert '模拟识别' in client.extract_text(page) and '{' not in client.extract_text(page)
+        assert client.parse_toc_response(client.client.generate_content(
+            client.model_name, client.build_contents(TOC_PROMPT, page))) is False
+        assert all(result[1] for result in client.extract_rich_structure_multi(make_pages(4)))
+        assert all(result[1] for result in client.extract_text_multi(make_pages(3)))
+    finally:
+        server.stop()
+    print("模拟识别结果测试通过")
+
+
+def test_faults_are_reproducible():
+    """测试同样的种子和请求得到同样的延迟和故障，各类故障大致按比例出现"""
+    print("\n测试故障注入...")
+    rates = {'429': 0.1, '500': 0.1, 'timeout': 0.05, 'malformed': 0.1, 'truncated': 0.1}
+    plans = []
+    for _ in range(2):
+        server = MockGeminiServer(latency='lognormal:1,0.5', fault_rates=rates, seed=7)
+        plans.append([server.plan(b'page %d' % (index % 50)) for index in range(1000)])
+        server.server_close()
+    assert plans[0] == plans[1]
+    # 同一请求体的重试使用不同的随机序列
+    assert plans[0][:50] != plans[0][50:100]
+    faults = [fault for _, fault in plans[0]]
+    for fault, rate in rates.items():
+        assert abs(faults.count(fault) / 1000 - rate) < 0.04, fault
+
+    try:
+        MockGeminiServer(fault_rates={'503': 0.1})
+        assert False, "应该拒绝未知的故障类型"
+    except ValueError:
+        pass
+    print("故障注入测试通过")
+
+
+def test_client_recovers_from_faults():
+    """测试客户端通过重试从429、500、超时、格式错误和被截断的响应中恢复"""
+    print("\n测试从故障中恢复...")
+    rates = {'429': 0.1, '500': 0.1, 'timeout': 0.05, 'malformed': 0.1, 'truncated': 0.1}
+    server = MockGeminiServer(response_text=canned_response, fault_rates=rates, hang_seconds=1, seed=3).start()
+    try:
+        client = make_client(server, read_timeout=0.3)
+        for page in make_pages(20):
+            is_toc, blocks = client.extract_rich_structure_with_toc(page, max_retries=10)
+            assert not is_toc and blocks
+
+        # 被截断和格式错误的响应都按格式错误重试；超时按超时重试
+        retries = client.retry_policy.retries
+        assert retries['malformed'] and retries['timeout'] and retries['throttled'] and retries['server_error']
+        assert server.requests == 20 + client.retry_policy.total_retries
+        assert sum(server.faults.values()) == client.retry_policy.total_retries
+    finally:
+        server.stop()
+
+    # 直接请求时可以拿到被截断响应的finishReason
+    server = MockGeminiServer(response_text=canned_response, fault_rates={'truncated': 1.0}).start()
+    try:
+        client = MiniGenAI('test_key', server.base_url)
+        text = client.generate_content('gemini-2.5-flash', [{'parts': [{'text': TEXT_PROMPT}]}])
+        assert client.last_finish_reason == 'MAX_TOKENS' and text
+    finally:
+        server.stop()
+    print("从故障中恢复测试通过")
+
+
+if __name__ == '__main__':
+    test_latency_distributions()
+    test_canned_responses_parse()
+    test_faults_are_reproducible()
+    test_client_recovers_from_faults()
+    print("\n所有模拟服务器测试通过！")
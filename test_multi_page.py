@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+测试一次请求识别多张页面：按编号解析各页结果，缺少或格式错误的页面逐页重新识别
+"""
+
+import sys
+import os
+import json
+import argparse
+from unittest.mock import patch, MagicMock
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.gemini_client import GeminiClient, MULTI_PAGE_RICH_PROMPT
+from src.main import iter_page_results, process_rich_mode_with_batching, process_simple_mode_with_batching
+# main.py 以src为根导入，isinstance判断需要使用同一个类
+from processors.text_layer import TextLayerPage
+from testing_utils import make_pages, make_client
+
+
+def page_blocks(page_num):
+    return [{'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': f'第{page_num}页正文'}]
+
+
+def test_parse_multi_page_response():
+    """测试按编号解析各页结果，跳过缺少、重复、越界和格式错误的条目"""
+    print("测试解析多页响应...")
+    response = json.dumps({"pages": [
+        {"page": 2, "is_toc": False, "blocks": page_blocks(2)},
+        {"page": "1", "is_toc": True, "blocks": []},
+        {"page": 2, "is_toc": False, "blocks": page_blocks(99)},
+        {"page": 3, "is_toc": False, "blocks": "第3页正文"},
+        {"page": 4, "is_toc": False},
+        {"page": 9, "is_toc": False, "blocks": []},
+        "第6页",
+    ]})
+    pages = GeminiClient.parse_multi_page_response(response, 6, GeminiClient.parse_rich_with_toc_response, 'blocks')
+    assert pages == {0: (True, []), 1: (False, page_blocks(2))}
+
+    # 截断的JSON按响应格式错误处理
+    try:
+        GeminiClient.parse_multi_page_response('{"pages": [{"page": 1', 2,
+                                               GeminiClient.parse_rich_with_toc_response, 'blocks')
+        assert False, "应该抛出ValueError"
+    except ValueError:
+        pass
+    print("解析多页响应测试通过")
+
+
+def test_missing_pages_are_requested_singly():
+    """测试多页请求只发送一次，缺少和格式错误的页面逐页重新识别"""
+    print("\n测试缺页逐页重新识别...")
+    client = make_client()
+    pages = make_pages(4)
+    multi_response = json.dumps({"pages": [
+        {"page": 1, "is_toc": False, "blocks": page_blocks(1)},
+        {"page": 3, "is_toc": False, "blocks": {"content": "格式错误"}},
+        {"page": 4, "is_toc": True, "blocks": []},
+    ]})
+    responses = [multi_response,
+                 json.dumps({"is_toc": False, "blocks": page_blocks(2)}),
+                 json.dumps({"is_toc": False, "blocks": page_blocks(3)})]
+    with patch.object(client.client, 'generate_content', side_effect=responses) as mock_generate:
+        results = client.extract_rich_structure_multi(pages)
+
+    assert results == [(False, page_blocks(1)), (False, page_blocks(2)), (False, page_blocks(3)), (True, [])]
+    assert mock_generate.call_count == 3
+    _, contents, generation_config = mock_generate.call_args_list[0].args
+    parts = contents[0]['parts']
+    assert parts[0]['text'] == MULTI_PAGE_RICH_PROMPT
+    assert [part['text'] for part in parts[1::2]] == ["图像 1:", "图像 2:", "图像 3:", "图像 4:"]
+    assert all('inline_data' in part for part in parts[2::2])
+    assert 'pages' in generation_config['response_schema']['properties']
+    # 逐页请求只包含一张图像
+    assert len(mock_generate.call_args_list[1].args[1][0]['parts']) == 2
+    assert (client.multi_page_requests, client.multi_page_pages, client.multi_page_fallbacks) == (1, 4, 2)
+    print("缺页逐页重新识别测试通过")
+
+
+def test_unparseable_response_falls_back():
+    """测试整个多页响应无法解析时所有页面逐页识别"""
+    print("\n测试多页响应无法解析...")
+    client = make_client()
+    responses = ['{"pages": [{"page": 1, "is_toc": false, "text": "第1',
+                 json.dumps({"is_toc": False, "text": "第1页"}),
+                 json.dumps({"is_toc": True, "text": ""})]
+    with patch.object(client.client, 'generate_content', side_effect=responses) as mock_generate:
+        assert client.extract_text_multi(make_pages(2)) == [(False, "第1页"), (True, '')]
+    assert mock_generate.call_count == 3
+    assert client.multi_page_fallbacks == 2
+    assert client.retry_policy.failures == {'malformed': 1}
+
+    # 只有一页时直接使用单页请求
+    with patch.object(client.client, 'generate_content',
+                      return_value=json.dumps({"is_toc": False, "text": "单页"})) as mock_generate:
+        assert client.extract_text_multi(make_pages(1)) == [(False, "单页")]
+    assert len(mock_generate.call_args.args[1][0]['parts']) == 2
+    print("多页响应无法解析测试通过")
+
+
+def make_multi_client(calls):
+    """模拟Gemini客户端：记录每次多页请求的页码，第5页为目录页"""
+    client = MagicMock()
+
+    def extract_rich(images):
+        calls.append([image.page_num for image in images])
+        return [(image.page_num == 5, page_blocks(image.page_num)) for image in images]
+
+    def extract_text(images):
+        calls.append([image.page_num for image in images])
+        return [(image.page_num == 5, f"## 标题{image.page_num}\n\n第{image.page_num}页正文") for image in images]
+
+    client.extract_rich_structure_multi.side_effect = extract_rich
+    client.extract_text_multi.side_effect = extract_text
+    return client
+
+
+def make_args(concurrency, pages_per_request):
+    return argparse.Namespace(concurrency=concurrency, batch_size=4, separate_toc_check=False,
+                              pages_per_request=pages_per_request, title='测试')
+
+
+def test_grouped_pages_keep_order():
+    """测试按组处理时结果仍按页码顺序组装，文本层页面不进入多页请求"""
+    print("\n测试按组处理页面...")
+    pages = make_pages(8)
+    pages[2] = TextLayerPage(3, "文本层第3页\n\n" + "正文内容 " * 40)
+    calls = []
+    progress_manager = MagicMock()
+    chapters = process_rich_mode_with_batching(pages, [], make_multi_client(calls), MagicMock(),
+                                               progress_manager, make_args(2, 3), 1, 8)
+
+    assert sorted(calls) == [[1, 2], [4, 5, 6], [7, 8]]
+    contents = [block['content'] for block in chapters[0]['blocks']]
+    assert contents[:2] == ['第1页正文', '第2页正文']
+    assert contents[2] == '文本层第3页'
+    assert contents[-4:] == ['第4页正文', '第6页正文', '第7页正文', '第8页正文']
+    saved_pages = [call.kwargs['processed_pages'] for call in progress_manager.save_progress.call_args_list]
+    assert saved_pages == [4, 8]
+
+    calls = []
+    chapters = process_simple_mode_with_batching(make_pages(7), [], make_multi_client(calls), MagicMock(),
+                                                 MagicMock(), make_args(1, 4), 1, 7)
+    assert calls == [[1, 2, 3, 4], [5, 6, 7]]
+    assert [chapter['title'] for chapter in chapters] == ['标题1', '标题2', '标题3', '标题4', '标题6', '标题7']
+    print("按组处理页面测试通过")
+
+
+def test_group_error_applies_to_every_page():
+    """测试一组失败时该组每一页都报告错误"""
+    print("\n测试按组处理出错...")
+
+    def worker(images, page_nums):
+        if 4 in page_nums:
+            raise Exception("模拟识别失败")
+        return page_nums
+
+    outcomes = []
+    for page_num, _, future in iter_page_results(range(6), 1, 6, worker, concurrency=2, pages_per_request=3):
+        outcomes.append((page_num, future.exception() is None))
+    assert outcomes == [(1, True), (2, True), (3, True), (4, False), (5, False), (6, False)]
+    print("按组处理出错测试通过")
+
+
+if __name__ == '__main__':
+    test_parse_multi_page_response()
+    test_missing_pages_are_requested_singly()
+    test_unparseable_response_falls_back()
+    test_grouped_pages_keep_order()
+    test_group_error_applies_to_every_page()
+    print("\n所有多页请求测试通过！")
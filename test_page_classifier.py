@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试本地页面分类：空白页、纯图片页、目录页、正文页
+"""
+
+import sys
+import os
+import io
+import zipfile
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from src.processors.page_classifier import PageClassifier
+from src.processors.pdf_processor import PageImage
+from src.generator.epub_generator import EpubGenerator
+
+
+PAGE_SIZE = (1240, 1754)
+
+
+def to_page(image, page_num=1):
+    """将PIL图像转换为内存页面"""
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return PageImage(page_num, buffer.getvalue(), 'image/png')
+
+
+def blank_page():
+    """只有页码和少量噪点的空白页"""
+    image = Image.new('L', PAGE_SIZE, 240)
+    draw = ImageDraw.Draw(image)
+    for x, y in ((100, 300), (900, 1200), (640, 40)):
+        draw.point((x, y), fill=0)
+    draw.text((610, 1700), "12", fill=0, font=ImageFont.load_default(size=18))
+    return to_page(image)
+
+
+def text_page():
+    """正文页"""
+    image = Image.new('L', PAGE_SIZE, 245)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=20)
+    for line in range(45):
+        words = 55 if line % 8 != 7 else 20
+        draw.text((120, 120 + line * 32), ("lorem ipsum dolor " * 20)[:words], fill=0, font=font)
+    return to_page(image)
+
+
+def toc_page():
+    """带点线引导符、页码右对齐的目录页"""
+    image = Image.new('L', PAGE_SIZE, 245)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=20)
+    draw.text((560, 100), "Contents", fill=0, font=font)
+    for line in range(20):
+        title = f"Chapter {line + 1} " + "x" * (line % 4 * 4)
+        y = 200 + line * 60
+        draw.text((150, y), title, fill=0, font=font)
+        x = 150 + draw.textlength(title, font=font) + 20
+        while x < 1000:
+            draw.text((x, y), '.', fill=0, font=font)
+            x += 14
+        number = str(line * 11 + 1)
+        draw.text((1100 - draw.textlength(number, font=font), y), number, fill=0, font=font)
+    return to_page(image)
+
+
+def picture_page():
+    """整页照片加一行图注"""
+    image = Image.new('L', PAGE_SIZE, 245)
+    image.paste(Image.effect_noise((900, 1200), 60), (170, 150))
+    ImageDraw.Draw(image).text((170, 1400), "Figure 1", fill=0, font=ImageFont.load_default(size=20))
+    return to_page(image)
+
+
+def test_classify_pages():
+    """测试四种页面的本地分类"""
+    print("测试本地页面分类...")
+    classifier = PageClassifier()
+    expected = [
+        (blank_page(), 'blank'),
+        (text_page(), 'text'),
+        (toc_page(), 'toc'),
+        (picture_page(), 'picture'),
+    ]
+    for page, page_type in expected:
+        result = classifier.classify(page, 1)
+        print(f"{page_type}: {result}")
+        assert result == page_type
+
+    assert classifier.counts['uncertain'] == 0
+    assert sum(classifier.counts.values()) == 4
+    print("本地页面分类测试通过")
+
+
+def test_text_layer_hint():
+    """测试文本层提示：文本层像目录时直接判定为目录页，有文本的浅色页面不判为空白"""
+    print("\n测试文本层提示...")
+    texts = {1: "目录\n第一章 总论 1\n第二章 方法 15", 2: "这一页的文字颜色很浅"}
+    classifier = PageClassifier(text_provider=texts.get)
+
+    assert classifier.classify(text_page(), 1) == 'toc'
+    faint = to_page(Image.new('L', PAGE_SIZE, 250))
+    assert classifier.classify(faint, 2) == 'uncertain'
+    assert classifier.classify(faint, 3) == 'blank'
+    print("文本层提示测试通过")
+
+
+def test_unreadable_image_is_uncertain():
+    """测试无法解码的图像交由模型判断"""
+    print("\n测试无法解码的图像...")
+    page = PageImage(5, b'not an image', 'image/png')
+    assert PageClassifier().classify(page, 5) == 'uncertain'
+    print("无法解码图像测试通过")
+
+
+def test_epub_embeds_picture_pages():
+    """测试纯图片页以<img>形式写入EPUB"""
+    print("\n测试EPUB嵌入图片...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_path = os.path.join(temp_dir, 'page-007.png')
+        with open(image_path, 'wb') as f:
+            f.write(picture_page().data)
+
+        chapters = [{
+            'title': '插图',
+            'blocks': [{'type': 'image', 'level': 0, 'style': {'align': 'center'}, 'content': '', 'src': image_path}]
+        }]
+        output_path = os.path.join(temp_dir, 'book.epub')
+        EpubGenerator().create_epub_from_structure(chapters, output_path)
+
+        with zipfile.ZipFile(output_path) as epub_file:
+            names = epub_file.namelist()
+            chapter = epub_file.read('EPUB/chap_001.xhtml').decode('utf-8')
+        assert 'EPUB/images/page-007.png' in names
+        assert '<img src="images/page-007.png"' in chapter
+    print("EPUB嵌入图片测试通过")
+
+
+if __name__ == '__main__':
+    test_classify_pages()
+    test_text_layer_hint()
+    test_unreadable_image_is_uncertain()
+    test_epub_embeds_picture_pages()
+    print("\n所有页面分类测试通过！")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+测试多进程并行渲染
+"""
+
+import sys
+import os
+import shutil
+import threading
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.processors.pdf_processor import PDFProcessor
+
+
+def make_fake_pdftoppm(total_pages, calls):
+    """模拟pdftoppm：按PDF总页数的位数补零写出 <root>-NN.png"""
+    lock = threading.Lock()
+    digits = len(str(total_pages))
+
+    def fake_run(cmd, **kwargs):
+        first = int(cmd[cmd.index('-f') + 1])
+        last = int(cmd[cmd.index('-l') + 1])
+        output_root = cmd[-1]
+        with lock:
+            calls.append((first, last))
+        for page in range(first, last + 1):
+            with open(f"{output_root}-{page:0{digits}d}.png", "wb") as f:
+                f.write(b"fake png")
+
+    return fake_run
+
+
+def test_split_page_range():
+    """测试页码范围分片"""
+    print("测试页码范围分片...")
+    processor = PDFProcessor()
+
+    shards = processor.split_page_range(1, 10, 3)
+    print(f"1-10页分3片: {shards}")
+    assert shards == [(1, 4), (5, 7), (8, 10)]
+
+    # 分片数超过页数时每页一片
+    assert processor.split_page_range(5, 6, 8) == [(5, 5), (6, 6)]
+    assert processor.split_page_range(1, 1, 1) == [(1, 1)]
+    print("页码范围分片测试通过")
+
+
+def test_parallel_pdf_to_images():
+    """测试并行渲染的页序与文件命名"""
+    print("\n测试并行渲染...")
+    processor = PDFProcessor()
+
+    for total_pages in (42, 120, 1500):
+        calls = []
+        with patch.object(processor, 'get_pdf_info', return_value={'Pages': str(total_pages)}), \
+             patch('src.processors.pdf_processor.subprocess.run',
+                   side_effect=make_fake_pdftoppm(total_pages, calls)):
+            images = processor.pdf_to_images('/tmp/book.pdf', dpi=300, page_range=(3, 40), workers=4)
+
+        names = [os.path.basename(path) for path in images]
+        print(f"总页数 {total_pages}: 分片 {sorted(calls)}，首尾文件 {names[0]} / {names[-1]}")
+        assert len(calls) == 4
+        assert names == [f"page-{i:03d}.png" for i in range(3, 41)]
+        shutil.rmtree(os.path.dirname(images[0]))
+
+    print("并行渲染测试通过")
+
+
+if __name__ == '__main__':
+    test_split_page_range()
+    test_parallel_pdf_to_images()
+    print("\n所有并行渲染测试通过！")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+测试跨进程配额协调：多个本地进程共享并发上限和每分钟请求数
+"""
+
+import sys
+import os
+import time
+import asyncio
+import sqlite3
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.quota_coordinator import QuotaCoordinator
+from src.api.rate_limiter import RateLimiter
+from src.api.minigenai import MiniGenAI
+from mock_gemini_server import MockGeminiServer
+
+
+CONTENTS = [{"role": "user", "parts": [{"text": "提取文本"}]}]
+
+
+def converter_process(path, base_url, requests, global_concurrency, barrier, results):
+    """模拟一个转换进程：4个线程通过协调器向同一个服务器发送请求"""
+    coordinator = QuotaCoordinator(path, max_concurrency=global_concurrency)
+    client = MiniGenAI('test_key', base_url, rate_limiter=RateLimiter(max_concurrency=4, coordinator=coordinator))
+    barrier.wait(timeout=30)
+
+    def call(_):
+        text = client.generate_content('gemini-2.5-flash', CONTENTS)
+        return text, time.time()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(call, range(requests)))
+    results.put((os.getpid(), [text for text, _ in responses], max(finished for _, finished in responses)))
+    coordinator.close()
+
+
+def rate_process(path, requests_per_minute, count, barrier, results):
+    """只通过协调器获取名额，记录每次获得名额的时间"""
+    coordinator = QuotaCoordinator(path, requests_per_minute=requests_per_minute, burst_seconds=0.05)
+    barrier.wait(timeout=30)
+    granted = []
+    for _ in range(count):
+        lease = coordinator.acquire()
+        granted.append(time.time())
+        coordinator.release(lease, 200)
+    results.put(granted)
+    coordinator.close()
+
+
+def crashing_process(path):
+    """获得名额后直接退出，不归还名额"""
+    coordinator = QuotaCoordinator(path, max_concurrency=1)
+    coordinator.acquire()
+    os._exit(0)
+
+
+def holding_process(path, requests_per_minute, ready, done):
+    """使用协调文件直到被通知退出"""
+    coordinator = QuotaCoordinator(path, requests_per_minute=requests_per_minute)
+    ready.set()
+    done.wait(timeout=30)
+    coordinator.close()
+
+
+def run_processes(target, args_list):
+    """启动多个进程并收集每个进程放入结果队列的数据"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(len(args_list))
+    results = context.Queue()
+    processes = [context.Process(target=target, args=(*args, barrier, results), daemon=True) for args in args_list]
+    for process in processes:
+        process.start()
+    collected = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=10)
+        assert process.exitcode == 0
+    return collected
+
+
+def test_global_concurrency_across_processes():
+    """测试3个进程各4个线程时，服务器同时处理的请求数不超过全局上限，且各进程公平推进"""
+    print("测试跨进程并发上限...")
+    server = MockGeminiServer(delay=0.05).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'quota.sqlite3')
+            start_time = time.time()
+            collected = run_processes(converter_process, [(path, server.base_url, 16, 3)] * 3)
+            finish_times = [finished - start_time for _, _, finished in collected]
+
+        print(f"服务器最大同时处理 {server.peak_in_flight} 个请求，各进程完成时间 "
+              + "、".join(f"{elapsed:.2f}s" for elapsed in finish_times))
+        assert all(texts == ["模拟响应"] * 16 for _, texts, _ in collected)
+        assert server.requests == 48
+        assert server.peak_in_flight <= 3
+        # 先来先服务排队：没有哪个进程被饿死，各进程几乎同时完成
+        assert max(finish_times) - min(finish_times) < 0.5
+    finally:
+        server.stop()
+    print("跨进程并发上限测试通过")
+
+
+def test_global_rate_across_processes():
+    """测试3个进程合计的请求速率不超过全局每分钟请求数"""
+    print("\n测试跨进程请求速率...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'quota.sqlite3')
+        collected = run_processes(rate_process, [(path, 1200, 10)] * 3)
+
+    granted = sorted(timestamp for timestamps in collected for timestamp in timestamps)
+    elapsed = granted[-1] - granted[0]
+    print(f"30个名额耗时 {elapsed:.2f} 秒（每分钟1200次，即每秒20次）")
+    assert elapsed >= 29 / 20 * 0.9
+    # 任意1秒内获得的名额不超过速率加突发额度
+    assert max(sum(1 for t in granted if start <= t < start + 1) for start in granted) <= 21
+    print("跨进程请求速率测试通过")
+
+
+def test_reclaims_leases_of_exited_process():
+    """测试异常退出的进程持有的名额会被回收"""
+    print("\n测试回收已退出进程的名额...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'quota.sqlite3')
+        process = multiprocessing.get_context('spawn').Process(target=crashing_process, args=(path,), daemon=True)
+        process.start()
+        process.join(timeout=30)
+
+        coordinator = QuotaCoordinator(path, max_concurrency=1)
+        assert coordinator.snapshot()['in_flight'] == 1
+        start_time = time.time()
+        lease = coordinator.acquire()
+        assert time.time() - start_time < 2
+        assert coordinator.reclaimed == 1
+        coordinator.release(lease, 200)
+        coordinator.close()
+    print("回收已退出进程的名额测试通过")
+
+
+def test_throttle_pauses_every_process():
+    """测试任一进程收到带Retry-After的429后，所有使用同一文件的协调器都暂停"""
+    print("\n测试全局暂停...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'quota.sqlite3')
+        first = QuotaCoordinator(path)
+        second = QuotaCoordinator(path)
+        first.release(first.acquire(), 429, retry_after=0.3)
+        assert second.snapshot()['paused_for'] > 0.2
+
+        start_time = time.time()
+        second.release(second.acquire(), 200)
+        assert time.time() - start_time >= 0.25
+        first.close()
+        second.close()
+    print("全局暂停测试通过")
+
+
+def test_limits_stored_in_quota_file():
+    """测试全局上限保存在协调文件中，其他进程仍在使用时不能以不同的上限启动"""
+    print("\n测试保存全局上限...")
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'quota.sqlite3')
+        ready, done = context.Event(), context.Event()
+        process = context.Process(target=holding_process, args=(path, 60, ready, done), daemon=True)
+        process.start()
+        try:
+            assert ready.wait(timeout=30)
+            try:
+                QuotaCoordinator(path, requests_per_minute=600)
+                assert False, "上限不一致时应该报错"
+            except ValueError as e:
+                assert '60' in str(e) and '600' in str(e)
+            same = QuotaCoordinator(path, requests_per_minute=60)
+            same.close()
+        finally:
+            done.set()
+            process.join(timeout=10)
+
+        # 其他进程都退出后可以更改上限，之后按文件中的上限发放名额
+        coordinator = QuotaCoordinator(path, requests_per_minute=600, burst_seconds=0.05)
+        coordinator.requests_per_minute = None
+        start_time = time.time()
+        for _ in range(3):
+            coordinator.release(coordinator.acquire(), 200)
+        assert time.time() - start_time >= 0.15
+        coordinator.close()
+    print("保存全局上限测试通过")
+
+
+def test_async_acquire_does_not_block_event_loop():
+    """测试等待其他进程的写锁时，acquire_async 不阻塞事件循环"""
+    print("\n测试异步获取名额...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'quota.sqlite3')
+        coordinator = QuotaCoordinator(path)
+        # 另一个连接持有写锁0.3秒，模拟其他进程正在修改状态
+        blocker = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        blocker.execute('BEGIN IMMEDIATE')
+        timer = threading.Timer(0.3, lambda: blocker.execute('COMMIT'))
+
+        async def run():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.create_task(tick())
+            lease = await coordinator.acquire_async()
+            ticker.cancel()
+            return lease, ticks
+
+        timer.start()
+        lease, ticks = asyncio.run(run())
+        timer.join()
+        blocker.close()
+        assert ticks >= 10
+        coordinator.release(lease, 200)
+        coordinator.close()
+    print("异步获取名额测试通过")
+
+
+if __name__ == '__main__':
+    test_global_concurrency_across_processes()
+    test_global_rate_across_processes()
+    test_reclaims_leases_of_exited_process()
+    test_throttle_pauses_every_process()
+    test_limits_stored_in_quota_file()
+    test_async_acquire_does_not_block_event_loop()
+    print("\n所有跨进程配额测试通过！")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+测试客户端限流：令牌桶、AIMD并发调整和Retry-After
+"""
+
+import sys
+import os
+import time
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+
+import requests
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.rate_limiter import RateLimiter, parse_retry_after, estimate_request_tokens
+from src.api.minigenai import MiniGenAI
+from src.api.async_minigenai import AsyncMiniGenAI
+from src.api.errors import AsyncHTTPError
+from mock_gemini_server import MockGeminiServer
+
+
+CONTENTS = [{"role": "user", "parts": [{"text": "提取文本"}, {"inline_data": {"mime_type": "image/png", "data": "eA=="}}]}]
+
+
+def test_parse_retry_after():
+    """测试从响应头和Gemini错误详情中解析等待时间"""
+    print("测试Retry-After解析...")
+    assert parse_retry_after({'Retry-After': '7'}) == 7.0
+    assert parse_retry_after({'retry-after': '1.5'}) == 1.5
+    assert 25 <= parse_retry_after({'Retry-After': formatdate(time.time() + 30, usegmt=True)}) <= 30
+    body = json.dumps({"error": {"code": 429, "details": [
+        {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "37s"}
+    ]}}).encode('utf-8')
+    assert parse_retry_after({}, body) == 37.0
+    assert parse_retry_after({}, b'not json') is None
+    assert parse_retry_after({}) is None
+    print("Retry-After解析测试通过")
+
+
+def test_request_bucket():
+    """测试每分钟请求数上限：突发额度用完后按速率放行"""
+    print("\n测试请求数令牌桶...")
+    # 每秒2个请求，突发额度为10秒即20个
+    limiter = RateLimiter(max_concurrency=50, requests_per_minute=120)
+    start_time = time.time()
+    for _ in range(24):
+        limiter.release(limiter.acquire(), 200)
+    elapsed = time.time() - start_time
+
+    print(f"24个请求耗时 {elapsed:.2f} 秒")
+    assert 1.8 <= elapsed < 3
+    print("请求数令牌桶测试通过")
+
+
+def test_token_bucket_uses_actual_usage():
+    """测试token配额按估算扣除，再按实际用量校正"""
+    print("\n测试token令牌桶...")
+    payload = {"contents": CONTENTS}
+    estimate = estimate_request_tokens(payload)
+    assert estimate > 1000
+
+    limiter = RateLimiter(max_concurrency=4, tokens_per_minute=60000)
+    capacity = limiter.token_bucket.capacity
+    ticket = limiter.acquire(estimate)
+    assert capacity - limiter.token_bucket.level == estimate
+    # 实际用量比估算多5000，差额从桶中补扣
+    limiter.release(ticket, 200, tokens_used=estimate + 5000)
+    assert capacity - limiter.token_bucket.level >= estimate + 5000 - 1
+    assert limiter.tokens_used == estimate + 5000
+    print("token令牌桶测试通过")
+
+
+def test_aimd_adjustment():
+    """测试限流时乘性减、成功时加性增，同一轮拥塞只缩小一次"""
+    print("\n测试AIMD并发调整...")
+    limiter = RateLimiter(max_concurrency=8)
+    tickets = [limiter.acquire() for _ in range(3)]
+    assert limiter.in_flight == 3
+
+    limiter.release(tickets[0], 429)
+    assert limiter.concurrency == 4
+    # 缩小之前发出的请求陆续收到429，不再继续缩小
+    limiter.release(tickets[1], 429)
+    limiter.release(tickets[2], 503)
+    assert limiter.concurrency == 4 and limiter.throttled == 3 and limiter.decreases == 1
+
+    limiter.release(limiter.acquire(), 429)
+    assert limiter.concurrency == 2
+
+    # 每个成功请求加 1/当前上限，从2恢复到3需要3个成功请求（2 -> 2.5 -> 2.9 -> 3.24）
+    for _ in range(2):
+        limiter.release(limiter.acquire(), 200)
+    assert limiter.concurrency == 2
+    limiter.release(limiter.acquire(), 200)
+    assert limiter.concurrency == 3
+    for _ in range(100):
+        limiter.release(limiter.acquire(), 200)
+    assert limiter.concurrency == 8
+    # 网络错误不影响并发上限
+    limiter.release(limiter.acquire(), None)
+    assert limiter.concurrency == 8 and limiter.lowest_limit == 2
+    print("AIMD并发调整测试通过")
+
+
+def test_retry_after_pauses_all_requests():
+    """测试Retry-After期间所有新请求都暂停"""
+    print("\n测试Retry-After暂停...")
+    limiter = RateLimiter(max_concurrency=4)
+    limiter.release(limiter.acquire(), 429, retry_after=0.3)
+    assert limiter.snapshot()['paused_for'] > 0.2
+
+    start_time = time.time()
+    limiter.release(limiter.acquire(), 200)
+    assert time.time() - start_time >= 0.29
+    print("Retry-After暂停测试通过")
+
+
+def call_until_success(client, attempts=50):
+    """429时立即重试，等待由限流器负责"""
+    for _ in range(attempts):
+        try:
+            return client.generate_content('gemini-2.5-flash', CONTENTS)
+        except requests.HTTPError as e:
+            if e.response.status_code != 429:
+                raise
+    raise AssertionError("重试次数过多")
+
+
+def test_converges_below_server_quota():
+    """测试多线程请求超过服务器并发配额时，限流器收敛到配额附近且全部请求完成"""
+    print("\n测试收敛到服务器配额...")
+    server = MockGeminiServer(delay=0.05, max_in_flight=3, retry_after=0.1).start()
+    try:
+        limiter = RateLimiter(max_concurrency=8)
+        client = MiniGenAI('test_key', server.base_url, pool_size=8, rate_limiter=limiter)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: call_until_success(client), range(60)))
+
+        limiter.print_summary()
+        print(f"服务器返回429 {server.throttled} 次，最大同时处理 {server.peak_in_flight} 个请求")
+        assert results == ["模拟响应"] * 60
+        assert limiter.decreases >= 1 and limiter.lowest_limit <= 4
+        # 没有限流器时8个线程持续重试会收到数百次429
+        assert server.throttled < 60
+        assert limiter.in_flight == 0
+    finally:
+        server.stop()
+    print("收敛到服务器配额测试通过")
+
+
+def test_async_client_shares_limiter():
+    """测试asyncio客户端使用同一个限流器"""
+    print("\n测试asyncio客户端限流...")
+    server = MockGeminiServer(delay=0.05, max_in_flight=2, retry_after=0.1).start()
+    limiter = RateLimiter(max_concurrency=16)
+
+    async def call(client):
+        while True:
+            try:
+                return await client.generate_content('gemini-2.5-flash', CONTENTS)
+            except AsyncHTTPError as e:
+                assert e.status == 429
+
+    async def run():
+        async with AsyncMiniGenAI('test_key', server.base_url, rate_limiter=limiter) as client:
+            return await asyncio.gather(*[call(client) for _ in range(30)])
+
+    try:
+        assert asyncio.run(run()) == ["模拟响应"] * 30
+        assert limiter.throttled >= 1 and limiter.concurrency < 16
+        assert server.throttled < 30
+    finally:
+        server.stop()
+    print("asyncio客户端限流测试通过")
+
+
+if __name__ == '__main__':
+    test_parse_retry_after()
+    test_request_bucket()
+    test_token_bucket_uses_actual_usage()
+    test_aimd_adjustment()
+    test_retry_after_pauses_all_requests()
+    test_converges_below_server_quota()
+    test_async_client_shares_limiter()
+    print("\n所有限流测试通过！")
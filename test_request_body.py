@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试请求体编码：与json.dumps的输出和缓存键一致，图像只编码一次，重试时复用同一个请求体
+"""
+
+import sys
+import os
+import json
+import base64
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.request_body import encode_payload, PreparedContents
+from src.api.response_cache import make_cache_key, make_body_cache_key
+from src.api.gemini_client import GeminiClient, TEXT_PROMPT
+from src.api.retry_policy import RetryPolicy, RetryError
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer
+
+
+def page_payload(data):
+    parts = [{"text": "识别\"图像\"\n\u0000"}, {"inline_data": {"mime_type": "image/png", "data": data}}]
+    return {"contents": [{"role": "user", "parts": parts}], "generationConfig": {"response_mime_type": "text/plain"}}
+
+
+def test_encode_matches_json_dumps():
+    """测试拼接base64字节的结果与对字符串数据调用json.dumps完全相同"""
+    print("测试请求体编码...")
+    data = base64.b64encode(os.urandom(3000))
+    expected = json.dumps(page_payload(data.decode('ascii')), sort_keys=True, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+    assert encode_payload(page_payload(data)) == expected
+    assert encode_payload(page_payload(memoryview(data))) == expected
+    assert make_cache_key('m', page_payload(data)) == make_cache_key('m', page_payload(data.decode('ascii')))
+    assert make_body_cache_key('m', expected) == make_cache_key('m', page_payload(data))
+    print("请求体编码测试通过")
+
+
+def test_prepared_contents_share_body():
+    """测试序列化后图像数据指向请求体内部，相同参数不重复序列化"""
+    print("\n测试请求体复用...")
+    data = base64.b64encode(os.urandom(3000))
+    contents = PreparedContents(page_payload(data)["contents"])
+    payload = {"contents": contents, "generationConfig": {"response_mime_type": "text/plain"}}
+    body = contents.encode(payload)
+    assert contents.encode(payload) is body
+    image_data = contents[0]['parts'][1]['inline_data']['data']
+    assert isinstance(image_data, memoryview) and image_data.obj is body and bytes(image_data) == data
+
+    # 其他字段不同时生成新的请求体
+    other = contents.encode({"contents": contents})
+    assert other is not body and json.loads(other)["contents"] == json.loads(body)["contents"]
+    print("请求体复用测试通过")
+
+
+def test_retries_reuse_body():
+    """测试重试时不再重新编码图像，每次发送相同的请求体"""
+    print("\n测试重试复用请求体...")
+    server = MockGeminiServer(max_in_flight=0).start()
+    try:
+        with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+            client = GeminiClient(base_url=server.base_url, retry_policy=RetryPolicy(base_delay=0.001))
+        page = PageImage(1, b'\x89PNG\r\n\x1a\n' + os.urandom(5000), 'image/png')
+        with patch.object(client.image_encoder, 'encode', wraps=client.image_encoder.encode) as mock_encode:
+            try:
+                client.extract_text(page, max_retries=3)
+                assert False, "应该抛出RetryError"
+            except RetryError as e:
+                assert e.reason == 'throttled'
+        assert mock_encode.call_count == 1
+    finally:
+        server.stop()
+
+    body = encode_payload({"contents": client.build_contents(TEXT_PROMPT, page)})
+    assert server.requests == 3
+    assert server.bytes_received == 3 * len(body)
+    print("重试复用请求体测试通过")
+
+
+if __name__ == '__main__':
+    test_encode_matches_json_dumps()
+    test_prepared_contents_share_body()
+    test_retries_reuse_body()
+    print("\n所有请求体编码测试通过！")
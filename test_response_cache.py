@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+测试模型响应的本地缓存
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+from unittest.mock import patch, MagicMock
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.minigenai import MiniGenAI
+from src.api.response_cache import ResponseCache, make_cache_key
+
+
+def mock_response(text):
+    """构造generateContent的HTTP响应"""
+    response = MagicMock()
+    response.json.return_value = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+    return response
+
+
+def page_contents(image_data, prompt="提取文本"):
+    """构造包含图像的请求内容"""
+    return [{"role": "user", "parts": [{"text": prompt}, {"inline_data": {"mime_type": "image/png", "data": image_data}}]}]
+
+
+def test_cache_key():
+    """测试缓存键由模型、图像、提示词和generation_config共同决定"""
+    print("测试缓存键...")
+    payload = {"contents": page_contents("aW1hZ2U="), "generationConfig": {"response_mime_type": "application/json"}}
+    key = make_cache_key('gemini-2.5-flash', payload)
+
+    assert key == make_cache_key('gemini-2.5-flash', json.loads(json.dumps(payload)))
+    assert key != make_cache_key('gemini-2.5-pro', payload)
+    assert key != make_cache_key('gemini-2.5-flash', {"contents": page_contents("aW1hZ2Uy")})
+    assert key != make_cache_key('gemini-2.5-flash', {"contents": page_contents("aW1hZ2U=", "其他提示词")})
+    assert key != make_cache_key('gemini-2.5-flash', {"contents": payload["contents"]})
+    print("缓存键测试通过")
+
+
+def test_minigenai_uses_cache():
+    """测试相同请求第二次直接命中缓存，不再访问网络"""
+    print("\n测试MiniGenAI缓存...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+        client = MiniGenAI('test_key', cache=cache)
+
+        with patch.object(client.session, 'post', return_value=mock_response("第一页")) as mock_post:
+            assert client.generate_content('gemini-2.5-flash', page_contents("cGFnZTE=")) == "第一页"
+            assert client.generate_content('gemini-2.5-flash', page_contents("cGFnZTE=")) == "第一页"
+            assert mock_post.call_count == 1
+            assert cache.hits == 1 and cache.misses == 1
+
+            # 缓存在重新打开后仍然有效
+            cache.close()
+            client.cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+            assert client.generate_content('gemini-2.5-flash', page_contents("cGFnZTE=")) == "第一页"
+            assert mock_post.call_count == 1
+            client.cache.close()
+    print("MiniGenAI缓存测试通过")
+
+
+def test_refresh_and_off_modes():
+    """测试refresh模式重新请求并更新缓存，off模式不读写缓存"""
+    print("\n测试缓存模式...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'cache.sqlite3')
+        ResponseCache(path).put('key', '旧结果')
+
+        refresh = ResponseCache(path, mode='refresh')
+        assert refresh.get('key') is None
+        refresh.put('key', '新结果')
+        refresh.close()
+        assert ResponseCache(path).get('key') == '新结果'
+
+        off = ResponseCache(os.path.join(temp_dir, 'unused.sqlite3'), mode='off')
+        off.put('key', '结果')
+        assert off.get('key') is None
+        assert not os.path.exists(os.path.join(temp_dir, 'unused.sqlite3'))
+    print("缓存模式测试通过")
+
+
+def test_lru_eviction():
+    """测试超过容量上限时淘汰最久未使用的条目"""
+    print("\n测试LRU淘汰...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'), max_bytes=300)
+        for name in ('a', 'b', 'c'):
+            cache.put(name, name * 100)
+            time.sleep(0.01)
+
+        # 访问a后，最久未使用的是b
+        assert cache.get('a') == 'a' * 100
+        time.sleep(0.01)
+        cache.put('d', 'd' * 100)
+
+        assert cache.get('b') is None
+        assert cache.get('a') and cache.get('c') and cache.get('d')
+        assert cache.evictions == 1
+        cache.close()
+    print("LRU淘汰测试通过")
+
+
+def test_invalid_json_not_cached():
+    """测试要求JSON输出时不缓存无法解析的响应"""
+    print("\n测试无效JSON不缓存...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+        client = MiniGenAI('test_key', cache=cache)
+        config = {"response_mime_type": "application/json"}
+
+        responses = [mock_response("[{\"type\": \"para"), mock_response("```json\n[]\n```")]
+        with patch.object(client.session, 'post', side_effect=responses) as mock_post:
+            client.generate_content('gemini-2.5-flash', page_contents("cGFnZQ=="), config)
+            assert client.generate_content('gemini-2.5-flash', page_contents("cGFnZQ=="), config) == "```json\n[]\n```"
+            assert client.generate_content('gemini-2.5-flash', page_contents("cGFnZQ=="), config) == "```json\n[]\n```"
+            assert mock_post.call_count == 2
+        cache.close()
+    print("无效JSON不缓存测试通过")
+
+
+def test_cached_rerun_is_fast():
+    """测试500页全部命中缓存时几秒内完成"""
+    print("\n测试缓存重跑耗时...")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+        client = MiniGenAI('test_key', cache=cache)
+        pages = [page_contents("x" * 200000 + str(page_num)) for page_num in range(500)]
+
+        with patch.object(client.session, 'post', side_effect=lambda *a, **k: mock_response("文本")):
+            for contents in pages:
+                client.generate_content('gemini-2.5-flash', contents)
+
+        with patch.object(client.session, 'post') as mock_post:
+            start_time = time.time()
+            for contents in pages:
+                assert client.generate_content('gemini-2.5-flash', contents) == "文本"
+            elapsed = time.time() - start_time
+            mock_post.assert_not_called()
+
+        print(f"500页缓存重跑耗时: {elapsed:.2f} 秒")
+        assert elapsed < 5
+        cache.close()
+    print("缓存重跑耗时测试通过")
+
+
+if __name__ == '__main__':
+    test_cache_key()
+    test_minigenai_uses_cache()
+    test_refresh_and_off_modes()
+    test_lru_eviction()
+    test_invalid_json_not_cached()
+    test_cached_rerun_is_fast()
+    print("\n所有响应缓存测试通过！")
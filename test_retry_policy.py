@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+测试统一的重试策略：错误分类、指数退避、Retry-After和重试次数预算
+"""
+
+import sys
+import os
+import json
+import random
+import asyncio
+from unittest.mock import patch
+
+import aiohttp
+import requests
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.retry_policy import RetryPolicy, RetryError, classify_error
+from src.api.errors import AsyncHTTPError
+from src.api.gemini_client import GeminiClient
+from src.processors.pdf_processor import PageImage
+
+
+def http_error(status, headers=None, body=b''):
+    """构造requests抛出的HTTPError"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return requests.HTTPError(f"{status} Error", response=response)
+
+
+def make_policy(**kwargs):
+    """记录等待时间而不真正等待的重试策略"""
+    sleeps = []
+    policy = RetryPolicy(sleep=sleeps.append, rng=random.Random(0), **kwargs)
+    return policy, sleeps
+
+
+def failing(*exceptions, result="成功"):
+    """依次抛出给定异常，之后返回result"""
+    remaining = list(exceptions)
+    calls = []
+
+    def operation():
+        calls.append(1)
+        if remaining:
+            raise remaining.pop(0)
+        return result
+    return operation, calls
+
+
+def test_classify_error():
+    """测试按HTTP状态码、超时、连接错误和JSON解析错误分类"""
+    print("测试错误分类...")
+    assert classify_error(http_error(400)) == 'client_error'
+    assert classify_error(http_error(403)) == 'client_error'
+    assert classify_error(http_error(429)) == 'throttled'
+    assert classify_error(http_error(408)) == 'timeout'
+    assert classify_error(http_error(503)) == 'server_error'
+    assert classify_error(AsyncHTTPError(500, 'Internal Server Error', {}, b'')) == 'server_error'
+    assert classify_error(requests.exceptions.ReadTimeout()) == 'timeout'
+    assert classify_error(asyncio.TimeoutError()) == 'timeout'
+    assert classify_error(aiohttp.ServerTimeoutError('read timed out')) == 'timeout'
+    assert classify_error(aiohttp.ServerDisconnectedError()) == 'connection'
+    assert classify_error(requests.exceptions.ConnectionError()) == 'connection'
+    assert classify_error(ConnectionResetError()) == 'connection'
+    try:
+        json.loads('[{"type": "para')
+    except ValueError as e:
+        assert classify_error(e) == 'malformed'
+    assert classify_error(Exception("未知错误")) == 'other'
+    print("错误分类测试通过")
+
+
+def test_backoff_is_capped_exponential_with_jitter():
+    """测试等待时间在 [0, min(上限, 基数*2^n)] 内随机分布"""
+    print("\n测试指数退避...")
+    policy = RetryPolicy(base_delay=1, max_delay=10, rng=random.Random(1))
+    for attempt, bound in enumerate([1, 2, 4, 8, 10, 10]):
+        delays = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= bound for delay in delays)
+        # 完全随机抖动：取值分散在整个区间内
+        assert max(delays) > bound * 0.9 and min(delays) < bound * 0.1
+    print("指数退避测试通过")
+
+
+def test_fatal_errors_are_not_retried():
+    """测试400不重试，无法解析的JSON只重试 malformed_retries 次"""
+    print("\n测试不可重试的错误...")
+    policy, sleeps = make_policy()
+    operation, calls = failing(http_error(400))
+    try:
+        policy.call(operation, max_attempts=5, description="文本提取失败")
+        assert False, "应该抛出RetryError"
+    except RetryError as e:
+        assert e.reason == 'client_error' and e.attempts == 1
+        assert str(e).startswith("文本提取失败")
+    assert len(calls) == 1 and sleeps == []
+
+    # 默认重试一次，重新生成的响应可以解析时成功
+    operation, calls = failing(json.JSONDecodeError("Expecting value", "", 0))
+    assert policy.call(operation, max_attempts=5) == "成功"
+    assert len(calls) == 2 and policy.retries == {'malformed': 1}
+
+    operation, calls = failing(*[json.JSONDecodeError("Expecting value", "", 0)] * 3)
+    try:
+        policy.call(operation, max_attempts=5)
+        assert False, "应该抛出RetryError"
+    except RetryError as e:
+        assert e.reason == 'malformed' and e.attempts == 2
+    assert len(calls) == 2
+
+    # 调用时可以关闭无法解析的响应的重试
+    operation, calls = failing(ValueError("缺少字段"))
+    try:
+        policy.call(operation, max_attempts=5, malformed_retries=0)
+        assert False, "应该抛出RetryError"
+    except RetryError as e:
+        assert e.attempts == 1
+    assert policy.failures == {'client_error': 1, 'malformed': 2}
+    print("不可重试的错误测试通过")
+
+
+def test_retryable_errors_and_counters():
+    """测试可重试的错误按原因计数，成功后返回结果"""
+    print("\n测试可重试的错误...")
+    policy, sleeps = make_policy(base_delay=1, max_delay=30)
+    operation, calls = failing(http_error(503), requests.exceptions.ReadTimeout(), http_error(503))
+    assert policy.call(operation, max_attempts=5) == "成功"
+    assert len(calls) == 4 and len(sleeps) == 3
+    assert sleeps[0] <= 1 and sleeps[1] <= 2 and sleeps[2] <= 4
+    assert policy.retries == {'server_error': 2, 'timeout': 1}
+
+    # 达到最多尝试次数后失败
+    operation, calls = failing(*[requests.exceptions.ConnectionError()] * 3)
+    try:
+        policy.call(operation, max_attempts=3)
+        assert False, "应该抛出RetryError"
+    except RetryError as e:
+        assert e.reason == 'connection' and e.attempts == 3
+    policy.print_summary()
+    print("可重试的错误测试通过")
+
+
+def test_retry_after_is_honored():
+    """测试限流响应按Retry-After等待"""
+    print("\n测试Retry-After...")
+    policy, sleeps = make_policy(base_delay=1, max_delay=30)
+    operation, _ = failing(http_error(429, {'Retry-After': '7'}))
+    policy.call(operation)
+    assert sleeps[0] >= 7
+
+    body = json.dumps({"error": {"details": [{"retryDelay": "12s"}]}}).encode('utf-8')
+    operation, _ = failing(AsyncHTTPError(429, 'Too Many Requests', {}, body))
+
+    async def attempt():
+        return operation()
+
+    async def record_sleep(delay):
+        sleeps.append(delay)
+
+    policy.async_sleep = record_sleep
+    assert asyncio.run(policy.call_async(attempt)) == "成功"
+    assert sleeps[1] >= 12
+    assert policy.retries['throttled'] == 2
+    print("Retry-After测试通过")
+
+
+def test_retry_budget():
+    """测试整个任务的重试次数用完后不再重试"""
+    print("\n测试重试次数预算...")
+    policy, sleeps = make_policy(retry_budget=2)
+    results = []
+    for _ in range(3):
+        operation, calls = failing(requests.exceptions.ReadTimeout(), requests.exceptions.ReadTimeout())
+        try:
+            results.append(policy.call(operation, max_attempts=5))
+        except RetryError:
+            results.append(len(calls))
+
+    # 第一页用掉2次重试后成功，之后的页面第一次失败就放弃
+    assert results == ["成功", 1, 1]
+    assert policy.total_retries == 2 and policy.budget_exhausted == 2
+    print("重试次数预算测试通过")
+
+
+def test_gemini_client_uses_policy():
+    """测试GeminiClient的所有提取方法共用重试策略"""
+    print("\n测试GeminiClient使用重试策略...")
+    policy, sleeps = make_policy()
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        client = GeminiClient(retry_policy=policy)
+    image = PageImage(1, b'\x89PNG\r\n\x1a\n' + b'\x00' * 100, 'image/png')
+
+    with patch.object(client.client, 'generate_content',
+                      side_effect=[requests.exceptions.ReadTimeout(), '{"is_toc": false, "text": "正文"}']):
+        assert client.extract_text_with_toc(image) == (False, "正文")
+
+    # 截断的JSON只重试一次
+    with patch.object(client.client, 'generate_content', return_value='{"is_toc": false, "blo') as mock_generate:
+        try:
+            client.extract_rich_structure_with_toc(image)
+            assert False, "应该抛出RetryError"
+        except RetryError as e:
+            assert e.reason == 'malformed'
+        assert mock_generate.call_count == 2
+
+    # 目录检测失败时默认不跳过
+    with patch.object(client.client, 'generate_content', side_effect=http_error(400)):
+        assert client.is_table_of_contents_page(image) is False
+
+    assert policy.retries == {'timeout': 1, 'malformed': 1}
+    assert policy.failures == {'malformed': 1, 'client_error': 1}
+    print("GeminiClient使用重试策略测试通过")
+
+
+if __name__ == '__main__':
+    test_classify_error()
+    test_backoff_is_capped_exponential_with_jitter()
+    test_fatal_errors_are_not_retried()
+    test_retryable_errors_and_counters()
+    test_retry_after_is_honored()
+    test_retry_budget()
+    test_gemini_client_uses_policy()
+    print("\n所有重试策略测试通过！")
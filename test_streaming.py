@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+测试流式响应：增量解析内容块、停滞的流提前中断并重试、格式错误的内容块立即中断
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.json_stream import JsonArrayStream
+from src.api.minigenai import MiniGenAI, StreamStalledError
+from src.api.response_cache import ResponseCache
+from src.api.retry_policy import RetryPolicy, RetryError
+from src.processors.pdf_processor import PageImage
+from mock_gemini_server import MockGeminiServer
+import testing_utils
+
+
+BLOCKS = [{'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': '第一章 "开端" [上]'},
+          {'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': '正文{括号}\\和转义\n换行'},
+          {'type': 'paragraph', 'level': 0, 'style': {'align': 'left'}, 'content': '第二段'}]
+RESPONSE = json.dumps({'is_toc': False, 'blocks': BLOCKS}, ensure_ascii=False)
+
+
+def make_client(server, cache=None):
+    return testing_utils.make_client(server, cache=cache, stream=True, stall_timeout=0.5,
+                                     retry_policy=RetryPolicy(base_delay=0.01))
+
+
+def test_incremental_parser():
+    """测试逐字符输入时每个内容块在其右括号到达时产出"""
+    print("测试增量解析...")
+    parser = JsonArrayStream('blocks')
+    text = '```json\n' + RESPONSE + '\n```'
+    completed = []
+    for position, char in enumerate(text):
+        for block in parser.feed(char):
+            completed.append((block, position))
+    assert [block for block, _ in completed] == BLOCKS
+    # 第一个内容块在第二个内容块开始之前就已产出
+    first_end = text.index('}, {"type"')
+    assert completed[0][1] == first_end
+    assert parser.text == text
+
+    # 根为数组，以及数组中的标量元素
+    parser = JsonArrayStream('blocks')
+    assert parser.feed('[{"a": [1, 2]}, "x,]", 3') == [{'a': [1, 2]}, 'x,]']
+    assert parser.feed(']') == [3]
+    # 其他字段中的数组不会被当作内容块
+    parser = JsonArrayStream('blocks')
+    assert parser.feed('{"notes": [1], "blocks": [{"b": 1}], "tail": [2]}') == [{'b': 1}]
+
+    try:
+        JsonArrayStream('blocks').feed('{"blocks": [{"a": tru}]}')
+        assert False, "应该抛出ValueError"
+    except ValueError:
+        pass
+    print("增量解析测试通过")
+
+
+def test_blocks_arrive_during_generation():
+    """测试内容块在响应生成过程中陆续交给回调，结果与非流式请求一致并写入响应缓存"""
+    print("\n测试边生成边解析...")
+    server = MockGeminiServer(response_text=RESPONSE, stream_chunk_size=16, stream_delay=0.02).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+            client = make_client(server, cache)
+            arrivals = []
+            start = time.time()
+            result = client.extract_rich_structure_with_toc(
+                PageImage(1, b'\x89PNG page 1', 'image/png'),
+                on_block=lambda index, block: arrivals.append((index, block, time.time() - start)))
+            elapsed = time.time() - start
+
+            assert result == (False, BLOCKS)
+            assert [(index, block) for index, block, _ in arrivals] == list(enumerate(BLOCKS))
+            assert arrivals[0][2] < elapsed / 2
+
+            # 流式请求与非流式请求共用缓存键
+            client.stream = False
+            assert client.extract_rich_structure_with_toc(PageImage(1, b'\x89PNG page 1', 'image/png')) == result
+            cache.close()
+    finally:
+        server.stop()
+    assert server.requests == 1
+    print("边生成边解析测试通过")
+
+
+def test_stalled_stream_is_retried():
+    """测试停滞的流在stall_timeout后中断，按超时重试"""
+    print("\n测试停滞的流...")
+
+    def respond(request):
+        # 前两次请求停滞，之后恢复正常
+        if server.requests > 2:
+            server.stall_after = None
+        return RESPONSE
+
+    server = MockGeminiServer(response_text=respond, stream_chunk_size=16, stall_after=3, stall_seconds=5).start()
+    try:
+        client = MiniGenAI('test_key', server.base_url)
+        start = time.time()
+        chunks = []
+        try:
+            for chunk in client.stream_generate_content('gemini-2.5-flash', [{'parts': [{'text': '页面'}]}],
+                                                        stall_timeout=0.3):
+                chunks.append(chunk)
+            assert False, "应该抛出StreamStalledError"
+        except StreamStalledError:
+            pass
+        assert time.time() - start < 2
+        assert ''.join(chunks) == RESPONSE[:48]
+
+        gemini_client = make_client(server)
+        page = PageImage(1, b'\x89PNG', 'image/png')
+        assert gemini_client.extract_rich_structure_with_toc(page) == (False, BLOCKS)
+        assert gemini_client.retry_policy.retries == {'timeout': 1}
+    finally:
+        server.stop()
+    print("停滞的流测试通过")
+
+
+def test_malformed_block_aborts_stream():
+    """测试内容块格式错误时立即中断，不等待剩余内容生成"""
+    print("\n测试格式错误的内容块...")
+    text = json.dumps({'is_toc': False, 'blocks': [BLOCKS[0], '不是对象'] + BLOCKS * 3}, ensure_ascii=False)
+    server = MockGeminiServer(response_text=text, stream_chunk_size=16, stream_delay=0.05).start()
+    try:
+        client = make_client(server)
+        start = time.time()
+        try:
+            client.extract_rich_structure_with_toc(PageImage(1, b'\x89PNG', 'image/png'))
+            assert False, "应该抛出RetryError"
+        except RetryError as e:
+            assert e.reason == 'malformed'
+        full_duration = len(text) / 16 * 0.05
+        assert time.time() - start < full_duration / 2
+    finally:
+        server.stop()
+    print("格式错误的内容块测试通过")
+
+
+if __name__ == '__main__':
+    test_incremental_parser()
+    test_blocks_arrive_during_generation()
+    test_stalled_stream_is_retried()
+    test_malformed_block_aborts_stream()
+    print("\n所有流式响应测试通过！")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+测试流式页面渲染（有界预渲染窗口）
+"""
+
+import sys
+import os
+import threading
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.processors.pdf_processor import PDFProcessor
+
+
+class FakePdftoppm:
+    """模拟pdftoppm：按 -singlefile 约定写出 <root>.png，并记录同时存在的图像数量"""
+
+    def __init__(self):
+        self.rendered_pages = []
+        self.max_files_on_disk = 0
+        self.output_dir = None
+        self.lock = threading.Lock()
+
+    def __call__(self, cmd, **kwargs):
+        page_num = int(cmd[cmd.index('-f') + 1])
+        output_root = cmd[-1]
+        self.output_dir = os.path.dirname(output_root)
+        with open(f"{output_root}.png", "wb") as f:
+            f.write(b"fake png")
+        with self.lock:
+            self.rendered_pages.append(page_num)
+            files = [name for name in os.listdir(self.output_dir) if name.endswith('.png')]
+            self.max_files_on_disk = max(self.max_files_on_disk, len(files))
+
+
+def test_iter_page_images_order_and_bound():
+    """测试流式渲染按页序产出且磁盘占用受预渲染窗口限制"""
+    print("测试流式渲染...")
+
+    processor = PDFProcessor()
+    fake = FakePdftoppm()
+    lookahead = 3
+
+    with patch('src.processors.pdf_processor.subprocess.run', side_effect=fake):
+        pages = []
+        for image_path in processor.iter_page_images('/tmp/book.pdf', 5, 24, dpi=300, lookahead=lookahead):
+            pages.append(os.path.basename(image_path))
+            # 模拟主流程处理完页面后删除图像
+            os.remove(image_path)
+
+    expected = [f"page-{i:03d}.png" for i in range(5, 25)]
+    print(f"产出页面: {pages[0]} ... {pages[-1]}，共 {len(pages)} 页")
+    assert pages == expected
+
+    # 当前处理中的一页 + 最多 lookahead 页预渲染
+    print(f"磁盘上同时存在的最大图像数: {fake.max_files_on_disk}")
+    assert fake.max_files_on_disk <= lookahead + 1
+
+    assert not os.path.exists(fake.output_dir), "临时目录应在迭代结束后清理"
+    print("流式渲染测试通过")
+
+
+def test_iter_page_images_early_stop():
+    """测试调用方提前停止时不会继续渲染并清理临时目录"""
+    print("\n测试提前停止...")
+
+    processor = PDFProcessor()
+    fake = FakePdftoppm()
+
+    with patch('src.processors.pdf_processor.subprocess.run', side_effect=fake):
+        images = processor.iter_page_images('/tmp/book.pdf', 1, 100, lookahead=4)
+        first = next(images)
+        assert os.path.basename(first) == "page-001.png"
+        images.close()
+
+    print(f"提前停止后共渲染 {len(fake.rendered_pages)} 页")
+    assert len(fake.rendered_pages) <= 6
+    assert not os.path.exists(fake.output_dir)
+    print("提前停止测试通过")
+
+
+if __name__ == '__main__':
+    test_iter_page_images_order_and_bound()
+    test_iter_page_images_early_stop()
+    print("\n所有流式渲染测试通过！")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试PDF文本层直出（跳过Gemini OCR）
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from src.processors.pdf_processor import PDFProcessor
+from src.processors.text_layer import TextLayerPage, is_text_layer_usable
+
+
+SAMPLE_PAGE = """第一章 导言
+中国是一个拥有五千年文明历史的国家，其社会结构和文化传统具有独特的复杂
+性。本书试图从日常生活的角度观察这个社会。
+作者在北京居住多年，走访了许多城市和乡村。
+第一节 出发
+那是一个寒冷的冬天，我们从上海出发，一路向北，沿途经过了许多从未到过的
+地方，也认识了许多朋友。"""
+
+ENGLISH_LINES = [
+    "Chapter 1",
+    "It was a bright cold day in April, and the clocks were striking thirteen.",
+    "Winston Smith, his chin nuzzled into his breast in an effort to escape the",
+    "vile wind, slipped quickly through the glass doors of Victory Mansions.",
+]
+
+
+def build_text_pdf(pdf_path, pages):
+    """生成使用标准Helvetica字体的文本PDF，pages为 (行列表, 文本渲染模式) 列表"""
+    writer = PdfWriter()
+    for lines, render_mode in pages:
+        page = PageObject.create_blank_page(width=612, height=792)
+        font = DictionaryObject({
+            NameObject('/Type'): NameObject('/Font'),
+            NameObject('/Subtype'): NameObject('/Type1'),
+            NameObject('/BaseFont'): NameObject('/Helvetica'),
+        })
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})
+        })
+        ops = [f"BT {render_mode} Tr /F1 11 Tf 72 720 Td 14 TL"]
+        for line in lines:
+            ops.append(f"({line}) Tj T*")
+        ops.append("ET")
+        stream = DecodedStreamObject()
+        stream.set_data("\n".join(ops).encode('latin-1'))
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        writer.add_page(page)
+
+    with open(pdf_path, 'wb') as f:
+        writer.write(f)
+
+
+def test_text_quality():
+    """测试文本层质量判断"""
+    print("测试文本层质量判断...")
+    assert is_text_layer_usable(SAMPLE_PAGE)
+    assert is_text_layer_usable("\n".join(ENGLISH_LINES))
+    assert not is_text_layer_usable("第3页")
+    assert not is_text_layer_usable("(cid:12)(cid:34)(cid:56) " * 10)
+    assert not is_text_layer_usable("\ufffd\ufffd乱码" * 20)
+    assert not is_text_layer_usable("T h i s  i s  s p a c e d  o u t  t e x t  " * 5)
+    print("文本层质量判断测试通过")
+
+
+def test_text_to_blocks():
+    """测试文本层转换为富文本内容块与纯文本"""
+    print("\n测试文本层结构转换...")
+    page = TextLayerPage(1, SAMPLE_PAGE)
+    blocks = page.to_blocks()
+    for block in blocks:
+        print(f"  {block['type']}({block['level']}): {block['content'][:20]}")
+
+    assert blocks[0] == {'type': 'heading', 'level': 1, 'style': {'align': 'center'}, 'content': '第一章 导言'}
+    assert blocks[1]['type'] == 'paragraph'
+    assert blocks[1]['content'].startswith('中国是一个') and blocks[1]['content'].endswith('观察这个社会。')
+    assert blocks[2]['content'] == '作者在北京居住多年，走访了许多城市和乡村。'
+    assert blocks[3]['type'] == 'heading' and blocks[3]['level'] == 2
+    assert '到过的地方' in blocks[4]['content']
+
+    text = page.to_text()
+    assert text.startswith('## 第一章 导言\n\n中国是一个')
+
+    english = TextLayerPage(2, "\n".join(ENGLISH_LINES)).to_blocks()
+    assert english[0]['type'] == 'heading'
+    assert 'escape the vile wind' in english[1]['content']
+    print("文本层结构转换测试通过")
+
+
+def test_toc_detection():
+    """测试基于文本的目录页检测"""
+    print("\n测试目录页检测...")
+    toc = TextLayerPage(3, "目录\n第一章 导言 ........ 1\n第二章 北京 ........ 15\n第三章 上海 ........ 40")
+    assert toc.looks_like_toc()
+    entries = "\n".join(f"Chapter {i} Something happened .... {i * 12}" for i in range(1, 9))
+    assert TextLayerPage(4, entries).looks_like_toc()
+    assert not TextLayerPage(5, SAMPLE_PAGE).looks_like_toc()
+    print("目录页检测测试通过")
+
+
+def test_classify_text_layer_modes():
+    """测试off/auto/force三种模式"""
+    print("\n测试文本层模式...")
+    temp_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(temp_dir, 'text.pdf')
+    build_text_pdf(pdf_path, [
+        (ENGLISH_LINES, 0),        # 正常文本页
+        (["Page 7"], 0),           # 文本太少
+        (ENGLISH_LINES, 3),        # 扫描件上的不可见OCR层
+    ])
+
+    try:
+        processor = PDFProcessor()
+        for mode, expected in (('off', {}), ('auto', {1}), ('force', {1, 2, 3})):
+            text_pages = processor.classify_text_layer_pages(pdf_path, 1, 3, mode)
+            print(f"{mode}: {sorted(text_pages)}")
+            assert set(text_pages) == set(expected)
+
+        page = processor.classify_text_layer(pdf_path, 1, 'auto')
+        assert 'bright cold day' in page.text
+        print("文本层模式测试通过")
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    test_text_quality()
+    test_text_to_blocks()
+    test_toc_detection()
+    test_classify_text_layer_modes()
+    print("\n所有文本层测试通过！")
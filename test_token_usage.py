@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试token用量统计：generate_content的结果保留用量和finishReason，用量按页面、调用类型、模型和整个任务累计
+"""
+
+import sys
+import os
+import json
+import tempfile
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.minigenai import MiniGenAI
+from src.api.response_cache import ResponseCache
+from src.api.retry_policy import RetryPolicy
+from src.api.token_usage import TokenUsage, GenerateResult, extract_usage, estimate_cost, page_number
+from src.processors.pdf_processor import PageImage
+from src.utils.progress_manager import ProgressManager
+from mock_gemini_server import MockGeminiServer, canned_response
+import testing_utils
+from testing_utils import make_pages
+
+
+CONTENTS = [{'parts': [{'text': '你好'}]}]
+
+
+def make_client(server, usage, **kwargs):
+    return testing_utils.make_client(server, usage=usage,
+                                     retry_policy=RetryPolicy(base_delay=0.001, malformed_retries=10), **kwargs)
+
+
+def test_generate_result():
+    """测试generate_content返回带有用量和finishReason的文本，命中缓存时没有用量"""
+    print("测试结构化结果...")
+    usage = extract_usage({'usageMetadata': {'promptTokenCount': 10, 'candidatesTokenCount': 5,
+                                             'thoughtsTokenCount': 3}})
+    assert usage == {'prompt': 10, 'candidates': 5, 'thoughts': 3, 'cached': 0, 'total': 18}
+    assert extract_usage({'candidates': []}) is None
+    assert estimate_cost(usage, 'gemini-2.5-flash') == (10 * 0.30 + 8 * 2.50) / 1_000_000
+    assert estimate_cost(usage, 'unknown-model') is None
+
+    server = MockGeminiServer().start()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = ResponseCache(os.path.join(temp_dir, 'cache.sqlite3'))
+        try:
+            client = MiniGenAI('test_key', server.base_url, cache=cache)
+            result = client.generate_content('gemini-2.5-flash', CONTENTS)
+            assert isinstance(result, GenerateResult) and result == '模拟响应'
+            assert (result.prompt_tokens, result.candidates_tokens, result.total_tokens) == (2, 4, 6)
+            assert result.finish_reason == 'STOP' and not result.cached
+            assert client.last_usage == result.usage
+
+            cached = client.generate_content('gemini-2.5-flash', CONTENTS)
+            assert cached == result and cached.cached and cached.usage is None
+            assert client.last_usage is None and server.requests == 1
+
+            # 流式请求的用量从最后一个事件中读取
+            client.cache = None
+            assert ''.join(client.stream_generate_content('gemini-2.5-flash', CONTENTS)) == '模拟响应'
+            assert client.last_usage == result.usage
+
+            # 没有文本的响应（如被安全过滤拦截）以原始JSON作为文本，同样保留用量和finishReason
+            blocked = {'candidates': [{'finishReason': 'SAFETY'}],
+                       'usageMetadata': {'promptTokenCount': 7, 'totalTokenCount': 7}}
+            with patch.object(client, '_post', return_value=(blocked, None)):
+                result = client.generate_content('gemini-2.5-flash', CONTENTS)
+            assert isinstance(result, GenerateResult) and json.loads(result) == blocked
+            assert result.finish_reason == 'SAFETY' and result.prompt_tokens == 7
+            assert client.last_usage == result.usage
+        finally:
+            server.stop()
+            cache.close()
+    print("结构化结果测试通过")
+
+
+def test_usage_by_call_type_and_page():
+    """测试用量按调用类型、模型和页面累计，多页请求在页面之间平均分摊，重试的请求同样计入"""
+    print("\n测试用量累计...")
+    server = MockGeminiServer(response_text=canned_response).start()
+    try:
+        usage = TokenUsage()
+        client = make_client(server, usage)
+        page = make_pages(1)[0]
+        assert client.is_table_of_contents_page(page) is False
+        client.extract_rich_structure(page)
+        client.extract_rich_structure_multi(make_pages(4)[2:])
+
+        assert usage.total['requests'] == server.requests == 3
+        assert usage.by_call_type['toc_check']['requests'] == 1
+        assert usage.by_call_type['extraction']['requests'] == 2
+        assert set(usage.by_page) == {1, 3, 4} and usage.by_page[1]['requests'] == 2
+        assert abs(usage.by_page[3]['total'] - usage.by_page[4]['total']) <= 1
+        assert abs(sum(counts['total'] for counts in usage.by_page.values()) - usage.total['total']) <= 1
+        assert usage.by_model['gemini-2.5-flash']['total'] == usage.total['total']
+        assert abs(usage.total['cost'] - sum(counts['cost'] for counts in usage.by_call_type.values())) < 1e-12
+    finally:
+        server.stop()
+
+    # 格式错误而重试的响应也计费
+    server = MockGeminiServer(response_text=canned_response, fault_rates={'malformed': 0.5}, seed=1).start()
+    try:
+        usage = TokenUsage()
+        client = make_client(server, usage)
+        for page in make_pages(6):
+            client.extract_rich_structure_with_toc(page, max_retries=10)
+        assert client.retry_policy.retries['malformed'] > 0
+        assert usage.total['requests'] == server.requests
+    finally:
+        server.stop()
+    print("用量累计测试通过")
+
+
+def test_summary_saved_with_progress():
+    """测试用量汇总随进度保存，恢复任务时累加到新的统计中"""
+    print("\n测试用量随进度保存...")
+    assert page_number('/tmp/pages/page-012.png') == 12
+    assert page_number(PageImage(7, b'', 'image/png')) == 7
+    assert page_number('/tmp/scan.png') is None
+
+    usage = TokenUsage()
+    usage.record({'prompt': 1000, 'candidates': 200, 'thoughts': 0, 'cached': 0, 'total': 1200},
+                 'gemini-2.5-pro', 'extraction', [5])
+    usage.record({'prompt': 1000, 'candidates': 10, 'thoughts': 0, 'cached': 0, 'total': 1010},
+                 'gemini-2.5-flash', 'toc_check', [5, 6])
+    usage.record(None, 'gemini-2.5-flash')
+    usage.record({'prompt': 1, 'candidates': 1, 'thoughts': 0, 'cached': 0, 'total': 2}, 'custom-model')
+    assert usage.total['requests'] == 3 and usage.unpriced == {'custom-model'}
+    assert usage.by_page[6] == {'requests': 1, 'prompt': 500, 'candidates': 5, 'thoughts': 0, 'total': 505,
+                                'cost': estimate_cost({'prompt': 1000, 'total': 1010}, 'gemini-2.5-flash') / 2}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        progress_manager = ProgressManager(os.path.join(temp_dir, 'book.pdf'), os.path.join(temp_dir, 'book.epub'))
+        progress_manager.token_usage = usage
+        progress_manager.save_progress(6, 10, [], 'rich')
+        with open(progress_manager.progress_file, encoding='utf-8') as f:
+            saved = json.load(f)['token_usage']
+        assert saved == json.loads(json.dumps(usage.summary()))
+
+        resumed = TokenUsage()
+        resumed.load(saved)
+        resumed.load(None)
+        assert resumed.total['total'] == usage.total['total']
+        assert resumed.by_page == usage.by_page and resumed.by_model == usage.by_model
+        assert abs(resumed.total['cost'] - usage.total['cost']) < 1e-9
+        resumed.print_summary()
+    print("用量随进度保存测试通过")
+
+
+if __name__ == '__main__':
+    test_generate_result()
+    test_usage_by_call_type_and_page()
+    test_summary_saved_with_progress()
+    print("\n所有token用量测试通过！")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+测试辅助函数：各测试脚本共用的内存页面和GeminiClient构造
+"""
+
+import sys
+import os
+from unittest.mock import patch
+
+# 添加src目录到Python路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.api.gemini_client import GeminiClient
+from src.processors.pdf_processor import PageImage
+
+
+def make_pages(count):
+    """
+    创建第1页到第count页的内存页面
+
+    Args:
+        count (int): 页数
+
+    Returns:
+        list: PageImage列表，图像数据以页码结尾，模拟模型可以据此分辨页面
+    """
+    return [PageImage(page_num, b'\x89PNG page %d' % page_num, 'image/png') for page_num in range(1, count + 1)]
+
+
+def make_client(server=None, **kwargs):
+    """
+    使用测试密钥创建GeminiClient
+
+    Args:
+        server (MockGeminiServer): 指定时请求发往该模拟服务器
+        **kwargs: 传给GeminiClient的其他参数
+
+    Returns:
+        GeminiClient: 客户端
+    """
+    if server is not None:
+        kwargs.setdefault('base_url', server.base_url)
+    with patch.dict(os.environ, {'GEMINI_API_KEY': 'test_key'}):
+        return GeminiClient(**kwargs)